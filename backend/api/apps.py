@@ -0,0 +1,22 @@
+from django.apps import AppConfig
+
+
+class ApiConfig(AppConfig):
+    name = 'api'
+
+    def ready(self):
+        from celery.signals import task_postrun, task_prerun
+        from django.conf import settings
+        from django.db.models.signals import post_delete, post_save
+
+        from core.httpcache import CATALOGS, invalidate_catalog
+        from core.profiling import task_finished, task_started
+
+        for model in CATALOGS:
+            label = model._meta.label_lower
+            post_save.connect(invalidate_catalog, sender=model, dispatch_uid=f'catalog_cache_save_{label}')
+            post_delete.connect(invalidate_catalog, sender=model, dispatch_uid=f'catalog_cache_delete_{label}')
+
+        if settings.QUERY_PROFILING:
+            task_prerun.connect(task_started, dispatch_uid='query_profiling_task_started')
+            task_postrun.connect(task_finished, dispatch_uid='query_profiling_task_finished')
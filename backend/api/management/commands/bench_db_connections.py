@@ -0,0 +1,82 @@
+import threading
+import time
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresWrapper
+
+from core.benchmark import BenchmarkCommand, summarize_latencies
+from core.db.base import DatabaseWrapper as PooledWrapper
+from core.db.pool import DEFAULTS
+
+# Типичный короткий запрос API: значки счетчиков компании
+DEFAULT_QUERY = 'SELECT name, key, SUM(value) FROM companies_counter WHERE company_id = 1 GROUP BY name, key'
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Сравнивает жизненный цикл подключения запроса API без пула (новое подключение на запрос) и с пулом '
+        'core.db: подключение, запрос, закрытие в конце запроса, при разном числе потоков'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Запросов на прогон')
+        parser.add_argument('--threads', type=int, nargs='+', default=[1, 8, 32])
+        parser.add_argument('--max-size', type=int, default=DEFAULTS['max_size'], help='max_size пула')
+        parser.add_argument('--query', default=DEFAULT_QUERY, help='SQL одного запроса')
+
+    def handle(self, *args, **options):
+        settings_dict = connections[DEFAULT_DB_ALIAS].settings_dict
+        plain = {**settings_dict, 'ENGINE': 'django.db.backends.postgresql', 'OPTIONS': {}}
+        pool_options = {**DEFAULTS, 'min_size': 0, 'max_size': options['max_size']}
+        pooled = {**settings_dict, 'ENGINE': 'core.db', 'OPTIONS': {'pool': pool_options}}
+
+        for threads in options['threads']:
+            # Свой пул на прогон: метрики не смешиваются
+            alias = f'bench_{threads}'
+            per_request = self.run(lambda: PostgresWrapper(plain, alias=alias), threads, options)
+            pool_run = self.run(lambda: PooledWrapper(pooled, alias=alias), threads, options)
+            pool = PooledWrapper(pooled, alias=alias).pool
+            stats = pool.stats()
+            pool.close_idle()
+            self.report(f'connections_{threads}_threads', {
+                'threads': threads,
+                'requests': options['requests'],
+                **{f'per_request_{key}': value for key, value in per_request.items()},
+                **{f'pooled_{key}': value for key, value in pool_run.items()},
+                'p50_speedup': per_request['p50_ms'] / pool_run['p50_ms'] if pool_run['p50_ms'] else 0.0,
+                **{f'pool_{key}': stats[key] for key in (
+                    'max_size', 'peak_in_use', 'opened', 'checkouts', 'waits', 'wait_time_ms', 'max_wait_ms',
+                    'timeouts',
+                )},
+            }, options)
+
+    def run(self, make_wrapper, threads, options):
+        """
+        Каждый поток — обработчик запросов со своим подключением Django, как в gunicorn с потоками
+        """
+        per_thread = options['requests'] // threads
+        samples, lock = [], threading.Lock()
+
+        def worker():
+            wrapper = make_wrapper()
+            local = []
+            for _request in range(per_thread):
+                started = time.perf_counter()
+                wrapper.ensure_connection()
+                with wrapper.cursor() as cursor:
+                    cursor.execute(options['query'])
+                    cursor.fetchall()
+                # Конец запроса: CONN_MAX_AGE = 0 закрывает подключение
+                wrapper.close()
+                local.append(time.perf_counter() - started)
+            with lock:
+                samples.extend(local)
+
+        workers = [threading.Thread(target=worker) for _thread in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return {**summarize_latencies(samples), 'requests_per_second': len(samples) / elapsed}
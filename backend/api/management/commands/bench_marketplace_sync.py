@@ -0,0 +1,86 @@
+import asyncio
+import uuid
+
+from api.marketplace_stub import StubMarketplaceServer, stub_barcode
+from api.models import Marketplace
+from api.sync import SyncEngine
+from companies.models import Company
+from core.benchmark import BenchmarkCommand, stopwatch, summarize_latencies
+from products.models import Product
+
+
+class Command(BenchmarkCommand):
+    help = 'Замеряет синхронизацию одного и N маркетплейсов через локальную заглушку API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--marketplaces', type=int, default=200)
+        parser.add_argument('--catalog-size', type=int, default=100)
+        parser.add_argument('--orders', type=int, default=200, help='Заказов на маркетплейс')
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--latency-ms', type=float, default=50.0)
+        parser.add_argument('--concurrency', type=int, default=50, help='Лимит одновременных кабинетов на тип')
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        server = StubMarketplaceServer(
+            ('127.0.0.1', 0),
+            latency=options['latency_ms'] / 1000,
+            catalog_size=options['catalog_size'],
+            orders_count=options['orders'],
+            page_size=options['page_size'],
+            barcode_prefix=run_id,
+        )
+        stub = server.start_in_process()
+
+        company = Company.objects.create(name=f'Benchmark {run_id}', inn=run_id, legal_address='-')
+        try:
+            Product.objects.bulk_create([
+                Product(name=f'Product {n}', article=f'A-{n}', barcode=stub_barcode(n, run_id), company=company)
+                for n in range(options['catalog_size'])
+            ])
+            marketplaces = Marketplace.objects.bulk_create([
+                Marketplace(
+                    name=f'Benchmark {n}', type='wildberries', company=company, api_key=f'{run_id}-{n}',
+                    is_connected=True, is_fbs_enabled=True,
+                )
+                for n in range(options['marketplaces'] + 1)
+            ])
+            engine_options = {
+                'default_base_url': server.url,
+                'base_urls': {},
+                'concurrency': {'default': options['concurrency']},
+            }
+
+            with stopwatch() as elapsed:
+                single = asyncio.run(SyncEngine(**engine_options).sync(marketplaces[:1]))
+            single_seconds = elapsed()
+
+            engine = SyncEngine(**engine_options)
+            with stopwatch() as elapsed:
+                results = asyncio.run(engine.sync(marketplaces[1:]))
+            all_seconds = elapsed()
+
+            # Повторный проход должен выгрузить только изменения после курсора
+            with stopwatch() as elapsed:
+                asyncio.run(SyncEngine(**engine_options).sync(marketplaces[1:]))
+            incremental_seconds = elapsed()
+        finally:
+            stub.terminate()
+            stub.join()
+            server.server_close()
+            company.delete()
+
+        errors = [result.error for result in single + results if result.error]
+        orders = sum(result.items.get('orders', 0) for result in results)
+        self.report('marketplace_sync', {
+            'marketplaces': options['marketplaces'],
+            'latency_ms': options['latency_ms'],
+            'single_seconds': single_seconds,
+            'all_seconds': all_seconds,
+            'all_to_single_ratio': all_seconds / single_seconds,
+            'incremental_seconds': incremental_seconds,
+            'pages': sum(result.pages for result in results),
+            'orders_per_second': orders / all_seconds,
+            'page_latency': summarize_latencies(engine.latencies),
+            'errors': len(errors),
+        }, options)
@@ -0,0 +1,66 @@
+import json
+import platform
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import connection
+from django.utils import timezone
+
+from core.benchmark import BenchmarkCommand
+from core.loadtest import SCENARIOS, LoadContext, dataset_summary, run_scenario
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Нагрузочный набор: прогоняет сценарии API и сервисов на синтетических данных '
+        '(generate_dataset) и сообщает пропускную способность и перцентили задержек'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Компания с данными (по умолчанию первая синтетическая)')
+        parser.add_argument('--iterations', type=int, default=200, help='Операций на сценарий')
+        parser.add_argument('--concurrency', type=int, default=1, help='Параллельных потоков на сценарий')
+        parser.add_argument('--warmup', type=int, default=5, help='Прогревочных операций на поток')
+        parser.add_argument(
+            '--scenario', action='append', choices=[scenario.name for scenario in SCENARIOS],
+            help='Выполнить только этот сценарий (можно указать несколько раз)',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Записать результаты прогона в JSON-файл для сравнения между версиями')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1 or options['concurrency'] < 1 or options['warmup'] < 0:
+            raise CommandError('--iterations and --concurrency must be positive, --warmup non-negative')
+        try:
+            context = LoadContext.load(options['company'], seed=options['seed'])
+        except LookupError as exc:
+            raise CommandError(str(exc))
+
+        started_at = timezone.now()
+        selected = set(options['scenario'] or [])
+        results = {}
+        for scenario in SCENARIOS:
+            if selected and scenario.name not in selected:
+                continue
+            metrics = run_scenario(
+                scenario, context, iterations=options['iterations'], concurrency=options['concurrency'],
+                warmup=options['warmup'],
+            )
+            results[scenario.name] = {'description': scenario.description, **metrics}
+            self.report(scenario.name, results[scenario.name], options)
+
+        if options['output']:
+            document = {
+                'started_at': started_at.isoformat(),
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'debug': settings.DEBUG,
+                'dataset': dataset_summary(context.company),
+                'options': {
+                    key: options[key] for key in ('iterations', 'concurrency', 'warmup', 'seed')
+                },
+                'scenarios': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(document, output, indent=2, default=str)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
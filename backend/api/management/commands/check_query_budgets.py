@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.urls import reverse
+
+from core.datagen import DatasetGenerator
+from core.loadtest import LoadContext
+from core.profiling import check_endpoint_budget
+
+from .check_query_plans import SEED_COMPANIES, SEED_SCALE, SEED_TREE, Seeded
+
+# Конечные точки и параметры, на которых проверяются объявленные бюджеты запросов
+PROBES = [
+    ('counter-badges', {}),
+    ('report-dashboard', {}),
+    ('order-list', {'page_size': 100}),
+    ('order-list', {'page_size': 100, 'total': 'approximate'}),
+    ('order-list', {'page_size': 100, 'expand': 'items.product,marketplace,shipping_warehouse'}),
+    ('order-list', {'page_size': 100, 'fields': 'id,status,items.quantity,items.product.name'}),
+    ('product-list', {'page_size': 100}),
+    ('warehouse-list', {}),
+    ('storage-unit-list', {'page_size': 100}),
+    ('service-list', {}),
+    ('marketplace-list', {}),
+    ('supply-list', {'page_size': 100, 'expand': 'items.product,source_warehouse,destination_warehouse'}),
+    ('shipment-list', {'page_size': 100, 'expand': 'shipment_orders.order.items.product,warehouse'}),
+    ('inventory-list', {'page_size': 100, 'expand': 'items.product,warehouse'}),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет бюджеты запросов конечных точек API: загружает синтетический набор (откатывается после '
+        'проверки), выполняет GET от пользователя компании и завершается ошибкой, если запросов больше объявленного'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--company', type=int,
+            help='Проверять на данных этой компании без загрузки набора (например, после generate_dataset)',
+        )
+
+    def handle(self, *args, **options):
+        if options['company'] is not None:
+            failed = self.check_budgets(LoadContext.load(options['company']))
+        else:
+            try:
+                with transaction.atomic():
+                    generator = DatasetGenerator(companies=SEED_COMPANIES, scale=SEED_SCALE, tree=SEED_TREE)
+                    company_ids = generator.generate()
+                    self.stdout.write(f'Seeded {sum(generator.counts.values())} rows')
+                    failed = self.check_budgets(LoadContext.load(company_ids[0]))
+                    raise Seeded
+            except Seeded:
+                pass
+        if failed:
+            raise CommandError(f'{failed} endpoints exceed their query budgets')
+        self.stdout.write(self.style.SUCCESS(f'{len(PROBES)} endpoint requests are within their query budgets'))
+
+    def check_budgets(self, context):
+        client = context.client()
+        failed = 0
+        for name, params in PROBES:
+            path = reverse(name)
+            label = f'{path}?{"&".join(f"{key}={value}" for key, value in params.items())}' if params else path
+            try:
+                current, budget = check_endpoint_budget(client, path, params, label=label)
+            except AssertionError as exc:
+                failed += 1
+                self.stdout.write(self.style.ERROR(str(exc)))
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f'{label}: {current.count}/{budget} queries, {current.duplicates} duplicates, '
+                f'{current.time * 1000:.1f} ms in the database'
+            ))
+        return failed
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.datagen import DatasetGenerator
+from core.loadtest import LoadContext
+from core.queryplans import DEFAULT_MIN_PAGES, HOT_QUERIES, check_query
+
+# Набор, на котором откалиброваны бюджеты стоимости горячих запросов
+SEED_COMPANIES = 4
+SEED_SCALE = 0.1
+SEED_TREE = (10, 10, 4, 3, 2)
+
+
+class Seeded(Exception):
+    """
+    Откат загруженного набора после проверки
+    """
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет планы горячих запросов: загружает синтетический набор (откатывается после проверки), '
+        'выполняет EXPLAIN и завершается ошибкой при последовательном чтении или превышении бюджета стоимости'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--company', type=int,
+            help='Проверять на данных этой компании без загрузки набора (например, после generate_dataset)',
+        )
+        parser.add_argument('--query', action='append', choices=[query.name for query in HOT_QUERIES])
+        parser.add_argument('--cost-scale', type=float, default=1.0, help='Множитель бюджетов стоимости')
+        parser.add_argument(
+            '--min-pages', type=int, default=DEFAULT_MIN_PAGES,
+            help='Последовательное чтение таблицы меньшего размера (в страницах) допустимо',
+        )
+        parser.add_argument('--verbose-sql', action='store_true', help='Печатать SQL проверенных запросов')
+
+    def handle(self, *args, **options):
+        selected = set(options['query'] or [])
+        queries = [query for query in HOT_QUERIES if not selected or query.name in selected]
+        if options['company'] is not None:
+            failed = self.check_plans(queries, LoadContext.load(options['company']), options)
+        else:
+            # Загрузка набора блокирует таблицы до конца транзакции: только для тестовой базы
+            try:
+                with transaction.atomic():
+                    generator = DatasetGenerator(companies=SEED_COMPANIES, scale=SEED_SCALE, tree=SEED_TREE)
+                    company_ids = generator.generate()
+                    self.stdout.write(f'Seeded {sum(generator.counts.values())} rows')
+                    failed = self.check_plans(queries, LoadContext.load(company_ids[0]), options)
+                    raise Seeded
+            except Seeded:
+                pass
+        if failed:
+            raise CommandError(f'{failed} hot queries have plan regressions')
+        self.stdout.write(self.style.SUCCESS(f'{len(queries)} hot queries passed plan checks'))
+
+    def check_plans(self, queries, context, options):
+        failed = 0
+        for query in queries:
+            checks = check_query(query, context, cost_scale=options['cost_scale'], min_pages=options['min_pages'])
+            if not checks:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'{query.name}: no statements read the checked tables'))
+                continue
+            if not all(check.ok for check in checks):
+                failed += 1
+            for check in checks:
+                style = self.style.SUCCESS if check.ok else self.style.ERROR
+                self.stdout.write(style(
+                    f'{query.name}: cost {check.cost:.0f}/{check.budget:.0f}, {", ".join(check.scans)}'
+                ))
+                for problem in check.problems:
+                    self.stdout.write(self.style.ERROR(f'  {problem}'))
+                if options['verbose_sql'] or not check.ok:
+                    self.stdout.write(f'  {check.sql}')
+        return failed
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import stopwatch
+from core.datagen import DEFAULT_TREE, PROFILE, DatasetGenerator
+
+
+def _tree(value):
+    levels = tuple(int(part) for part in value.split(','))
+    if len(levels) != len(DEFAULT_TREE) or min(levels[:4]) < 1 or levels[4] < 0:
+        raise ValueError(value)
+    return levels
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает синтетический набор данных для нагрузочных замеров через COPY. '
+        f'Объем одной компании при --scale 1: {PROFILE["orders"]} заказов, {PROFILE["products"]} товаров, '
+        f'{PROFILE["warehouses"]} склада'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=10)
+        parser.add_argument('--scale', type=float, default=1.0, help='Множитель объема данных одной компании')
+        parser.add_argument('--days', type=int, default=365, help='Глубина истории заказов в днях')
+        parser.add_argument(
+            '--tree', type=_tree, default=DEFAULT_TREE,
+            help='Ветвление дерева единиц хранения: проходы,стеллажи,полки,ячейки,коробки (например 20,20,4,3,2)',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--password', default='synthetic', help='Пароль пользователей synthetic-<ID компании>')
+
+    def handle(self, *args, **options):
+        if options['companies'] < 1 or options['scale'] <= 0:
+            raise CommandError('--companies and --scale must be positive')
+        generator = DatasetGenerator(
+            companies=options['companies'], scale=options['scale'], days=options['days'], tree=options['tree'],
+            seed=options['seed'], password=options['password'], stdout=self.stdout,
+        )
+        with stopwatch() as elapsed:
+            company_ids = generator.generate()
+        seconds = elapsed()
+
+        total = sum(generator.counts.values())
+        for label, count in sorted(generator.counts.items()):
+            self.stdout.write(f'  {label}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {total} rows for companies {company_ids[0]}..{company_ids[-1]} '
+            f'in {seconds:.1f} s ({total / seconds:.0f} rows/s)'
+        ))
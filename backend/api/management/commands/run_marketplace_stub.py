@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from api.marketplace_stub import StubMarketplaceServer
+
+
+class Command(BaseCommand):
+    help = 'Запускает локальную заглушку API маркетплейса'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=float, default=50.0, help='Задержка ответа на страницу')
+        parser.add_argument('--catalog-size', type=int, default=500)
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--page-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        server = StubMarketplaceServer(
+            (options['host'], options['port']),
+            latency=options['latency_ms'] / 1000,
+            catalog_size=options['catalog_size'],
+            orders_count=options['orders'],
+            page_size=options['page_size'],
+        )
+        self.stdout.write(f'Marketplace stub listening on {server.url}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Marketplace
+from api.sync import sync_marketplaces
+
+
+class Command(BaseCommand):
+    help = 'Инкрементально синхронизирует товары, заказы и остатки подключенных маркетплейсов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--marketplace', type=int, action='append', help='ID маркетплейса (можно несколько)')
+
+    def handle(self, *args, **options):
+        marketplaces = Marketplace.objects.filter(is_connected=True)
+        if options['marketplace']:
+            marketplaces = marketplaces.filter(pk__in=options['marketplace'])
+
+        failed = 0
+        for result in sync_marketplaces(marketplaces):
+            if result.error:
+                failed += 1
+                self.stderr.write(f'Marketplace {result.marketplace_id}: {result.error}')
+            else:
+                self.stdout.write(
+                    f'Marketplace {result.marketplace_id}: {result.pages} pages, {result.items} '
+                    f'in {result.seconds:.2f}s' + (f', skipped {result.skipped}' if result.skipped else '')
+                )
+        if failed:
+            self.stderr.write(self.style.ERROR(f'{failed} marketplaces failed to sync'))
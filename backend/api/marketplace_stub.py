@@ -0,0 +1,162 @@
+"""
+Локальная заглушка API маркетплейса для офлайн-замеров синхронизации.
+
+Отдает детерминированные товары, заказы и остатки по протоколу
+MarketplaceClient. Набор данных определяется API-ключом кабинета, штрихкоды
+товаров имеют вид <prefix>00000001 ... (см. stub_barcode).
+"""
+import json
+import multiprocessing
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+STUB_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def stub_barcode(index, prefix='STUB'):
+    return f'{prefix}{index:08d}'
+
+
+class StubDataset:
+    """
+    Данные одного кабинета; все изменения лежат в интервале [STUB_EPOCH, STUB_EPOCH + span)
+    """
+
+    def __init__(self, api_key, catalog_size, orders_count, barcode_prefix='STUB', span=timedelta(days=30)):
+        seed = zlib.crc32(api_key.encode())
+        step = span / max(orders_count, catalog_size, 1)
+
+        self.products = [
+            {
+                'external_id': f'{seed}-{n}',
+                'barcode': stub_barcode(n, barcode_prefix),
+                'external_barcode': f'{seed % 100000:05d}{n:08d}',
+                'external_article': f'ART-{n}',
+                'is_active': True,
+                'updated_at': STUB_EPOCH + step * n,
+            }
+            for n in range(catalog_size)
+        ]
+        self.orders = [
+            {
+                'external_id': f'{seed}-{n}',
+                'status': 'new',
+                'total_price': f'{100 + (seed + n) % 9900}.00',
+                'weight': 100 + (seed + n) % 5000,
+                'items': [{
+                    'barcode': stub_barcode((seed + n) % catalog_size, barcode_prefix),
+                    'quantity': 1 + n % 3,
+                    'price': '99.00',
+                }],
+                'updated_at': STUB_EPOCH + step * n,
+            }
+            for n in range(orders_count)
+        ] if catalog_size else []
+        self.stocks = [
+            {
+                'external_id': product['external_id'],
+                'quantity': (seed + n) % 500,
+                'updated_at': product['updated_at'],
+            }
+            for n, product in enumerate(self.products)
+        ]
+
+    def page(self, resource, since, until, offset, limit):
+        rows = [
+            row for row in getattr(self, resource)
+            if (since is None or row['updated_at'] > since) and row['updated_at'] <= until
+        ]
+        page = rows[offset:offset + limit]
+        next_token = str(offset + limit) if offset + limit < len(rows) else None
+        items = [{key: value for key, value in row.items() if key != 'updated_at'} for row in page]
+        return items, next_token
+
+
+class StubMarketplaceServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency=0.0, catalog_size=500, orders_count=1000, page_size=500,
+                 barcode_prefix='STUB'):
+        super().__init__(address, StubRequestHandler)
+        self.latency = latency
+        self.barcode_prefix = barcode_prefix
+        self.catalog_size = catalog_size
+        self.orders_count = orders_count
+        self.page_size = page_size
+        self.requests_count = 0
+        self._datasets = {}
+        self._lock = threading.Lock()
+
+    def dataset(self, api_key):
+        with self._lock:
+            self.requests_count += 1
+            if api_key not in self._datasets:
+                self._datasets[api_key] = StubDataset(
+                    api_key, self.catalog_size, self.orders_count, self.barcode_prefix
+                )
+            return self._datasets[api_key]
+
+    def start_in_thread(self):
+        thread = threading.Thread(target=self.serve_forever, name='marketplace-stub', daemon=True)
+        thread.start()
+        return thread
+
+    def start_in_process(self):
+        """
+        Запускает обслуживание в дочернем процессе, чтобы заглушка не делила GIL с клиентом
+        """
+        process = multiprocessing.get_context('fork').Process(
+            target=self.serve_forever, name='marketplace-stub', daemon=True
+        )
+        process.start()
+        return process
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело пишутся отдельно; без TCP_NODELAY ответ ждет отложенного ACK клиента
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        resource = url.path.rsplit('/', 1)[-1]
+        if not url.path.startswith('/v1/') or resource not in ('products', 'orders', 'stocks'):
+            return self._send(404, {'error': 'not found'})
+
+        api_key = self.headers.get('Authorization')
+        if not api_key:
+            return self._send(401, {'error': 'missing API key'})
+
+        query = parse_qs(url.query)
+        try:
+            since = datetime.fromisoformat(query['since'][0]) if 'since' in query else None
+            until = datetime.fromisoformat(query['until'][0])
+            offset = int(query.get('page_token', ['0'])[0])
+        except (KeyError, ValueError):
+            return self._send(400, {'error': 'invalid query'})
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        items, next_token = self.server.dataset(api_key).page(resource, since, until, offset, self.server.page_size)
+        self._send(200, {'items': items, 'next_page_token': next_token})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
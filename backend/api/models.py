@@ -46,6 +46,82 @@ class Marketplace(models.Model):
     class Meta:
         verbose_name = _('marketplace')
         verbose_name_plural = _('marketplaces')
+        indexes = [
+            # Водяной знак справочника компании (см. core.httpcache)
+            models.Index(fields=['company', 'updated_at'], name='marketplace_company_upd_idx'),
+        ]
         
     def __str__(self):
         return f"{self.name} ({self.get_type_display()})"
+
+
+class MarketplaceSyncState(models.Model):
+    """
+    Контрольная точка синхронизации ресурса маркетплейса
+    """
+    RESOURCES = (
+        ('products', _('Products')),
+        ('orders', _('Orders')),
+        ('stocks', _('Stocks')),
+    )
+    
+    marketplace = models.ForeignKey(
+        Marketplace,
+        on_delete=models.CASCADE,
+        related_name='sync_states'
+    )
+    
+    resource = models.CharField(_('resource'), max_length=20, choices=RESOURCES)
+    
+    # Изменения до cursor уже загружены; текущее окно выгрузки — (cursor, window_end]
+    cursor = models.DateTimeField(_('cursor'), blank=True, null=True)
+    window_end = models.DateTimeField(_('window end'), blank=True, null=True)
+    page_token = models.CharField(_('page token'), max_length=255, blank=True, null=True)
+    
+    last_error = models.TextField(_('last error'), blank=True, null=True)
+    
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+    
+    class Meta:
+        verbose_name = _('marketplace sync state')
+        verbose_name_plural = _('marketplace sync states')
+        unique_together = ('marketplace', 'resource')
+        
+    def __str__(self):
+        return f"{self.marketplace_id} {self.resource} at {self.cursor}"
+
+
+class QueryStats(models.Model):
+    """
+    Часовая сводка запросов к базе по конечной точке API или задаче Celery (см. core.profiling)
+    """
+    KINDS = (
+        ('request', _('Request')),
+        ('task', _('Task')),
+    )
+    
+    kind = models.CharField(_('kind'), max_length=10, choices=KINDS)
+    # "GET orders/" для запросов, имя задачи для задач
+    name = models.CharField(_('name'), max_length=255)
+    period = models.DateTimeField(_('period'))
+    
+    calls = models.IntegerField(_('calls'), default=0)
+    queries = models.BigIntegerField(_('queries'), default=0)
+    duplicates = models.BigIntegerField(_('duplicate queries'), default=0)
+    db_time = models.FloatField(_('DB time, s'), default=0)
+    max_queries = models.IntegerField(_('max queries'), default=0)
+    max_db_time = models.FloatField(_('max DB time, s'), default=0)
+    over_budget = models.IntegerField(_('calls over query budget'), default=0)
+    # [[время, SQL], ...] — самые медленные операторы (без параметров) по убыванию времени
+    slowest = models.JSONField(_('slowest statements'), default=list)
+    
+    class Meta:
+        verbose_name = _('query stats')
+        verbose_name_plural = _('query stats')
+        unique_together = ('kind', 'name', 'period')
+        indexes = [
+            models.Index(fields=['period'], name='query_stats_period_idx'),
+        ]
+        
+    def __str__(self):
+        return f"{self.name} at {self.period}"
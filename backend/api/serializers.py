@@ -0,0 +1,11 @@
+from core.fieldsets import FieldsetSerializer
+
+from .models import Marketplace
+
+
+class MarketplaceSerializer(FieldsetSerializer):
+    # Без ключей API: маркетплейс раскрывается в ответах других списков
+    class Meta:
+        model = Marketplace
+        fields = ('id', 'name', 'type', 'is_fbs_enabled', 'is_connected', 'last_sync')
+        read_only_fields = fields
@@ -0,0 +1,343 @@
+"""
+Инкрементальная синхронизация маркетплейсов.
+
+Все подключенные маркетплейсы синхронизируются одновременно в asyncio:
+HTTP-запросы идут через общий пул соединений на тип маркетплейса, число
+одновременно синхронизируемых кабинетов ограничено для каждого типа из
+MARKETPLACE_TYPES, а запись в БД выполняется в отдельном пуле потоков.
+
+Для каждого ресурса (товары, заказы, остатки) хранится контрольная точка
+MarketplaceSyncState: курсор (начальное значение — Marketplace.last_sync),
+граница текущего окна и токен следующей страницы. Точка сохраняется в одной
+транзакции с данными страницы, поэтому после сбоя синхронизация
+продолжается с первой незагруженной страницы.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import aiohttp
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from orders.ingestion import ingest_orders
+from products.models import Product, ProductMarketplace
+
+from .models import Marketplace, MarketplaceSyncState
+
+logger = logging.getLogger(__name__)
+
+RESOURCES = ('products', 'orders', 'stocks')
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
+
+STOCK_QUANTITY_MAX = 2 ** 31 - 1
+
+
+@dataclass
+class SyncResult:
+    """
+    Итог синхронизации одного маркетплейса
+    """
+    marketplace_id: int
+    pages: int = 0
+    items: dict = field(default_factory=dict)
+    skipped: dict = field(default_factory=dict)
+    error: str = None
+    seconds: float = 0.0
+
+
+class MarketplaceClient:
+    """
+    HTTP-клиент маркетплейса.
+
+    Реализует общий протокол постраничной выгрузки изменений:
+    GET /v1/<resource>?since=&until=&page_token= ->
+    {"items": [...], "next_page_token": "..." | null}.
+    Адаптеры конкретных маркетплейсов переопределяют fetch_page.
+    """
+
+    def __init__(self, http, marketplace, latencies=None):
+        self.http = http
+        self.marketplace = marketplace
+        self.latencies = latencies if latencies is not None else []
+
+    def headers(self):
+        headers = {'Authorization': self.marketplace.api_key or ''}
+        if self.marketplace.client_id:
+            headers['Client-Id'] = self.marketplace.client_id
+        return headers
+
+    async def fetch_page(self, resource, since, until, page_token):
+        params = {'until': until.isoformat()}
+        if since is not None:
+            params['since'] = since.isoformat()
+        if page_token:
+            params['page_token'] = page_token
+
+        for attempt in range(MAX_RETRIES + 1):
+            started = time.perf_counter()
+            async with self.http.get(f'/v1/{resource}', params=params, headers=self.headers()) as response:
+                if response.status in RETRY_STATUSES and attempt < MAX_RETRIES:
+                    self.latencies.append(time.perf_counter() - started)
+                    await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+                    continue
+                response.raise_for_status()
+                data = await response.json()
+                self.latencies.append(time.perf_counter() - started)
+                return data.get('items', []), data.get('next_page_token')
+
+
+def _external_id(value):
+    return value if isinstance(value, str) and 0 < len(value) <= 100 else None
+
+
+def _quantity(value):
+    # Остаток приходит числом или строкой с числом; все остальное — ошибка данных маркетплейса
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value <= STOCK_QUANTITY_MAX:
+        return None
+    return value
+
+
+def _apply_products(marketplace, items, now):
+    valid = [
+        item for item in items
+        if isinstance(item, dict) and isinstance(item.get('barcode'), str) and _external_id(item.get('external_id'))
+    ]
+    products = dict(
+        Product.objects.filter(company_id=marketplace.company_id, barcode__in={item['barcode'] for item in valid})
+        .values_list('barcode', 'id')
+    )
+    # Товары без карточки в системе не связываются и не считаются пропущенными
+    known = [item for item in valid if item['barcode'] in products]
+    # Один товар может прийти на странице дважды; ON CONFLICT не обновляет строку два раза,
+    # поэтому побеждает последняя карточка
+    links = {}
+    for item in known:
+        links[products[item['barcode']]] = ProductMarketplace(
+            product_id=products[item['barcode']],
+            marketplace_id=marketplace.pk,
+            external_id=item['external_id'],
+            external_barcode=item.get('external_barcode'),
+            external_article=item.get('external_article'),
+            is_active=item.get('is_active', True),
+            last_sync=now,
+        )
+    ProductMarketplace.objects.bulk_create(
+        list(links.values()),
+        update_conflicts=True,
+        unique_fields=['product', 'marketplace'],
+        update_fields=['external_id', 'external_barcode', 'external_article', 'is_active', 'last_sync', 'updated_at'],
+    )
+    return len(links), len(items) - len(valid) + len(known) - len(links)
+
+
+def _apply_orders(marketplace, items, now):
+    result = ingest_orders(marketplace, items)
+    return result.created + result.updated + result.unchanged, result.duplicates + len(result.rejected)
+
+
+def _apply_stocks(marketplace, items, now):
+    stocks = {}
+    for item in items:
+        if isinstance(item, dict) and _external_id(item.get('external_id')):
+            quantity = _quantity(item.get('quantity'))
+            if quantity is not None:
+                stocks[item['external_id']] = quantity
+    table = ProductMarketplace._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {table} AS link
+            SET stock_quantity = src.quantity, last_sync = %s
+            FROM unnest(%s::varchar[], %s::integer[]) AS src(external_id, quantity)
+            WHERE link.marketplace_id = %s AND link.external_id = src.external_id
+            """,
+            [now, list(stocks), list(stocks.values()), marketplace.pk],
+        )
+        return cursor.rowcount, len(items) - len(stocks)
+
+
+APPLY_HANDLERS = {
+    'products': _apply_products,
+    'orders': _apply_orders,
+    'stocks': _apply_stocks,
+}
+
+
+def _open_windows(marketplaces):
+    """
+    Загружает контрольные точки всех ресурсов набора маркетплейсов.
+
+    Недостающие точки создаются с курсором Marketplace.last_sync; для точек
+    с завершенным окном открывается новое окно до текущего момента.
+    """
+    wanted = {(marketplace.pk, resource): marketplace for marketplace in marketplaces
+              for resource in _resources_for(marketplace)}
+    states = {
+        (state.marketplace_id, state.resource): state
+        for state in MarketplaceSyncState.objects.filter(marketplace__in=marketplaces)
+        if (state.marketplace_id, state.resource) in wanted
+    }
+    now = timezone.now()
+    MarketplaceSyncState.objects.bulk_create([
+        MarketplaceSyncState(marketplace=marketplace, resource=resource, cursor=marketplace.last_sync)
+        for (marketplace_id, resource), marketplace in wanted.items()
+        if (marketplace_id, resource) not in states
+    ], ignore_conflicts=True)
+    MarketplaceSyncState.objects.filter(marketplace__in=marketplaces, window_end__isnull=True).update(
+        window_end=now, page_token=None, updated_at=now
+    )
+    return {
+        (state.marketplace_id, state.resource): state
+        for state in MarketplaceSyncState.objects.filter(marketplace__in=marketplaces)
+    }
+
+
+def _apply_page(marketplace, state, items, next_page_token):
+    """
+    Применяет страницу и сдвигает контрольную точку в одной транзакции.
+
+    Возвращает (применено, пропущено): некорректные записи и повторы пропускаются,
+    чтобы одна плохая запись не останавливала синхронизацию на этой странице.
+    """
+    with transaction.atomic():
+        count, skipped = APPLY_HANDLERS[state.resource](marketplace, items, timezone.now()) if items else (0, 0)
+        if next_page_token:
+            state.page_token = next_page_token
+        else:
+            state.cursor = state.window_end
+            state.window_end = None
+            state.page_token = None
+        state.last_error = None
+        state.save(update_fields=['cursor', 'window_end', 'page_token', 'last_error', 'updated_at'])
+    return count, skipped
+
+
+def _record_error(state, error):
+    MarketplaceSyncState.objects.filter(pk=state.pk).update(last_error=error, updated_at=timezone.now())
+
+
+def _finish(marketplaces):
+    """
+    Переносит курсоры ресурсов в Marketplace.last_sync (products_count поддерживают триггеры, см. companies.counters)
+    """
+    cursors = {}
+    for marketplace_id, resource, cursor in MarketplaceSyncState.objects.filter(
+        marketplace__in=marketplaces
+    ).values_list('marketplace_id', 'resource', 'cursor'):
+        cursors.setdefault(marketplace_id, {})[resource] = cursor
+    now = timezone.now()
+    for marketplace in marketplaces:
+        resource_cursors = [cursors.get(marketplace.pk, {}).get(resource) for resource in _resources_for(marketplace)]
+        # last_sync — момент, до которого загружены все ресурсы кабинета
+        marketplace.last_sync = None if None in resource_cursors else min(resource_cursors)
+        marketplace.updated_at = now
+    Marketplace.objects.bulk_update(marketplaces, ['last_sync', 'updated_at'], batch_size=500)
+
+
+def _in_thread(func, *args):
+    # Подключение потока пула возвращается после каждого вызова, иначе оно остается занятым до конца процесса
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+def _resources_for(marketplace):
+    # Заказы FBS выгружаются только для кабинетов с включенной схемой FBS
+    return [resource for resource in RESOURCES if resource != 'orders' or marketplace.is_fbs_enabled]
+
+
+class SyncEngine:
+    """
+    Параллельная синхронизация набора маркетплейсов
+    """
+
+    def __init__(self, concurrency=None, base_urls=None, default_base_url=None, timeout=None, db_workers=None):
+        self.concurrency = concurrency or settings.MARKETPLACE_SYNC_CONCURRENCY
+        self.base_urls = base_urls if base_urls is not None else settings.MARKETPLACE_API_URLS
+        self.default_base_url = default_base_url or settings.MARKETPLACE_API_URL
+        self.timeout = timeout or settings.MARKETPLACE_SYNC_TIMEOUT
+        self.db_workers = db_workers or 4
+        self.latencies = []
+
+    def _limit(self, marketplace_type):
+        return self.concurrency.get(marketplace_type, self.concurrency.get('default', 10))
+
+    async def _db(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, _in_thread, func, *args)
+
+    async def sync(self, marketplaces):
+        types = {marketplace.type for marketplace in marketplaces}
+        self._semaphores = {t: asyncio.Semaphore(self._limit(t)) for t in types}
+        self._clients = {
+            t: aiohttp.ClientSession(
+                self.base_urls.get(t, self.default_base_url),
+                connector=aiohttp.TCPConnector(limit=self._limit(t)),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            for t in types
+        }
+        self._executor = ThreadPoolExecutor(max_workers=self.db_workers, thread_name_prefix='marketplace-sync-db')
+        try:
+            states = await self._db(_open_windows, marketplaces)
+            results = await asyncio.gather(*(
+                self._sync_marketplace(marketplace, states) for marketplace in marketplaces
+            ))
+            await self._db(_finish, marketplaces)
+            return results
+        finally:
+            for client in self._clients.values():
+                await client.close()
+            self._executor.shutdown(wait=True)
+
+    async def _sync_marketplace(self, marketplace, states):
+        result = SyncResult(marketplace_id=marketplace.pk)
+        async with self._semaphores[marketplace.type]:
+            started = time.perf_counter()
+            client = MarketplaceClient(self._clients[marketplace.type], marketplace, self.latencies)
+            try:
+                for resource in _resources_for(marketplace):
+                    await self._sync_resource(client, marketplace, states[marketplace.pk, resource], result)
+            except Exception as exc:
+                # Сбой одного кабинета не должен останавливать остальные
+                result.error = f'{type(exc).__name__}: {exc}'
+                logger.warning('Marketplace %s sync failed: %s', marketplace.pk, result.error)
+            result.seconds = time.perf_counter() - started
+        return result
+
+    async def _sync_resource(self, client, marketplace, state, result):
+        while True:
+            try:
+                items, next_page_token = await client.fetch_page(
+                    state.resource, state.cursor, state.window_end, state.page_token
+                )
+                count, skipped = await self._db(_apply_page, marketplace, state, items, next_page_token)
+            except Exception as exc:
+                await self._db(_record_error, state, f'{type(exc).__name__}: {exc}')
+                raise
+            result.pages += 1
+            result.items[state.resource] = result.items.get(state.resource, 0) + count
+            if skipped:
+                result.skipped[state.resource] = result.skipped.get(state.resource, 0) + skipped
+                logger.warning('Marketplace %s %s: skipped %s items', marketplace.pk, state.resource, skipped)
+            if not next_page_token:
+                return
+
+
+def sync_marketplaces(marketplaces=None, **engine_options):
+    """
+    Синхронно запускает синхронизацию (по умолчанию — всех подключенных маркетплейсов)
+    """
+    if marketplaces is None:
+        marketplaces = Marketplace.objects.filter(is_connected=True)
+    # ORM нельзя вызывать внутри цикла событий, поэтому список загружается заранее
+    return asyncio.run(SyncEngine(**engine_options).sync(list(marketplaces)))
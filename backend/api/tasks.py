@@ -0,0 +1,15 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.celery import app
+
+from .models import QueryStats
+
+
+@app.task(name='api.prune_query_stats')
+def prune_query_stats():
+    before = timezone.now() - timedelta(days=settings.QUERY_PROFILING_RETENTION_DAYS)
+    deleted, _by_model = QueryStats.objects.filter(period__lt=before).delete()
+    return deleted
@@ -0,0 +1,43 @@
+from django.urls import path, re_path
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from companies.views import CounterBadgesView
+from orders.views import ArchivedOrderView, OrderIngestView, OrderListView, WavePickListView, WavePlanView
+from products.views import BarcodeResolveView, ImageRenditionView, ProductImageListView, ProductListView
+from reports.views import (
+    DashboardView, InventoryListView, ReportCancelView, ReportGenerateView, ReportProgressView,
+)
+from services.views import ServiceListView
+from shipments.views import ShipmentListView
+from supplies.views import SupplyListView
+from warehouses.views import StorageUnitListView, WarehouseListView
+
+from .views import DatabasePoolView, MarketplaceListView, QueryStatsView
+
+urlpatterns = [
+    path('token/', TokenObtainPairView.as_view(), name='token-obtain'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
+    path('counters/', CounterBadgesView.as_view(), name='counter-badges'),
+    path('orders/', OrderListView.as_view(), name='order-list'),
+    path('orders/ingest/', OrderIngestView.as_view(), name='order-ingest'),
+    path('orders/waves/plan/', WavePlanView.as_view(), name='wave-plan'),
+    path('orders/waves/pick-lists/', WavePickListView.as_view(), name='wave-pick-lists'),
+    path('orders/archive/', ArchivedOrderView.as_view(), name='order-archive'),
+    path('products/', ProductListView.as_view(), name='product-list'),
+    path('products/images/', ProductImageListView.as_view(), name='product-image-list'),
+    re_path(r'^images/(?P<sha256>[0-9a-f]{64})/(?P<size>\w+)/$', ImageRenditionView.as_view(), name='image-rendition'),
+    path('warehouses/', WarehouseListView.as_view(), name='warehouse-list'),
+    path('storage-units/', StorageUnitListView.as_view(), name='storage-unit-list'),
+    path('services/', ServiceListView.as_view(), name='service-list'),
+    path('marketplaces/', MarketplaceListView.as_view(), name='marketplace-list'),
+    path('supplies/', SupplyListView.as_view(), name='supply-list'),
+    path('shipments/', ShipmentListView.as_view(), name='shipment-list'),
+    path('inventories/', InventoryListView.as_view(), name='inventory-list'),
+    path('barcodes/resolve/', BarcodeResolveView.as_view(), name='barcode-resolve'),
+    path('profiling/queries/', QueryStatsView.as_view(), name='query-stats'),
+    path('profiling/pool/', DatabasePoolView.as_view(), name='database-pool'),
+    path('reports/dashboard/', DashboardView.as_view(), name='report-dashboard'),
+    path('reports/<int:pk>/generate/', ReportGenerateView.as_view(), name='report-generate'),
+    path('reports/<int:pk>/progress/', ReportProgressView.as_view(), name='report-progress'),
+    path('reports/<int:pk>/cancel/', ReportCancelView.as_view(), name='report-cancel'),
+]
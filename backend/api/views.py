@@ -0,0 +1,118 @@
+import heapq
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max, Sum
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import ListAPIView
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.db.pool import pools
+from core.fieldsets import FieldsetMixin
+from core.httpcache import CatalogCacheMixin
+from core.replicas import replica_status
+
+from .models import Marketplace, QueryStats
+from .serializers import MarketplaceSerializer
+
+MAX_STATS_HOURS = 24 * 14
+
+
+class MarketplaceListView(CatalogCacheMixin, FieldsetMixin, ListAPIView):
+    """
+    Маркетплейсы компании от новых к старым, постранично по ключу (created_at, id); поддерживает If-None-Match.
+
+    GET ?type=<тип>&fields=id,name,is_connected&cursor=...
+    """
+    # Пользователь токена, водяной знак справочника и страница
+    query_budget = 3
+    serializer_class = MarketplaceSerializer
+    catalog_model = Marketplace
+
+    def get_queryset(self):
+        queryset = Marketplace.objects.filter(company_id=self.request.user.company_id)
+        marketplace_type = self.request.query_params.get('type')
+        if marketplace_type:
+            queryset = queryset.filter(type=marketplace_type)
+        return queryset
+
+
+class QueryStatsView(APIView):
+    """
+    Запросы к базе по конечным точкам API и задачам Celery за последние часы (см. core.profiling).
+
+    GET ?hours=24&kind=request|task&name=<маршрут или задача>&order=db_time|queries|duplicates|calls
+    """
+    permission_classes = [IsAdminUser]
+    orderings = ('db_time', 'queries', 'duplicates', 'calls')
+
+    def get(self, request):
+        try:
+            hours = min(max(int(request.query_params.get('hours', 24)), 1), MAX_STATS_HOURS)
+        except ValueError:
+            raise ValidationError({'hours': 'Expected an integer number of hours'})
+        order = request.query_params.get('order', 'db_time')
+        if order not in self.orderings:
+            raise ValidationError({'order': f'Expected one of: {", ".join(self.orderings)}'})
+
+        since = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
+        queryset = QueryStats.objects.filter(period__gte=since)
+        for name in ('kind', 'name'):
+            value = request.query_params.get(name)
+            if value:
+                queryset = queryset.filter(**{name: value})
+
+        # Самые медленные операторы часовых сводок: наибольшее время на текст оператора
+        slowest = {}
+        for kind, name, statements in queryset.values_list('kind', 'name', 'slowest').iterator():
+            merged = slowest.setdefault((kind, name), {})
+            for duration, sql in statements:
+                merged[sql] = max(duration, merged.get(sql, 0))
+
+        rows = []
+        totals = queryset.values('kind', 'name').annotate(
+            calls=Sum('calls'), queries=Sum('queries'), duplicates=Sum('duplicates'), db_time=Sum('db_time'),
+            max_queries=Max('max_queries'), max_db_time=Max('max_db_time'), over_budget=Sum('over_budget'),
+        )
+        for total in totals.order_by(f'-{order}', 'kind', 'name'):
+            calls = total['calls'] or 1
+            top = heapq.nlargest(
+                settings.QUERY_PROFILING_SLOWEST, slowest.get((total['kind'], total['name']), {}).items(),
+                key=lambda item: item[1],
+            )
+            rows.append({
+                'kind': total['kind'],
+                'name': total['name'],
+                'calls': total['calls'],
+                'queries': total['queries'],
+                'queries_per_call': round(total['queries'] / calls, 2),
+                'max_queries': total['max_queries'],
+                'duplicates': total['duplicates'],
+                'db_time_ms': round(total['db_time'] * 1000, 1),
+                'db_time_per_call_ms': round(total['db_time'] * 1000 / calls, 2),
+                'max_db_time_ms': round(total['max_db_time'] * 1000, 1),
+                'over_budget': total['over_budget'],
+                'slowest': [{'sql': sql, 'time_ms': round(duration * 1000, 2)} for sql, duration in top],
+            })
+        return Response({'since': since, 'results': rows})
+
+
+class DatabasePoolView(APIView):
+    """
+    Метрики пулов подключений процесса, обслужившего запрос (см. core.db.pool), и отставание реплик.
+
+    GET -> {"pid", "pools": [{"alias", "size", "in_use", "saturation", "checkouts", "waits", "wait_time_ms", ...}],
+            "replicas": [{"alias", "lag", "checked_seconds_ago", "eligible"}]}
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'pid': os.getpid(),
+            'pools': [pool.stats() for pool in pools()],
+            'replicas': replica_status(),
+        })
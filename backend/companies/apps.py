@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class CompaniesConfig(AppConfig):
+    name = 'companies'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+
+        from .signals import install_counter_triggers
+
+        post_migrate.connect(install_counter_triggers, sender=self, dispatch_uid='company_counter_triggers')
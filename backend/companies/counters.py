@@ -0,0 +1,330 @@
+"""
+Денормализованные счетчики компаний и складов.
+
+Счетчик (CounterSpec) считает строки исходной таблицы по компании, по складу
+(если задано поле склада) и по ключу (например, статусу). Значения хранятся
+в Counter и меняются триггерами уровня оператора (core.triggers) в той же
+транзакции, что и исходные строки, — включая пакетную загрузку, сырые
+запросы и queryset.update(). Приращение по оператору одно на группу.
+
+Горячие счетчики разнесены по нескольким строкам-шардам: транзакция
+прибавляет свою разницу к шарду pg_backend_pid() % shards, поэтому
+параллельные загрузки заказов не ждут друг друга на одной строке. Значение
+счетчика — сумма шардов, чтение не зависит от размера исходных таблиц.
+
+Marketplace.products_count поддерживается тем же способом приращением
+(products_count + разница) прямо в строке маркетплейса.
+
+reconcile() сверяет счетчики с исходными таблицами и исправляет
+расхождения приращением, не блокируя запись; заодно сворачивает шарды.
+"""
+from dataclasses import dataclass
+
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.db.models import Sum
+
+from api.models import Marketplace
+from core.triggers import install_statement_triggers
+from orders.models import Order
+from products.models import Product, ProductMarketplace
+from shipments.models import Shipment
+from supplies.models import Supply
+
+from .models import Counter
+
+COUNTER_KEY = 'company_id, COALESCE(warehouse_id, 0), name, key, shard'
+
+OPEN_SUPPLY_STATUSES = ('pending', 'approved', 'in_transit')
+PENDING_SHIPMENT_STATUSES = ('pending', 'approved')
+
+
+@dataclass(frozen=True)
+class CounterSpec:
+    """
+    Описание счетчика: строки model (с условием condition) по компании, складу и ключу
+    """
+    name: str
+    model: type
+    key: str = None
+    warehouse: str = None
+    condition: str = None
+    condition_columns: tuple = ()
+    shards: int = 1
+
+    @property
+    def table(self):
+        return self.model._meta.db_table
+
+    @property
+    def columns(self):
+        """
+        Поля, от которых зависит вклад строки
+        """
+        return tuple(
+            column for column in ('company_id', self.key, self.warehouse, *self.condition_columns) if column
+        )
+
+    def key_sql(self, alias):
+        return f'{alias}.{self.key}' if self.key else "''"
+
+    def condition_sql(self, alias):
+        return self.condition.format(row=alias) if self.condition else 'true'
+
+
+COUNTERS = (
+    # Заказы пишут одновременно загрузка, синхронизация и волны — счетчик шардирован
+    CounterSpec('orders', Order, key='status', warehouse='shipping_warehouse_id', shards=8),
+    CounterSpec('supplies', Supply, key='status', warehouse='destination_warehouse_id'),
+    CounterSpec('shipments', Shipment, key='status', warehouse='warehouse_id'),
+    CounterSpec(
+        'active_products', Product,
+        condition='{row}.is_active AND NOT {row}.is_deleted', condition_columns=('is_active', 'is_deleted'),
+    ),
+)
+
+
+def _delta(spec, alias, sign, source):
+    """
+    Вклад строк source в счетчик: по компании и, если у счетчика есть склад, по складу
+    """
+    where = f'{source} AND {spec.condition_sql(alias)}'
+
+    def select(warehouse):
+        return (
+            f'SELECT {alias}.company_id, {warehouse} AS warehouse_id, {spec.key_sql(alias)} AS key, '
+            f'{sign} AS value {where}'
+        )
+
+    delta = select('NULL::bigint')
+    if spec.warehouse:
+        column = f'{alias}.{spec.warehouse}'
+        delta += f' UNION ALL {select(column)} AND {column} IS NOT NULL'
+    return delta
+
+
+def _changed(columns, old='o', new='n'):
+    old_values = ', '.join(f'{old}.{column}' for column in columns)
+    new_values = ', '.join(f'{new}.{column}' for column in columns)
+    return f'({old_values}) IS DISTINCT FROM ({new_values})'
+
+
+def _apply(spec, delta):
+    shard = f'pg_backend_pid() % {spec.shards}' if spec.shards > 1 else '0'
+    # Строки счетчиков блокируются в одном порядке, чтобы параллельные операторы не взаимоблокировались
+    return f"""
+        INSERT INTO {Counter._meta.db_table} AS c (name, company_id, warehouse_id, key, shard, value, updated_at)
+        SELECT '{spec.name}', company_id, warehouse_id, key, {shard}, SUM(value), clock_timestamp()
+        FROM ({delta}) AS delta
+        GROUP BY company_id, warehouse_id, key
+        HAVING SUM(value) <> 0
+        ORDER BY company_id, warehouse_id, key
+        ON CONFLICT ({COUNTER_KEY}) DO UPDATE SET
+            value = c.value + EXCLUDED.value,
+            updated_at = EXCLUDED.updated_at;
+    """
+
+
+def _apply_products_count(delta):
+    return f"""
+        UPDATE {Marketplace._meta.db_table} AS m SET products_count = m.products_count + d.value
+        FROM (
+            SELECT marketplace_id, SUM(value) AS value FROM ({delta}) AS delta
+            GROUP BY marketplace_id HAVING SUM(value) <> 0
+        ) AS d
+        WHERE m.id = d.marketplace_id;
+    """
+
+
+def _trigger_bodies():
+    """
+    Тела функций триггеров: {(таблица, операция): SQL}
+    """
+    bodies = {}
+    for spec in COUNTERS:
+        changed = f'FROM old_rows o JOIN new_rows n ON n.id = o.id WHERE {_changed(spec.columns)}'
+        for operation, body in (
+            ('INSERT', _apply(spec, _delta(spec, 'n', 1, 'FROM new_rows n WHERE true'))),
+            ('UPDATE', _apply(spec, f"{_delta(spec, 'o', -1, changed)} UNION ALL {_delta(spec, 'n', 1, changed)}")),
+            ('DELETE', _apply(spec, _delta(spec, 'o', -1, 'FROM old_rows o WHERE true'))),
+        ):
+            bodies[spec.table, operation] = bodies.get((spec.table, operation), '') + body
+
+    links = ProductMarketplace._meta.db_table
+    changed_links = 'FROM old_rows o JOIN new_rows n ON n.id = o.id WHERE ' + _changed(('marketplace_id', 'is_active'))
+    bodies[links, 'INSERT'] = _apply_products_count(
+        'SELECT n.marketplace_id, 1 AS value FROM new_rows n WHERE n.is_active'
+    )
+    bodies[links, 'UPDATE'] = _apply_products_count(
+        f'SELECT o.marketplace_id, -1 AS value {changed_links} AND o.is_active '
+        f'UNION ALL SELECT n.marketplace_id, 1 AS value {changed_links} AND n.is_active'
+    )
+    bodies[links, 'DELETE'] = _apply_products_count(
+        'SELECT o.marketplace_id, -1 AS value FROM old_rows o WHERE o.is_active'
+    )
+    return bodies
+
+
+def install_triggers(using=DEFAULT_DB_ALIAS):
+    """
+    Создает (или пересоздает) функции и триггеры поддержки счетчиков
+    """
+    install_statement_triggers(_trigger_bodies(), 'counter', using)
+
+
+def counts(company_id, warehouse_id=None):
+    """
+    Значения счетчиков компании (или ее склада): {счетчик: {ключ: значение}}
+    """
+    values = {}
+    rows = (
+        Counter.objects.filter(company_id=company_id, warehouse_id=warehouse_id)
+        .values_list('name', 'key').annotate(total=Sum('value')).order_by()
+    )
+    for name, key, total in rows:
+        if total:
+            values.setdefault(name, {})[key] = total
+    return values
+
+
+def badges(company_id, warehouse_id=None):
+    """
+    Счетчики для значков интерфейса без подсчета исходных строк
+    """
+    values = counts(company_id, warehouse_id)
+    by_status = {
+        'orders': (values.get('orders', {}), Order.ORDER_STATUSES),
+        'supplies': (values.get('supplies', {}), Supply.SUPPLY_STATUSES),
+        'shipments': (values.get('shipments', {}), Shipment.SHIPMENT_STATUSES),
+    }
+    result = {
+        name: {status: counter.get(status, 0) for status, _label in statuses}
+        for name, (counter, statuses) in by_status.items()
+    }
+    result['open_supplies'] = sum(result['supplies'][status] for status in OPEN_SUPPLY_STATUSES)
+    result['pending_shipments'] = sum(result['shipments'][status] for status in PENDING_SHIPMENT_STATUSES)
+    if warehouse_id is None:
+        result['active_products'] = values.get('active_products', {}).get('', 0)
+        result['marketplace_products'] = dict(
+            Marketplace.objects.filter(company_id=company_id).values_list('pk', 'products_count')
+        )
+    return result
+
+
+def _expected(spec):
+    """
+    Точные значения счетчика по исходной таблице
+    """
+    scope = '(%(company)s::bigint IS NULL OR t.company_id = %(company)s)'
+    select = (
+        f'SELECT t.company_id, {{warehouse}} AS warehouse_id, {spec.key_sql("t")} AS key, COUNT(*) AS value '
+        f'FROM {spec.table} t WHERE {spec.condition_sql("t")} AND {scope}'
+    )
+    expected = select.format(warehouse='NULL::bigint') + ' GROUP BY 1, 3'
+    if spec.warehouse:
+        expected += (
+            f' UNION ALL {select.format(warehouse=f"t.{spec.warehouse}")}'
+            f' AND t.{spec.warehouse} IS NOT NULL GROUP BY 1, 2, 3'
+        )
+    return expected
+
+
+def compact(company_id=None):
+    """
+    Сворачивает шарды счетчиков в нулевой и удаляет нулевые строки; возвращает число удаленных строк
+    """
+    table = Counter._meta.db_table
+    scope = '(%(company)s::bigint IS NULL OR company_id = %(company)s)'
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {table} WHERE shard <> 0 AND {scope}
+                RETURNING name, company_id, warehouse_id, key, value
+            )
+            INSERT INTO {table} AS c (name, company_id, warehouse_id, key, shard, value, updated_at)
+            SELECT name, company_id, warehouse_id, key, 0, SUM(value), clock_timestamp()
+            FROM moved
+            GROUP BY name, company_id, warehouse_id, key
+            ORDER BY company_id, warehouse_id, name, key
+            ON CONFLICT ({COUNTER_KEY}) DO UPDATE SET
+                value = c.value + EXCLUDED.value,
+                updated_at = EXCLUDED.updated_at
+            """,
+            {'company': company_id},
+        )
+        cursor.execute(f'DELETE FROM {table} WHERE value = 0 AND {scope}', {'company': company_id})
+        return cursor.rowcount
+
+
+def reconcile(company_id=None, fix=True):
+    """
+    Сверяет счетчики с исходными таблицами (всех компаний или одной).
+
+    Расхождение считается одним запросом, то есть по одному снимку данных, и
+    прибавляется к счетчику как приращение, поэтому параллельные изменения не
+    теряются. Возвращает расхождения: [(счетчик, компания, склад, ключ, разница)].
+    """
+    if fix:
+        compact(company_id)
+    table = Counter._meta.db_table
+    drifts = []
+    with connection.cursor() as cursor:
+        for spec in COUNTERS:
+            drift = f"""
+                SELECT COALESCE(e.company_id, a.company_id) AS company_id,
+                       COALESCE(e.warehouse_id, a.warehouse_id) AS warehouse_id,
+                       COALESCE(e.key, a.key) AS key,
+                       (COALESCE(e.value, 0) - COALESCE(a.value, 0))::bigint AS value
+                FROM ({_expected(spec)}) AS e
+                FULL JOIN (
+                    SELECT company_id, warehouse_id, key, SUM(value) AS value FROM {table}
+                    WHERE name = %(name)s AND (%(company)s::bigint IS NULL OR company_id = %(company)s)
+                    GROUP BY company_id, warehouse_id, key
+                ) AS a ON a.company_id = e.company_id
+                    AND COALESCE(a.warehouse_id, 0) = COALESCE(e.warehouse_id, 0) AND a.key = e.key
+            """
+            if fix:
+                query = f"""
+                    WITH drift AS ({drift}), fixed AS (
+                        INSERT INTO {table} AS c (name, company_id, warehouse_id, key, shard, value, updated_at)
+                        SELECT %(name)s, company_id, warehouse_id, key, 0, value, clock_timestamp()
+                        FROM drift WHERE value <> 0
+                        ORDER BY company_id, warehouse_id, key
+                        ON CONFLICT ({COUNTER_KEY}) DO UPDATE SET
+                            value = c.value + EXCLUDED.value,
+                            updated_at = EXCLUDED.updated_at
+                    )
+                    SELECT company_id, warehouse_id, key, value FROM drift WHERE value <> 0
+                """
+            else:
+                query = f'SELECT company_id, warehouse_id, key, value FROM ({drift}) AS drift WHERE value <> 0'
+            cursor.execute(query, {'name': spec.name, 'company': company_id})
+            drifts.extend((spec.name, *row) for row in cursor.fetchall())
+
+        marketplaces = Marketplace._meta.db_table
+        drift = f"""
+            SELECT m.company_id, m.id AS marketplace_id, COALESCE(p.value, 0) - m.products_count AS value
+            FROM {marketplaces} m
+            LEFT JOIN (
+                SELECT marketplace_id, COUNT(*) AS value FROM {ProductMarketplace._meta.db_table}
+                WHERE is_active GROUP BY marketplace_id
+            ) AS p ON p.marketplace_id = m.id
+            WHERE COALESCE(p.value, 0) <> m.products_count
+                AND (%(company)s::bigint IS NULL OR m.company_id = %(company)s)
+        """
+        if fix:
+            query = f"""
+                WITH drift AS ({drift}), fixed AS (
+                    UPDATE {marketplaces} AS m SET products_count = m.products_count + d.value
+                    FROM drift d WHERE m.id = d.marketplace_id
+                )
+                SELECT company_id, marketplace_id, value FROM drift
+            """
+        else:
+            query = drift
+        cursor.execute(query, {'company': company_id})
+        drifts.extend(
+            ('marketplace_products', company, None, str(marketplace), value)
+            for company, marketplace, value in cursor.fetchall()
+        )
+    return drifts
@@ -0,0 +1,91 @@
+import uuid
+
+from django.db import connection, transaction
+from django.db.models import Count, Q
+
+from api.models import Marketplace
+from companies.counters import OPEN_SUPPLY_STATUSES, PENDING_SHIPMENT_STATUSES, badges, reconcile
+from companies.models import Company
+from core.benchmark import BenchmarkCommand, stopwatch, summarize_latencies
+from orders.models import Order
+from products.models import Product
+from shipments.models import Shipment
+from supplies.models import Supply
+from warehouses.models import Warehouse
+
+
+class Command(BenchmarkCommand):
+    help = 'Сравнивает чтение значков по счетчикам с подсчетом строк и замеряет цену поддержки счетчиков при загрузке'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000000)
+        parser.add_argument('--batch', type=int, default=5000)
+        parser.add_argument('--repeats', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            run_id = uuid.uuid4().hex[:8]
+            company = Company.objects.create(name=f'Benchmark {run_id}', inn=run_id, legal_address='-')
+            marketplace = Marketplace.objects.create(name='Benchmark', type='wildberries', company=company)
+            warehouses = [
+                Warehouse.objects.create(name=f'Benchmark {n}', type='fulfillment', address='-', company=company).pk
+                for n in range(3)
+            ]
+
+            batches = []
+            for start in range(0, options['orders'], options['batch']):
+                count = min(options['batch'], options['orders'] - start)
+                with stopwatch() as elapsed:
+                    self._insert_orders(company, marketplace, warehouses, start, count, run_id)
+                batches.append(elapsed())
+
+            counter_samples = []
+            for _repeat in range(options['repeats']):
+                with stopwatch() as elapsed:
+                    badges(company.pk)
+                counter_samples.append(elapsed())
+
+            count_samples = []
+            for _repeat in range(max(1, options['repeats'] // 20)):
+                with stopwatch() as elapsed:
+                    list(Order.objects.filter(company=company).values('status').annotate(n=Count('id')).order_by())
+                    Supply.objects.filter(company=company, status__in=OPEN_SUPPLY_STATUSES).count()
+                    Shipment.objects.filter(company=company, status__in=PENDING_SHIPMENT_STATUSES).count()
+                    Product.objects.filter(company=company, is_active=True, is_deleted=False).count()
+                    Marketplace.objects.filter(company=company).aggregate(
+                        products=Count('product_links', filter=Q(product_links__is_active=True))
+                    )
+                count_samples.append(elapsed())
+
+            with stopwatch() as elapsed:
+                drifts = reconcile(company.pk, fix=False)
+            reconcile_seconds = elapsed()
+            assert not drifts, f'counters drifted: {drifts[:5]}'
+
+            transaction.set_rollback(True)
+
+        self.report('counters', {
+            'orders': options['orders'],
+            **{f'insert_batch_{key}': value for key, value in summarize_latencies(batches).items()},
+            **{f'badges_{key}': value for key, value in summarize_latencies(counter_samples).items()},
+            **{f'count_{key}': value for key, value in summarize_latencies(count_samples).items()},
+            'reconcile_seconds': reconcile_seconds,
+        }, options)
+
+    def _insert_orders(self, company, marketplace, warehouses, start, count, run_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {Order._meta.db_table}
+                    (marketplace_id, company_id, external_id, status, shipping_warehouse_id,
+                     total_price, weight, created_at, updated_at)
+                SELECT %(marketplace)s, %(company)s, %(run_id)s || '-' || n,
+                       (ARRAY['new', 'processing', 'ready_to_ship', 'shipped', 'delivered'])[1 + n %% 5],
+                       (%(warehouses)s::bigint[])[1 + n / 7 %% 3], 100 + n %% 9900, 50, now(), now()
+                FROM generate_series(%(start)s + 1, %(start)s + %(count)s) AS n
+                """,
+                {
+                    'marketplace': marketplace.pk, 'company': company.pk, 'warehouses': warehouses,
+                    'run_id': run_id, 'start': start, 'count': count,
+                },
+            )
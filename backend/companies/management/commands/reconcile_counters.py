@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from companies.counters import install_triggers, reconcile
+
+
+class Command(BaseCommand):
+    help = 'Сверяет денормализованные счетчики с исходными таблицами и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Сверить счетчики только этой компании')
+        parser.add_argument('--check', action='store_true', help='Только показать расхождения, не исправляя их')
+        parser.add_argument(
+            '--install-triggers', action='store_true', help='Переустановить триггеры счетчиков перед сверкой'
+        )
+
+    def handle(self, *args, **options):
+        if options['install_triggers']:
+            install_triggers()
+        drifts = reconcile(options['company'], fix=not options['check'])
+        for name, company, warehouse, key, value in drifts:
+            scope = f'company {company}' + (f' warehouse {warehouse}' if warehouse else '')
+            self.stdout.write(f'{name}[{key}] {scope}: {value:+d}')
+        verb = 'Found' if options['check'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(drifts)} counter discrepancies'))
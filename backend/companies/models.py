@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
 from django.utils.translation import gettext_lazy as _
 
 
@@ -36,3 +38,45 @@ class Company(models.Model):
         
     def __str__(self):
         return self.name
+
+
+class Counter(models.Model):
+    """
+    Модель шарда денормализованного счетчика (см. companies.counters)
+    """
+    name = models.CharField(_('name'), max_length=50)
+    
+    # Область счетчика: компания целиком (warehouse пуст) или ее склад
+    company = models.ForeignKey(
+        Company,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    warehouse = models.ForeignKey(
+        'warehouses.Warehouse',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+        blank=True,
+        null=True
+    )
+    
+    key = models.CharField(_('key'), max_length=50, blank=True, default='')
+    shard = models.SmallIntegerField(_('shard'), default=0)
+    value = models.BigIntegerField(_('value'), default=0)
+    
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+    
+    class Meta:
+        verbose_name = _('counter')
+        verbose_name_plural = _('counters')
+        constraints = [
+            models.UniqueConstraint(
+                F('company'), Coalesce(F('warehouse'), Value(0)), F('name'), F('key'), F('shard'),
+                name='counter_key',
+            ),
+        ]
+        
+    def __str__(self):
+        return f"{self.name}[{self.key}] = {self.value}"
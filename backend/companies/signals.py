@@ -0,0 +1,8 @@
+from django.db import connections
+
+from . import counters
+
+
+def install_counter_triggers(sender, using='default', **kwargs):
+    if connections[using].vendor == 'postgresql':
+        counters.install_triggers(using)
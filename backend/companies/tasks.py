@@ -0,0 +1,8 @@
+from core.celery import app
+
+from . import counters
+
+
+@app.task(name='companies.reconcile_counters')
+def reconcile_counters(company_id=None):
+    return len(counters.reconcile(company_id))
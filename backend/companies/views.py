@@ -0,0 +1,24 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .counters import badges
+
+
+class CounterBadgesView(APIView):
+    """
+    Значки интерфейса: заказы, поставки и отгрузки по статусам, открытые поставки,
+    ожидающие отгрузки, активные товары и товары на маркетплейсах.
+
+    GET ?warehouse=<id> — счетчики одного склада компании
+    """
+    query_budget = 3
+
+    def get(self, request):
+        warehouse = request.query_params.get('warehouse')
+        if warehouse:
+            try:
+                warehouse = int(warehouse)
+            except ValueError:
+                raise ValidationError({'warehouse': 'Expected an ID'})
+        return Response(badges(request.user.company_id, warehouse or None))
@@ -1,5 +1,8 @@
 """
 ASGI config for core project.
+
+Вебхуки заказов маркетплейсов (/webhooks/) принимает orders.webhooks без
+Django; остальные запросы обслуживает Django.
 """
 
 import os
@@ -8,4 +11,20 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Индекс штрихкодов строится в фоне при старте процесса
+from products.barcodes import resolver  # noqa: E402
+from orders.webhooks import WebhookIntake  # noqa: E402
+
+resolver.warm()
+
+webhooks = WebhookIntake()
+
+
+async def application(scope, receive, send):
+    # lifespan — старт писателя вебхуков и дозапись очереди при остановке
+    if scope['type'] == 'lifespan' or scope['path'].startswith('/webhooks/'):
+        await webhooks(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
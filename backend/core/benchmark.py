@@ -0,0 +1,67 @@
+"""
+Общие средства для команд-бенчмарков (manage.py bench_*).
+"""
+import json
+import math
+import time
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand
+
+
+def percentile(sorted_values, pct):
+    """
+    Перцентиль по заранее отсортированному списку (метод ближайшего ранга)
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize_latencies(samples):
+    """
+    Сводка по задержкам в секундах; результат в миллисекундах
+    """
+    values = sorted(samples)
+    count = len(values)
+    return {
+        'count': count,
+        'mean_ms': (sum(values) / count * 1000) if count else 0.0,
+        'p50_ms': percentile(values, 50) * 1000,
+        'p95_ms': percentile(values, 95) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+        'max_ms': (values[-1] * 1000) if count else 0.0,
+    }
+
+
+@contextmanager
+def stopwatch():
+    """
+    Замер времени блока: with stopwatch() as elapsed: ...; elapsed()
+    """
+    started = time.perf_counter()
+    finished = []
+    yield lambda: (finished[0] if finished else time.perf_counter()) - started
+    finished.append(time.perf_counter())
+
+
+class BenchmarkCommand(BaseCommand):
+    """
+    Базовая команда бенчмарка с выводом результатов в текстовом виде или JSON
+    """
+
+    def create_parser(self, prog_name, subcommand, **kwargs):
+        parser = super().create_parser(prog_name, subcommand, **kwargs)
+        parser.add_argument('--json', action='store_true', help='Вывести результаты в формате JSON')
+        return parser
+
+    def report(self, name, metrics, options):
+        if options.get('json'):
+            self.stdout.write(json.dumps({'benchmark': name, **metrics}, default=str))
+            return
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        for key, value in metrics.items():
+            if isinstance(value, float):
+                value = f'{value:.3f}'
+            self.stdout.write(f'  {key}: {value}')
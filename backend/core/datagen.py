@@ -0,0 +1,542 @@
+"""
+Генератор синтетических данных для нагрузочных замеров (manage.py generate_dataset).
+
+Набор похож на рабочий: компании с пользователями, маркетплейсами и
+складами, дерево единиц хранения (проход → стеллаж → полка → ячейка →
+коробка, коды разбираются маршрутизацией подбора), товары со связями с
+маркетплейсами, заказы за период с суточным профилем и статусами по
+возрасту, поставки, отгрузки, остатки с журналом движений, заявки на услуги
+и инвентаризации. Популярность товаров неравномерна: небольшая доля товаров
+дает большую часть позиций.
+
+Строки пишутся через COPY ... FROM STDIN порциями по COPY_BATCH_SIZE, а не
+через ORM: десятки миллионов строк загружаются за минуты. Вся загрузка —
+одна транзакция: пользовательские триггеры (итоги, счетчики) на время
+загрузки отключены, а после нее таблица замыкания, дневные итоги и счетчики
+новых компаний пересчитываются целиком. Идентификаторы заранее берутся из последовательностей
+таблиц, поэтому связи строятся без обратного чтения загруженных строк.
+"""
+import io
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.models import Marketplace
+from companies import counters
+from companies.models import Company
+from orders import partitions
+from orders.models import Order, OrderItem, OrderKey
+from products.models import Product, ProductMarketplace
+from reports import rollups
+from reports.models import Inventory, InventoryItem
+from services.models import Service, ServiceRequest, ServiceRequestItem
+from shipments.models import Shipment, ShipmentOrder
+from stock.models import StockBalance, StockMovement
+from supplies.models import Supply, SupplyItem
+from users.models import User
+from warehouses import hierarchy
+from warehouses.models import StorageUnit, Warehouse
+
+COPY_BATCH_SIZE = 50000
+
+SYNTHETIC_PREFIX = 'Synthetic'
+
+# Объем данных одной компании при scale=1
+PROFILE = {
+    'marketplaces': 3,
+    'warehouses': 2,
+    'products': 3000,
+    'orders': 100000,
+    'supplies': 1000,
+    'shipments': 500,
+    'service_requests': 2000,
+    'inventories': 3,  # на склад
+}
+
+# Ветвление дерева единиц хранения склада: проходы, стеллажи в проходе, полки, ячейки, коробки
+DEFAULT_TREE = (20, 20, 4, 3, 2)
+
+ORDER_STATUS_WEIGHTS = {
+    'recent': (('new', 35), ('processing', 30), ('ready_to_ship', 25), ('cancelled', 10)),
+    'in_delivery': (('ready_to_ship', 10), ('shipped', 75), ('delivered', 5), ('cancelled', 10)),
+    'old': (('delivered', 85), ('cancelled', 8), ('returned', 7)),
+}
+
+LOADED_MODELS = (
+    Company, User, Marketplace, Warehouse, StorageUnit, Product, ProductMarketplace, Order, OrderItem,
+    OrderKey, Supply, SupplyItem, Shipment, ShipmentOrder, Service, ServiceRequest, ServiceRequestItem,
+    StockBalance, StockMovement, Inventory, InventoryItem,
+)
+
+_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _text(value):
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, str):
+        return value.translate(_ESCAPES)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class CopyWriter:
+    """
+    Накопитель строк одной таблицы, сбрасываемый в базу через COPY
+    """
+
+    def __init__(self, loader, model, fields):
+        self.loader = loader
+        self.model = model
+        columns = ', '.join(model._meta.get_field(name).column for name in fields)
+        self.sql = f'COPY {model._meta.db_table} ({columns}) FROM STDIN'
+        self.lines = []
+        self.count = 0
+
+    def add(self, *values):
+        self.lines.append('\t'.join(map(_text, values)))
+        if len(self.lines) >= self.loader.batch_size:
+            self.loader.flush()
+
+    def flush(self, cursor):
+        if self.lines:
+            self.lines.append('')
+            cursor.copy_expert(self.sql, io.StringIO('\n'.join(self.lines)))
+            self.count += len(self.lines) - 1
+            self.lines = []
+
+
+class CopyLoader:
+    """
+    Накопители таблиц в порядке регистрации: сброс идет в этом порядке, поэтому
+    строки, на которые ссылаются внешние ключи, попадают в базу раньше ссылающихся
+    """
+
+    def __init__(self, cursor, batch_size=COPY_BATCH_SIZE):
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self.writers = {}
+
+    def table(self, model, *fields):
+        writer = self.writers.get(model)
+        if writer is None:
+            writer = self.writers[model] = CopyWriter(self, model, fields)
+        return writer
+
+    def flush(self):
+        for writer in self.writers.values():
+            writer.flush(self.cursor)
+
+    @property
+    def counts(self):
+        return {writer.model._meta.label: writer.count for writer in self.writers.values()}
+
+
+def reserve_ids(cursor, model, count):
+    """
+    Берет count идентификаторов из последовательности таблицы модели
+    """
+    if not count:
+        return []
+    cursor.execute(
+        'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+        [model._meta.db_table, model._meta.pk.column, count],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _aisle_code(number):
+    code = ''
+    number += 1
+    while number:
+        number, rest = divmod(number - 1, 26)
+        code = chr(ord('A') + rest) + code
+    return code
+
+
+def _weighted(rng, weights):
+    values = [value for value, _weight in weights]
+    cumulative = []
+    total = 0
+    for _value, weight in weights:
+        total += weight
+        cumulative.append(total)
+    return lambda: rng.choices(values, cum_weights=cumulative)[0]
+
+
+class DatasetGenerator:
+    """
+    Загрузка синтетического набора данных; counts — число загруженных строк по таблицам
+    """
+
+    def __init__(self, companies=10, scale=1.0, days=365, tree=DEFAULT_TREE, seed=0, password='synthetic',
+                 stdout=None):
+        self.companies = companies
+        self.sizes = {name: max(1, round(size * scale)) for name, size in PROFILE.items()}
+        self.sizes['marketplaces'] = PROFILE['marketplaces']
+        self.sizes['warehouses'] = PROFILE['warehouses']
+        self.sizes['inventories'] = PROFILE['inventories']
+        self.days = days
+        self.tree = tuple(tree)
+        self.rng = random.Random(seed)
+        self.password = make_password(password)
+        self.stdout = stdout
+        self.now = timezone.now()
+        self.counts = {}
+        self.statuses = {name: _weighted(self.rng, weights) for name, weights in ORDER_STATUS_WEIGHTS.items()}
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def generate(self):
+        """
+        Загружает набор данных одной транзакцией; возвращает ID созданных компаний
+        """
+        tables = ', '.join(model._meta.db_table for model in LOADED_MODELS)
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Проверки внешних ключей по ходу загрузки, а не очередью до COMMIT
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            # Секции заказов на всю глубину истории
+            partitions.ensure_partitions(since=self.now - timedelta(days=self.days + 1))
+            for model in LOADED_MODELS:
+                cursor.execute(f'ALTER TABLE {model._meta.db_table} DISABLE TRIGGER USER')
+            self.loader = CopyLoader(cursor)
+            company_ids = reserve_ids(cursor, Company, self.companies)
+            self.warehouse_ids = []
+            for number, company_id in enumerate(company_ids, start=1):
+                self._company(cursor, company_id)
+                self.log(f'Company {number}/{len(company_ids)} loaded')
+            self.loader.flush()
+            self.counts = self.loader.counts
+            for model in LOADED_MODELS:
+                cursor.execute(f'ALTER TABLE {model._meta.db_table} ENABLE TRIGGER USER')
+
+            # Статистика планировщика для пересчетов по только что загруженным таблицам
+            cursor.execute(f'ANALYZE {tables}')
+            self.log('Rebuilding storage hierarchy, rollups and counters')
+            hierarchy.rebuild(self.warehouse_ids)
+            for company_id in company_ids:
+                rollups.rebuild(company_id)
+                counters.reconcile(company_id)
+        return company_ids
+
+    def _writer(self, model, *fields):
+        return self.loader.table(model, *fields)
+
+    def _moment(self, max_age_days=None):
+        """
+        Момент в прошлом с суточным профилем: больше всего заказов днем
+        """
+        rng = self.rng
+        age = rng.random() * (self.days if max_age_days is None else max_age_days)
+        day = self.now - timedelta(days=int(age))
+        seconds = rng.triangular(6 * 3600, 24 * 3600 - 1, 14 * 3600)
+        moment = day.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(seconds=seconds)
+        return min(moment, self.now)
+
+    def _company(self, cursor, company_id):
+        rng = self.rng
+        now = self.now
+        sizes = self.sizes
+
+        self._writer(
+            Company, 'id', 'name', 'inn', 'legal_address', 'is_dropshipping_enabled', 'created_at',
+            'updated_at',
+        ).add(company_id, f'{SYNTHETIC_PREFIX} {company_id}', f'{company_id:012d}', 'Synthetic address',
+              rng.random() < 0.3, now, now)
+        self._writer(
+            User, 'password', 'is_superuser', 'username', 'first_name', 'last_name', 'is_staff', 'is_active',
+            'date_joined', 'email', 'company', 'is_two_factor_enabled', 'token_version',
+        ).add(self.password, False, f'synthetic-{company_id}', 'Synthetic', str(company_id), False, True, now,
+              f'synthetic-{company_id}@example.com', company_id, False, 0)
+
+        marketplaces = reserve_ids(cursor, Marketplace, sizes['marketplaces'])
+        types = ['wildberries', 'ozon', 'yandex_market', 'aliexpress', 'sber_mega_market']
+        writer = self._writer(
+            Marketplace, 'id', 'name', 'type', 'company', 'is_fbs_enabled', 'is_connected', 'products_count',
+            'created_at', 'updated_at',
+        )
+        for number, marketplace_id in enumerate(marketplaces):
+            marketplace_type = types[number % len(types)]
+            writer.add(marketplace_id, f'{marketplace_type} {company_id}', marketplace_type, company_id, True, True, 0,
+                       now, now)
+
+        warehouses = reserve_ids(cursor, Warehouse, sizes['warehouses'])
+        self.warehouse_ids.extend(warehouses)
+        writer = self._writer(Warehouse, 'id', 'name', 'type', 'address', 'company', 'created_at', 'updated_at')
+        for number, warehouse_id in enumerate(warehouses):
+            writer.add(warehouse_id, f'Warehouse {number + 1}', 'fulfillment', 'Synthetic address', company_id, now,
+                       now)
+        cells = {warehouse_id: self._storage_units(cursor, warehouse_id) for warehouse_id in warehouses}
+
+        products = self._products(cursor, company_id, marketplaces)
+        # Популярность товаров: квадрат равномерной величины смещает выбор к началу списка
+        prices = {product_id: price for product_id, price in products}
+        product_ids = [product_id for product_id, _price in products]
+
+        def popular():
+            return product_ids[int(len(product_ids) * rng.random() ** 2)]
+
+        shipped = self._orders(cursor, company_id, marketplaces, warehouses, prices, popular)
+        self._supplies(cursor, company_id, warehouses, popular)
+        self._shipments(cursor, company_id, shipped)
+        self._stock(cursor, cells, product_ids)
+        self._services(cursor, company_id, warehouses, popular)
+        self._inventories(cursor, company_id, warehouses, product_ids)
+
+    def _storage_units(self, cursor, warehouse_id):
+        """
+        Дерево единиц хранения склада; возвращает ID листьев (куда кладется товар)
+        """
+        rng = self.rng
+        now = self.now
+        aisles, racks, shelves, cells, boxes = self.tree
+        total = aisles * (1 + racks * (1 + shelves * (1 + cells * (1 + boxes))))
+        ids = iter(reserve_ids(cursor, StorageUnit, total))
+        writer = self._writer(
+            StorageUnit, 'id', 'warehouse', 'name', 'type', 'code', 'width', 'height', 'depth', 'max_weight',
+            'max_items', 'parent_unit', 'created_at', 'updated_at',
+        )
+        leaves = []
+
+        def add(unit_id, name, unit_type, code, size, max_weight, max_items, parent_id):
+            width, height, depth = size or (None, None, None)
+            writer.add(unit_id, warehouse_id, name, unit_type, f'{code}-W{warehouse_id}', width, height, depth,
+                       max_weight, max_items, parent_id, now, now)
+
+        for aisle in range(aisles):
+            aisle_code = _aisle_code(aisle)
+            # Коды проходов не разбираются как точка подбора (нет номера стеллажа)
+            aisle_id = next(ids)
+            add(aisle_id, f'Aisle {aisle_code}', 'rack', f'AISLE-{aisle_code}', None, None, None, None)
+            for rack in range(1, racks + 1):
+                rack_id = next(ids)
+                rack_code = f'{aisle_code}-{rack:02d}'
+                add(rack_id, f'Rack {rack_code}', 'rack', rack_code, (120, 250, 80), 2000, None, aisle_id)
+                for shelf in range(1, shelves + 1):
+                    shelf_id = next(ids)
+                    shelf_code = f'{rack_code}-{shelf}'
+                    add(shelf_id, f'Shelf {shelf_code}', 'shelf', shelf_code, (120, 50, 80), 400, None, rack_id)
+                    for cell in range(1, cells + 1):
+                        cell_id = next(ids)
+                        cell_code = f'{shelf_code}-{cell}'
+                        add(cell_id, f'Cell {cell_code}', 'cell', cell_code, (40, 50, 80), 120, 200, shelf_id)
+                        if not boxes:
+                            leaves.append(cell_id)
+                        for box in range(1, boxes + 1):
+                            box_id = next(ids)
+                            add(box_id, f'Box {cell_code}-{box}', 'box', f'{cell_code}-B{box}', (20, 25, 40), 30,
+                                rng.choice((50, 100)), cell_id)
+                            leaves.append(box_id)
+        return leaves
+
+    def _products(self, cursor, company_id, marketplaces):
+        rng = self.rng
+        now = self.now
+        product_ids = reserve_ids(cursor, Product, self.sizes['products'])
+        products = self._writer(
+            Product, 'id', 'name', 'article', 'barcode', 'company', 'brand', 'category', 'weight', 'width',
+            'height', 'depth', 'purchase_price', 'recommended_price', 'is_active', 'is_deleted', 'created_at',
+            'updated_at',
+        )
+        links = self._writer(
+            ProductMarketplace, 'product', 'marketplace', 'external_id', 'external_barcode',
+            'external_article', 'is_active', 'stock_quantity', 'last_sync', 'created_at', 'updated_at',
+        )
+        result = []
+        for number, product_id in enumerate(product_ids):
+            price = round(rng.lognormvariate(6.5, 0.8), 2)
+            active = rng.random() < 0.95
+            products.add(
+                product_id, f'Product {number + 1}', f'ART-{company_id}-{number + 1}', f'2{product_id:012d}',
+                company_id, f'Brand {number % 40}', f'Category {number % 25}', rng.randint(50, 5000), rng.randint(5, 60),
+                rng.randint(5, 60), rng.randint(1, 40), round(price * 0.6, 2), price, active, False, now, now,
+            )
+            for marketplace_id in marketplaces:
+                if rng.random() < 0.7:
+                    links.add(
+                        product_id, marketplace_id, f'{marketplace_id}-{product_id}',
+                        f'3{marketplace_id:05d}{product_id:08d}', f'MP-{marketplace_id}-{number + 1}', active, rng.randint(0, 200), now, now, now,
+                    )
+            result.append((product_id, price))
+        return result
+
+    def _orders(self, cursor, company_id, marketplaces, warehouses, prices, popular):
+        """
+        Заказы и их позиции; возвращает {склад: [ID отгруженных заказов]} для отгрузок
+        """
+        rng = self.rng
+        count = self.sizes['orders']
+        orders = self._writer(
+            Order, 'id', 'marketplace', 'company', 'external_id', 'status', 'shipping_warehouse',
+            'shipping_date', 'total_price', 'fulfillment_cost', 'weight', 'created_at', 'updated_at',
+        )
+        items = self._writer(OrderItem, 'order', 'product', 'quantity', 'price', 'is_processed', 'created_at')
+        # Триггеры ключей отключены на время загрузки
+        keys = self._writer(OrderKey, 'order_id', 'marketplace', 'external_id', 'created_at')
+        shipped = {warehouse_id: [] for warehouse_id in warehouses}
+        for start in range(0, count, COPY_BATCH_SIZE):
+            for order_id in reserve_ids(cursor, Order, min(COPY_BATCH_SIZE, count - start)):
+                created_at = self._moment()
+                age = (self.now - created_at).days
+                status = self.statuses['recent' if age < 1 else 'in_delivery' if age < 5 else 'old']()
+                warehouse_id = rng.choice(warehouses) if rng.random() < 0.9 else None
+                lines = []
+                for _line in range(1 + int(rng.expovariate(1.2))):
+                    product_id = popular()
+                    lines.append((product_id, 1 + int(rng.expovariate(1.5)), prices[product_id]))
+                shipping_date = (created_at + timedelta(days=1)).date() if status not in ('new', 'cancelled') else None
+                marketplace_id = rng.choice(marketplaces)
+                orders.add(
+                    order_id, marketplace_id, company_id, f'SYN-{order_id}', status, warehouse_id,
+                    shipping_date, round(sum(quantity * price for _product_id, quantity, price in lines), 2),
+                    rng.choice((None, 35, 50, 75)), rng.randint(100, 20000), created_at, created_at,
+                )
+                keys.add(order_id, marketplace_id, f'SYN-{order_id}', created_at)
+                for product_id, quantity, price in lines:
+                    items.add(order_id, product_id, quantity, price, status in ('shipped', 'delivered'), created_at)
+                if warehouse_id and status in ('shipped', 'delivered'):
+                    shipped[warehouse_id].append(order_id)
+        return shipped
+
+    def _supplies(self, cursor, company_id, warehouses, popular):
+        rng = self.rng
+        supplies = self._writer(
+            Supply, 'id', 'company', 'source_warehouse', 'destination_warehouse', 'status', 'supply_date',
+            'supply_time_slot', 'pallets_count', 'boxes_count', 'pickup_required', 'created_at', 'updated_at',
+        )
+        items = self._writer(
+            SupplyItem, 'supply', 'product', 'quantity', 'quantity_received', 'is_processed', 'created_at',
+        )
+        for supply_id in reserve_ids(cursor, Supply, self.sizes['supplies']):
+            created_at = self._moment()
+            age = (self.now - created_at).days
+            status = rng.choice(('draft', 'pending', 'approved', 'in_transit')) if age < 14 else (
+                'received' if rng.random() < 0.9 else 'cancelled'
+            )
+            source, destination = rng.choice(warehouses), rng.choice(warehouses)
+            supplies.add(
+                supply_id, company_id, source, destination, status, (created_at + timedelta(days=3)).date(),
+                rng.choice(('09:00-12:00', '12:00-15:00', '15:00-18:00')), rng.randint(0, 6), rng.randint(1, 60),
+                rng.random() < 0.2, created_at, created_at,
+            )
+            for product_id in {popular() for _line in range(rng.randint(5, 20))}:
+                quantity = rng.randint(10, 500)
+                received = status == 'received'
+                items.add(supply_id, product_id, quantity, quantity if received else 0, received, created_at)
+
+    def _shipments(self, cursor, company_id, shipped):
+        rng = self.rng
+        shipments = self._writer(
+            Shipment, 'id', 'company', 'warehouse', 'status', 'shipment_date', 'transport_company',
+            'tracking_number', 'pallets_count', 'boxes_count', 'total_weight', 'created_at', 'updated_at',
+        )
+        links = self._writer(ShipmentOrder, 'shipment', 'order', 'created_at')
+        orders = [(warehouse_id, order_id) for warehouse_id, ids in shipped.items() for order_id in ids]
+        rng.shuffle(orders)
+        position = 0
+        for shipment_id in reserve_ids(cursor, Shipment, self.sizes['shipments']):
+            created_at = self._moment()
+            batch = orders[position:position + rng.randint(20, 100)]
+            position += len(batch)
+            warehouse_id = batch[0][0] if batch else rng.choice(list(shipped))
+            age = (self.now - created_at).days
+            status = rng.choice(('draft', 'pending', 'approved')) if age < 2 else (
+                'shipped' if age < 7 else 'delivered'
+            )
+            shipments.add(
+                shipment_id, company_id, warehouse_id, status, created_at.date(), 'Synthetic transport',
+                f'TRK{shipment_id:010d}', rng.randint(1, 10), len(batch), rng.randint(10, 2000), created_at, created_at,
+            )
+            for _warehouse_id, order_id in batch:
+                links.add(shipment_id, order_id, created_at)
+
+    def _stock(self, cursor, cells, product_ids):
+        rng = self.rng
+        now = self.now
+        balances = self._writer(StockBalance, 'product', 'storage_unit', 'warehouse', 'quantity', 'updated_at')
+        movements = self._writer(
+            StockMovement, 'movement_type', 'product', 'storage_unit', 'warehouse', 'quantity', 'balance_after',
+            'operation_id', 'created_at',
+        )
+        for product_id in product_ids:
+            warehouse_id = rng.choice(list(cells))
+            for unit_id in rng.sample(cells[warehouse_id], min(len(cells[warehouse_id]), rng.randint(1, 3))):
+                quantity = rng.randint(1, 300)
+                balances.add(product_id, unit_id, warehouse_id, quantity, now)
+                movements.add('receipt', product_id, unit_id, warehouse_id, quantity, quantity, uuid.uuid4(),
+                              self._moment())
+
+    def _services(self, cursor, company_id, warehouses, popular):
+        rng = self.rng
+        now = self.now
+        services = self._writer(
+            Service, 'id', 'name', 'type', 'company', 'price', 'price_type', 'is_active', 'created_at',
+            'updated_at',
+        )
+        service_types = ('packaging', 'labeling', 'photo', 'inspection', 'repair')
+        service_ids = reserve_ids(cursor, Service, len(service_types))
+        for service_id, service_type in zip(service_ids, service_types):
+            services.add(service_id, service_type.capitalize(), service_type, company_id, rng.randint(10, 500),
+                         'per_item', True, now, now)
+
+        requests = self._writer(
+            ServiceRequest, 'id', 'service', 'company', 'warehouse', 'status', 'quantity', 'planned_date',
+            'completed_date', 'total_cost', 'created_at', 'updated_at',
+        )
+        items = self._writer(
+            ServiceRequestItem, 'service_request', 'product', 'quantity', 'quantity_processed',
+            'is_completed', 'created_at',
+        )
+        for request_id in reserve_ids(cursor, ServiceRequest, self.sizes['service_requests']):
+            created_at = self._moment()
+            age = (self.now - created_at).days
+            status = rng.choice(('new', 'in_progress')) if age < 3 else (
+                'completed' if rng.random() < 0.92 else 'cancelled'
+            )
+            planned = (created_at + timedelta(days=2)).date()
+            lines = [(product_id, rng.randint(1, 50)) for product_id in {popular() for _line in range(rng.randint(1, 3))}]
+            quantity = sum(line_quantity for _product_id, line_quantity in lines)
+            requests.add(
+                request_id, rng.choice(service_ids), company_id, rng.choice(warehouses), status, quantity, planned,
+                planned if status == 'completed' else None, quantity * rng.randint(10, 100), created_at, created_at,
+            )
+            done = status == 'completed'
+            for product_id, line_quantity in lines:
+                items.add(request_id, product_id, line_quantity, line_quantity if done else 0, done, created_at)
+
+    def _inventories(self, cursor, company_id, warehouses, product_ids):
+        rng = self.rng
+        inventories = self._writer(
+            Inventory, 'id', 'company', 'warehouse', 'name', 'status', 'start_date', 'end_date', 'created_at',
+            'updated_at',
+        )
+        items = self._writer(
+            InventoryItem, 'inventory', 'product', 'expected_quantity', 'actual_quantity', 'is_checked',
+            'has_discrepancy', 'created_at', 'updated_at',
+        )
+        for warehouse_id in warehouses:
+            for number, inventory_id in enumerate(reserve_ids(cursor, Inventory, self.sizes['inventories'])):
+                created_at = self._moment()
+                completed = number + 1 < self.sizes['inventories']
+                inventories.add(
+                    inventory_id, company_id, warehouse_id, f'Inventory {number + 1}',
+                    'completed' if completed else 'in_progress', created_at.date(),
+                    created_at.date() + timedelta(days=1) if completed else None, created_at, created_at,
+                )
+                for product_id in rng.sample(product_ids, min(len(product_ids), 300)):
+                    expected = rng.randint(0, 300)
+                    actual = expected if rng.random() < 0.95 else max(0, expected + rng.randint(-5, 5))
+                    checked = completed or rng.random() < 0.5
+                    items.add(inventory_id, product_id, expected, actual if checked else None, checked,
+                              checked and actual != expected, created_at, created_at)
@@ -0,0 +1,69 @@
+"""
+Бэкенд PostgreSQL с пулом подключений процесса (ENGINE = 'core.db').
+
+Отличается от django.db.backends.postgresql только тем, откуда берется и куда
+уходит подключение: get_new_connection() выдает его из пула, _close()
+возвращает в пул (см. core.db.pool). Настройки пула — OPTIONS['pool']
+(min_size, max_size, timeout, max_idle, max_lifetime, health_check_after);
+CONN_MAX_AGE должен оставаться 0, чтобы подключение возвращалось в конце
+каждого запроса и задачи.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.postgresql import base, creation
+from django.utils.asyncio import async_unsafe
+
+from .pool import PooledConnection, get_pool, pools
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Простаивающие подключения пула к тестовой базе не дали бы ее удалить
+        for pool in pools():
+            pool.close_idle()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def __init__(self, settings_dict, alias=DEFAULT_DB_ALIAS):
+        super().__init__(settings_dict, alias)
+        if settings_dict.get('CONN_MAX_AGE'):
+            raise ImproperlyConfigured(
+                f'DATABASES[{alias!r}]: CONN_MAX_AGE must be 0 with the pooled backend, '
+                f'connections are reused through the pool'
+            )
+
+    @property
+    def pool(self):
+        # Django открывает и служебные подключения с тем же псевдонимом к другой базе (_nodb_cursor)
+        settings_dict = self.settings_dict
+        target = (settings_dict['NAME'], settings_dict['HOST'], settings_dict['PORT'], settings_dict['USER'])
+        return get_pool(self.alias, target, settings_dict['OPTIONS'].get('pool', {}))
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('pool', None)
+        return conn_params
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        def connect():
+            connection = super(DatabaseWrapper, self).get_new_connection(conn_params)
+            return PooledConnection(connection, self.isolation_level)
+
+        entry = self.pool.checkout(connect)
+        self.isolation_level = entry.isolation_level
+        return entry.connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # Django еще держит подключение до выхода из atomic: в пул его возвращать нельзя
+                self.pool.discard(self.connection)
+            else:
+                self.pool.checkin(self.connection)
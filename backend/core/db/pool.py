@@ -0,0 +1,272 @@
+"""
+Пул подключений PostgreSQL процесса (см. core.db.base).
+
+Django закрывает подключение в конце каждого запроса и задачи
+(CONN_MAX_AGE = 0), а бэкенд core.db вместо закрытия возвращает его в пул;
+следующее подключение берется из пула без установки соединения. Так
+поведение одинаково под WSGI (потоки gunicorn) и ASGI (синхронный код в
+потоках asgiref): подключение никогда не переживает запрос, но и не
+открывается заново.
+
+- max_size ограничивает число подключений процесса; если все заняты,
+  подключение ждет освобождения до timeout секунд, затем OperationalError;
+- min_size подключений не закрываются за простой, остальные закрываются
+  после max_idle секунд без работы; старше max_lifetime — при возврате;
+- при выдаче проверяется состояние подключения, а простоявшее дольше
+  health_check_after секунд — еще и SELECT 1; сломанное заменяется новым;
+- возвращенное посреди транзакции откатывается;
+- после fork (gunicorn --preload, Celery prefork) пул процесса создается
+  заново, унаследованные сокеты не используются и не закрываются.
+
+Метрики пула (stats()): выдачи, ожидания и их время, таймауты, открытые и
+закрытые подключения, сбои проверок и насыщение (занято / max_size).
+"""
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+DEFAULTS = {
+    'min_size': 2,
+    'max_size': 10,
+    'timeout': 10.0,
+    'max_idle': 300.0,
+    'max_lifetime': 3600.0,
+    'health_check_after': 30.0,
+}
+
+
+@dataclass
+class PooledConnection:
+    connection: object
+    # Уровень изоляции, с которым подключение было открыто (DatabaseWrapper.isolation_level)
+    isolation_level: object
+    created_at: float = field(default_factory=time.monotonic)
+    released_at: float = field(default_factory=time.monotonic)
+
+
+class ConnectionPool:
+    """
+    Пул подключений одного псевдонима базы в одном процессе
+    """
+
+    def __init__(self, alias, min_size, max_size, timeout, max_idle, max_lifetime, health_check_after):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError(f'Invalid pool size for {alias}: min_size={min_size}, max_size={max_size}')
+        self.alias = alias
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.pid = os.getpid()
+
+        self.condition = threading.Condition()
+        self.idle = deque()  # последний возвращенный — справа
+        self.in_use = {}
+        self.size = 0  # открытые и открываемые подключения
+
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+        self.opened = 0
+        self.closed = 0
+        self.health_check_failures = 0
+        self.peak_in_use = 0
+
+    def checkout(self, connect):
+        """
+        Свободное подключение пула; connect() -> PooledConnection открывает новое
+        """
+        started = time.monotonic()
+        entry, waited = None, False
+        with self.condition:
+            while True:
+                if self.idle:
+                    entry = self.idle.pop()
+                    break
+                if self.size < self.max_size:
+                    self.size += 1
+                    break
+                remaining = started + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    self.waits += 1
+                    self.wait_time += time.monotonic() - started
+                    raise psycopg2.OperationalError(
+                        f'Connection pool {self.alias!r} exhausted: {self.max_size} connections in use '
+                        f'for {self.timeout} s'
+                    )
+                waited = True
+                self.condition.wait(remaining)
+            wait = time.monotonic() - started
+            self.checkouts += 1
+            self.waits += waited
+            self.wait_time += wait
+            self.max_wait = max(self.max_wait, wait)
+
+        if entry is not None and not self._healthy(entry):
+            self._close(entry.connection)
+            entry = None
+            with self.condition:
+                self.closed += 1
+        if entry is None:
+            try:
+                entry = connect()
+            except BaseException:
+                with self.condition:
+                    self.size -= 1
+                    self.condition.notify()
+                raise
+            with self.condition:
+                self.opened += 1
+
+        with self.condition:
+            self.in_use[id(entry.connection)] = entry
+            self.peak_in_use = max(self.peak_in_use, len(self.in_use))
+        return entry
+
+    def checkin(self, connection):
+        """
+        Возвращает подключение в пул (или закрывает, если оно сломано или устарело)
+        """
+        with self.condition:
+            entry = self.in_use.pop(id(connection), None)
+        if entry is None:
+            # Не из этого пула (например, открыто до fork)
+            self._close(connection)
+            return
+        reusable = not connection.closed and time.monotonic() - entry.created_at < self.max_lifetime
+        if reusable and connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                reusable = False
+        if not reusable:
+            self._close(connection)
+            self._release_slot()
+            return
+        entry.released_at = time.monotonic()
+        with self.condition:
+            self.idle.append(entry)
+            self.condition.notify()
+        self._trim()
+
+    def discard(self, connection):
+        """
+        Закрывает выданное подключение и освобождает его место в пуле
+        """
+        with self.condition:
+            known = self.in_use.pop(id(connection), None) is not None
+        self._close(connection)
+        if known:
+            self._release_slot()
+
+    def _release_slot(self):
+        with self.condition:
+            self.size -= 1
+            self.closed += 1
+            self.condition.notify()
+
+    def _healthy(self, entry):
+        connection = entry.connection
+        if connection.closed or connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - entry.released_at < self.health_check_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except psycopg2.Error:
+            with self.condition:
+                self.health_check_failures += 1
+            return False
+        return True
+
+    def _trim(self):
+        # Простаивающие сверх min_size — с самого давнего (слева)
+        expired = []
+        now = time.monotonic()
+        with self.condition:
+            while self.idle and self.size > self.min_size and now - self.idle[0].released_at > self.max_idle:
+                expired.append(self.idle.popleft())
+                self.size -= 1
+                self.closed += 1
+        for entry in expired:
+            self._close(entry.connection)
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    def close_idle(self):
+        """
+        Закрывает все простаивающие подключения (завершение процесса, тесты)
+        """
+        with self.condition:
+            idle, self.idle = list(self.idle), deque()
+            self.size -= len(idle)
+            self.closed += len(idle)
+        for entry in idle:
+            self._close(entry.connection)
+
+    def stats(self):
+        with self.condition:
+            in_use = len(self.in_use)
+            return {
+                'alias': self.alias,
+                'pid': self.pid,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self.size,
+                'in_use': in_use,
+                'idle': len(self.idle),
+                'saturation': in_use / self.max_size,
+                'peak_in_use': self.peak_in_use,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_time_ms': self.wait_time * 1000,
+                'max_wait_ms': self.max_wait * 1000,
+                'timeouts': self.timeouts,
+                'opened': self.opened,
+                'closed': self.closed,
+                'health_check_failures': self.health_check_failures,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, target, options):
+    """
+    Пул подключений к target (база, хост, порт, пользователь) в текущем процессе; после fork создается новый
+    """
+    key = (alias, *target)
+    pool = _pools.get(key)
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.pid != os.getpid():
+            pool = _pools[key] = ConnectionPool(alias, **{**DEFAULTS, **options})
+        return pool
+
+
+def pools():
+    """
+    Пулы текущего процесса
+    """
+    return [pool for pool in _pools.values() if pool.pid == os.getpid()]
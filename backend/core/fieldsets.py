@@ -0,0 +1,216 @@
+"""
+Выборочные поля и раскрытие связей в ответах API (?fields= и ?expand=).
+
+?fields=id,status,items.quantity,items.product.name оставляет в ответе только
+перечисленные поля; имя через точку относится к раскрытой связи и само ее
+раскрывает. ?expand=items.product заменяет идентификаторы связей вложенными
+объектами со всеми полями по умолчанию. Раскрывать можно только связи из
+Meta.expandable сериализатора.
+
+План запроса выводится из того же дерева полей (plan): прямые связи читаются
+через select_related, обратные — отдельным запросом prefetch_related на
+уровень вложенности, а only() оставляет в SELECT только столбцы выбранных
+полей, первичный ключ и ключи, по которым связываются уровни. Поэтому число
+запросов страницы не зависит от числа строк в ней.
+"""
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from core.pagination import DEFAULT_ORDERING
+
+
+class Selection:
+    """
+    Узел дерева выбранных полей: names — поля уровня (None — поля по умолчанию), children — раскрытые связи
+    """
+
+    def __init__(self, path=''):
+        self.path = path
+        self.names = None
+        self.children = OrderedDict()
+
+    def child(self, name):
+        if name not in self.children:
+            self.children[name] = Selection(f'{self.path}{name}.')
+        return self.children[name]
+
+    @classmethod
+    def parse(cls, fields=None, expand=None):
+        root = cls()
+        for value in filter(None, (expand or '').split(',')):
+            node = root
+            for name in value.strip().split('.'):
+                node = node.child(name)
+        for value in filter(None, (fields or '').split(',')):
+            *relations, name = value.strip().split('.')
+            node = root
+            for relation in relations:
+                node = node.child(relation)
+            if node.names is None:
+                node.names = set()
+            node.names.add(name)
+        root._include_children()
+        return root
+
+    def _include_children(self):
+        for name, child in self.children.items():
+            if self.names is not None:
+                self.names.add(name)
+            child._include_children()
+
+
+def _serializer_class(value):
+    return import_string(value) if isinstance(value, str) else value
+
+
+class FieldsetSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор с выборочными полями; Meta.expandable — {связь: сериализатор или путь к нему}
+    """
+
+    def __init__(self, *args, selection=None, **kwargs):
+        self.selection = selection or Selection()
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expandable = getattr(self.Meta, 'expandable', {})
+        selection = self.selection
+        for name in selection.children:
+            if name not in expandable:
+                raise ValidationError({'expand': f'Cannot expand {selection.path}{name}'})
+        if selection.names is not None:
+            unknown = sorted(selection.names - set(fields) - set(expandable))
+            if unknown:
+                raise ValidationError({'fields': f'Unknown fields: {", ".join(selection.path + n for n in unknown)}'})
+            fields = OrderedDict((name, field) for name, field in fields.items() if name in selection.names)
+        for name, child in selection.children.items():
+            relation = self.Meta.model._meta.get_field(name)
+            fields[name] = _serializer_class(expandable[name])(
+                selection=child, read_only=True, many=relation.one_to_many or relation.many_to_many,
+            )
+        return fields
+
+
+def _nested(field):
+    if isinstance(field, serializers.ListSerializer):
+        field = field.child
+    return field if isinstance(field, FieldsetSerializer) else None
+
+
+def _collect(model, serializer, prefix=''):
+    """
+    Столбцы, пути select_related и Prefetch для уровня serializer (пути — от корневой модели)
+    """
+    opts = model._meta
+    columns = {opts.pk.name}
+    related, prefetches = [], []
+    restricted = True
+    for name, field in serializer.fields.items():
+        nested = _nested(field)
+        if nested is not None:
+            relation = opts.get_field(name)
+            if relation.many_to_one or (relation.one_to_one and relation.concrete):
+                columns.add(name)
+                related.append(prefix + name)
+                inner_columns, inner_related, inner_prefetches = _collect(
+                    relation.related_model, nested, f'{prefix}{name}__',
+                )
+                if inner_columns is None:
+                    inner_columns = _all_columns(relation.related_model)
+                columns.update(f'{name}__{column}' for column in inner_columns)
+                related.extend(inner_related)
+                prefetches.extend(inner_prefetches)
+            else:
+                back = (relation.field.name,) if relation.one_to_many else ()
+                related_model = relation.related_model
+                queryset = plan(related_model._default_manager.order_by(related_model._meta.pk.name), nested, back)
+                prefetches.append(Prefetch(prefix + name, queryset=queryset))
+            continue
+        if field.source == '*' or '.' in field.source:
+            restricted = False
+            continue
+        try:
+            model_field = opts.get_field(field.source)
+        except FieldDoesNotExist:
+            restricted = False
+            continue
+        if model_field.concrete and not model_field.many_to_many:
+            columns.add(model_field.name)
+    return (columns if restricted else None), related, prefetches
+
+
+def _all_columns(model):
+    return {field.name for field in model._meta.concrete_fields}
+
+
+def plan(queryset, serializer, required=()):
+    """
+    queryset с select_related/prefetch_related/only(), которых требует экземпляр serializer
+    (FieldsetSerializer); required — поля, которые нужны помимо сериализуемых (ключи сортировки и связей)
+    """
+    columns, related, prefetches = _collect(queryset.model, serializer)
+    if columns is None:
+        columns = _all_columns(queryset.model)
+    columns.update(required)
+    if related:
+        queryset = queryset.select_related(*related)
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    return queryset.only(*columns)
+
+
+def prefetch_queries(queryset):
+    """
+    Число запросов prefetch_related, которые queryset выполнит помимо основного
+    """
+    return sum(
+        1 + (prefetch_queries(lookup.queryset) if getattr(lookup, 'queryset', None) is not None else 0)
+        for lookup in queryset._prefetch_related_lookups
+    )
+
+
+class FieldsetMixin:
+    """
+    ?fields= и ?expand= для списков: сериализатор получает дерево полей, queryset — план под него
+    """
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+    query_budget = None
+
+    def get_selection(self):
+        if not hasattr(self, '_selection'):
+            params = self.request.query_params
+            self._selection = Selection.parse(
+                params.get(self.fields_query_param), params.get(self.expand_query_param),
+            )
+        return self._selection
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('selection', self.get_selection())
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        ordering = getattr(self, 'keyset_ordering', DEFAULT_ORDERING)
+        serializer = self.get_serializer_class()(selection=self.get_selection())
+        return plan(queryset, serializer, required=[name.lstrip('-') for name in ordering])
+
+    def get_query_budget(self):
+        # Бюджет без раскрытий плюс по запросу на каждую раскрытую обратную связь и на оценку ?total=approximate
+        if self.query_budget is None:
+            return None
+        budget = self.query_budget
+        total_query_param = getattr(self.paginator, 'total_query_param', None)
+        if total_query_param and self.request.query_params.get(total_query_param) == 'approximate':
+            budget += 1
+        try:
+            serializer = self.get_serializer_class()(selection=self.get_selection())
+            return budget + prefetch_queries(plan(self.get_queryset(), serializer))
+        except ValidationError:
+            return budget
@@ -0,0 +1,130 @@
+"""
+Условный GET и кэш ответов справочников компании (товары, склады, юниты
+хранения, услуги, маркетплейсы).
+
+Справочники меняются редко, а клиенты запрашивают их постоянно. Водяной
+знак справочника — максимальный updated_at и число строк компании — стоит
+одного запроса по индексу (company, updated_at); число строк замечает
+удаления, которые максимум не меняют. ETag — хэш водяного знака и варианта
+ответа (путь с параметрами и тип содержимого), Last-Modified — максимальный
+updated_at.
+
+- If-None-Match с текущим ETag получает 304 без чтения страницы и
+  сериализации (If-Modified-Since не проверяется: по нему не видны удаления);
+- иначе данные ответа берутся из кэша Django (CATALOG_CACHE), если запись
+  сделана при том же ETag, а новый ответ кладется туда;
+- сохранение и удаление строки справочника (post_save, post_delete, см.
+  api.apps) сбрасывают кэш справочника компании сменой версии в ключах.
+
+Изменения в обход updated_at (QuerySet.update без него) не видны, пока не
+изменится число строк или не придет другое сохранение.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Count, Max
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.models import Marketplace
+from products.models import Product
+from services.models import Service
+from warehouses.models import StorageUnit, Warehouse
+
+# Справочник -> путь к компании
+CATALOGS = {
+    Product: 'company',
+    Warehouse: 'company',
+    StorageUnit: 'warehouse__company',
+    Service: 'company',
+    Marketplace: 'company',
+}
+
+
+def _cache():
+    return caches[settings.CATALOG_CACHE]
+
+
+def catalog_watermark(model, company_id):
+    """
+    (максимальный updated_at, число строк) справочника компании одним запросом
+    """
+    marks = model.objects.filter(**{f'{CATALOGS[model]}_id': company_id}).aggregate(
+        latest=Max('updated_at'), rows=Count('*'),
+    )
+    return marks['latest'], marks['rows']
+
+
+def _version_key(model, company_id):
+    return f'catalog-version:{model._meta.label_lower}:{company_id}'
+
+
+def invalidate_catalog(sender, instance, raw=False, **kwargs):
+    """
+    Сбрасывает кэш ответов справочника компании строки (обработчик post_save и post_delete)
+    """
+    if raw:
+        return
+    *relations, _company = CATALOGS[sender].split('__')
+    try:
+        for relation in relations:
+            instance = getattr(instance, relation)
+    except ObjectDoesNotExist:
+        # Юнит, удаленный вместе со складом: водяной знак заметит удаление по числу строк
+        return
+    key = _version_key(sender, instance.company_id)
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+class CatalogCacheMixin:
+    """
+    ETag, Last-Modified, 304 и кэш ответов для списка справочника catalog_model (см. модуль)
+    """
+    catalog_model = None
+
+    def list(self, request, *args, **kwargs):
+        company_id = request.user.company_id
+        latest, rows = catalog_watermark(self.catalog_model, company_id)
+        variant = f'{request.accepted_media_type}|{request.get_full_path()}'
+        digest = hashlib.sha256(f'{variant}|{latest.isoformat() if latest else ""}|{rows}'.encode()).hexdigest()
+        etag = quote_etag(digest[:32])
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if latest is not None:
+            headers['Last-Modified'] = http_date(latest.timestamp())
+
+        # Слабые метки (W/"...") сравниваются как сильные: прокси делают их слабыми при сжатии
+        tags = parse_etags(request.headers.get('If-None-Match', ''))
+        matches = {tag[2:] if tag.startswith('W/') else tag for tag in tags}
+        if etag in matches or '*' in matches:
+            return self._conditional(Response(status=status.HTTP_304_NOT_MODIFIED), headers)
+
+        cache = _cache()
+        version = cache.get(_version_key(self.catalog_model, company_id), 0)
+        key = f'catalog:{self.catalog_model._meta.label_lower}:{company_id}:{version}:' + hashlib.sha256(
+            variant.encode()
+        ).hexdigest()
+        cached = cache.get(key)
+        if cached is not None and cached[0] == etag:
+            return self._conditional(Response(cached[1]), headers)
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        cache.set(key, (etag, response.data), settings.CATALOG_CACHE_TIMEOUT)
+        return self._conditional(response, headers)
+
+    @staticmethod
+    def _conditional(response, headers):
+        for name, value in headers.items():
+            response[name] = value
+        # Ответы разных компаний различаются токеном
+        patch_vary_headers(response, ('Authorization',))
+        return response
@@ -0,0 +1,359 @@
+"""
+Сценарии нагрузочного набора (manage.py bench_suite).
+
+Сценарий — фабрика операции: получает LoadContext (компания, пользователь,
+выборки кодов, складов и единиц хранения) и возвращает функцию без
+аргументов, выполняющую одну операцию. Фабрика вызывается в каждом потоке
+нагрузки, поэтому у потока свой клиент API и свое соединение с базой.
+
+API-сценарии проходят весь стек Django в процессе: тестовый клиент,
+промежуточные слои, аутентификацию JWT и представления DRF. Сервисные
+сценарии вызывают функции приложений напрямую. Сценарии с записью
+выполняются в транзакции, которая откатывается после замера, поэтому
+повторные прогоны идут на одних и тех же данных.
+
+Данные ожидаются от generate_dataset: по умолчанию берется первая
+синтетическая компания.
+"""
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.db import close_old_connections, connection, reset_queries, transaction
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from companies.counters import badges
+from companies.models import Company
+from orders.ingestion import ingest_orders
+from orders.models import Order
+from orders.waves import plan_waves
+from products.barcodes import resolve_codes
+from products.models import Product, ProductMarketplace
+from reports.cache import generate_report
+from reports.models import Report
+from reports.rollups import dashboard
+from stock.services import get_warehouse_stock
+from users.models import User
+from users.tokens import access_token_for
+from warehouses.models import StorageUnit, Warehouse
+from warehouses.routing import route_storage_units
+
+from .benchmark import summarize_latencies
+from .pagination import encode_cursor
+from .datagen import SYNTHETIC_PREFIX
+
+SAMPLE_SIZE = 5000
+LOAD_REPORT_NAME = 'Load test'
+
+_setup_lock = threading.Lock()
+
+
+@dataclass
+class Scenario:
+    """
+    Сценарий нагрузки: factory(context) -> операция; writes — операция пишет в базу и откатывается
+    """
+    name: str
+    factory: object
+    writes: bool = False
+    max_iterations: int = None
+    description: str = ''
+
+
+@dataclass
+class LoadContext:
+    """
+    Данные компании, на которых выполняются сценарии
+    """
+    company: Company
+    user: User
+    token: str
+    warehouse_ids: list
+    marketplace_ids: list
+    product_codes: list
+    codes: list
+    storage_unit_ids: dict
+    seed: int = 0
+
+    @classmethod
+    def load(cls, company_id=None, seed=0):
+        companies = Company.objects.order_by('pk')
+        if company_id is None:
+            company = companies.filter(name__startswith=SYNTHETIC_PREFIX).first()
+            if company is None:
+                raise LookupError('No synthetic company found, run generate_dataset first')
+        else:
+            company = companies.get(pk=company_id)
+        user = User.objects.filter(company=company, is_active=True).order_by('pk').first()
+        if user is None:
+            raise LookupError(f'Company {company.pk} has no active users')
+
+        warehouse_ids = list(Warehouse.objects.filter(company=company).order_by('pk').values_list('pk', flat=True))
+        marketplace_ids = list(company.marketplaces.order_by('pk').values_list('pk', flat=True))
+        product_codes = list(Product.objects.filter(company=company).values_list('barcode', flat=True)[:SAMPLE_SIZE])
+        codes = product_codes + list(
+            ProductMarketplace.objects.filter(product__company=company, external_barcode__isnull=False)
+            .values_list('external_barcode', flat=True)[:SAMPLE_SIZE]
+        )
+        # Места хранения — юниты без вложенных (ячейки и коробки)
+        storage_unit_ids = {
+            warehouse_id: list(
+                StorageUnit.objects.filter(warehouse_id=warehouse_id, child_units__isnull=True)
+                .values_list('pk', flat=True)[:SAMPLE_SIZE]
+            )
+            for warehouse_id in warehouse_ids
+        }
+        return cls(
+            company=company, user=user, token=str(access_token_for(user)),
+            warehouse_ids=warehouse_ids, marketplace_ids=marketplace_ids, product_codes=product_codes, codes=codes,
+            storage_unit_ids=storage_unit_ids, seed=seed,
+        )
+
+    def rng(self):
+        return random.Random(f'{self.seed}-{threading.get_ident()}')
+
+    def client(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        return client
+
+    def order_rows(self, rng, count):
+        """
+        Заказы для загрузки с уникальными внешними номерами; штрихкоды маркетплейсов не годятся,
+        они известны только своему кабинету
+        """
+        prefix = f'LOAD-{time.time_ns()}-{threading.get_ident()}'
+        return [
+            {
+                'external_id': f'{prefix}-{number}',
+                'status': 'new',
+                'total_price': '990.00',
+                'shipping_warehouse': rng.choice(self.warehouse_ids),
+                'items': [
+                    {'barcode': rng.choice(self.product_codes), 'quantity': rng.randint(1, 3), 'price': '330.00'}
+                    for _line in range(rng.randint(1, 3))
+                ],
+            }
+            for number in range(count)
+        ]
+
+
+def _check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f'HTTP {response.status_code}: {response.content[:200]!r}')
+    return response
+
+
+def api_counters(context):
+    client = context.client()
+    return lambda: _check(client.get('/api/counters/'))
+
+
+def api_dashboard(context):
+    client = context.client()
+    return lambda: _check(client.get('/api/reports/dashboard/'))
+
+
+def api_barcode_resolve(context):
+    client, rng = context.client(), context.rng()
+    return lambda: _check(
+        client.post('/api/barcodes/resolve/', {'codes': rng.sample(context.codes, 20)}, format='json')
+    )
+
+
+def api_wave_plan(context):
+    client, rng = context.client(), context.rng()
+    return lambda: _check(
+        client.post('/api/orders/waves/plan/', {'warehouse': rng.choice(context.warehouse_ids), 'dry_run': True},
+                    format='json')
+    )
+
+
+def api_order_ingest(context):
+    client, rng = context.client(), context.rng()
+    return lambda: _check(
+        client.post(
+            '/api/orders/ingest/',
+            {'marketplace': rng.choice(context.marketplace_ids), 'orders': context.order_rows(rng, 100)},
+            format='json',
+        )
+    )
+
+
+def api_order_list(context):
+    client = context.client()
+    return lambda: _check(client.get('/api/orders/'))
+
+
+def api_order_list_deep(context):
+    client, rng = context.client(), context.rng()
+
+    def operation():
+        # Страница с произвольной глубины в пределах года: курсор с ключом (created_at, id)
+        position = timezone.now() - timedelta(days=rng.random() * 365)
+        return _check(client.get('/api/orders/', {'cursor': encode_cursor('next', [position, 0])}))
+    return operation
+
+
+def resolve_barcodes(context):
+    rng = context.rng()
+    return lambda: resolve_codes(context.company.pk, rng.sample(context.codes, 100))
+
+
+def ingest_order_batch(context):
+    rng = context.rng()
+    marketplaces = list(context.company.marketplaces.order_by('pk'))
+    return lambda: ingest_orders(rng.choice(marketplaces), context.order_rows(rng, 500))
+
+
+def plan_waves_dry_run(context):
+    rng = context.rng()
+    return lambda: plan_waves(rng.choice(context.warehouse_ids), dry_run=True)
+
+
+def route_pick_list(context):
+    rng = context.rng()
+    warehouses = [warehouse_id for warehouse_id, units in context.storage_unit_ids.items() if units]
+
+    def operation():
+        warehouse_id = rng.choice(warehouses)
+        return route_storage_units(warehouse_id, rng.sample(context.storage_unit_ids[warehouse_id], 50))
+    return operation
+
+
+def dashboard_30_days(context):
+    return lambda: dashboard(context.company.pk)
+
+
+def dashboard_year(context):
+    today = timezone.localdate()
+    return lambda: dashboard(context.company.pk, date_from=today - timedelta(days=364), date_to=today)
+
+
+def counter_badges(context):
+    return lambda: badges(context.company.pk)
+
+
+def warehouse_stock(context):
+    rng = context.rng()
+    return lambda: get_warehouse_stock(rng.choice(context.warehouse_ids))
+
+
+def order_report_cached(context):
+    parameters = {'date_from': (timezone.localdate() - timedelta(days=6)).isoformat()}
+    with _setup_lock:
+        # Отчет и запись кэша создаются один раз и остаются: дальше замеряются только попадания
+        report, created = Report.objects.get_or_create(
+            company=context.company, name=LOAD_REPORT_NAME, type='orders', format='csv',
+            defaults={'parameters': parameters},
+        )
+        if not created and report.parameters != parameters:
+            report.parameters = parameters
+            report.save(update_fields=['parameters', 'updated_at'])
+        generate_report(report)
+    return lambda: generate_report(report)
+
+
+SCENARIOS = [
+    Scenario('api_counters', api_counters, description='GET /api/counters/'),
+    Scenario('api_dashboard', api_dashboard, description='GET /api/reports/dashboard/'),
+    Scenario('api_barcode_resolve', api_barcode_resolve, description='POST /api/barcodes/resolve/, 20 codes'),
+    Scenario('api_wave_plan', api_wave_plan, description='POST /api/orders/waves/plan/ with dry_run'),
+    Scenario('api_order_ingest', api_order_ingest, writes=True, description='POST /api/orders/ingest/, 100 orders'),
+    Scenario('api_order_list', api_order_list, description='GET /api/orders/, first page'),
+    Scenario('api_order_list_deep', api_order_list_deep, description='GET /api/orders/ at a random depth'),
+    Scenario('resolve_barcodes', resolve_barcodes, description='resolve_codes(), 100 codes'),
+    Scenario('ingest_orders', ingest_order_batch, writes=True, description='ingest_orders(), 500 orders'),
+    Scenario('plan_waves', plan_waves_dry_run, description='plan_waves(dry_run=True)'),
+    Scenario('route_pick_list', route_pick_list, description='route_storage_units(), 50 units'),
+    Scenario('dashboard_30d', dashboard_30_days, description='dashboard() for 30 days'),
+    Scenario('dashboard_year', dashboard_year, description='dashboard() for 365 days'),
+    Scenario('counter_badges', counter_badges, description='badges()'),
+    Scenario('warehouse_stock', warehouse_stock, description='get_warehouse_stock()'),
+    Scenario('order_report_cached', order_report_cached, writes=True, max_iterations=200,
+             description='generate_report() for a 7-day order report served from the cache'),
+]
+
+
+def run_scenario(scenario, context, iterations=200, concurrency=1, warmup=5):
+    """
+    Выполняет сценарий в concurrency потоках; возвращает пропускную способность и перцентили задержек
+    """
+    if scenario.max_iterations:
+        iterations = min(iterations, scenario.max_iterations)
+    remaining = [iterations]
+    lock = threading.Lock()
+    ready = threading.Barrier(concurrency + 1)
+    latencies = []
+    errors = []
+
+    def take():
+        with lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def call(operation):
+        if not scenario.writes:
+            return operation()
+        with transaction.atomic():
+            result = operation()
+            transaction.set_rollback(True)
+        return result
+
+    def worker():
+        samples = []
+        try:
+            try:
+                operation = scenario.factory(context)
+                for _number in range(warmup):
+                    call(operation)
+            finally:
+                ready.wait()
+            while take():
+                started = time.perf_counter()
+                try:
+                    call(operation)
+                except Exception as exc:
+                    errors.append(repr(exc))
+                    continue
+                samples.append(time.perf_counter() - started)
+                reset_queries()
+        except Exception as exc:
+            errors.append(repr(exc))
+        finally:
+            with lock:
+                latencies.extend(samples)
+            connection.close()
+
+    threads = [threading.Thread(target=worker, name=f'{scenario.name}-{number}') for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - started
+    close_old_connections()
+
+    return {
+        'concurrency': concurrency,
+        'wall_seconds': wall_seconds,
+        'throughput_per_second': len(latencies) / wall_seconds if wall_seconds else 0.0,
+        'errors': len(errors),
+        **summarize_latencies(latencies),
+        'first_error': errors[0] if errors else None,
+    }
+
+
+def dataset_summary(company):
+    return {
+        'company': company.pk,
+        'orders': Order.objects.filter(company=company).count(),
+        'products': Product.objects.filter(company=company).count(),
+        'storage_units': StorageUnit.objects.filter(warehouse__company=company).count(),
+    }
@@ -0,0 +1,183 @@
+"""
+Постраничная выдача списков по ключу (keyset).
+
+Страница — строки, следующие за последней строкой предыдущей страницы в
+порядке составного ключа представления (keyset_ordering, по умолчанию
+-created_at, -id). Условие (created_at, id) < (%s, %s) сравнивает строки
+целиком и продолжает чтение индекса с места остановки, поэтому глубокая
+страница стоит столько же, сколько первая: ни COUNT(*), ни OFFSET не
+выполняются. Последнее поле ключа должно быть уникальным, иначе строки с
+одинаковым ключом на границе страниц терялись бы.
+
+Курсор — непрозрачная строка с направлением и значениями ключа граничной
+строки. ?total=approximate добавляет к ответу оценку общего числа строк по
+статистике планировщика (EXPLAIN) без чтения таблицы.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import F, Field, Func, Value
+from django.db.models.lookups import GreaterThan, LessThan
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+DEFAULT_ORDERING = ('-created_at', '-id')
+
+
+class Row(Func):
+    """
+    Конструктор строки (a, b, ...) для сравнения составных ключей
+    """
+    template = '(%(expressions)s)'
+    output_field = Field()
+
+
+def _fields(queryset, ordering):
+    names = [name.lstrip('-') for name in ordering]
+    if len({name.startswith('-') for name in ordering}) > 1:
+        raise ValueError('Keyset ordering must use one direction for all fields')
+    return names, [queryset.model._meta.get_field(name) for name in names]
+
+
+def keyset_page(queryset, ordering=DEFAULT_ORDERING, size=None, after=None, before=None):
+    """
+    Страница queryset в порядке ordering после ключа after (или перед ключом before).
+
+    Возвращает (строки, есть ли еще строки в направлении чтения).
+    """
+    size = size or api_settings.PAGE_SIZE
+    names, fields = _fields(queryset, ordering)
+    descending = ordering[0].startswith('-')
+    position = after if before is None else before
+    backward = before is not None
+    if position is not None:
+        key = Row(*(F(name) for name in names))
+        values = Row(*(Value(value, output_field=field) for value, field in zip(position, fields)))
+        # Вперед по убыванию — меньшие ключи, назад — большие
+        lookup = LessThan if descending != backward else GreaterThan
+        queryset = queryset.filter(lookup(key, values))
+    if backward:
+        ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+    rows = list(queryset.order_by(*ordering)[:size + 1])
+    more = len(rows) > size
+    rows = rows[:size]
+    if backward:
+        rows.reverse()
+    return rows, more
+
+
+def estimate_count(queryset):
+    """
+    Оценка числа строк queryset планировщиком (Plan Rows корневого узла)
+    """
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        document = cursor.fetchone()[0]
+    if isinstance(document, str):
+        document = json.loads(document)
+    return int(document[0]['Plan']['Plan Rows'])
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, values], default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, fields):
+    """
+    (направление, значения ключа) курсора; NotFound для испорченного курсора
+    """
+    try:
+        direction, values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if direction not in ('next', 'previous') or len(values) != len(fields):
+            raise ValueError(direction)
+        return direction, [field.to_python(value) for field, value in zip(fields, values)]
+    except (TypeError, ValueError, UnicodeDecodeError, ValidationError):
+        raise NotFound('Invalid cursor')
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по составному ключу представления (keyset_ordering) с курсорами next/previous
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    total_query_param = 'total'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = getattr(view, 'keyset_ordering', DEFAULT_ORDERING)
+        self.names, fields = _fields(queryset, self.ordering)
+        size = self.get_page_size(request)
+
+        direction, position = None, None
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            direction, position = decode_cursor(cursor, fields)
+        rows, more = keyset_page(
+            queryset, self.ordering, size,
+            after=position if direction == 'next' else None,
+            before=position if direction == 'previous' else None,
+        )
+        # Назад всегда можно вернуться туда, откуда пришли
+        self.has_next = more if direction != 'previous' else True
+        self.has_previous = more if direction == 'previous' else direction == 'next'
+        self.rows = rows
+
+        self.total = None
+        if request.query_params.get(self.total_query_param) == 'approximate':
+            self.total = estimate_count(queryset)
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return min(max(size, 1), self.max_page_size)
+
+    def _link(self, direction, row):
+        url = self.request.build_absolute_uri()
+        values = [getattr(row, name) for name in self.names]
+        return replace_query_param(url, self.cursor_query_param, encode_cursor(direction, values))
+
+    def get_next_link(self):
+        if not self.has_next or not self.rows:
+            return None
+        return self._link('next', self.rows[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.rows:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self._link('previous', self.rows[0])
+
+    def get_paginated_response(self, data):
+        body = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+        if self.total is not None:
+            body['total_estimate'] = self.total
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'total_estimate': {'type': 'integer', 'description': 'Only with ?total=approximate'},
+                'results': schema,
+            },
+        }
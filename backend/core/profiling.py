@@ -0,0 +1,334 @@
+"""
+Профилирование запросов к базе по запросам API и задачам Celery.
+
+profile(label) ставит на все подключения потока execute_wrapper и считает
+операторы, их время, точные повторы (тот же SQL с теми же параметрами) и
+самые медленные тексты операторов. Издержки — perf_counter и запись в
+словарь на оператор; параметры в профиле не хранятся.
+
+QueryProfilingMiddleware профилирует каждый запрос API, сигналы Celery
+(api.apps) — каждую задачу:
+
+- в DEBUG ответ получает заголовки X-DB-Queries, X-DB-Duplicates, X-DB-Time
+  и Server-Timing;
+- сводки копятся в памяти процесса по (вид, маршрут или задача, час) и не
+  чаще QUERY_PROFILING_FLUSH_INTERVAL секунд сливаются в QueryStats одним
+  INSERT ... ON CONFLICT с приращением, так что процессы не мешают друг другу.
+
+Бюджет запросов объявляется в представлении: query_budget или
+get_query_budget() (FieldsetMixin добавляет запросы раскрытых связей и оценки ?total=approximate).
+Превышение пишется в журнал и в сводку, а assert_query_budget() и
+check_endpoint_budget() (manage.py check_query_budgets) завершаются ошибкой
+со списком повторяющихся операторов — так N+1 находится до выкладки.
+"""
+import heapq
+import json
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connection, connections
+from django.utils import timezone
+
+from api.models import QueryStats
+
+logger = logging.getLogger(__name__)
+
+MAX_SQL_LENGTH = 2000
+# Точные повторы отслеживаются для первых операторов профиля: длинная задача не копит память
+MAX_TRACKED_STATEMENTS = 10000
+
+_local = threading.local()
+_tasks = {}
+
+
+@dataclass
+class QueryProfile:
+    """
+    Запросы к базе одного запроса API, задачи или блока кода
+    """
+    label: str
+    count: int = 0
+    duplicates: int = 0
+    time: float = 0.0
+    # SQL без параметров -> [выполнений, наибольшее время]
+    statements: dict = field(default_factory=dict)
+    seen: set = field(default_factory=set, repr=False)
+
+    def record(self, sql, params, many, duration):
+        self.count += 1
+        self.time += duration
+        statement = self.statements.get(sql)
+        if statement is None:
+            self.statements[sql] = [1, duration]
+        else:
+            statement[0] += 1
+            statement[1] = max(statement[1], duration)
+        if not many and len(self.seen) < MAX_TRACKED_STATEMENTS:
+            key = hash((sql, repr(params)))
+            if key in self.seen:
+                self.duplicates += 1
+            else:
+                self.seen.add(key)
+
+    def repeated(self):
+        """
+        Операторы, выполненные больше одного раза: [(выполнений, SQL)] по убыванию
+        """
+        return sorted(
+            ((count, sql) for sql, (count, _slowest) in self.statements.items() if count > 1), reverse=True,
+        )
+
+    def slowest(self, limit=None):
+        """
+        Самые медленные операторы: [(время, SQL)] по убыванию
+        """
+        limit = limit or settings.QUERY_PROFILING_SLOWEST
+        return heapq.nlargest(limit, ((slowest, sql) for sql, (_count, slowest) in self.statements.items()))
+
+
+class _Recorder:
+    def __init__(self, profile):
+        self.profile = profile
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.profile.record(sql, params, many, time.perf_counter() - start)
+
+
+@contextmanager
+def profile(label):
+    """
+    Профиль запросов блока на всех подключениях текущего потока
+    """
+    current = QueryProfile(label)
+    recorder = _Recorder(current)
+    _local.depth = getattr(_local, 'depth', 0) + 1
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+            yield current
+    finally:
+        _local.depth -= 1
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Блок или конечная точка выполнили больше запросов, чем объявлено
+    """
+
+    def __init__(self, profile, budget):
+        self.profile = profile
+        self.budget = budget
+        lines = [f'{profile.label}: {profile.count} queries exceed the budget of {budget}']
+        lines += [f'  {count}x {sql[:300]}' for count, sql in profile.repeated()]
+        super().__init__('\n'.join(lines))
+
+
+@contextmanager
+def assert_query_budget(budget, label='block'):
+    """
+    Профиль блока; QueryBudgetExceeded, если запросов больше budget
+    """
+    with profile(label) as current:
+        yield current
+    if current.count > budget:
+        raise QueryBudgetExceeded(current, budget)
+
+
+def declared_budget(view):
+    """
+    Бюджет запросов представления DRF или None, если он не объявлен
+    """
+    get_budget = getattr(view, 'get_query_budget', None)
+    if get_budget is not None:
+        return get_budget()
+    return getattr(view, 'query_budget', None)
+
+
+def check_endpoint_budget(client, path, data=None, label=None):
+    """
+    GET path клиентом тестов; (профиль, бюджет) или QueryBudgetExceeded
+    """
+    with profile(label or path) as current:
+        response = client.get(path, data)
+    if response.status_code != 200:
+        raise AssertionError(f'{current.label}: HTTP {response.status_code}')
+    budget = declared_budget(getattr(response, 'renderer_context', {}).get('view'))
+    if budget is None:
+        raise AssertionError(f'{current.label}: the view declares no query budget')
+    if current.count > budget:
+        raise QueryBudgetExceeded(current, budget)
+    return current, budget
+
+
+@dataclass
+class _Totals:
+    calls: int = 0
+    queries: int = 0
+    duplicates: int = 0
+    db_time: float = 0.0
+    max_queries: int = 0
+    max_db_time: float = 0.0
+    over_budget: int = 0
+    slowest: dict = field(default_factory=dict)
+
+    def add(self, profile, over_budget):
+        self.calls += 1
+        self.queries += profile.count
+        self.duplicates += profile.duplicates
+        self.db_time += profile.time
+        self.max_queries = max(self.max_queries, profile.count)
+        self.max_db_time = max(self.max_db_time, profile.time)
+        self.over_budget += over_budget
+        for duration, sql in profile.slowest():
+            sql = sql[:MAX_SQL_LENGTH]
+            self.slowest[sql] = max(duration, self.slowest.get(sql, 0))
+        if len(self.slowest) > settings.QUERY_PROFILING_SLOWEST:
+            top = heapq.nlargest(settings.QUERY_PROFILING_SLOWEST, self.slowest.items(), key=lambda item: item[1])
+            self.slowest = dict(top)
+
+
+class QueryStatsBuffer:
+    """
+    Сводки профилей процесса до записи в QueryStats
+    """
+    columns = (
+        'kind', 'name', 'period', 'calls', 'queries', 'duplicates', 'db_time', 'max_queries', 'max_db_time',
+        'over_budget', 'slowest',
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.flushed_at = time.monotonic()
+
+    def add(self, kind, profile, over_budget=False):
+        period = timezone.now().replace(minute=0, second=0, microsecond=0)
+        with self.lock:
+            key = (kind, profile.label[:255], period)
+            if key not in self.totals:
+                self.totals[key] = _Totals()
+            self.totals[key].add(profile, over_budget)
+
+    def flush_if_due(self):
+        # Не внутри чужой транзакции и не внутри другого профиля (задача, выполненная в запросе)
+        if getattr(_local, 'depth', 0) or connection.in_atomic_block:
+            return
+        if time.monotonic() - self.flushed_at >= settings.QUERY_PROFILING_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """
+        Сливает накопленные сводки с QueryStats; при ошибке базы они теряются, а не копятся
+        """
+        with self.lock:
+            totals, self.totals = self.totals, {}
+            self.flushed_at = time.monotonic()
+        if not totals:
+            return 0
+        rows, params = [], []
+        for (kind, name, period), total in totals.items():
+            slowest = sorted(([duration, sql] for sql, duration in total.slowest.items()), reverse=True)
+            rows.append(f'({", ".join(["%s"] * (len(self.columns) - 1))}, %s::jsonb)')
+            params += [
+                kind, name, period, total.calls, total.queries, total.duplicates, total.db_time, total.max_queries,
+                total.max_db_time, total.over_budget, json.dumps(slowest),
+            ]
+        table = QueryStats._meta.db_table
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {table} AS s ({", ".join(self.columns)}) VALUES {", ".join(rows)}
+                    ON CONFLICT (kind, name, period) DO UPDATE SET
+                        calls = s.calls + EXCLUDED.calls,
+                        queries = s.queries + EXCLUDED.queries,
+                        duplicates = s.duplicates + EXCLUDED.duplicates,
+                        db_time = s.db_time + EXCLUDED.db_time,
+                        max_queries = GREATEST(s.max_queries, EXCLUDED.max_queries),
+                        max_db_time = GREATEST(s.max_db_time, EXCLUDED.max_db_time),
+                        over_budget = s.over_budget + EXCLUDED.over_budget,
+                        slowest = (
+                            SELECT COALESCE(jsonb_agg(statement ORDER BY (statement->>0)::float DESC), '[]')
+                            FROM (
+                                SELECT statement FROM (
+                                    SELECT DISTINCT ON (statement->>1) statement
+                                    FROM jsonb_array_elements(s.slowest || EXCLUDED.slowest) AS statement
+                                    ORDER BY statement->>1, (statement->>0)::float DESC
+                                ) AS distinct_statements
+                                ORDER BY (statement->>0)::float DESC
+                                LIMIT %s
+                            ) AS top_statements
+                        )
+                    """,
+                    params + [settings.QUERY_PROFILING_SLOWEST],
+                )
+        except DatabaseError as exc:
+            logger.warning('Query stats flush failed, %s rows dropped: %s', len(rows), exc)
+            return 0
+        return len(rows)
+
+
+stats = QueryStatsBuffer()
+
+
+def _route(request):
+    match = request.resolver_match
+    # Неразрешенные пути сводятся в одну строку, чтобы сводка не росла от сканеров
+    return f'{request.method} {match.route if match else "<unresolved>"}'
+
+
+class QueryProfilingMiddleware:
+    """
+    Профиль запросов к базе каждого запроса API (см. модуль)
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with profile(request.path) as current:
+            response = self.get_response(request)
+        current.label = _route(request)
+        budget = declared_budget(getattr(response, 'renderer_context', {}).get('view'))
+        over_budget = budget is not None and current.count > budget
+        if over_budget:
+            logger.warning('%s: %s queries exceed the budget of %s', current.label, current.count, budget)
+        stats.add('request', current, over_budget)
+
+        if settings.DEBUG:
+            milliseconds = current.time * 1000
+            response['X-DB-Queries'] = str(current.count)
+            response['X-DB-Duplicates'] = str(current.duplicates)
+            response['X-DB-Time'] = f'{milliseconds:.1f}'
+            response['Server-Timing'] = f'db;dur={milliseconds:.1f};desc="{current.count} queries"'
+            if budget is not None:
+                response['X-DB-Query-Budget'] = str(budget)
+        stats.flush_if_due()
+        return response
+
+
+def task_started(task_id=None, task=None, **kwargs):
+    stack = ExitStack()
+    _tasks[task_id] = (stack, stack.enter_context(profile(task.name)))
+
+
+def task_finished(task_id=None, task=None, **kwargs):
+    started = _tasks.pop(task_id, None)
+    if started is None:
+        return
+    stack, current = started
+    stack.close()
+    stats.add('task', current)
+    stats.flush_if_due()
@@ -0,0 +1,271 @@
+"""
+Регрессионная проверка планов горячих запросов (manage.py check_query_plans).
+
+Горячий запрос — реальный путь кода (функция отчета, планирования волн,
+разрешения штрихкодов и т.п.), выполняемый на синтетических данных. SQL,
+который он отправляет в базу, перехватывается, и для каждого SELECT по
+перечисленным таблицам строится EXPLAIN (FORMAT JSON):
+
+- с enable_seqscan = off планировщик выбирает последовательное чтение,
+  только если пригодного индекса нет вовсе — это проверка не зависит от
+  объема данных;
+- в обычном плане последовательное чтение таблицы больше min_pages страниц
+  считается регрессией, а полная стоимость плана сравнивается с бюджетом.
+  Исключение — месячная секция, оставшаяся после отсечения по дате, из
+  которой запрос выбирает заметную долю строк (SEQ_SCAN_PARTITION_SHARE):
+  читать ее целиком дешевле, чем по индексу.
+
+Бюджеты стоимости откалиброваны на наборе, который команда загружает по
+умолчанию; для других объемов их масштабирует --cost-scale.
+"""
+import json
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from companies.counters import badges
+from companies.models import Counter
+from core.fieldsets import Selection, plan
+from core.httpcache import catalog_watermark
+from core.pagination import keyset_page
+from orders.models import Order, OrderItem
+from orders.serializers import OrderSerializer
+from orders.waves import build_pick_lists, plan_waves
+from products.barcodes import resolve_from_db
+from products.models import Product, ProductMarketplace
+from reports.cache import watermark
+from reports.models import OrderDailyRollup
+from reports.rendering import orders_source, sales_source
+from reports.rollups import dashboard
+from stock.models import StockBalance
+from stock.services import get_warehouse_stock
+from warehouses.models import StorageUnit, Warehouse
+
+DEFAULT_MIN_PAGES = 64
+SEQ_SCAN_PARTITION_SHARE = 0.25
+
+
+@dataclass(frozen=True)
+class HotQuery:
+    """
+    Горячий путь доступа: run(context) выполняет код, tables — таблицы, которые нельзя читать целиком
+    """
+    name: str
+    run: object
+    tables: tuple
+    max_cost: float
+    description: str = ''
+
+
+@dataclass
+class PlanCheck:
+    """
+    Результат проверки одного перехваченного запроса
+    """
+    query: str
+    sql: str
+    cost: float
+    budget: float
+    scans: list
+    problems: list = field(default_factory=list)
+
+    @property
+    def ok(self):
+        return not self.problems
+
+
+def _open_orders_report(context):
+    queryset, _columns = orders_source(context.company.pk, {
+        'date_from': (timezone.localdate() - timedelta(days=30)).isoformat(),
+        'status': ['new', 'processing'],
+    })
+    return list(queryset[:100])
+
+
+def _sales_report(context):
+    queryset, _columns = sales_source(context.company.pk, {
+        'date_from': (timezone.localdate() - timedelta(days=6)).isoformat(),
+    })
+    return list(queryset[:100])
+
+
+def _marketplace_links(context):
+    marketplace_id = context.marketplace_ids[0]
+    external_ids = list(
+        ProductMarketplace.objects.filter(marketplace_id=marketplace_id).values_list('external_id', flat=True)[:20]
+    )
+    return list(ProductMarketplace.objects.filter(marketplace_id=marketplace_id, external_id__in=external_ids))
+
+
+def _barcode_resolve(context):
+    # Штрихкоды товаров и маркетплейсов: вторые разрешаются только через связи
+    return resolve_from_db(context.company.pk, context.codes[:50] + context.codes[-50:])
+
+
+def _order_list_page(context):
+    # Глубокая страница списка: ключ полугодовой давности вместо OFFSET
+    return keyset_page(
+        Order.objects.filter(company=context.company), after=(timezone.now() - timedelta(days=180), 0),
+    )
+
+
+def _expanded_order_page(context):
+    # Страница списка с ?expand=items.product: заказы, затем строки всех заказов страницы одним запросом
+    selection = Selection.parse('id,status,items.quantity,items.product.name')
+    rows, _more = keyset_page(
+        plan(Order.objects.filter(company=context.company), OrderSerializer(selection=selection), ('created_at',)),
+        size=100,
+    )
+    return [list(order.items.all()) for order in rows]
+
+
+def _product_list_page(context):
+    return keyset_page(
+        Product.objects.filter(company=context.company, is_deleted=False), after=(timezone.now(), 0),
+    )
+
+
+def _catalog_page(context):
+    return list(Product.objects.filter(company=context.company, is_deleted=False).order_by('article')[:50])
+
+
+HOT_QUERIES = [
+    HotQuery('open_orders_report', _open_orders_report, (Order,), 60,
+             'orders of a company by status and creation date'),
+    HotQuery('sales_report', _sales_report, (Order, OrderItem), 4000,
+             'shipped order lines of a company for the last week'),
+    HotQuery('orders_watermark', lambda context: watermark(context.company.pk, 'orders'), (Order,), 20,
+             'latest order change of a company for the report cache'),
+    HotQuery('wave_planning', lambda context: plan_waves(context.warehouse_ids[0], dry_run=True), (Order,), 200,
+             'open orders of a warehouse and existing wave numbers by shipping date'),
+    HotQuery('pick_lists', lambda context: build_pick_lists(context.warehouse_ids[0]),
+             (Order, OrderItem, StockBalance), 200, 'planned open orders of a warehouse with stock locations'),
+    HotQuery('barcode_resolve', _barcode_resolve, (Product, ProductMarketplace), 600,
+             'scanned codes to live products and marketplace links'),
+    HotQuery('catalog_page', _catalog_page, (Product,), 60, 'live products of a company by article'),
+    HotQuery('order_list_page', _order_list_page, (Order,), 60,
+             'a deep keyset page of company orders by (created_at, id)'),
+    HotQuery('expanded_order_page', _expanded_order_page, (Order, OrderItem, Product), 2500,
+             'a keyset page of company orders with their items and products prefetched'),
+    HotQuery('product_list_page', _product_list_page, (Product,), 60,
+             'a keyset page of live company products by (created_at, id)'),
+    HotQuery('product_catalog_watermark', lambda context: catalog_watermark(Product, context.company.pk), (Product,),
+             100, 'latest product change and product count of a company for conditional GET'),
+    HotQuery('storage_unit_catalog_watermark', lambda context: catalog_watermark(StorageUnit, context.company.pk),
+             (StorageUnit, Warehouse), 1000, 'latest storage unit change and unit count of a company (all its units)'),
+    HotQuery('marketplace_links', _marketplace_links, (ProductMarketplace,), 150,
+             'marketplace links by external ID during synchronization'),
+    HotQuery('dashboard', lambda context: dashboard(context.company.pk), (OrderDailyRollup,), 60,
+             'daily rollups of a company for the last 30 days'),
+    HotQuery('counter_badges', lambda context: badges(context.company.pk), (Counter,), 40,
+             'counter values of a company'),
+    HotQuery('warehouse_stock', lambda context: get_warehouse_stock(context.warehouse_ids[0]), (StockBalance,),
+             120, 'positive stock balances of a warehouse'),
+]
+
+
+def explain(sql, seqscan=True):
+    """
+    План запроса в формате JSON; seqscan=False запрещает последовательное чтение, где есть альтернатива
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not seqscan:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+        document = cursor.fetchone()[0]
+        # SET LOCAL переживает освобождение точки сохранения, но не откат к ней
+        transaction.set_rollback(True)
+    if isinstance(document, str):
+        document = json.loads(document)
+    return document[0]['Plan']
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+def _relations(tables):
+    """
+    Таблицы и их секции: {имя отношения: (таблица, число страниц, число строк)}
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT relname, relname, relpages, reltuples FROM pg_class WHERE relname = ANY(%(tables)s)
+            UNION ALL
+            SELECT c.relname, p.relname, c.relpages, c.reltuples
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = ANY(%(tables)s)
+            """,
+            {'tables': list(tables)},
+        )
+        return {name: (table, pages, rows) for name, table, pages, rows in cursor.fetchall()}
+
+
+def _describe(scans, relations):
+    """
+    Виды чтения по таблицам; для секционированных — сколько секций прочитано
+    """
+    partitions = {}
+    for node in scans:
+        table = relations[node['Relation Name']][0]
+        partitions.setdefault((node['Node Type'], table), set()).add(node['Relation Name'])
+    return sorted(
+        f'{node_type} on {table}' + (f' ({len(names)} partitions)' if names != {table} else '')
+        for (node_type, table), names in partitions.items()
+    )
+
+
+def _is_select(sql):
+    return sql.lstrip().upper().startswith(('SELECT', 'WITH'))
+
+
+def check_query(hot_query, context, cost_scale=1.0, min_pages=DEFAULT_MIN_PAGES):
+    """
+    Выполняет горячий запрос и проверяет планы всех его SELECT по отслеживаемым таблицам
+    """
+    tables = {model._meta.db_table for model in hot_query.tables}
+    with transaction.atomic():
+        with CaptureQueriesContext(connection) as captured:
+            hot_query.run(context)
+        transaction.set_rollback(True)
+
+    relations = _relations(tables)
+    budget = hot_query.max_cost * cost_scale
+    checks = []
+    for query in captured.captured_queries:
+        sql = query['sql']
+        if not _is_select(sql):
+            continue
+        plan = explain(sql)
+        scans = [node for node in plan_nodes(plan) if node.get('Relation Name') in relations]
+        if not scans:
+            continue
+        check = PlanCheck(
+            query=hot_query.name, sql=sql, cost=plan['Total Cost'], budget=budget,
+            scans=_describe(scans, relations),
+        )
+        forced = explain(sql, seqscan=False)
+        for node in plan_nodes(forced):
+            if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in relations:
+                check.problems.append(f"no usable index on {relations[node['Relation Name']][0]}")
+        for node in scans:
+            relation = node['Relation Name']
+            table, pages, rows = relations[relation]
+            if node['Node Type'] != 'Seq Scan' or pages < min_pages:
+                continue
+            if table != relation and node['Plan Rows'] >= rows * SEQ_SCAN_PARTITION_SHARE:
+                continue
+            check.problems.append(f'sequential scan on {relation} ({pages} pages)')
+        if check.cost > budget:
+            check.problems.append(f'cost {check.cost:.0f} exceeds budget {budget:.0f}')
+        check.problems = sorted(set(check.problems))
+        checks.append(check)
+    return checks
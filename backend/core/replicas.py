@@ -0,0 +1,204 @@
+"""
+Чтение отчетов и аналитики с реплик (DATABASE_REPLICAS).
+
+Реплика используется только внутри analytics(): блок выбирает одну базу и
+все чтения ORM в нем идут туда (ReplicaRouter), а сырой SQL может взять
+connections[alias]. Запись всегда идет на основную базу. Вне блока
+чтения тоже остаются на основной базе, даже для объектов, прочитанных с
+реплики.
+
+Реплика пригодна, если ее отставание (время с последней воспроизведенной
+транзакции, 0 — если весь полученный WAL воспроизведен) не больше
+REPLICA_MAX_LAG секунд. Отставание измеряется не чаще раза в
+REPLICA_LAG_CHECK_INTERVAL секунд на процесс; недоступная реплика
+непригодна до следующей проверки. Если пригодных реплик нет, блок читает
+основную базу.
+
+Запрос API, который уже писал в основную базу (ORM или сырым SQL), до
+своего конца читает только ее: иначе он мог бы не увидеть собственных
+изменений. Так же читает код внутри транзакции основной базы. Задачи
+Celery не закрепляются — их служебные записи (статус части отчета) не
+касаются читаемых данных, а база для чтения выбирается явно. Вложенный
+блок analytics() использует базу внешнего, поэтому данные и водяные знаки
+кэша отчетов читаются из одного источника.
+"""
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# Отставание реплики в секундах; на основной базе (не в восстановлении) — 0
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+READ_STATEMENTS = ('SELECT', 'SHOW', 'EXPLAIN', 'SET', 'SAVEPOINT', 'RELEASE', 'ROLLBACK', 'FETCH', 'CLOSE')
+
+_scope = ContextVar('analytics_database', default=None)
+# None — записи не отслеживаются (вне запроса API)
+_pinned = ContextVar('primary_pinned', default=None)
+# Псевдоним -> (время проверки по monotonic, отставание или None для недоступной реплики)
+_lags = {}
+
+
+def replica_lag(alias):
+    """
+    Отставание реплики в секундах (с кэшем на REPLICA_LAG_CHECK_INTERVAL); None — реплика недоступна
+    """
+    now = time.monotonic()
+    checked = _lags.get(alias)
+    if checked is not None and now - checked[0] < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return checked[1]
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(LAG_SQL)
+            lag = float(cursor.fetchone()[0])
+    except DatabaseError as exc:
+        logger.warning('Replica %s is unavailable: %s', alias, exc)
+        lag = None
+    _lags[alias] = (now, lag)
+    return lag
+
+
+def is_eligible(alias):
+    if alias == DEFAULT_DB_ALIAS:
+        return True
+    lag = replica_lag(alias)
+    return lag is not None and lag <= settings.REPLICA_MAX_LAG
+
+
+def reads_primary():
+    """
+    Чтения должны видеть записи текущего запроса или транзакции основной базы
+    """
+    return bool(_pinned.get()) or connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+def choose_database():
+    """
+    Пригодная реплика (случайная из пригодных) или основная база
+    """
+    if reads_primary():
+        return DEFAULT_DB_ALIAS
+    eligible = [alias for alias in settings.DATABASE_REPLICAS if is_eligible(alias)]
+    return random.choice(eligible) if eligible else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def analytics(database=None):
+    """
+    Блок аналитических чтений; возвращает псевдоним базы блока.
+
+    database — база, выбранная раньше (например, при постановке частей отчета в очередь): используется,
+    если все еще пригодна, иначе — основная база, которая не старше ни одной реплики.
+    """
+    current = _scope.get()
+    if current is not None:
+        yield current
+        return
+    if reads_primary():
+        database = DEFAULT_DB_ALIAS
+    elif database is None:
+        database = choose_database()
+    elif not is_eligible(database):
+        database = DEFAULT_DB_ALIAS
+    token = _scope.set(database)
+    try:
+        yield database
+    finally:
+        _scope.reset(token)
+
+
+def analytics_connection():
+    """
+    Подключение к базе текущего блока analytics() (для сырого SQL)
+    """
+    return connections[_scope.get() or DEFAULT_DB_ALIAS]
+
+
+def pin_to_primary():
+    if _pinned.get() is not None:
+        _pinned.set(True)
+
+
+def _pin_on_write(execute, sql, params, many, context):
+    if not sql.lstrip()[:9].upper().startswith(READ_STATEMENTS):
+        pin_to_primary()
+    return execute(sql, params, many, context)
+
+
+@contextmanager
+def unit_of_work():
+    """
+    Запрос API: чтения с реплик, пока в основную базу не было записи
+    """
+    token = _pinned.set(bool(_pinned.get()))
+    try:
+        with connections[DEFAULT_DB_ALIAS].execute_wrapper(_pin_on_write):
+            yield
+    finally:
+        _pinned.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Чтения блока analytics() — с его базы, остальные чтения и все записи — с основной
+    """
+
+    def db_for_read(self, model, **hints):
+        return _scope.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии основной базы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """
+    Запрос API как unit_of_work(): после записи чтения аналитики идут на основную базу
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with unit_of_work():
+            return self.get_response(request)
+
+
+def replica_status():
+    """
+    Последние измерения отставания реплик процесса
+    """
+    now = time.monotonic()
+    status = []
+    for alias in settings.DATABASE_REPLICAS:
+        checked = _lags.get(alias)
+        status.append({
+            'alias': alias,
+            'lag': checked[1] if checked else None,
+            'checked_seconds_ago': round(now - checked[0], 1) if checked else None,
+            'eligible': bool(checked) and checked[1] is not None and checked[1] <= settings.REPLICA_MAX_LAG,
+        })
+    return status
@@ -39,9 +39,14 @@ INSTALLED_APPS = [
     'shipments',
     'services',
     'reports',
+    'stock',
 ]
 
 MIDDLEWARE = [
+    # Outermost, so that the query profile covers sessions and authentication too
+    'core.profiling.QueryProfilingMiddleware',
+    # Pins analytics reads to the primary once the request has written (see core.replicas)
+    'core.replicas.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -73,17 +78,50 @@ TEMPLATES = [
 WSGI_APPLICATION = 'core.wsgi.application'
 
 # Database
+# core.db is the PostgreSQL backend with a per-process connection pool: Django still closes the connection
+# at the end of every request and task (CONN_MAX_AGE = 0), and closing returns it to the pool.
+# DB_POOL=0 falls back to a new connection per request.
+DB_POOL = os.environ.get('DB_POOL', '1') == '1'
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db' if DB_POOL else 'django.db.backends.postgresql',
         'NAME': 'lite_wms',
         'USER': 'postgres',
         'PASSWORD': 'postgres',
         'HOST': 'localhost',
         'PORT': '5432',
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),  # kept open while idle
+                # Per process: gunicorn workers (or Celery processes) x max_size must fit max_connections
+                'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+                'timeout': 10,  # seconds a checkout waits for a free connection
+                'max_idle': 300,  # seconds before idle connections above min_size are closed
+                'max_lifetime': 3600,  # seconds before a connection is replaced
+                'health_check_after': 30,  # idle seconds after which a checkout runs SELECT 1 first
+            },
+        } if DB_POOL else {},
     }
 }
 
+# Read replicas for reports and analytics (see core.replicas): DB_REPLICA_HOSTS=host[:port],... adds
+# replica_1, replica_2, ... with the credentials of default. Only analytics() blocks read from them.
+DATABASE_REPLICAS = []
+for number, address in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    host, _, port = address.strip().partition(':')
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 10))  # seconds; laggier replicas fall back to primary
+REPLICA_LAG_CHECK_INTERVAL = 5  # seconds a process reuses a replica's measured lag
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -122,12 +160,14 @@ AUTH_USER_MODEL = 'users.User'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Tokens carry company and permission claims: no user lookup per request (see users.authentication)
+        'users.authentication.TenantJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # Keyset pagination on (created_at, id): no COUNT(*) or OFFSET, deep pages cost the same as the first
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
     'PAGE_SIZE': 20,
 }
 
@@ -145,16 +185,142 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.TenantTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.TenantTokenRefreshSerializer',
 }
+# Seconds a process trusts a user's cached token version: revocation reaches other processes within this time
+JWT_TOKEN_VERSION_TTL = 5
 
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
 
 # Celery settings
-CELERY_BROKER_URL = 'redis://localhost:6379/0'
-CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
+# Run tasks in-process without a broker (tests, local development)
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER') == '1'
+CELERY_TASK_EAGER_PROPAGATES = True
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'reconcile-counters': {
+        'task': 'companies.reconcile_counters',
+        'schedule': 60 * 60,  # seconds
+    },
+    'maintain-order-partitions': {
+        'task': 'orders.maintain_partitions',
+        'schedule': 24 * 60 * 60,
+    },
+    'archive-orders': {
+        'task': 'orders.archive_orders',
+        'schedule': 24 * 60 * 60,
+    },
+    'prune-query-stats': {
+        'task': 'api.prune_query_stats',
+        'schedule': 24 * 60 * 60,
+    },
+    'render-pending-images': {
+        'task': 'products.render_pending_images',
+        'schedule': 10 * 60,
+    },
+}
+
+# Marketplace sync settings
+MARKETPLACE_API_URL = os.environ.get('MARKETPLACE_API_URL', 'http://localhost:8765')
+MARKETPLACE_API_URLS = {
+    # 'wildberries': 'https://...',
+}
+MARKETPLACE_SYNC_CONCURRENCY = {
+    'default': 20,
+}
+MARKETPLACE_SYNC_TIMEOUT = 30
+
+# Marketplace order webhooks (ASGI intake, see orders.webhooks)
+WEBHOOK_QUEUE_SIZE = 20000  # events buffered per process; a full queue answers 503
+WEBHOOK_BATCH_SIZE = 500  # events per write
+WEBHOOK_BATCH_INTERVAL = 0.05  # seconds the writer waits to fill a batch
+WEBHOOK_MAX_BODY = 1024 * 1024  # bytes
+WEBHOOK_MAX_EVENTS = 1000  # events per request
+WEBHOOK_RECENT_EVENTS = 100000  # event keys a process remembers to answer redeliveries without writing
+
+# Cache settings: CACHE_URL=redis://... shares cached responses between processes
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['CACHE_URL'],
+    } if os.environ.get('CACHE_URL') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+# Catalog responses (products, warehouses, storage units, services, marketplaces, see core.httpcache)
+CATALOG_CACHE = 'default'
+CATALOG_CACHE_TIMEOUT = 60 * 60  # seconds; entries are also checked against the catalog watermark
+
+# Product image renditions (see products.renditions)
+PRODUCT_IMAGE_RENDITIONS = {
+    # name: longest side, px
+    'thumb': 160,
+    'card': 480,
+    'zoom': 1200,
+}
+PRODUCT_IMAGE_FORMATS = ['avif', 'webp', 'jpeg']  # by preference; formats Pillow cannot write are skipped
+PRODUCT_IMAGE_QUALITY = 80
+PRODUCT_IMAGE_TASK_BATCH = 20  # images per rendering task
+PRODUCT_IMAGE_WORKERS = os.cpu_count() or 1  # processes of render_product_images
+PRODUCT_IMAGE_BATCH_SIZE = 500  # images claimed at a time by render_product_images
+PRODUCT_IMAGE_RENDER_TIMEOUT = 15 * 60  # seconds before a stuck rendering is queued again
+PRODUCT_IMAGE_CACHE_MAX_AGE = 365 * 24 * 60 * 60  # renditions are immutable
+
+# Barcode index settings
+BARCODE_INDEX_POLL_INTERVAL = 2
+BARCODE_INDEX_MAX_OVERLAY = 50000
+BARCODE_INDEX_MAX_AGE = 15 * 60
+
+# Wave planning settings
+# Shipping cutoff times per marketplace type, local to TIME_ZONE
+WAVE_CUTOFF_TIMES = {
+    'default': ['12:00', '18:00'],
+}
+# Orders created closer than this to a cutoff move to the next one
+WAVE_PICKING_LEAD_MINUTES = 60
+WAVE_MAX_ORDERS = 200
+WAVE_MAX_WEIGHT = 500000  # grams
+
+# Order partitioning settings (monthly partitions by created_at, local to TIME_ZONE)
+ORDER_PARTITION_MONTHS_AHEAD = 3
+# Partitions older than this many months are detached by the maintenance task; None keeps them attached
+ORDER_PARTITION_RETENTION_MONTHS = None
+# Closed partitions are frozen once their oldest transaction ID is older than this
+ORDER_PARTITION_FREEZE_AGE = 50000000
+
+# Order archive settings (delivered, cancelled and returned orders moved to Parquet files)
+ORDER_ARCHIVE_ROOT = os.environ.get('ORDER_ARCHIVE_ROOT', os.path.join(BASE_DIR, 'archive'))
+ORDER_ARCHIVE_AFTER_MONTHS = 12
+ORDER_ARCHIVE_BATCH_SIZE = 5000  # orders per file and per deleting transaction
+ORDER_ARCHIVE_LOCK_TIMEOUT = '2s'  # a batch gives up instead of queueing behind writers
+
+# Pick route settings
+# Storage unit codes are parsed as <aisle><sep><rack>[<sep><shelf>[<sep><cell>]], e.g. A-03-2-1
+PICK_ROUTE_CODE_PATTERN = r'^(?P<aisle>[A-Za-z]+|\d+)[^A-Za-z0-9]*(?P<rack>\d+)'
+PICK_ROUTE_LAYOUT = {
+    'aisle_spacing': 3.0,  # metres between aisle centre lines
+    'rack_length': 1.2,  # metres along the aisle per rack
+    'depot_x': 0.0,  # packing station position on the front cross aisle
+}
+PICK_ROUTE_TIME_BUDGET = 0.02  # seconds of 2-opt improvement per route
+
+# Report rendering settings
+REPORT_CHUNK_SIZE = 5000
+REPORT_CACHE_MAX_BYTES = 2 * 1024 ** 3  # total size of cached report files
+REPORT_CACHE_MAX_ENTRIES = 1000
+REPORT_PIPELINE_MAX_CHUNKS = 32
+REPORT_PIPELINE_MIN_CHUNK_ROWS = 50000  # smaller reports are rendered as a single chunk
+
+# Query profiling settings (per API request and Celery task, see core.profiling)
+QUERY_PROFILING = os.environ.get('QUERY_PROFILING', '1') == '1'
+QUERY_PROFILING_FLUSH_INTERVAL = 30  # seconds between writes of a process's stats to QueryStats
+QUERY_PROFILING_SLOWEST = 5  # slowest statements kept per endpoint and hour
+QUERY_PROFILING_RETENTION_DAYS = 14
@@ -0,0 +1,103 @@
+"""
+Тесты маршрутизации чтений на реплики (core.replicas).
+
+Нужны два псевдонима базы: реплика в тестах — зеркало основной базы
+(TEST: {'MIRROR': 'default'}), поэтому достаточно одного PostgreSQL:
+DB_REPLICA_HOSTS=localhost python manage.py test core.tests
+"""
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from companies.models import Company
+
+from . import replicas
+
+REPLICA = settings.DATABASE_REPLICAS[0] if settings.DATABASE_REPLICAS else None
+
+
+@skipUnless(REPLICA, 'DB_REPLICA_HOSTS is not set')
+class ReplicaRouterTests(TransactionTestCase):
+    # Без транзакции теста: внутри транзакции основной базы чтения закреплены за ней
+    databases = {DEFAULT_DB_ALIAS, REPLICA} if REPLICA else {DEFAULT_DB_ALIAS}
+
+    def setUp(self):
+        lags = mock.patch.dict(replicas._lags, clear=True)
+        lags.start()
+        self.addCleanup(lags.stop)
+
+    def lag(self, value):
+        return mock.patch.object(replicas, 'replica_lag', return_value=value)
+
+    def test_reads_go_to_replica_only_inside_analytics(self):
+        with replicas.analytics() as alias:
+            self.assertEqual(alias, REPLICA)
+            self.assertEqual(Company.objects.all().db, REPLICA)
+            self.assertEqual(replicas.analytics_connection().alias, REPLICA)
+        self.assertEqual(Company.objects.all().db, DEFAULT_DB_ALIAS)
+
+    def test_write_pins_reads_to_primary_until_end_of_unit_of_work(self):
+        with replicas.unit_of_work():
+            with replicas.analytics() as alias:
+                self.assertEqual(alias, REPLICA)
+            Company.objects.create(name='Pinned', inn='7700000002', legal_address='-')
+            with replicas.analytics() as alias:
+                self.assertEqual(alias, DEFAULT_DB_ALIAS)
+                self.assertEqual(Company.objects.all().db, DEFAULT_DB_ALIAS)
+        with replicas.unit_of_work():
+            with replicas.analytics() as alias:
+                self.assertEqual(alias, REPLICA)
+
+    def test_raw_sql_write_pins_reads_to_primary(self):
+        company = Company.objects.create(name='Raw', inn='7700000003', legal_address='-')
+        with replicas.unit_of_work():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            with replicas.analytics() as alias:
+                self.assertEqual(alias, REPLICA)
+            with connection.cursor() as cursor:
+                cursor.execute(f'UPDATE {Company._meta.db_table} SET name = %s WHERE id = %s', ['Raw 2', company.pk])
+            with replicas.analytics() as alias:
+                self.assertEqual(alias, DEFAULT_DB_ALIAS)
+
+    def test_writes_outside_unit_of_work_do_not_pin(self):
+        Company.objects.create(name='Task', inn='7700000004', legal_address='-')
+        with replicas.analytics() as alias:
+            self.assertEqual(alias, REPLICA)
+
+    def test_lagging_or_unavailable_replica_falls_back_to_primary(self):
+        for lag in (settings.REPLICA_MAX_LAG + 1, None):
+            with self.subTest(lag=lag), self.lag(lag):
+                with replicas.analytics() as alias:
+                    self.assertEqual(alias, DEFAULT_DB_ALIAS)
+                # База, выбранная раньше, тоже не используется, пока не станет пригодной
+                with replicas.analytics(REPLICA) as alias:
+                    self.assertEqual(alias, DEFAULT_DB_ALIAS)
+        with self.lag(settings.REPLICA_MAX_LAG):
+            with replicas.analytics(REPLICA) as alias:
+                self.assertEqual(alias, REPLICA)
+
+    def test_lag_is_measured_once_per_interval(self):
+        with CaptureQueriesContext(connections[REPLICA]) as queries:
+            # Зеркало — основная база, не в восстановлении: отставание 0
+            self.assertEqual(replicas.replica_lag(REPLICA), 0)
+            self.assertEqual(replicas.replica_lag(REPLICA), 0)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(replicas.replica_status()[0]['eligible'], True)
+
+    def test_nested_analytics_reuses_outer_database(self):
+        with replicas.analytics() as outer:
+            self.assertEqual(outer, REPLICA)
+            # Реплика стала непригодной посреди блока: вложенный блок все равно читает базу внешнего
+            with self.lag(None):
+                with replicas.analytics() as inner:
+                    self.assertEqual(inner, outer)
+                with replicas.analytics(DEFAULT_DB_ALIAS) as inner:
+                    self.assertEqual(inner, outer)
+                    self.assertEqual(Company.objects.all().db, outer)
+        with replicas.analytics(DEFAULT_DB_ALIAS) as outer:
+            with replicas.analytics() as inner:
+                self.assertEqual(inner, DEFAULT_DB_ALIAS)
@@ -0,0 +1,49 @@
+"""
+Триггеры PostgreSQL уровня оператора с таблицами переходов.
+
+Тело триггера видит затронутые оператором строки как old_rows/new_rows и
+обрабатывает их одним запросом, поэтому пакетная загрузка, queryset.update()
+и сырые запросы обходятся одним срабатыванием на оператор.
+
+Удаление при переносе строк в архив (orders.archive) — не изменение данных:
+транзакция архивации включает ARCHIVE_SETTING (archiving()), а тела
+триггеров, обернутые в unless_archiving(), в ней не выполняются.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+TRANSITIONS = {
+    'INSERT': 'NEW TABLE AS new_rows',
+    'UPDATE': 'OLD TABLE AS old_rows NEW TABLE AS new_rows',
+    'DELETE': 'OLD TABLE AS old_rows',
+}
+
+ARCHIVE_SETTING = 'wms.archiving'
+
+
+def unless_archiving(body):
+    return f"IF current_setting('{ARCHIVE_SETTING}', true) IS DISTINCT FROM 'on' THEN\n{body}\nEND IF;"
+
+
+def archiving(cursor):
+    """
+    Отмечает текущую транзакцию как перенос в архив (до ее окончания)
+    """
+    cursor.execute(f"SET LOCAL {ARCHIVE_SETTING} = 'on'")
+
+
+def install_statement_triggers(bodies, suffix, using=DEFAULT_DB_ALIAS):
+    """
+    Создает (или пересоздает) функции и триггеры {таблица}_{suffix}_{операция}; bodies — {(таблица, операция): SQL}
+    """
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        for (table, operation), body in bodies.items():
+            name = f'{table}_{suffix}_{operation.lower()}'
+            cursor.execute(
+                f"CREATE OR REPLACE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$\n"
+                f"BEGIN\n{body}\nRETURN NULL;\nEND\n$$"
+            )
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name} ON {table}')
+            cursor.execute(
+                f'CREATE TRIGGER {name} AFTER {operation} ON {table} '
+                f'REFERENCING {TRANSITIONS[operation]} FOR EACH STATEMENT EXECUTE FUNCTION {name}()'
+            )
@@ -9,3 +9,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+# Индекс штрихкодов строится в фоне при старте процесса
+from products.barcodes import resolver  # noqa: E402
+
+resolver.warm()
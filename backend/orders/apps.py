@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class OrdersConfig(AppConfig):
+    name = 'orders'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+
+        from .signals import install_order_partitions
+
+        post_migrate.connect(install_order_partitions, sender=self, dispatch_uid='order_partitions')
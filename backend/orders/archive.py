@@ -0,0 +1,404 @@
+"""
+Холодный архив завершенных заказов в файлах Parquet.
+
+Заказы в статусах TERMINAL_STATUSES старше ORDER_ARCHIVE_AFTER_MONTHS больше
+не меняются. archive() переносит их пакетами по ORDER_ARCHIVE_BATCH_SIZE:
+заказы одной компании за один месяц вместе с позициями и связями с
+отгрузками записываются в три файла Parquet со сжатием zstd
+(ORDER_ARCHIVE_ROOT/company=<id>/month=<YYYY-MM>/<пакет>-<вид>.parquet) и
+удаляются из рабочих таблиц в той же транзакции, что создает запись
+OrderArchiveBatch. Транзакция пакета короткая, блокирует только строки
+своих заказов (FOR UPDATE SKIP LOCKED — занятые заказы переносятся в
+следующий раз) и не ждет чужих блокировок дольше ORDER_ARCHIVE_LOCK_TIMEOUT,
+поэтому архивация идет параллельно с обычной работой. Файлы пакета,
+транзакция которого откатилась, удаляются сразу; читатели видят только
+файлы зафиксированных пакетов.
+
+Файлы самодостаточны: рядом с идентификаторами хранятся названия
+маркетплейса, склада и товара на момент архивации, день заказа в TIME_ZONE и
+итоги позиций заказа. Колонки названы как пути полей отчетов
+(marketplace__name, order__created_at), поэтому reports.rendering дополняет
+отчеты строками архива без преобразований.
+
+Перенос в архив — не изменение данных: дневные итоги (reports.rollups) и
+ключи OrderKey при удалении заказов архивацией не меняются
+(core.triggers.archiving), а счетчики компаний уменьшаются — они считают
+заказы рабочих таблиц. Ссылки движений остатков на позиции обнуляются, как
+при удалении позиции.
+"""
+import os
+import uuid
+from datetime import date
+from itertools import groupby
+from operator import attrgetter
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+
+from api.models import Marketplace
+from companies.models import Company
+from core.triggers import archiving
+from products.models import Product
+from shipments.models import ShipmentOrder
+from stock.models import StockMovement
+from warehouses.models import Warehouse
+
+from .models import Order, OrderArchiveBatch, OrderItem
+from .partitions import add_months, month_start
+from .signals import orders_archived
+
+TERMINAL_STATUSES = ('delivered', 'cancelled', 'returned')
+
+# Код ошибки PostgreSQL при истечении lock_timeout
+LOCK_NOT_AVAILABLE = '55P03'
+
+MONEY = pa.decimal128(10, 2)
+AMOUNT = pa.decimal128(20, 2)
+TIMESTAMP = pa.timestamp('us', tz='UTC')
+
+SCHEMAS = {
+    'orders': pa.schema([
+        ('id', pa.int64()),
+        ('company_id', pa.int64()),
+        ('marketplace_id', pa.int64()),
+        ('marketplace__name', pa.string()),
+        ('external_id', pa.string()),
+        ('status', pa.string()),
+        ('shipping_warehouse_id', pa.int64()),
+        ('shipping_warehouse__name', pa.string()),
+        ('shipping_wave', pa.string()),
+        ('shipping_date', pa.date32()),
+        ('total_price', MONEY),
+        ('fulfillment_cost', MONEY),
+        ('weight', MONEY),
+        ('items_quantity', pa.int64()),
+        ('items_amount', AMOUNT),
+        ('day', pa.date32()),
+        ('created_at', TIMESTAMP),
+        ('updated_at', TIMESTAMP),
+    ]),
+    'items': pa.schema([
+        ('id', pa.int64()),
+        ('order_id', pa.int64()),
+        ('company_id', pa.int64()),
+        ('product_id', pa.int64()),
+        ('product__article', pa.string()),
+        ('product__barcode', pa.string()),
+        ('product__name', pa.string()),
+        ('quantity', pa.int64()),
+        ('price', MONEY),
+        ('amount', AMOUNT),
+        ('is_processed', pa.bool_()),
+        ('created_at', TIMESTAMP),
+        ('order__external_id', pa.string()),
+        ('order__marketplace_id', pa.int64()),
+        ('order__marketplace__name', pa.string()),
+        ('order__shipping_warehouse_id', pa.int64()),
+        ('order__status', pa.string()),
+        ('order__created_at', TIMESTAMP),
+        ('day', pa.date32()),
+    ]),
+    'links': pa.schema([
+        ('id', pa.int64()),
+        ('shipment_id', pa.int64()),
+        ('order_id', pa.int64()),
+        ('created_at', TIMESTAMP),
+    ]),
+}
+
+# Колонки файлов для параметров отчета (см. reports.rendering)
+FILTER_COLUMNS = {
+    'orders': {
+        'warehouse': 'shipping_warehouse_id',
+        'marketplace': 'marketplace_id',
+        'status': 'status',
+        'date': 'created_at',
+    },
+    'items': {
+        'warehouse': 'order__shipping_warehouse_id',
+        'marketplace': 'order__marketplace_id',
+        'status': 'order__status',
+        'date': 'order__created_at',
+    },
+}
+
+
+def _day(alias):
+    return f"({alias}.created_at AT TIME ZONE '{settings.TIME_ZONE}')::date"
+
+
+def _queries():
+    """
+    SELECT строк пакета по видам файлов; колонки — в порядке SCHEMAS
+    """
+    orders = Order._meta.db_table
+    items = OrderItem._meta.db_table
+    marketplaces = Marketplace._meta.db_table
+    scope = 'o.id = ANY(%(ids)s) AND o.created_at >= %(start)s AND o.created_at < %(end)s'
+    return {
+        'orders': f"""
+            SELECT o.id, o.company_id, o.marketplace_id, m.name, o.external_id, o.status,
+                   o.shipping_warehouse_id, w.name, o.shipping_wave, o.shipping_date,
+                   o.total_price, o.fulfillment_cost, o.weight,
+                   COALESCE(t.quantity, 0), COALESCE(t.amount, 0), {_day('o')}, o.created_at, o.updated_at
+            FROM {orders} o
+            JOIN {marketplaces} m ON m.id = o.marketplace_id
+            LEFT JOIN {Warehouse._meta.db_table} w ON w.id = o.shipping_warehouse_id
+            LEFT JOIN LATERAL (
+                SELECT SUM(quantity) AS quantity, SUM(quantity * price) AS amount
+                FROM {items} WHERE order_id = o.id AND created_at >= o.created_at
+            ) AS t ON true
+            WHERE {scope}
+            ORDER BY o.created_at, o.id
+        """,
+        'items': f"""
+            SELECT i.id, i.order_id, o.company_id, i.product_id, p.article, p.barcode, p.name,
+                   i.quantity, i.price, i.quantity * i.price, i.is_processed, i.created_at,
+                   o.external_id, o.marketplace_id, m.name, o.shipping_warehouse_id, o.status, o.created_at,
+                   {_day('o')}
+            FROM {items} i
+            JOIN {orders} o ON o.id = i.order_id AND i.created_at >= o.created_at
+            JOIN {marketplaces} m ON m.id = o.marketplace_id
+            JOIN {Product._meta.db_table} p ON p.id = i.product_id
+            WHERE {scope} AND i.created_at >= %(start)s
+            ORDER BY o.created_at, i.order_id, i.id
+        """,
+        'links': f"""
+            SELECT l.id, l.shipment_id, l.order_id, l.created_at
+            FROM {ShipmentOrder._meta.db_table} l
+            WHERE l.order_id = ANY(%(ids)s)
+            ORDER BY l.order_id, l.id
+        """,
+    }
+
+
+def _table(schema, rows):
+    columns = list(zip(*rows)) if rows else [()] * len(schema)
+    return pa.Table.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema,
+    )
+
+
+def file_path(path, kind):
+    return os.path.join(settings.ORDER_ARCHIVE_ROOT, f'{path}-{kind}.parquet')
+
+
+def _remove(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _archive_batch(company_id, start, end, batch_size):
+    """
+    Переносит до batch_size заказов компании, созданных в [start, end); возвращает OrderArchiveBatch или None
+    """
+    orders = Order._meta.db_table
+    path = f'company={company_id}/month={start:%Y-%m}/{uuid.uuid4().hex}'
+    written = []
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SET LOCAL lock_timeout = %s', [settings.ORDER_ARCHIVE_LOCK_TIMEOUT])
+            archiving(cursor)
+            cursor.execute(
+                f"""
+                SELECT id FROM {orders}
+                WHERE company_id = %s AND status = ANY(%s) AND created_at >= %s AND created_at < %s
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+                """,
+                [company_id, list(TERMINAL_STATUSES), start, end, batch_size],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                return None
+
+            parameters = {'ids': ids, 'start': start, 'end': end}
+            tables = {}
+            for kind, sql in _queries().items():
+                cursor.execute(sql, parameters)
+                tables[kind] = _table(SCHEMAS[kind], cursor.fetchall())
+            os.makedirs(os.path.dirname(file_path(path, 'orders')), exist_ok=True)
+            for kind, table in tables.items():
+                written.append(file_path(path, kind))
+                pq.write_table(table, written[-1], compression='zstd')
+
+            item_ids = tables['items'].column('id').to_pylist()
+            cursor.execute(
+                f'UPDATE {StockMovement._meta.db_table} SET order_item_id = NULL WHERE order_item_id = ANY(%s)',
+                [item_ids],
+            )
+            cursor.execute(f'DELETE FROM {ShipmentOrder._meta.db_table} WHERE order_id = ANY(%(ids)s)', parameters)
+            cursor.execute(
+                f'DELETE FROM {OrderItem._meta.db_table} WHERE order_id = ANY(%(ids)s) AND created_at >= %(start)s',
+                parameters,
+            )
+            cursor.execute(
+                f'DELETE FROM {orders} WHERE id = ANY(%(ids)s) AND created_at >= %(start)s AND created_at < %(end)s',
+                parameters,
+            )
+            return OrderArchiveBatch.objects.create(
+                company_id=company_id,
+                month=start.date(),
+                path=path,
+                orders=len(ids),
+                items=len(item_ids),
+                links=tables['links'].num_rows,
+                size=sum(os.path.getsize(name) for name in written),
+            )
+    except BaseException:
+        _remove(written)
+        raise
+
+
+def _oldest_month(company_id, before):
+    # Минимум по каждому статусу отдельно читает начало диапазона индекса (company, status, created_at)
+    oldest = [
+        Order.objects.filter(company_id=company_id, status=status, created_at__lt=before)
+        .order_by('created_at').values_list('created_at', flat=True).first()
+        for status in TERMINAL_STATUSES
+    ]
+    oldest = [value for value in oldest if value is not None]
+    return month_start(min(oldest)) if oldest else None
+
+
+def archive(before=None, company_id=None, batch_size=None, max_batches=None):
+    """
+    Переносит в архив завершенные заказы, созданные раньше месяца before.
+
+    По умолчанию before — начало месяца ORDER_ARCHIVE_AFTER_MONTHS назад.
+    Месяц, в котором пакет не дождался блокировки, пропускается до следующего
+    запуска. Возвращает {'batches', 'orders', 'items', 'links', 'bytes', 'skipped'}.
+    """
+    before = month_start(before) if before else add_months(month_start(), -settings.ORDER_ARCHIVE_AFTER_MONTHS)
+    batch_size = batch_size or settings.ORDER_ARCHIVE_BATCH_SIZE
+    if company_id is None:
+        companies = Company.objects.order_by('pk').values_list('pk', flat=True)
+    else:
+        companies = [company_id]
+    totals = dict.fromkeys(('batches', 'orders', 'items', 'links', 'bytes', 'skipped'), 0)
+
+    def exhausted():
+        return max_batches is not None and totals['batches'] >= max_batches
+
+    for company in companies:
+        archived = []
+        month = _oldest_month(company, before)
+        while month is not None and month < before and not exhausted():
+            end = min(add_months(month, 1), before)
+            while not exhausted():
+                try:
+                    batch = _archive_batch(company, month, end, batch_size)
+                except OperationalError as exc:
+                    if getattr(exc.__cause__, 'pgcode', None) != LOCK_NOT_AVAILABLE:
+                        raise
+                    totals['skipped'] += 1
+                    break
+                if batch is None:
+                    break
+                archived.append(batch)
+                totals['batches'] += 1
+                totals['orders'] += batch.orders
+                totals['items'] += batch.items
+                totals['links'] += batch.links
+                totals['bytes'] += batch.size
+                if batch.orders < batch_size:
+                    break
+            month = add_months(month, 1)
+        if archived:
+            orders_archived.send(sender=OrderArchiveBatch, company_id=company, batches=archived)
+        if exhausted():
+            break
+    return totals
+
+
+def batches(company_id=None, date_from=None, date_to=None):
+    """
+    Пакеты архива (компании) с заказами дней [date_from, date_to] по возрастанию месяца
+    """
+    queryset = OrderArchiveBatch.objects.all()
+    if company_id is not None:
+        queryset = queryset.filter(company_id=company_id)
+    if date_from:
+        queryset = queryset.filter(month__gte=date_from.replace(day=1))
+    if date_to:
+        queryset = queryset.filter(month__lte=date_to)
+    return list(queryset.order_by('month', 'company_id', 'pk'))
+
+
+def by_month(archive_batches):
+    """
+    Пакеты, сгруппированные по месяцу: [[пакет, ...], ...]
+    """
+    return [list(group) for _month, group in groupby(archive_batches, key=attrgetter('month'))]
+
+
+def read_table(archive_batches, kind, columns=None, condition=None):
+    """
+    Таблица Arrow вида kind ('orders', 'items', 'links') из файлов пакетов
+    """
+    paths = [file_path(batch.path, kind) for batch in archive_batches]
+    if not paths:
+        table = SCHEMAS[kind].empty_table()
+        return table.select(columns) if columns else table
+    return ds.dataset(paths, schema=SCHEMAS[kind], format='parquet').to_table(columns=columns, filter=condition)
+
+
+def find(company_id, order_id=None, external_id=None, marketplace_id=None):
+    """
+    Архивные заказы компании по ID или внешнему номеру: словари заказа с 'items' и 'shipment_links'
+    """
+    if order_id is None and external_id is None:
+        raise ValueError('Expected an order ID or an external ID')
+    condition = ds.field('id') == order_id if order_id is not None else ds.field('external_id') == external_id
+    if marketplace_id is not None:
+        condition &= ds.field('marketplace_id') == marketplace_id
+    archive_batches = batches(company_id)
+    orders = read_table(archive_batches, 'orders', condition=condition).to_pylist()
+    result = []
+    for order in orders:
+        month = [batch for batch in archive_batches if batch.month == order['day'].replace(day=1)]
+        related = ds.field('order_id') == order['id']
+        result.append({
+            **order,
+            'items': read_table(month, 'items', condition=related).sort_by('id').to_pylist(),
+            'shipment_links': read_table(month, 'links', condition=related).sort_by('id').to_pylist(),
+        })
+    return result
+
+
+def report_rows(company_id, kind, parameters, columns):
+    """
+    Строки архива для отчета: кортежи значений columns по возрастанию даты заказа.
+
+    parameters — параметры отчета (date_from, date_to, warehouse, marketplace, status).
+    """
+    fields = FILTER_COLUMNS[kind]
+    date_from = date.fromisoformat(parameters['date_from']) if parameters.get('date_from') else None
+    date_to = date.fromisoformat(parameters['date_to']) if parameters.get('date_to') else None
+    condition = ds.field('company_id') == company_id
+    if date_from:
+        condition &= ds.field('day') >= date_from
+    if date_to:
+        condition &= ds.field('day') <= date_to
+    for name in ('warehouse', 'marketplace', 'status'):
+        value = parameters.get(name)
+        if not value:
+            continue
+        values = value if isinstance(value, list) else [value]
+        if name != 'status':
+            values = [int(item) for item in values]
+        condition &= ds.field(fields[name]).isin(values)
+
+    order = [(fields['date'], 'ascending'), ('id', 'ascending')]
+    for month in by_month(batches(company_id, date_from, date_to)):
+        # Пакеты месяца дописываются в разные запуски: строки месяца упорядочиваются заново
+        table = read_table(month, kind, columns=sorted({*columns, fields['date'], 'id'}), condition=condition)
+        table = table.sort_by(order).select(columns)
+        for record_batch in table.to_batches(max_chunksize=settings.ORDER_ARCHIVE_BATCH_SIZE):
+            yield from zip(*(column.to_pylist() for column in record_batch.columns))
@@ -0,0 +1,462 @@
+"""
+Пакетная загрузка FBS-заказов маркетплейсов.
+
+Существующие заказы пачки находятся по ключу (marketplace, external_id) в
+OrderKey и обновляются одним UPDATE, новые вставляются одним INSERT, позиции
+новых заказов — одним INSERT из массивов.
+Товары ищутся по штрихкоду одним запросом на пачку.
+
+События вебхуков (ingest_events) несут версию заказа у маркетплейса;
+примененная версия хранится в OrderEventVersion, и повторы или опоздавшие
+события пропускаются.
+"""
+import datetime
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from products.models import Product
+from warehouses.models import Warehouse
+
+from .models import Order, OrderEventVersion, OrderItem, OrderKey
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Ключ рекомендательной блокировки загрузки (второй ключ — ID маркетплейса)
+INGEST_LOCK = 6002
+
+ORDER_STATUS_VALUES = frozenset(status for status, _ in Order.ORDER_STATUSES)
+
+# Суммы и вес заказов и позиций хранятся как numeric(10, 2)
+AMOUNT_FIELD = Order._meta.get_field('total_price')
+AMOUNT_QUANTUM = Decimal(1).scaleb(-AMOUNT_FIELD.decimal_places)
+AMOUNT_LIMIT = Decimal(10) ** (AMOUNT_FIELD.max_digits - AMOUNT_FIELD.decimal_places)
+
+
+@dataclass
+class IngestResult:
+    """
+    Итог загрузки пачки заказов
+    """
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    duplicates: int = 0
+    rejected: list = field(default_factory=list)
+
+    def merge(self, other):
+        self.created += other.created
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+        self.duplicates += other.duplicates
+        self.rejected.extend(other.rejected)
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'duplicates': self.duplicates,
+            'rejected': len(self.rejected),
+            'errors': self.rejected,
+        }
+
+
+class RowError(ValueError):
+    pass
+
+
+def _decimal(value, name, required=False):
+    if value is None or value == '':
+        if required:
+            raise RowError(f"{name} is required")
+        return None
+    try:
+        result = Decimal(str(value))
+    except InvalidOperation:
+        raise RowError(f"{name} must be a number")
+    if not result.is_finite() or result < 0:
+        raise RowError(f"{name} must be a non-negative number")
+    if result < AMOUNT_LIMIT:
+        # Округление как в PostgreSQL; оно же может довести значение до предела
+        result = result.quantize(AMOUNT_QUANTUM, ROUND_HALF_UP)
+    if result >= AMOUNT_LIMIT:
+        raise RowError(f"{name} must be less than {AMOUNT_LIMIT}")
+    return result
+
+
+def _date(value, name):
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{name} must be a date in YYYY-MM-DD format")
+
+
+def _status(value):
+    if not isinstance(value, str) or value not in ORDER_STATUS_VALUES:
+        raise RowError(f"unknown status '{value}'")
+    return value
+
+
+def _parse_order(row):
+    external_id = row.get('external_id')
+    if not external_id or not isinstance(external_id, str) or len(external_id) > 100:
+        raise RowError("external_id must be a non-empty string up to 100 characters")
+
+    status = _status(row.get('status') or 'new')
+
+    warehouse_id = row.get('shipping_warehouse')
+    if warehouse_id is not None and (isinstance(warehouse_id, bool) or not isinstance(warehouse_id, int)):
+        raise RowError("shipping_warehouse must be an integer ID")
+
+    items = row.get('items')
+    if not items or not isinstance(items, list):
+        raise RowError("items must be a non-empty list")
+
+    parsed_items = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise RowError("each item must be an object")
+        barcode = item.get('barcode')
+        if not barcode or not isinstance(barcode, str):
+            raise RowError("item barcode is required")
+        quantity = item.get('quantity', 1)
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0:
+            raise RowError("item quantity must be a positive integer")
+        parsed_items.append((barcode, quantity, _decimal(item.get('price'), 'item price', required=True)))
+
+    return {
+        'external_id': external_id,
+        'status': status,
+        'shipping_warehouse_id': warehouse_id,
+        'shipping_date': _date(row.get('shipping_date'), 'shipping_date'),
+        'total_price': _decimal(row.get('total_price'), 'total_price', required=True),
+        'fulfillment_cost': _decimal(row.get('fulfillment_cost'), 'fulfillment_cost'),
+        'weight': _decimal(row.get('weight'), 'weight'),
+        'items': parsed_items,
+    }
+
+
+def parse_event(row):
+    """
+    Проверяет событие заказа из вебхука; возвращает его ключ (external_id, версия).
+
+    Событие с items — полный заказ (как в ingest_orders), без них — смена статуса.
+    """
+    if not isinstance(row, dict):
+        raise RowError("event must be an object")
+    version = row.get('version')
+    if isinstance(version, bool) or not isinstance(version, int) or version < 0:
+        raise RowError("version must be a non-negative integer")
+    if 'items' in row:
+        _parse_order(row)
+    else:
+        external_id = row.get('external_id')
+        if not external_id or not isinstance(external_id, str) or len(external_id) > 100:
+            raise RowError("external_id must be a non-empty string up to 100 characters")
+        _status(row.get('status'))
+    return row['external_id'], version
+
+
+def _upsert_orders(marketplace, orders, now):
+    """
+    Вставляет новые и обновляет изменившиеся заказы пачки.
+
+    Существующие заказы находятся по OrderKey: у секционированной таблицы
+    заказов нет уникального индекса (marketplace, external_id) для ON CONFLICT,
+    поэтому пачки одного маркетплейса записываются по очереди под
+    рекомендательной блокировкой. Возвращает строки (id, external_id, inserted)
+    только для реально созданных или измененных заказов.
+    """
+    table = Order._meta.db_table
+    changed = []
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [INGEST_LOCK, marketplace.pk])
+        cursor.execute(
+            f'SELECT external_id, order_id, created_at FROM {OrderKey._meta.db_table} '
+            'WHERE marketplace_id = %s AND external_id = ANY(%s)',
+            [marketplace.pk, [order['external_id'] for order in orders]],
+        )
+        existing = {external_id: (order_id, created_at) for external_id, order_id, created_at in cursor.fetchall()}
+        known = [order for order in orders if order['external_id'] in existing]
+        new = [order for order in orders if order['external_id'] not in existing]
+
+        if known:
+            # created_at в условии отсекает секции, в которых заказа быть не может
+            cursor.execute(
+                f"""
+                UPDATE {table} AS o SET
+                    status = src.status,
+                    shipping_warehouse_id = COALESCE(src.shipping_warehouse_id, o.shipping_warehouse_id),
+                    shipping_date = COALESCE(src.shipping_date, o.shipping_date),
+                    total_price = src.total_price,
+                    fulfillment_cost = COALESCE(src.fulfillment_cost, o.fulfillment_cost),
+                    weight = COALESCE(src.weight, o.weight),
+                    updated_at = %s
+                FROM unnest(
+                    %s::bigint[], %s::timestamptz[], %s::varchar[], %s::bigint[], %s::date[],
+                    %s::numeric[], %s::numeric[], %s::numeric[]
+                ) AS src (id, created_at, status, shipping_warehouse_id, shipping_date, total_price,
+                          fulfillment_cost, weight)
+                WHERE o.id = src.id AND o.created_at = src.created_at
+                  AND (o.status, o.shipping_warehouse_id, o.shipping_date, o.total_price, o.fulfillment_cost, o.weight)
+                    IS DISTINCT FROM (
+                        src.status,
+                        COALESCE(src.shipping_warehouse_id, o.shipping_warehouse_id),
+                        COALESCE(src.shipping_date, o.shipping_date),
+                        src.total_price,
+                        COALESCE(src.fulfillment_cost, o.fulfillment_cost),
+                        COALESCE(src.weight, o.weight)
+                    )
+                RETURNING o.id, o.external_id, false
+                """,
+                [
+                    now,
+                    [existing[order['external_id']][0] for order in known],
+                    [existing[order['external_id']][1] for order in known],
+                    *_columns(known),
+                ],
+            )
+            changed.extend(cursor.fetchall())
+
+        if new:
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (
+                    marketplace_id, company_id, external_id, status, shipping_warehouse_id,
+                    shipping_date, total_price, fulfillment_cost, weight, created_at, updated_at
+                )
+                SELECT %s, %s, src.*, %s, %s
+                FROM unnest(
+                    %s::varchar[], %s::varchar[], %s::bigint[], %s::date[],
+                    %s::numeric[], %s::numeric[], %s::numeric[]
+                ) AS src
+                RETURNING id, external_id, true
+                """,
+                [
+                    marketplace.pk, marketplace.company_id, now, now,
+                    [order['external_id'] for order in new],
+                    *_columns(new),
+                ],
+            )
+            changed.extend(cursor.fetchall())
+    return changed
+
+
+def _columns(orders):
+    return [
+        [order['status'] for order in orders],
+        [order['shipping_warehouse_id'] for order in orders],
+        [order['shipping_date'] for order in orders],
+        [order['total_price'] for order in orders],
+        [order['fulfillment_cost'] for order in orders],
+        [order['weight'] for order in orders],
+    ]
+
+
+def _insert_items(rows, now):
+    if not rows:
+        return
+    table = OrderItem._meta.db_table
+    sql = f"""
+        INSERT INTO {table} (order_id, product_id, quantity, price, is_processed, created_at)
+        SELECT src.*, false, %s
+        FROM unnest(%s::bigint[], %s::bigint[], %s::integer[], %s::numeric[]) AS src
+    """
+    order_ids, product_ids, quantities, prices = zip(*rows)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [now, list(order_ids), list(product_ids), list(quantities), list(prices)])
+
+
+def _ingest_batch(marketplace, rows):
+    result = IngestResult()
+
+    orders = {}
+    for row in rows:
+        external_id = row.get('external_id') if isinstance(row, dict) else None
+        try:
+            if not isinstance(row, dict):
+                raise RowError("order must be an object")
+            order = _parse_order(row)
+        except RowError as exc:
+            result.rejected.append({'external_id': external_id, 'error': str(exc)})
+            continue
+        # Повторы внутри пачки: побеждает последняя версия заказа
+        if order['external_id'] in orders:
+            result.duplicates += 1
+        orders[order['external_id']] = order
+
+    barcodes = {barcode for order in orders.values() for barcode, _, _ in order['items']}
+    products = dict(
+        Product.objects.filter(company_id=marketplace.company_id, barcode__in=barcodes)
+        .values_list('barcode', 'id')
+    )
+
+    warehouse_ids = {order['shipping_warehouse_id'] for order in orders.values()} - {None}
+    warehouses = set(
+        Warehouse.objects.filter(company_id=marketplace.company_id, id__in=warehouse_ids)
+        .values_list('id', flat=True)
+    ) if warehouse_ids else set()
+
+    valid = []
+    for order in orders.values():
+        unknown = [barcode for barcode, _, _ in order['items'] if barcode not in products]
+        if unknown:
+            result.rejected.append({
+                'external_id': order['external_id'],
+                'error': f"unknown barcodes: {', '.join(sorted(set(unknown)))}",
+            })
+        elif order['shipping_warehouse_id'] is not None and order['shipping_warehouse_id'] not in warehouses:
+            result.rejected.append({
+                'external_id': order['external_id'],
+                'error': f"unknown shipping_warehouse {order['shipping_warehouse_id']}",
+            })
+        else:
+            valid.append(order)
+
+    if not valid:
+        return result
+
+    now = timezone.now()
+    with transaction.atomic():
+        changed = _upsert_orders(marketplace, valid, now)
+
+        # Состав заказа фиксируется при создании: позиции пишутся только для новых заказов,
+        # чтобы не терять отметки об обработке и ссылки из журнала движений
+        by_external_id = {order['external_id']: order for order in valid}
+        item_rows = []
+        for order_id, external_id, inserted in changed:
+            if inserted:
+                result.created += 1
+                for barcode, quantity, price in by_external_id[external_id]['items']:
+                    item_rows.append((order_id, products[barcode], quantity, price))
+            else:
+                result.updated += 1
+        _insert_items(item_rows, now)
+
+    result.unchanged = len(valid) - len(changed)
+    return result
+
+
+def _update_statuses(marketplace, events):
+    """
+    Меняет статусы существующих заказов; события неизвестных заказов отклоняются
+    """
+    result = IngestResult()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT external_id, order_id, created_at FROM {OrderKey._meta.db_table} '
+            'WHERE marketplace_id = %s AND external_id = ANY(%s)',
+            [marketplace.pk, [event['external_id'] for event in events]],
+        )
+        existing = {external_id: (order_id, created_at) for external_id, order_id, created_at in cursor.fetchall()}
+        known = [event for event in events if event['external_id'] in existing]
+        result.rejected.extend(
+            {'external_id': event['external_id'], 'error': 'unknown order'}
+            for event in events if event['external_id'] not in existing
+        )
+        if not known:
+            return result
+        cursor.execute(
+            f"""
+            UPDATE {Order._meta.db_table} AS o SET status = src.status, updated_at = %s
+            FROM unnest(%s::bigint[], %s::timestamptz[], %s::varchar[]) AS src (id, created_at, status)
+            WHERE o.id = src.id AND o.created_at = src.created_at AND o.status IS DISTINCT FROM src.status
+            """,
+            [
+                timezone.now(),
+                [existing[event['external_id']][0] for event in known],
+                [existing[event['external_id']][1] for event in known],
+                [event['status'] for event in known],
+            ],
+        )
+        result.updated = cursor.rowcount
+    result.unchanged = len(known) - result.updated
+    return result
+
+
+def _fold_events(events, applied):
+    """
+    Сводит события заказов к одному на заказ: свежее полное событие, в котором статус
+    заменен более поздними сменами статуса. События с версией не выше примененной — повторы.
+    """
+    latest = {}
+    duplicates = 0
+    for event in sorted(events, key=lambda event: event['version']):
+        external_id = event['external_id']
+        current = latest.get(external_id)
+        floor = current['version'] if current is not None else applied.get(external_id, -1)
+        if event['version'] <= floor:
+            duplicates += 1
+        elif 'items' in event or current is None:
+            latest[external_id] = event
+        else:
+            latest[external_id] = {**current, 'status': event['status'], 'version': event['version']}
+    return list(latest.values()), duplicates
+
+
+def ingest_events(marketplace, events):
+    """
+    Применяет пачку событий заказов из вебхуков маркетплейса (см. parse_event) одной транзакцией.
+
+    Версии читаются и записываются под той же рекомендательной блокировкой, что и заказы,
+    поэтому параллельные писатели не применят одно событие дважды. Версия отклоненного
+    события не записывается: его можно доставить повторно.
+    """
+    result = IngestResult()
+    table = OrderEventVersion._meta.db_table
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [INGEST_LOCK, marketplace.pk])
+            cursor.execute(
+                f'SELECT external_id, version FROM {table} WHERE marketplace_id = %s AND external_id = ANY(%s)',
+                [marketplace.pk, list({event['external_id'] for event in events})],
+            )
+            fresh, result.duplicates = _fold_events(events, dict(cursor.fetchall()))
+
+        orders = [event for event in fresh if 'items' in event]
+        statuses = [event for event in fresh if 'items' not in event]
+        if orders:
+            result.merge(_ingest_batch(marketplace, orders))
+        if statuses:
+            result.merge(_update_statuses(marketplace, statuses))
+
+        rejected = {error['external_id'] for error in result.rejected}
+        applied = [event for event in fresh if event['external_id'] not in rejected]
+        if applied:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {table} (marketplace_id, external_id, version, updated_at)
+                    SELECT %s, src.*, %s FROM unnest(%s::varchar[], %s::bigint[]) AS src
+                    ON CONFLICT (marketplace_id, external_id)
+                    DO UPDATE SET version = EXCLUDED.version, updated_at = EXCLUDED.updated_at
+                    """,
+                    [
+                        marketplace.pk, timezone.now(),
+                        [event['external_id'] for event in applied],
+                        [event['version'] for event in applied],
+                    ],
+                )
+    return result
+
+
+def ingest_orders(marketplace, rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Загружает заказы маркетплейса с позициями.
+
+    rows — последовательность словарей вида
+    {'external_id', 'status', 'total_price', 'items': [{'barcode', 'quantity', 'price'}], ...}.
+    Каждая пачка из batch_size заказов фиксируется отдельной транзакцией. Повтор external_id
+    внутри пачки засчитывается в duplicates, а применяется последняя строка заказа.
+    """
+    result = IngestResult()
+    for start in range(0, len(rows), batch_size):
+        result.merge(_ingest_batch(marketplace, rows[start:start + batch_size]))
+    return result
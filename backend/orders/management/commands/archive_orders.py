@@ -0,0 +1,45 @@
+from datetime import date, datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from orders import archive
+from orders.partitions import add_months, month_start
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит доставленные, отмененные и возвращенные заказы старше заданного срока в архив Parquet '
+        'и удаляет их из рабочих таблиц короткими пакетами'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, help='Архивировать заказы старше этого числа месяцев')
+        parser.add_argument('--before', help='Архивировать заказы, созданные раньше месяца этой даты (YYYY-MM-DD)')
+        parser.add_argument('--company', type=int, help='Только заказы этой компании')
+        parser.add_argument('--batch-size', type=int, help='Заказов в пакете (файле и транзакции)')
+        parser.add_argument('--max-batches', type=int, help='Остановиться после этого числа пакетов')
+
+    def handle(self, *args, **options):
+        before = None
+        if options['before']:
+            try:
+                day = date.fromisoformat(options['before'])
+            except ValueError:
+                raise CommandError('--before must be a date in YYYY-MM-DD format')
+            before = timezone.make_aware(datetime.combine(day, time.min))
+        elif options['months'] is not None:
+            before = add_months(month_start(), -options['months'])
+
+        result = archive.archive(
+            before=before, company_id=options['company'], batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+        )
+        if result['skipped']:
+            self.stdout.write(self.style.WARNING(
+                f'{result["skipped"]} months skipped on lock timeout, they are retried on the next run'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {result["orders"]} orders, {result["items"]} items and {result["links"]} shipment links '
+            f'in {result["batches"]} batches ({result["bytes"] / 1024 ** 2:.1f} MB)'
+        ))
@@ -0,0 +1,86 @@
+import random
+import uuid
+from decimal import Decimal
+
+from django.db import transaction
+
+from api.models import Marketplace
+from companies.models import Company
+from core.benchmark import BenchmarkCommand, stopwatch
+from orders.ingestion import DEFAULT_BATCH_SIZE, ingest_orders
+from products.models import Product
+
+
+class Command(BenchmarkCommand):
+    help = 'Замеряет скорость пакетной загрузки FBS-заказов (данные откатываются после замера)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=50000, help='Количество заказов')
+        parser.add_argument('--items', type=int, default=2, help='Позиций в заказе')
+        parser.add_argument('--products', type=int, default=5000, help='Размер каталога')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            run_id = uuid.uuid4().hex[:8]
+            company = Company.objects.create(name=f'Benchmark {run_id}', inn=run_id, legal_address='-')
+            marketplace = Marketplace.objects.create(name='Benchmark', type='wildberries', company=company)
+            Product.objects.bulk_create(
+                [
+                    Product(name=f'Product {i}', article=f'A-{i}', barcode=f'{run_id}{i:08d}', company=company)
+                    for i in range(options['products'])
+                ],
+                batch_size=5000,
+            )
+
+            rng = random.Random(42)
+            rows = [
+                {
+                    'external_id': f'{run_id}-{n}',
+                    'status': 'new',
+                    'total_price': str(Decimal(rng.randint(100, 100000)) / 100),
+                    'weight': rng.randint(50, 20000),
+                    'items': [
+                        {
+                            'barcode': f'{run_id}{rng.randrange(options["products"]):08d}',
+                            'quantity': rng.randint(1, 3),
+                            'price': '99.90',
+                        }
+                        for _ in range(options['items'])
+                    ],
+                }
+                for n in range(options['orders'])
+            ]
+
+            with stopwatch() as elapsed:
+                created = ingest_orders(marketplace, rows, batch_size=options['batch_size'])
+            insert_seconds = elapsed()
+
+            for row in rows:
+                row['status'] = 'processing'
+            with stopwatch() as elapsed:
+                updated = ingest_orders(marketplace, rows, batch_size=options['batch_size'])
+            update_seconds = elapsed()
+
+            with stopwatch() as elapsed:
+                unchanged = ingest_orders(marketplace, rows, batch_size=options['batch_size'])
+            noop_seconds = elapsed()
+
+            transaction.set_rollback(True)
+
+        total = len(rows)
+        self.report('order_ingest', {
+            'orders': total,
+            'items_per_order': options['items'],
+            'batch_size': options['batch_size'],
+            'insert_seconds': insert_seconds,
+            'insert_orders_per_second': total / insert_seconds,
+            'update_seconds': update_seconds,
+            'update_orders_per_second': total / update_seconds,
+            'noop_seconds': noop_seconds,
+            'noop_orders_per_second': total / noop_seconds,
+            'created': created.created,
+            'updated': updated.updated,
+            'unchanged': unchanged.unchanged,
+            'rejected': len(created.rejected),
+        }, options)
@@ -0,0 +1,106 @@
+import uuid
+
+from django.db import connection, transaction
+
+from api.models import Marketplace
+from companies.models import Company
+from core.benchmark import BenchmarkCommand, stopwatch
+from orders.models import Order, OrderItem
+from orders.waves import build_pick_lists, plan_waves
+from products.models import Product
+from warehouses.models import Warehouse
+
+
+class Command(BenchmarkCommand):
+    help = 'Замеряет планирование волн и сборку листов подбора (данные откатываются после замера)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=100000, help='Количество открытых заказов')
+        parser.add_argument('--marketplaces', type=int, default=3)
+        parser.add_argument('--products', type=int, default=5000, help='Размер каталога')
+        parser.add_argument('--max-orders', type=int)
+        parser.add_argument('--max-weight', type=int)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            run_id = uuid.uuid4().hex[:8]
+            company = Company.objects.create(name=f'Benchmark {run_id}', inn=run_id, legal_address='-')
+            warehouse = Warehouse.objects.create(name='Benchmark', type='fulfillment', address='-', company=company)
+            marketplaces = Marketplace.objects.bulk_create([
+                Marketplace(name=f'Benchmark {n}', type=Marketplace.MARKETPLACE_TYPES[n % 3][0], company=company)
+                for n in range(options['marketplaces'])
+            ])
+            products = Product.objects.bulk_create(
+                [
+                    Product(name=f'Product {i}', article=f'A-{i}', barcode=f'{run_id}{i:08d}', company=company)
+                    for i in range(options['products'])
+                ],
+                batch_size=5000,
+            )
+            self._generate_orders(
+                company, warehouse, [m.pk for m in marketplaces], [p.pk for p in products], options['orders'], run_id
+            )
+
+            with stopwatch() as elapsed:
+                waves = plan_waves(warehouse, max_orders=options['max_orders'], max_weight=options['max_weight'])
+            plan_seconds = elapsed()
+
+            with stopwatch() as elapsed:
+                pick_lists = build_pick_lists(warehouse)
+            pick_list_seconds = elapsed()
+
+            with stopwatch() as elapsed:
+                replanned = plan_waves(
+                    warehouse, max_orders=options['max_orders'], max_weight=options['max_weight'], replan=True
+                )
+            replan_seconds = elapsed()
+
+            transaction.set_rollback(True)
+
+        planned = sum(wave.orders for wave in waves)
+        self.report('wave_planning', {
+            'orders': planned,
+            'waves': len(waves),
+            'cutoffs': len({wave.cutoff for wave in waves}),
+            'plan_seconds': plan_seconds,
+            'plan_orders_per_second': planned / plan_seconds,
+            'replan_seconds': replan_seconds,
+            'replanned_waves': len(replanned),
+            'pick_list_seconds': pick_list_seconds,
+            'pick_list_lines': sum(len(pick_list['lines']) for pick_list in pick_lists),
+        }, options)
+
+    def _generate_orders(self, company, warehouse, marketplace_ids, product_ids, count, run_id):
+        """
+        Заказы с датами создания за последние сутки и одной-двумя позициями
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {Order._meta.db_table}
+                    (marketplace_id, company_id, external_id, status, shipping_warehouse_id,
+                     total_price, weight, created_at, updated_at)
+                SELECT (%(marketplaces)s::bigint[])[1 + n %% array_length(%(marketplaces)s::bigint[], 1)],
+                       %(company)s, %(run_id)s || '-' || n, CASE WHEN n %% 5 = 0 THEN 'processing' ELSE 'new' END,
+                       %(warehouse)s, 100 + n %% 9900, 50 + (n * 7919) %% 20000,
+                       now() - (n %% 86400) * interval '1 second', now()
+                FROM generate_series(1, %(count)s) AS n
+                """,
+                {
+                    'marketplaces': marketplace_ids,
+                    'company': company.pk,
+                    'run_id': run_id,
+                    'warehouse': warehouse.pk,
+                    'count': count,
+                },
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO {OrderItem._meta.db_table} (order_id, product_id, quantity, price, is_processed, created_at)
+                SELECT o.id, (%(products)s::bigint[])[1 + (o.id * line + 17) %% array_length(%(products)s::bigint[], 1)],
+                       1 + o.id %% 3, 99.90, false, now()
+                FROM {Order._meta.db_table} o, generate_series(1, 1 + o.id %% 2) AS line
+                WHERE o.shipping_warehouse_id = %(warehouse)s
+                """,
+                {'products': product_ids, 'warehouse': warehouse.pk},
+            )
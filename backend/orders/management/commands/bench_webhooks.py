@@ -0,0 +1,249 @@
+import asyncio
+import json
+import random
+import secrets
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import CommandError
+from django.db import close_old_connections, transaction
+
+from api.models import Marketplace
+from core.benchmark import BenchmarkCommand, stopwatch, summarize_latencies
+from core.loadtest import LoadContext
+from orders.ingestion import ingest_events
+from orders.models import Order, OrderEventVersion
+from orders.webhooks import WebhookIntake, sign
+
+
+async def _asgi_post(application, path, body, headers):
+    """
+    POST в ASGI-приложение в том же процессе; возвращает код ответа
+    """
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'headers': headers,
+        'client': ('127.0.0.1', 0), 'server': ('127.0.0.1', 80),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    response = {}
+
+    async def receive():
+        return messages.pop() if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+
+    await application(scope, receive, send)
+    return response['status']
+
+
+@sync_to_async(thread_sensitive=False)
+def _count(queryset):
+    try:
+        return queryset.count()
+    finally:
+        close_old_connections()
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Нагрузочный замер приема вебхуков заказов: время подтверждения, пропускная способность записи '
+        'пачками и сравнение с транзакцией на событие (данные generate_dataset, маркетплейс замера удаляется)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Компания с данными (по умолчанию первая синтетическая)')
+        parser.add_argument('--orders', type=int, default=20000, help='Заказов (событий создания)')
+        parser.add_argument('--status-share', type=float, default=0.5, help='Доля заказов со сменой статуса')
+        parser.add_argument('--duplicate-share', type=float, default=0.1, help='Доля повторно доставленных событий')
+        parser.add_argument('--events-per-request', type=int, default=1)
+        parser.add_argument('--concurrency', type=int, default=200, help='Одновременных запросов клиента')
+        parser.add_argument('--batch-size', type=int, help='WEBHOOK_BATCH_SIZE')
+        parser.add_argument('--batch-interval', type=float, help='WEBHOOK_BATCH_INTERVAL')
+        parser.add_argument('--queue-size', type=int, help='WEBHOOK_QUEUE_SIZE')
+        parser.add_argument('--single-events', type=int, default=1000,
+                            help='Событий для замера записи транзакцией на событие (0 — без замера)')
+        parser.add_argument('--url', help='Адрес запущенного ASGI-сервера (по умолчанию приложение в процессе)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        try:
+            context = LoadContext.load(options['company'])
+        except LookupError as exc:
+            raise CommandError(str(exc))
+        if not context.product_codes:
+            raise CommandError(f'Company {context.company.pk} has no products')
+
+        run_id = uuid.uuid4().hex[:8]
+        marketplace = Marketplace.objects.create(
+            name=f'Webhook benchmark {run_id}', type='wildberries', company=context.company,
+            api_secret=secrets.token_hex(16), is_connected=True, is_fbs_enabled=True,
+        )
+        try:
+            metrics = self._run(marketplace, context, run_id, options)
+        finally:
+            with transaction.atomic():
+                Order.objects.filter(marketplace=marketplace).delete()
+                marketplace.delete()
+        self.report('webhooks', metrics, options)
+
+    def _run(self, marketplace, context, run_id, options):
+        rng = random.Random(options['seed'])
+        created = [
+            {
+                'external_id': f'wh-{run_id}-{n}',
+                'version': 1,
+                'status': 'new',
+                'total_price': f'{rng.randint(100, 100000) / 100:.2f}',
+                'weight': rng.randint(50, 20000),
+                'items': [
+                    {'barcode': rng.choice(context.product_codes), 'quantity': rng.randint(1, 3), 'price': '99.90'},
+                ],
+            }
+            for n in range(options['orders'])
+        ]
+        changed = [
+            {'external_id': event['external_id'], 'version': 2, 'status': 'processing'}
+            for event in rng.sample(created, int(len(created) * options['status_share']))
+        ]
+        redelivered = rng.sample(created, int(len(created) * options['duplicate_share']))
+        # Сначала создания, затем смены статуса вперемешку с повторами
+        second = changed + redelivered
+        rng.shuffle(second)
+
+        metrics = {
+            'orders': len(created),
+            'events': len(created) + len(second),
+            'events_per_request': options['events_per_request'],
+            'concurrency': options['concurrency'],
+        }
+        started = time.perf_counter()
+        if options['url']:
+            metrics.update(asyncio.run(self._drive_server(marketplace, created, second, options)))
+        else:
+            metrics.update(asyncio.run(self._drive_in_process(marketplace, created, second, options)))
+        metrics['events_per_second'] = metrics['events'] / (time.perf_counter() - started)
+
+        written = Order.objects.filter(marketplace=marketplace)
+        metrics['orders_written'] = written.count()
+        metrics['orders_processing'] = written.filter(status='processing').count()
+        if metrics['orders_written'] != len(created) or metrics['orders_processing'] != len(changed):
+            raise CommandError(
+                f'Expected {len(created)} orders ({len(changed)} processing), '
+                f'got {metrics["orders_written"]} ({metrics["orders_processing"]})'
+            )
+
+        if options['single_events']:
+            singles = [
+                {**event, 'external_id': f'wh-{run_id}-single-{n}'}
+                for n, event in enumerate(created[:options['single_events']])
+            ]
+            with stopwatch() as elapsed:
+                for event in singles:
+                    ingest_events(marketplace, [event])
+            metrics['single_transaction_events_per_second'] = len(singles) / elapsed()
+        return metrics
+
+    def _requests(self, events, options):
+        size = options['events_per_request']
+        chunks = [events[start:start + size] for start in range(0, len(events), size)]
+        return [json.dumps(chunk[0] if size == 1 else chunk).encode() for chunk in chunks]
+
+    async def _warm_up(self, post, bodies):
+        """
+        Первый запрос отдельно: он загружает секрет маркетплейса и открывает подключение к базе
+        """
+        with stopwatch() as elapsed:
+            status = await post(bodies[0])
+        return bodies[1:], [elapsed()], {status: 1}
+
+    async def _drive(self, post, bodies, options, latencies, statuses):
+        pending = iter(bodies)
+
+        async def client():
+            for body in pending:
+                while True:
+                    with stopwatch() as elapsed:
+                        status = await post(body)
+                    latencies.append(elapsed())
+                    statuses[status] = statuses.get(status, 0) + 1
+                    if status != 503:
+                        break
+                    # Обратное давление: очередь приема полна
+                    await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(client() for _ in range(options['concurrency'])))
+
+    async def _drive_in_process(self, marketplace, created, second, options):
+        intake = WebhookIntake(
+            queue_size=options['queue_size'], batch_size=options['batch_size'],
+            batch_interval=options['batch_interval'],
+        )
+        path = f'/webhooks/marketplaces/{marketplace.pk}/orders/'
+
+        async def post(body):
+            headers = [
+                (b'content-type', b'application/json'),
+                (b'x-webhook-signature', sign(marketplace.api_secret, body).encode()),
+            ]
+            return await _asgi_post(intake, path, body, headers)
+
+        first, latencies, statuses = await self._warm_up(post, self._requests(created, options))
+        with stopwatch() as elapsed:
+            await self._drive(post, first, options, latencies, statuses)
+            # Смены статуса идут после записи созданий, иначе они относились бы к неизвестным заказам
+            await intake.drain()
+            await self._drive(post, self._requests(second, options), options, latencies, statuses)
+            acked = elapsed()
+            await intake.stop()
+        metrics = {f'ack_{key}': value for key, value in summarize_latencies(latencies[1:]).items()}
+        metrics.update({
+            'ack_first_ms': latencies[0] * 1000,
+            'ack_seconds': acked,
+            'drain_seconds': elapsed() - acked,
+            'statuses': ' '.join(f'{status}:{count}' for status, count in sorted(statuses.items())),
+            'queue_size': intake.queue_size,
+            'batch_size': intake.batch_size,
+            'batch_interval': intake.batch_interval,
+            'events_per_batch': intake.stats['accepted'] / max(intake.stats['batches'], 1),
+        })
+        metrics.update({f'intake_{name}': count for name, count in sorted(intake.stats.items())})
+        return metrics
+
+    async def _drive_server(self, marketplace, created, second, options):
+        import aiohttp
+
+        url = f'{options["url"].rstrip("/")}/webhooks/marketplaces/{marketplace.pk}/orders/'
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=options['concurrency'])) as session:
+
+            async def post(body):
+                headers = {
+                    'Content-Type': 'application/json',
+                    'X-Webhook-Signature': sign(marketplace.api_secret, body),
+                }
+                async with session.post(url, data=body, headers=headers) as response:
+                    await response.read()
+                    return response.status
+
+            first, latencies, statuses = await self._warm_up(post, self._requests(created, options))
+            with stopwatch() as elapsed:
+                await self._drive(post, first, options, latencies, statuses)
+                while await _count(OrderEventVersion.objects.filter(marketplace=marketplace)) < len(created):
+                    await asyncio.sleep(0.05)
+                await self._drive(post, self._requests(second, options), options, latencies, statuses)
+                acked = elapsed()
+                processing = Order.objects.filter(marketplace=marketplace, status='processing')
+                expected = sum(1 for event in second if 'items' not in event)
+                while await _count(processing) < expected:
+                    await asyncio.sleep(0.05)
+        metrics = {f'ack_{key}': value for key, value in summarize_latencies(latencies[1:]).items()}
+        metrics.update({
+            'ack_first_ms': latencies[0] * 1000,
+            'ack_seconds': acked,
+            'drain_seconds': elapsed() - acked,
+            'statuses': ' '.join(f'{status}:{count}' for status, count in sorted(statuses.items())),
+        })
+        return metrics
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+
+from orders import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Обслуживает месячные секции заказов и позиций: создает будущие, отсоединяет старые '
+        'и замораживает закрытые месяцы'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert', action='store_true',
+            help='Перевести несекционированные таблицы на секции (блокирует таблицы на время переноса данных)',
+        )
+        parser.add_argument('--months-ahead', type=int, help='Сколько месяцев вперед держать готовые секции')
+        parser.add_argument(
+            '--retention-months', type=int,
+            help='Отсоединить секции старше этого числа месяцев (0 — не отсоединять)',
+        )
+        parser.add_argument('--no-freeze', action='store_true', help='Не замораживать закрытые месяцы')
+        parser.add_argument('--list', action='store_true', help='Показать секции и выйти')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for model in partitions.PARTITIONED_MODELS:
+                for partition in partitions.partitions(model):
+                    self.stdout.write(
+                        f'{partition.name}: {partition.start:%Y-%m-%d}..{partition.end:%Y-%m-%d}, '
+                        f'~{partition.rows} rows, xid age {partition.xid_age}'
+                    )
+            return
+
+        if options['convert']:
+            for model in partitions.PARTITIONED_MODELS:
+                if partitions.convert(model, months_ahead=options['months_ahead']):
+                    self.stdout.write(f'Converted {model._meta.db_table} to monthly partitions')
+
+        result = partitions.maintain(
+            months_ahead=options['months_ahead'], retention_months=options['retention_months'],
+            freeze=not options['no_freeze'],
+        )
+        for name in result['created']:
+            self.stdout.write(f'Created {name}')
+        for name in result['detached']:
+            self.stdout.write(f'Detached {name}')
+        for name in result['frozen']:
+            self.stdout.write(f'Frozen {name}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(result["created"])} partitions created, {len(result["detached"])} detached, '
+            f'{len(result["frozen"])} frozen'
+        ))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.waves import plan_waves
+from warehouses.models import Warehouse
+
+
+class Command(BaseCommand):
+    help = 'Распределяет открытые заказы склада по волнам отгрузки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('warehouse', type=int, help='ID склада')
+        parser.add_argument('--max-orders', type=int, help='Максимум заказов в волне')
+        parser.add_argument('--max-weight', type=int, help='Максимальный вес волны, г')
+        parser.add_argument('--replan', action='store_true', help='Пересобрать волны всех открытых заказов')
+        parser.add_argument('--dry-run', action='store_true', help='Не записывать назначения')
+
+    def handle(self, *args, **options):
+        try:
+            warehouse = Warehouse.objects.get(pk=options['warehouse'])
+        except Warehouse.DoesNotExist:
+            raise CommandError(f"Warehouse {options['warehouse']} does not exist")
+
+        waves = plan_waves(
+            warehouse,
+            max_orders=options['max_orders'],
+            max_weight=options['max_weight'],
+            replan=options['replan'],
+            dry_run=options['dry_run'],
+        )
+        for wave in waves:
+            self.stdout.write(f'{wave.label}: {wave.orders} orders, {wave.weight:.0f} g')
+        self.stdout.write(self.style.SUCCESS(
+            f'Planned {sum(wave.orders for wave in waves)} orders into {len(waves)} waves'
+        ))
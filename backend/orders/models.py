@@ -60,7 +60,21 @@ class Order(models.Model):
     class Meta:
         verbose_name = _('order')
         verbose_name_plural = _('orders')
-        unique_together = ('marketplace', 'external_id')
+        # Уникальность (marketplace, external_id) обеспечивает OrderKey: у секционированной таблицы
+        # уникальный индекс обязан включать created_at
+        indexes = [
+            models.Index(fields=['shipping_warehouse', 'status'], name='order_warehouse_status_idx'),
+            models.Index(fields=['company', 'updated_at'], name='order_company_updated_idx'),
+            models.Index(fields=['company', 'status', 'created_at'], name='order_company_status_idx'),
+            models.Index(fields=['shipping_warehouse', 'shipping_date'], name='order_warehouse_date_idx'),
+            # Списки заказов компании постранично по ключу (см. core.pagination)
+            models.Index(fields=['company', 'created_at', 'id'], name='order_company_created_idx'),
+            # Открытые заказы склада для планирования волн и листов подбора
+            models.Index(
+                fields=['shipping_warehouse', 'created_at'], name='order_open_warehouse_idx',
+                condition=models.Q(status__in=['new', 'processing']),
+            ),
+        ]
         
     def __str__(self):
         return f"Order {self.external_id} ({self.get_status_display()})"
@@ -70,10 +84,12 @@ class OrderItem(models.Model):
     """
     Модель товара в заказе
     """
+    # Секционированные таблицы не могут быть целью внешнего ключа по одному id
     order = models.ForeignKey(
         Order,
         on_delete=models.CASCADE,
-        related_name='items'
+        related_name='items',
+        db_constraint=False
     )
     
     product = models.ForeignKey(
@@ -96,3 +112,101 @@ class OrderItem(models.Model):
         
     def __str__(self):
         return f"{self.product.name} x{self.quantity} in Order {self.order.external_id}"
+
+
+class OrderKey(models.Model):
+    """
+    Модель ключа заказа маркетплейса (marketplace, external_id).
+
+    Уникальный ключ заказа вне секционированной таблицы заказов; строки
+    ведутся триггерами orders_order (см. orders.partitions), поэтому любой
+    способ записи заказа проверяет уникальность здесь.
+    """
+    order_id = models.BigIntegerField(_('order ID'), primary_key=True)
+    
+    marketplace = models.ForeignKey(
+        'api.Marketplace',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    
+    external_id = models.CharField(_('external ID'), max_length=100)
+    created_at = models.DateTimeField(_('created at'))
+    
+    class Meta:
+        verbose_name = _('order key')
+        verbose_name_plural = _('order keys')
+        constraints = [
+            models.UniqueConstraint(fields=['marketplace', 'external_id'], name='order_key_uniq'),
+        ]
+        
+    def __str__(self):
+        return f"{self.marketplace_id}:{self.external_id}"
+
+
+class OrderEventVersion(models.Model):
+    """
+    Модель последней примененной версии событий заказа из вебхуков маркетплейса.
+
+    Событие с версией не выше записанной — повтор или опоздавшее событие и
+    пропускается (см. orders.ingestion.ingest_events).
+    """
+    marketplace = models.ForeignKey(
+        'api.Marketplace',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    
+    external_id = models.CharField(_('external ID'), max_length=100)
+    version = models.BigIntegerField(_('version'))
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+    
+    class Meta:
+        verbose_name = _('order event version')
+        verbose_name_plural = _('order event versions')
+        constraints = [
+            models.UniqueConstraint(fields=['marketplace', 'external_id'], name='order_event_version_uniq'),
+        ]
+        
+    def __str__(self):
+        return f"{self.marketplace_id}:{self.external_id}@{self.version}"
+
+
+class OrderArchiveBatch(models.Model):
+    """
+    Модель пакета заказов, перенесенных в архив.
+
+    Пакет — заказы одной компании за один месяц в трех файлах Parquet
+    (заказы, позиции, связи с отгрузками, см. orders.archive). Строка
+    создается в той же транзакции, что удаляет заказы из рабочих таблиц,
+    поэтому читатели архива видят только файлы зафиксированных пакетов.
+    """
+    company = models.ForeignKey(
+        'companies.Company',
+        on_delete=models.CASCADE,
+        related_name='order_archive_batches'
+    )
+    
+    # Первый день месяца создания заказов пакета
+    month = models.DateField(_('month'))
+    
+    # Путь файлов пакета относительно ORDER_ARCHIVE_ROOT без суффикса вида
+    path = models.CharField(_('path'), max_length=255, unique=True)
+    
+    orders = models.IntegerField(_('orders'))
+    items = models.IntegerField(_('items'))
+    links = models.IntegerField(_('shipment links'))
+    size = models.BigIntegerField(_('size (bytes)'))
+    
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    
+    class Meta:
+        verbose_name = _('order archive batch')
+        verbose_name_plural = _('order archive batches')
+        indexes = [
+            models.Index(fields=['company', 'month'], name='order_archive_month_idx'),
+        ]
+        
+    def __str__(self):
+        return f"{self.path} ({self.orders} orders)"
@@ -0,0 +1,338 @@
+"""
+Помесячное секционирование заказов и позиций заказов по created_at.
+
+orders_order и orders_orderitem секционируются по диапазону created_at: одна
+секция на календарный месяц (границы — полночь первого числа в TIME_ZONE),
+имя секции {таблица}_pYYYYMM. Запросы с условием по created_at читают только
+секции своего периода, а автоочистка, сбор статистики и перестроение
+индексов работают с небольшой текущей секцией. Закрытые месяцы один раз
+замораживаются (VACUUM FREEZE), после чего автоочистка их не перечитывает.
+
+Ограничения секционирования PostgreSQL:
+- первичный ключ включает created_at — (id, created_at); id по-прежнему
+  выдает одна последовательность;
+- уникальный ключ (marketplace, external_id) ведет таблица OrderKey, которую
+  заполняют триггеры уровня оператора на orders_order;
+- внешние ключи на заказы и позиции (позиции, связи отгрузок, движения
+  остатков) существуют только на уровне Django (db_constraint=False).
+
+Позиция создается не раньше своего заказа, поэтому условие
+i.created_at >= o.created_at верно всегда и позволяет отсекать секции
+позиций в соединениях с заказами.
+
+convert() переводит существующую таблицу на секции одной транзакцией под
+исключительной блокировкой, перенося индексы, внешние ключи и триггеры.
+После migrate это делается автоматически только для пустых таблиц; таблицы
+с данными переводятся командой maintain_order_partitions --convert в окно
+обслуживания.
+
+Отсоединенные секции остаются отдельными таблицами с теми же данными. При
+отсоединении триггеры не срабатывают: дневные итоги (reports.rollups)
+сохраняют историю, счетчики компаний выравнивает очередная сверка, а ключи
+OrderKey остаются, поэтому повторно присланные архивные заказы не создаются.
+"""
+import re
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from core.triggers import install_statement_triggers, unless_archiving
+
+from .models import Order, OrderItem, OrderKey
+
+PARTITIONED_MODELS = (Order, OrderItem)
+PARTITION_KEY = 'created_at'
+
+# Пороги автоочистки считаются от размера секции: текущий месяц очищается и анализируется часто
+PARTITION_STORAGE = 'autovacuum_vacuum_scale_factor = 0.05, autovacuum_analyze_scale_factor = 0.02'
+
+PARTITION_NAME = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+@dataclass
+class Partition:
+    """
+    Секция таблицы: месяц [start, end), оценка числа строк и возраст самой старой незамороженной транзакции
+    """
+    table: str
+    name: str
+    start: datetime
+    end: datetime
+    rows: int
+    xid_age: int
+
+
+def month_start(value=None):
+    value = timezone.localtime(value)
+    return timezone.make_aware(datetime(value.year, value.month, 1))
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return timezone.make_aware(datetime(index // 12, index % 12 + 1, 1))
+
+
+def partition_name(model, month):
+    return f'{model._meta.db_table}_p{month:%Y%m}'
+
+
+def is_partitioned(model, using=DEFAULT_DB_ALIAS):
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))',
+            [model._meta.db_table],
+        )
+        return cursor.fetchone()[0]
+
+
+def partitions(model, using=DEFAULT_DB_ALIAS):
+    """
+    Месячные секции таблицы модели по возрастанию месяца
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname, GREATEST(c.reltuples, 0)::bigint, age(c.relfrozenxid)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+            ORDER BY c.relname
+            """,
+            [model._meta.db_table],
+        )
+        rows = cursor.fetchall()
+    result = []
+    for name, count, xid_age in rows:
+        match = PARTITION_NAME.search(name)
+        if match:
+            start = timezone.make_aware(datetime(int(match.group(1)), int(match.group(2)), 1))
+            result.append(Partition(model._meta.db_table, name, start, add_months(start, 1), count, xid_age))
+    return result
+
+
+def _create_partition(cursor, model, month):
+    cursor.execute(
+        f'CREATE TABLE {partition_name(model, month)} PARTITION OF {model._meta.db_table} '
+        f'FOR VALUES FROM (%s) TO (%s) WITH ({PARTITION_STORAGE})',
+        [month, add_months(month, 1)],
+    )
+
+
+def ensure_partitions(since=None, months_ahead=None, using=DEFAULT_DB_ALIAS):
+    """
+    Создает недостающие секции от месяца since (по умолчанию — текущего) до months_ahead месяцев вперед.
+
+    Возвращает имена созданных секций.
+    """
+    months_ahead = settings.ORDER_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    current = month_start()
+    first = min(month_start(since), current) if since else current
+    last = add_months(current, months_ahead)
+    created = []
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        for model in PARTITIONED_MODELS:
+            if not is_partitioned(model, using):
+                continue
+            existing = {partition.name for partition in partitions(model, using)}
+            month = first
+            while month <= last:
+                if partition_name(model, month) not in existing:
+                    _create_partition(cursor, model, month)
+                    created.append(partition_name(model, month))
+                month = add_months(month, 1)
+    return created
+
+
+def detach_partitions(before, using=DEFAULT_DB_ALIAS):
+    """
+    Отсоединяет секции месяцев раньше месяца before; возвращает их имена.
+
+    Вне транзакции секции отсоединяются без блокировки записи в таблицу (DETACH ... CONCURRENTLY).
+    """
+    connection = connections[using]
+    concurrently = '' if connection.in_atomic_block else ' CONCURRENTLY'
+    before = month_start(before)
+    detached = []
+    for model in PARTITIONED_MODELS:
+        for partition in partitions(model, using):
+            if partition.end > before:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'ALTER TABLE {partition.table} DETACH PARTITION {partition.name}{concurrently}')
+            detached.append(partition.name)
+    return detached
+
+
+def freeze_partitions(min_age=None, using=DEFAULT_DB_ALIAS):
+    """
+    VACUUM (FREEZE, ANALYZE) закрытых месяцев, чьи незамороженные транзакции старше min_age; вне транзакции
+    """
+    min_age = settings.ORDER_PARTITION_FREEZE_AGE if min_age is None else min_age
+    current = month_start()
+    frozen = []
+    for model in PARTITIONED_MODELS:
+        for partition in partitions(model, using):
+            if partition.end <= current and partition.xid_age > min_age:
+                with connections[using].cursor() as cursor:
+                    cursor.execute(f'VACUUM (FREEZE, ANALYZE) {partition.name}')
+                frozen.append(partition.name)
+    return frozen
+
+
+def convert(model, months_ahead=None, using=DEFAULT_DB_ALIAS):
+    """
+    Переводит таблицу модели на месячные секции с переносом данных, индексов, внешних ключей и триггеров.
+
+    Таблица заблокирована до конца переноса. Возвращает False, если таблица уже секционирована.
+    """
+    months_ahead = settings.ORDER_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    table = model._meta.db_table
+    legacy = f'{table}_unpartitioned'
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE')
+        if is_partitioned(model, using):
+            return False
+
+        # Уникальные индексы без ключа секционирования на секционированной таблице невозможны
+        cursor.execute(
+            'SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = %s::regclass AND NOT indisunique',
+            [table],
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            'SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint '
+            'WHERE conrelid = %s::regclass AND contype = %s',
+            [table, 'f'],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            'SELECT pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal', [table]
+        )
+        triggers = [row[0] for row in cursor.fetchall()]
+
+        # Ссылаться на секционированную таблицу по одному id нельзя
+        cursor.execute(
+            'SELECT conrelid::regclass::text, conname FROM pg_constraint '
+            'WHERE confrelid = %s::regclass AND contype = %s',
+            [table, 'f'],
+        )
+        for referencing, name in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {referencing} DROP CONSTRAINT {name}')
+
+        # Столбцы identity у секционированных таблиц появились только в PostgreSQL 17:
+        # id выдает обычная последовательность
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [table, 'id'])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0), MIN({PARTITION_KEY}), MAX({PARTITION_KEY}) FROM {table}')
+        last_id, oldest, newest = cursor.fetchone()
+        if sequence:
+            cursor.execute(f'SELECT last_value FROM {sequence}')
+            last_id = max(last_id, cursor.fetchone()[0])
+        cursor.execute("SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'", [table])
+        if cursor.fetchone()[0]:
+            cursor.execute(f'ALTER TABLE {table} ALTER COLUMN id DROP IDENTITY')
+        elif sequence:
+            cursor.execute(f'ALTER TABLE {table} ALTER COLUMN id DROP DEFAULT')
+            cursor.execute(f'DROP SEQUENCE {sequence}')
+
+        # Имена индексов и ограничений переходят к новой таблице
+        cursor.execute(f'ALTER TABLE {table} RENAME TO {legacy}')
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype IN ('p', 'u')", [legacy]
+        )
+        for (name,) in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {legacy} DROP CONSTRAINT {name}')
+        cursor.execute('SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = %s::regclass', [legacy])
+        for (name,) in cursor.fetchall():
+            cursor.execute(f'DROP INDEX {name}')
+
+        cursor.execute(
+            f'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE '
+            f'INCLUDING COMMENTS) PARTITION BY RANGE ({PARTITION_KEY})'
+        )
+        cursor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, {PARTITION_KEY})')
+        cursor.execute(f'CREATE SEQUENCE {table}_id_seq OWNED BY {table}.id START WITH %s', [last_id + 1])
+        cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{table}_id_seq')")
+
+        month = month_start(oldest) if oldest else month_start()
+        last = max(add_months(month_start(), months_ahead), month_start(newest) if newest else month)
+        while month <= last:
+            _create_partition(cursor, model, month)
+            month = add_months(month, 1)
+
+        cursor.execute(f'INSERT INTO {table} SELECT * FROM {legacy}')
+        # Индексы строятся после переноса: так быстрее, чем поддерживать их при вставке
+        for definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}')
+        for definition in triggers:
+            cursor.execute(definition)
+        cursor.execute(f'DROP TABLE {legacy}')
+        cursor.execute(f'ANALYZE {table}')
+    return True
+
+
+def _key_trigger_bodies():
+    table = Order._meta.db_table
+    keys = OrderKey._meta.db_table
+    return {
+        (table, 'INSERT'): f"""
+INSERT INTO {keys} (order_id, marketplace_id, external_id, created_at)
+SELECT id, marketplace_id, external_id, created_at FROM new_rows;""",
+        (table, 'UPDATE'): f"""
+UPDATE {keys} k
+SET marketplace_id = n.marketplace_id, external_id = n.external_id, created_at = n.created_at
+FROM new_rows n
+WHERE k.order_id = n.id
+  AND (k.marketplace_id, k.external_id, k.created_at)
+      IS DISTINCT FROM (n.marketplace_id, n.external_id, n.created_at);""",
+        # Ключи архивных заказов остаются: повторно присланный заказ не создается заново
+        (table, 'DELETE'): unless_archiving(f"""
+DELETE FROM {keys} k USING old_rows o WHERE k.order_id = o.id;"""),
+    }
+
+
+def backfill_keys(using=DEFAULT_DB_ALIAS):
+    """
+    Заполняет OrderKey по заказам, записанным до появления триггеров ключей; возвращает число добавленных строк
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {OrderKey._meta.db_table} (order_id, marketplace_id, external_id, created_at)
+            SELECT o.id, o.marketplace_id, o.external_id, o.created_at
+            FROM {Order._meta.db_table} o
+            WHERE NOT EXISTS (SELECT 1 FROM {OrderKey._meta.db_table} k WHERE k.order_id = o.id)
+            """
+        )
+        return cursor.rowcount
+
+
+def install(using=DEFAULT_DB_ALIAS):
+    """
+    Триггеры ключей заказов, перевод пустых таблиц на секции и секции на ORDER_PARTITION_MONTHS_AHEAD вперед
+    """
+    install_statement_triggers(_key_trigger_bodies(), 'key', using)
+    if not OrderKey.objects.using(using).exists():
+        backfill_keys(using)
+    for model in PARTITIONED_MODELS:
+        if not is_partitioned(model, using) and not model.objects.using(using).exists():
+            convert(model, using=using)
+    ensure_partitions(using=using)
+
+
+def maintain(months_ahead=None, retention_months=None, freeze=True, using=DEFAULT_DB_ALIAS):
+    """
+    Плановое обслуживание: будущие секции, отсоединение старых (если задан срок хранения) и заморозка закрытых
+    """
+    retention_months = settings.ORDER_PARTITION_RETENTION_MONTHS if retention_months is None else retention_months
+    result = {'created': ensure_partitions(months_ahead=months_ahead, using=using), 'detached': [], 'frozen': []}
+    if retention_months:
+        result['detached'] = detach_partitions(add_months(month_start(), -retention_months), using)
+    if freeze:
+        result['frozen'] = freeze_partitions(using=using)
+    return result
@@ -0,0 +1,26 @@
+from core.fieldsets import FieldsetSerializer
+
+from .models import Order, OrderItem
+
+
+class OrderItemSerializer(FieldsetSerializer):
+    class Meta:
+        model = OrderItem
+        fields = ('id', 'product', 'quantity', 'price', 'is_processed', 'created_at')
+        read_only_fields = fields
+        expandable = {'product': 'products.serializers.ProductSerializer'}
+
+
+class OrderSerializer(FieldsetSerializer):
+    class Meta:
+        model = Order
+        fields = (
+            'id', 'external_id', 'marketplace', 'status', 'shipping_warehouse', 'shipping_wave', 'shipping_date',
+            'total_price', 'fulfillment_cost', 'weight', 'created_at', 'updated_at',
+        )
+        read_only_fields = fields
+        expandable = {
+            'items': OrderItemSerializer,
+            'marketplace': 'api.serializers.MarketplaceSerializer',
+            'shipping_warehouse': 'warehouses.serializers.WarehouseSerializer',
+        }
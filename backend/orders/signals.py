@@ -0,0 +1,12 @@
+from django.db import connections
+from django.dispatch import Signal
+
+from . import partitions
+
+# Заказы компании перенесены в архив и удалены из рабочих таблиц: company_id, batch
+orders_archived = Signal()
+
+
+def install_order_partitions(sender, using='default', **kwargs):
+    if connections[using].vendor == 'postgresql':
+        partitions.install(using)
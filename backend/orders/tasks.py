@@ -0,0 +1,13 @@
+from core.celery import app
+
+from . import archive, partitions
+
+
+@app.task(name='orders.maintain_partitions')
+def maintain_partitions():
+    return partitions.maintain()
+
+
+@app.task(name='orders.archive_orders')
+def archive_orders():
+    return archive.archive()
@@ -0,0 +1,145 @@
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import ListAPIView
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from api.models import Marketplace
+from core.fieldsets import FieldsetMixin
+from warehouses.models import Warehouse
+
+from . import archive
+from .ingestion import ingest_orders
+from .models import Order
+from .serializers import OrderSerializer
+from .waves import build_pick_lists, plan_waves
+
+MAX_INGEST_ORDERS = 50000
+
+
+class OrderListView(FieldsetMixin, ListAPIView):
+    """
+    Заказы компании от новых к старым, постранично по ключу (created_at, id).
+
+    GET ?status=<статус>&status=...&marketplace=<id>&warehouse=<id>&cursor=...&total=approximate
+    &fields=id,status,items.quantity,items.product.name&expand=items.product,marketplace
+    """
+    # Пользователь токена и страница; раскрытые обратные связи добавляет FieldsetMixin
+    query_budget = 2
+    serializer_class = OrderSerializer
+
+    def get_queryset(self):
+        queryset = Order.objects.filter(company_id=self.request.user.company_id)
+        statuses = self.request.query_params.getlist('status')
+        if statuses:
+            queryset = queryset.filter(status__in=statuses)
+        for name, field in (('marketplace', 'marketplace_id'), ('warehouse', 'shipping_warehouse_id')):
+            value = self.request.query_params.get(name)
+            if value is not None:
+                try:
+                    queryset = queryset.filter(**{field: int(value)})
+                except ValueError:
+                    raise ValidationError({name: 'Expected an integer ID'})
+        return queryset
+
+
+class OrderIngestView(APIView):
+    """
+    Пакетная загрузка FBS-заказов маркетплейса.
+
+    POST {"marketplace": <id>, "orders": [{"external_id", "status", "total_price",
+    "items": [{"barcode", "quantity", "price"}], ...}]}
+    """
+
+    def post(self, request):
+        marketplace_id = request.data.get('marketplace')
+        if not isinstance(marketplace_id, int):
+            return Response({'marketplace': 'Expected a marketplace ID'}, status=status.HTTP_400_BAD_REQUEST)
+        marketplace = get_object_or_404(Marketplace, pk=marketplace_id, company_id=request.user.company_id)
+        orders = request.data.get('orders')
+        if not isinstance(orders, list):
+            return Response({'orders': 'Expected a list of orders'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(orders) > MAX_INGEST_ORDERS:
+            return Response(
+                {'orders': f'At most {MAX_INGEST_ORDERS} orders per request'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        result = ingest_orders(marketplace, orders)
+        return Response(result.as_dict())
+
+
+class WavePlanView(APIView):
+    """
+    Планирование волн отгрузки склада.
+
+    POST {"warehouse": <id>, "max_orders": 200, "max_weight": 500000, "replan": false, "dry_run": false}
+    """
+
+    def post(self, request):
+        warehouse = _get_warehouse(request, request.data.get('warehouse'))
+        limits = {}
+        for name in ('max_orders', 'max_weight'):
+            value = request.data.get(name)
+            if value is not None and (not isinstance(value, int) or value <= 0):
+                return Response({name: 'Expected a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
+            limits[name] = value
+
+        waves = plan_waves(
+            warehouse,
+            replan=bool(request.data.get('replan')),
+            dry_run=bool(request.data.get('dry_run')),
+            **limits,
+        )
+        return Response({
+            'waves': [wave.as_dict() for wave in waves],
+            'orders': sum(wave.orders for wave in waves),
+        })
+
+
+class WavePickListView(APIView):
+    """
+    Сводные листы подбора волн склада.
+
+    GET ?warehouse=<id>&wave=<label>&wave=<label>&route=1; без wave — по всем
+    запланированным волнам, route=1 добавляет порядок обхода ячеек
+    """
+
+    def get(self, request):
+        warehouse = _get_warehouse(request, request.query_params.get('warehouse'))
+        waves = request.query_params.getlist('wave') or None
+        routed = request.query_params.get('route') in ('1', 'true')
+        return Response({'pick_lists': build_pick_lists(warehouse, waves, routed=routed)})
+
+
+class ArchivedOrderView(APIView):
+    """
+    Поиск заказа в архиве (только чтение).
+
+    GET ?id=<id> или ?external_id=<номер>&marketplace=<id>; возвращает
+    {"orders": [...]} — заказы с позициями и связями с отгрузками
+    """
+
+    def get(self, request):
+        lookup = {}
+        for name, parameter in (('order_id', 'id'), ('marketplace_id', 'marketplace')):
+            value = request.query_params.get(parameter)
+            if value is not None:
+                try:
+                    lookup[name] = int(value)
+                except ValueError:
+                    raise ValidationError({parameter: 'Expected an integer ID'})
+        external_id = request.query_params.get('external_id')
+        if 'order_id' not in lookup and not external_id:
+            raise ValidationError({'id': 'Expected an order ID or an external ID'})
+        orders = archive.find(request.user.company_id, external_id=external_id, **lookup)
+        return Response({'orders': orders})
+
+
+def _get_warehouse(request, warehouse_id):
+    try:
+        warehouse_id = int(warehouse_id)
+    except (TypeError, ValueError):
+        raise ValidationError({'warehouse': 'Expected a warehouse ID'})
+    return get_object_or_404(Warehouse, pk=warehouse_id, company_id=request.user.company_id)
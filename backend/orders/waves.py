@@ -0,0 +1,296 @@
+"""
+Планирование волн отгрузки FBS-заказов.
+
+Открытые заказы склада (new/processing) распределяются по времени отсечки
+маркетплейса: заказ попадает в ближайшую отсечку, до которой остается не
+меньше WAVE_PICKING_LEAD_MINUTES с момента его создания (и с момента
+планирования). Заказы одной отсечки и одного маркетплейса делятся на волны
+с ограничением по числу заказов и суммарному весу.
+
+Группировка выполняется в БД одним запросом, который возвращает массивы
+заказов каждой группы; волны нарезаются двоичным поиском по накопленному
+весу, без обхода заказов в Python. Назначения записываются одним UPDATE.
+"""
+from bisect import bisect_right
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, time, timedelta
+from itertools import accumulate, repeat
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.models import Marketplace
+from products.models import Product
+from stock.models import StockBalance
+from warehouses.routing import get_layout
+
+from .models import Order, OrderItem
+
+OPEN_STATUSES = ('new', 'processing')
+
+# Ключ рекомендательной блокировки планирования (второй ключ — ID склада)
+PLANNING_LOCK = 6001
+
+
+@dataclass
+class Wave:
+    """
+    Волна отгрузки
+    """
+    label: str
+    marketplace_id: int
+    cutoff: datetime
+    shipping_date: date
+    orders: int
+    weight: float
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def wave_prefix(cutoff, marketplace_id):
+    return f'{cutoff:%Y%m%d-%H%M}-{marketplace_id}'
+
+
+def _cutoff_table():
+    """
+    Пары (тип маркетплейса, время отсечки) для всех типов с учетом значения по умолчанию
+    """
+    configured = settings.WAVE_CUTOFF_TIMES
+    types, times = [], []
+    for marketplace_type, _name in Marketplace.MARKETPLACE_TYPES:
+        for value in configured.get(marketplace_type, configured['default']):
+            types.append(marketplace_type)
+            times.append(time.fromisoformat(value))
+    return types, times
+
+
+def _split(weights, max_orders, max_weight):
+    """
+    Жадно режет упорядоченную группу на волны: [(начало, конец, вес)]
+    """
+    cumulative = list(accumulate(weights))
+    total = len(cumulative)
+    bounds = []
+    start = 0
+    base = 0.0
+    while start < total:
+        end = bisect_right(cumulative, base + max_weight, start, min(total, start + max_orders))
+        # Заказ тяжелее лимита образует отдельную волну
+        end = max(end, start + 1)
+        bounds.append((start, end, cumulative[end - 1] - base))
+        base = cumulative[end - 1]
+        start = end
+    return bounds
+
+
+def _candidate_groups(warehouse_id, replan, at):
+    """
+    Открытые заказы склада, сгруппированные по (отсечка, маркетплейс) в порядке создания
+    """
+    types, times = _cutoff_table()
+    unassigned = '' if replan else 'AND o.shipping_wave IS NULL'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH cutoffs (marketplace_type, cutoff) AS (
+                SELECT * FROM unnest(%(types)s::varchar[], %(times)s::time[])
+            ),
+            candidates AS (
+                SELECT o.id, o.marketplace_id, o.created_at, COALESCE(o.weight, 0)::float8 AS weight,
+                       (GREATEST(o.created_at, %(at)s) + %(lead)s) AT TIME ZONE %(tz)s AS ready_at,
+                       m.type AS marketplace_type
+                FROM {Order._meta.db_table} o
+                JOIN {Marketplace._meta.db_table} m ON m.id = o.marketplace_id
+                WHERE o.shipping_warehouse_id = %(warehouse)s AND o.status = ANY(%(statuses)s) {unassigned}
+            ),
+            slotted AS (
+                SELECT c.*, (
+                    SELECT MIN(ready_at::date + day_offset + cutoffs.cutoff)
+                    FROM cutoffs, generate_series(0, 1) AS day_offset
+                    WHERE cutoffs.marketplace_type = c.marketplace_type
+                      AND ready_at::date + day_offset + cutoffs.cutoff >= c.ready_at
+                ) AS cutoff
+                FROM candidates c
+            )
+            SELECT cutoff, marketplace_id,
+                   array_agg(id ORDER BY created_at, id),
+                   array_agg(created_at ORDER BY created_at, id),
+                   array_agg(weight ORDER BY created_at, id)
+            FROM slotted
+            GROUP BY cutoff, marketplace_id
+            ORDER BY cutoff, marketplace_id
+            """,
+            {
+                'types': types,
+                'times': times,
+                'lead': timedelta(minutes=settings.WAVE_PICKING_LEAD_MINUTES),
+                'at': at,
+                'tz': settings.TIME_ZONE,
+                'warehouse': warehouse_id,
+                'statuses': list(OPEN_STATUSES),
+            },
+        )
+        return cursor.fetchall()
+
+
+def _last_wave_numbers(warehouse_id, since, replan):
+    """
+    Последние номера существующих волн по префиксу 'дата-время-маркетплейс'
+    """
+    orders = Order.objects.filter(
+        shipping_warehouse_id=warehouse_id, shipping_wave__isnull=False, shipping_date__gte=since
+    )
+    if replan:
+        # Волны открытых заказов будут пересобраны заново
+        orders = orders.exclude(status__in=OPEN_STATUSES)
+    numbers = {}
+    for label in orders.values_list('shipping_wave', flat=True).distinct():
+        prefix, _sep, number = label.rpartition('-')
+        if number.isdigit():
+            numbers[prefix] = max(numbers.get(prefix, 0), int(number))
+    return numbers
+
+
+def plan_waves(warehouse, max_orders=None, max_weight=None, replan=False, dry_run=False, at=None):
+    """
+    Распределяет открытые заказы склада по волнам и записывает Order.shipping_wave/shipping_date.
+
+    По умолчанию планируются только заказы без волны; replan=True пересобирает
+    волны всех открытых заказов. Возвращает список Wave.
+    """
+    max_orders = max_orders or settings.WAVE_MAX_ORDERS
+    max_weight = float(max_weight or settings.WAVE_MAX_WEIGHT)
+    at = at or timezone.now()
+    warehouse_id = getattr(warehouse, 'pk', warehouse)
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # Параллельное планирование одного склада выдало бы одинаковые номера волн
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [PLANNING_LOCK, warehouse_id])
+
+        groups = _candidate_groups(warehouse_id, replan, at)
+        if not groups:
+            return []
+        numbers = _last_wave_numbers(warehouse_id, groups[0][0].date(), replan)
+
+        waves = []
+        order_ids, created, labels, dates = [], [], [], []
+        for cutoff, marketplace_id, ids, created_at, weights in groups:
+            prefix = wave_prefix(cutoff, marketplace_id)
+            number = numbers.get(prefix, 0)
+            for start, end, weight in _split(weights, max_orders, max_weight):
+                number += 1
+                wave = Wave(f'{prefix}-{number:03d}', marketplace_id, timezone.make_aware(cutoff), cutoff.date(),
+                            end - start, weight)
+                waves.append(wave)
+                order_ids.extend(ids[start:end])
+                created.extend(created_at[start:end])
+                labels.extend(repeat(wave.label, end - start))
+                dates.extend(repeat(wave.shipping_date, end - start))
+
+        if not dry_run:
+            with connection.cursor() as cursor:
+                # created_at в условии отсекает секции, в которых заказа быть не может, а нижняя граница —
+                # секции старше самого раннего заказа уже при планировании запроса
+                cursor.execute(
+                    f"""
+                    UPDATE {Order._meta.db_table} AS o
+                    SET shipping_wave = plan.wave, shipping_date = plan.shipping_date, updated_at = %s
+                    FROM unnest(%s::bigint[], %s::timestamptz[], %s::varchar[], %s::date[])
+                        AS plan(id, created_at, wave, shipping_date)
+                    WHERE o.id = plan.id AND o.created_at = plan.created_at AND o.created_at >= %s
+                    """,
+                    [timezone.now(), order_ids, created, labels, dates, min(created)],
+                )
+    return waves
+
+
+def build_pick_lists(warehouse, waves=None, routed=False):
+    """
+    Сводные листы подбора по волнам склада.
+
+    Позиции необработанных товаров волны суммируются по товару; для каждой
+    строки предлагаются ячейки с остатком (по порядку кода ячейки), причем
+    остаток, отданный одной волне, не предлагается следующим.
+    Возвращает [{'wave', 'lines': [{'product_id', 'barcode', 'name', 'quantity',
+    'orders', 'locations': [{'storage_unit_id', 'code', 'quantity'}], 'shortage'}]}].
+    С routed=True к каждому листу добавляется маршрут обхода (см. _route_pick_list).
+    """
+    warehouse_id = getattr(warehouse, 'pk', warehouse)
+    wave_filter = '' if waves is None else 'AND o.shipping_wave = ANY(%(waves)s)'
+    # Нижняя граница даты создания открытых заказов отсекает старые месячные секции заказов и позиций
+    since = Order.objects.filter(
+        shipping_warehouse_id=warehouse_id, status__in=OPEN_STATUSES,
+    ).order_by('created_at').values_list('created_at', flat=True).first()
+    if since is None:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT o.shipping_wave, p.id, p.barcode, p.name, SUM(i.quantity), COUNT(DISTINCT o.id)
+            FROM {OrderItem._meta.db_table} i
+            JOIN {Order._meta.db_table} o ON o.id = i.order_id
+            JOIN {Product._meta.db_table} p ON p.id = i.product_id
+            WHERE o.shipping_warehouse_id = %(warehouse)s AND o.status = ANY(%(statuses)s)
+              AND o.shipping_wave IS NOT NULL AND NOT i.is_processed {wave_filter}
+              AND o.created_at >= %(since)s AND i.created_at >= %(since)s AND i.created_at >= o.created_at
+            GROUP BY o.shipping_wave, p.id
+            ORDER BY o.shipping_wave, p.id
+            """,
+            {'warehouse': warehouse_id, 'statuses': list(OPEN_STATUSES), 'waves': list(waves or ()), 'since': since},
+        )
+        rows = cursor.fetchall()
+
+    available = {}
+    for product_id, storage_unit_id, code, quantity in StockBalance.objects.filter(
+        warehouse_id=warehouse_id, product_id__in={row[1] for row in rows}, quantity__gt=0
+    ).order_by('storage_unit__code').values_list('product_id', 'storage_unit_id', 'storage_unit__code', 'quantity'):
+        available.setdefault(product_id, []).append([storage_unit_id, code, quantity])
+
+    pick_lists = []
+    for label, product_id, barcode, name, quantity, orders in rows:
+        if not pick_lists or pick_lists[-1]['wave'] != label:
+            pick_lists.append({'wave': label, 'lines': []})
+        locations = []
+        remaining = quantity
+        for location in available.get(product_id, ()):
+            if not remaining:
+                break
+            taken = min(remaining, location[2])
+            if taken:
+                location[2] -= taken
+                remaining -= taken
+                locations.append({'storage_unit_id': location[0], 'code': location[1], 'quantity': taken})
+        pick_lists[-1]['lines'].append({
+            'product_id': product_id,
+            'barcode': barcode,
+            'name': name,
+            'quantity': quantity,
+            'orders': orders,
+            'locations': locations,
+            'shortage': remaining,
+        })
+
+    if routed:
+        layout = get_layout(warehouse_id)
+        for pick_list in pick_lists:
+            _route_pick_list(layout, pick_list)
+    return pick_lists
+
+
+def _route_pick_list(layout, pick_list):
+    """
+    Добавляет в лист подбора 'picks' — взятия из ячеек в порядке обхода склада
+    """
+    picks = [
+        {'storage_unit_id': location['storage_unit_id'], 'code': location['code'],
+         'product_id': line['product_id'], 'barcode': line['barcode'], 'quantity': location['quantity']}
+        for line in pick_list['lines'] for location in line['locations']
+    ]
+    route = layout.route([pick['storage_unit_id'] for pick in picks])
+    stop = {unit_id: number for number, unit_id in enumerate(route.storage_unit_ids + route.unrouted)}
+    pick_list['picks'] = sorted(picks, key=lambda pick: stop[pick['storage_unit_id']])
+    pick_list['distance'] = round(route.distance, 1)
+    pick_list['naive_distance'] = round(route.naive_distance, 1)
@@ -0,0 +1,333 @@
+"""
+Прием вебхуков заказов маркетплейсов (ASGI, в обход представлений Django).
+
+POST /webhooks/marketplaces/<id>/orders/ — событие или список событий
+{"external_id", "version", "status", ...} (с "items" — полный заказ, как в
+ingest_orders, без них — смена статуса) с заголовком
+X-Webhook-Signature: sha256=<HMAC-SHA256 тела по Marketplace.api_secret>.
+
+Запрос проверяется в цикле событий — подпись, JSON и поля событий
+(orders.ingestion.parse_event) — и сразу получает 202: события кладутся в
+ограниченную очередь процесса (WEBHOOK_QUEUE_SIZE). Если запрос в нее не
+помещается, он целиком получает 503 с Retry-After, и маркетплейс повторяет
+доставку. Писатель забирает события пачками — WEBHOOK_BATCH_SIZE событий или
+то, что накопилось за WEBHOOK_BATCH_INTERVAL секунд с первого события
+пачки, — и пишет их в отдельном потоке через ingest_events, транзакцией на
+маркетплейс. Сбой записи повторяется только для событий маркетплейса, на
+котором он произошел.
+
+Повторы отсекаются дважды: ключи (маркетплейс, external_id, версия)
+недавно принятых событий процесс помнит и отвечает на них 200 без постановки
+в очередь, остальные отсекает OrderEventVersion при записи.
+
+Принятые события до записи живут только в памяти процесса: при штатной
+остановке (lifespan.shutdown) очередь дописывается, при аварийной —
+теряется. Секрет маркетплейса кэшируется на SECRET_CACHE_TTL секунд.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import re
+import time
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from api.models import Marketplace
+
+from .ingestion import IngestResult, RowError, ingest_events, parse_event
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = re.compile(r'/webhooks/marketplaces/(?P<marketplace>\d+)/orders/')
+SIGNATURE_HEADER = b'x-webhook-signature'
+
+SECRET_CACHE_TTL = 60
+MAX_WRITE_RETRIES = 3
+RETRY_BACKOFF = 0.5
+
+
+def sign(secret, body):
+    """
+    Значение X-Webhook-Signature для тела запроса
+    """
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def _load_secret(marketplace_id):
+    try:
+        return Marketplace.objects.filter(pk=marketplace_id).values_list('api_secret', flat=True).first()
+    finally:
+        close_old_connections()
+
+
+def write_events(batch):
+    """
+    Записывает пачку событий [(ID маркетплейса, событие)] — транзакцией на маркетплейс.
+
+    Возвращает итог и события маркетплейсов, запись которых не удалась: сбой одного
+    маркетплейса не мешает записи остальных.
+    """
+    by_marketplace = defaultdict(list)
+    for marketplace_id, event in batch:
+        by_marketplace[marketplace_id].append(event)
+    result = IngestResult()
+    failed = []
+    try:
+        marketplaces = Marketplace.objects.in_bulk(list(by_marketplace))
+        for marketplace_id, events in by_marketplace.items():
+            marketplace = marketplaces.get(marketplace_id)
+            if marketplace is None:
+                # Маркетплейс удален после приема событий
+                result.rejected.extend(
+                    {'external_id': event['external_id'], 'error': 'unknown marketplace'} for event in events
+                )
+                continue
+            try:
+                result.merge(ingest_events(marketplace, events))
+            except Exception:
+                logger.exception('Webhook events of marketplace %s failed (%s events)', marketplace_id, len(events))
+                failed.extend((marketplace_id, event) for event in events)
+    finally:
+        close_old_connections()
+    return result, failed
+
+
+async def _respond(send, status, payload=None, headers=()):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            *headers,
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class WebhookIntake:
+    """
+    ASGI-приложение приема вебхуков заказов с очередью и пакетной записью (см. модуль)
+    """
+
+    def __init__(self, queue_size=None, batch_size=None, batch_interval=None):
+        self.queue_size = queue_size or settings.WEBHOOK_QUEUE_SIZE
+        self.batch_size = batch_size or settings.WEBHOOK_BATCH_SIZE
+        self.batch_interval = batch_interval if batch_interval is not None else settings.WEBHOOK_BATCH_INTERVAL
+        self.stats = Counter()
+        self._queue = None
+        self._writer = None
+        self._executor = None
+        self._recent = OrderedDict()
+        # ID маркетплейса -> (момент устаревания по monotonic, секрет или None)
+        self._secrets = {}
+        self._loading = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def start(self):
+        """
+        Запускает писателя в текущем цикле событий (при первом запросе, если сервер не шлет lifespan)
+        """
+        if self._writer is not None and not self._writer.done():
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+        if self._executor is None:
+            # Один поток: пачки пишутся по очереди, в порядке приема
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='webhook-writer')
+        self._writer = asyncio.get_running_loop().create_task(self._write_loop())
+
+    async def stop(self):
+        """
+        Дописывает принятые события и останавливает писателя
+        """
+        if self._writer is None:
+            return
+        await self._queue.join()
+        self._writer.cancel()
+        try:
+            await self._writer
+        except asyncio.CancelledError:
+            pass
+        self._writer = None
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    async def drain(self):
+        """
+        Ждет записи всех принятых событий
+        """
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def _http(self, scope, receive, send):
+        match = WEBHOOK_PATH.fullmatch(scope['path'])
+        if match is None:
+            return await _respond(send, 404, {'detail': 'Not found'})
+        if scope['method'] != 'POST':
+            return await _respond(send, 405, {'detail': 'Method not allowed'}, [(b'allow', b'POST')])
+
+        body = await self._read_body(receive)
+        if body is None:
+            return await _respond(send, 413, {'detail': f'Body exceeds {settings.WEBHOOK_MAX_BODY} bytes'})
+
+        marketplace_id = int(match['marketplace'])
+        secret = await self._secret(marketplace_id)
+        if not secret:
+            return await _respond(send, 404, {'detail': 'Unknown marketplace or webhooks are not configured'})
+        signature = dict(scope['headers']).get(SIGNATURE_HEADER, b'').decode('latin-1')
+        if not hmac.compare_digest(signature, sign(secret, body)):
+            self.stats['unauthorized'] += 1
+            return await _respond(send, 401, {'detail': 'Invalid signature'})
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            self.stats['invalid'] += 1
+            return await _respond(send, 400, {'detail': 'Invalid JSON'})
+        events = payload if isinstance(payload, list) else [payload]
+        if not events or len(events) > settings.WEBHOOK_MAX_EVENTS:
+            self.stats['invalid'] += 1
+            return await _respond(send, 400, {'detail': f'Expected 1 to {settings.WEBHOOK_MAX_EVENTS} events'})
+
+        keys = []
+        errors = []
+        for index, event in enumerate(events):
+            try:
+                keys.append((marketplace_id, *parse_event(event)))
+            except RowError as exc:
+                errors.append({'index': index, 'error': str(exc)})
+        if errors:
+            self.stats['invalid'] += 1
+            return await _respond(send, 400, {'errors': errors})
+
+        self.start()
+        fresh = [(key, event) for key, event in zip(keys, events) if key not in self._recent]
+        # Запрос принимается целиком или не принимается: частичный прием маркетплейс не повторит
+        if len(fresh) > self.queue_size - self._queue.qsize():
+            self.stats['throttled'] += 1
+            return await _respond(send, 503, {'detail': 'Intake queue is full'}, [(b'retry-after', b'1')])
+        for key, event in fresh:
+            self._queue.put_nowait((marketplace_id, event))
+            self._remember(key)
+        self.stats['accepted'] += len(fresh)
+        self.stats['duplicates'] += len(events) - len(fresh)
+        if not fresh:
+            return await _respond(send, 200, {'accepted': 0, 'duplicates': len(events)})
+        return await _respond(send, 202, {'accepted': len(fresh), 'duplicates': len(events) - len(fresh)})
+
+    async def _read_body(self, receive):
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return b''
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > settings.WEBHOOK_MAX_BODY:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def _secret(self, marketplace_id):
+        now = time.monotonic()
+        cached = self._secrets.get(marketplace_id)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        # Одновременные запросы к маркетплейсу без секрета в кэше ждут одну загрузку
+        loading = self._loading.get(marketplace_id)
+        if loading is None:
+            loading = asyncio.ensure_future(sync_to_async(_load_secret, thread_sensitive=False)(marketplace_id))
+            self._loading[marketplace_id] = loading
+            try:
+                secret = await asyncio.shield(loading)
+                self._secrets[marketplace_id] = (now + SECRET_CACHE_TTL, secret)
+            finally:
+                del self._loading[marketplace_id]
+            return secret
+        return await asyncio.shield(loading)
+
+    def _remember(self, key):
+        self._recent[key] = None
+        if len(self._recent) > settings.WEBHOOK_RECENT_EVENTS:
+            self._recent.popitem(last=False)
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._write(loop, batch)
+            finally:
+                for _event in batch:
+                    self._queue.task_done()
+
+    async def _write(self, loop, batch):
+        result = IngestResult()
+        pending = batch
+        for attempt in range(MAX_WRITE_RETRIES):
+            try:
+                written, pending = await loop.run_in_executor(self._executor, write_events, pending)
+                result.merge(written)
+            except Exception:
+                logger.exception('Webhook batch of %s events failed (attempt %s)', len(pending), attempt + 1)
+            if not pending:
+                break
+            # Повтор безопасен: примененные события отсекут версии
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+        if pending:
+            self.stats['failed'] += len(pending)
+            self._forget(pending)
+        self.stats['batches'] += 1
+        for name in ('created', 'updated', 'unchanged'):
+            self.stats[name] += getattr(result, name)
+        self.stats['stale'] += result.duplicates
+        self.stats['rejected'] += len(result.rejected)
+        if result.rejected:
+            logger.warning('Webhook events rejected: %s (first: %s)', len(result.rejected), result.rejected[:5])
+            rejected = {error['external_id'] for error in result.rejected}
+            self._forget([(marketplace, event) for marketplace, event in batch if event['external_id'] in rejected])
+
+    def _forget(self, batch):
+        # Незаписанное событие можно доставить повторно
+        for marketplace_id, event in batch:
+            self._recent.pop((marketplace_id, event['external_id'], event['version']), None)
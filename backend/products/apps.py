@@ -0,0 +1,23 @@
+from django.apps import AppConfig
+
+
+class ProductsConfig(AppConfig):
+    name = 'products'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save, pre_save
+
+        from .models import Product, ProductImage, ProductMarketplace
+        from .signals import (
+            attach_image_content,
+            invalidate_link_codes,
+            invalidate_product_codes,
+            schedule_image_renditions,
+        )
+
+        post_save.connect(invalidate_product_codes, sender=Product, dispatch_uid='barcode_index_product_save')
+        post_delete.connect(invalidate_product_codes, sender=Product, dispatch_uid='barcode_index_product_delete')
+        post_save.connect(invalidate_link_codes, sender=ProductMarketplace, dispatch_uid='barcode_index_link_save')
+        post_delete.connect(invalidate_link_codes, sender=ProductMarketplace, dispatch_uid='barcode_index_link_delete')
+        pre_save.connect(attach_image_content, sender=ProductImage, dispatch_uid='image_content_attach')
+        post_save.connect(schedule_image_renditions, sender=ProductImage, dispatch_uid='image_renditions_schedule')
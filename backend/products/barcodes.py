@@ -0,0 +1,334 @@
+"""
+Разрешение отсканированных кодов в товары.
+
+Код ищется в трех источниках: Product.barcode, ProductMarketplace.external_barcode
+и ProductMarketplace.external_article (в порядке приоритета) в пределах компании.
+
+Основной индекс хранится в памяти процесса в виде отсортированных массивов:
+64-битный хеш пары (компания, код) и параллельные массивы товара, маркетплейса
+и источника — около 25 байт на код вместо сотен байт в словаре. Изменения
+товаров и связей с маркетплейсами попадают в небольшой оверлей: локальные —
+через сигналы, сделанные в других процессах — через опрос updated_at.
+Полная перестройка выполняется в фоне, когда оверлей разрастается или
+индекс устаревает.
+"""
+import hashlib
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Product, ProductMarketplace
+
+logger = logging.getLogger(__name__)
+
+# Источники кода в порядке приоритета
+SOURCE_BARCODE = 0
+SOURCE_EXTERNAL_BARCODE = 1
+SOURCE_EXTERNAL_ARTICLE = 2
+
+SOURCE_NAMES = {
+    SOURCE_BARCODE: 'barcode',
+    SOURCE_EXTERNAL_BARCODE: 'external_barcode',
+    SOURCE_EXTERNAL_ARTICLE: 'external_article',
+}
+
+# Код соответствует нескольким товарам одного приоритета — решение через БД
+AMBIGUOUS = -1
+
+POLL_OVERLAP = timedelta(seconds=5)
+
+
+def code_hash(company_id, code):
+    digest = hashlib.blake2b(f'{company_id}:{code}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def _codes_query(product_ids=None):
+    """
+    Все коды товаров: (company_id, code, product_id, marketplace_id, source)
+    """
+    products = Product.objects.filter(is_deleted=False)
+    links = ProductMarketplace.objects.filter(product__is_deleted=False)
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+        links = links.filter(product_id__in=product_ids)
+
+    for company_id, barcode, product_id in products.values_list('company_id', 'barcode', 'id').iterator(
+        chunk_size=20000
+    ):
+        yield company_id, barcode, product_id, 0, SOURCE_BARCODE
+
+    for company_id, external_barcode, external_article, product_id, marketplace_id in links.values_list(
+        'product__company_id', 'external_barcode', 'external_article', 'product_id', 'marketplace_id'
+    ).iterator(chunk_size=20000):
+        if external_barcode:
+            yield company_id, external_barcode, product_id, marketplace_id, SOURCE_EXTERNAL_BARCODE
+        if external_article:
+            yield company_id, external_article, product_id, marketplace_id, SOURCE_EXTERNAL_ARTICLE
+
+
+class BarcodeIndex:
+    """
+    Неизменяемый отсортированный индекс кодов
+    """
+
+    def __init__(self, keys, products, marketplaces, sources):
+        self.keys = keys
+        self.products = products
+        self.marketplaces = marketplaces
+        self.sources = sources
+
+    @classmethod
+    def build(cls, rows):
+        """
+        Строит индекс из строк (company_id, code, product_id, marketplace_id, source)
+        """
+        keys = array('Q')
+        products = array('q')
+        marketplaces = array('q')
+        sources = array('b')
+        for company_id, code, product_id, marketplace_id, source in rows:
+            keys.append(code_hash(company_id, code))
+            products.append(product_id)
+            marketplaces.append(marketplace_id)
+            sources.append(source)
+
+        order = sorted(range(len(keys)), key=lambda i: keys[i] << 2 | sources[i])
+        index = cls(array('Q'), array('q'), array('q'), array('b'))
+        for i in order:
+            key = keys[i]
+            if index.keys and index.keys[-1] == key:
+                last = len(index.keys) - 1
+                # Коды с одинаковым хешем отсортированы по приоритету источника:
+                # менее приоритетные отбрасываются, равные по приоритету — неоднозначны
+                if index.sources[last] == sources[i] and index.products[last] != products[i]:
+                    index.products[last] = AMBIGUOUS
+                continue
+            index.keys.append(key)
+            index.products.append(products[i])
+            index.marketplaces.append(marketplaces[i])
+            index.sources.append(sources[i])
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def memory_bytes(self):
+        return sum(
+            part.buffer_info()[1] * part.itemsize
+            for part in (self.keys, self.products, self.marketplaces, self.sources)
+        )
+
+    def get(self, key):
+        position = bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            return self.products[position], self.marketplaces[position], self.sources[position]
+        return None
+
+
+class BarcodeResolver:
+    """
+    Индекс кодов процесса с оверлеем изменений и фоновой перестройкой
+    """
+
+    def __init__(self):
+        self._index = None
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self._built_at = 0.0
+        self._polled_at = 0.0
+        self._watermark = None
+        # Товары, коды которых пересчитаны после построения индекса
+        self._stale_products = set()
+        self._overlay = {}
+        self._overlay_keys = {}
+        self._pending = set()
+
+    @property
+    def is_ready(self):
+        return self._index is not None
+
+    def warm(self, background=True):
+        if background:
+            self._start_rebuild()
+        else:
+            self._rebuild()
+
+    def _start_rebuild(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_in_thread, name='barcode-index', daemon=True).start()
+
+    def _rebuild_in_thread(self):
+        try:
+            self._rebuild()
+        finally:
+            connection.close()
+
+    def _rebuild(self):
+        self._rebuilding = True
+        try:
+            started = timezone.now()
+            watermark = max(
+                Product.objects.aggregate(value=Max('updated_at'))['value'] or started,
+                ProductMarketplace.objects.aggregate(value=Max('updated_at'))['value'] or started,
+            )
+            index = BarcodeIndex.build(_codes_query())
+            with self._lock:
+                # Изменения, сделанные во время построения, подхватит ближайший опрос
+                self._index = index
+                self._watermark = min(watermark, started)
+                self._built_at = time.monotonic()
+                self._polled_at = 0.0
+                self._stale_products = set()
+                self._overlay = {}
+                self._overlay_keys = {}
+            logger.info('Barcode index built: %s codes, %s bytes', len(index), index.memory_bytes)
+        except Exception:
+            logger.exception('Barcode index build failed')
+        finally:
+            self._rebuilding = False
+
+    def invalidate(self, product_id):
+        """
+        Помечает товар измененным; его коды будут пересчитаны при следующем поиске
+        """
+        with self._lock:
+            self._pending.add(product_id)
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._built_at > settings.BARCODE_INDEX_MAX_AGE or (
+            len(self._overlay) > settings.BARCODE_INDEX_MAX_OVERLAY
+        ):
+            self._start_rebuild()
+
+        product_ids = set()
+        if now - self._polled_at >= settings.BARCODE_INDEX_POLL_INTERVAL:
+            # Изменения, сделанные другими процессами
+            self._polled_at = now
+            polled_at = timezone.now()
+            # Перекрытие окна опроса защищает от расхождения часов серверов приложения
+            since = self._watermark - POLL_OVERLAP
+            product_ids.update(Product.objects.filter(updated_at__gt=since).values_list('id', flat=True))
+            product_ids.update(
+                ProductMarketplace.objects.filter(updated_at__gt=since).values_list('product_id', flat=True)
+            )
+            self._watermark = polled_at
+        with self._lock:
+            product_ids |= self._pending
+            self._pending = set()
+        if not product_ids:
+            return
+
+        codes = {}
+        owners = {}
+        for company_id, code, product_id, marketplace_id, source in _codes_query(product_ids):
+            key = code_hash(company_id, code)
+            owners.setdefault(product_id, []).append(key)
+            current = codes.get(key)
+            if current is None or source < current[2]:
+                codes[key] = (product_id, marketplace_id, source)
+            elif source == current[2] and product_id != current[0]:
+                codes[key] = (AMBIGUOUS, 0, source)
+
+        with self._lock:
+            for product_id in product_ids:
+                for key in self._overlay_keys.pop(product_id, ()):
+                    self._overlay.pop(key, None)
+            self._overlay.update(codes)
+            self._overlay_keys.update(owners)
+            self._stale_products |= product_ids
+
+    def _lookup(self, key):
+        overlay_entry = self._overlay.get(key)
+        base_entry = self._index.get(key)
+        if base_entry is not None and base_entry[0] in self._stale_products:
+            base_entry = None
+        if overlay_entry is None or (base_entry is not None and base_entry[2] < overlay_entry[2]):
+            return base_entry
+        if base_entry is not None and base_entry[2] == overlay_entry[2] and base_entry[0] != overlay_entry[0]:
+            return AMBIGUOUS, 0, overlay_entry[2]
+        return overlay_entry
+
+    def resolve(self, company_id, codes):
+        """
+        Разрешает коды компании: {code: {'product_id', 'marketplace_id', 'source'} | None}
+        """
+        if self._index is None:
+            self.warm(background=True)
+            return resolve_from_db(company_id, codes)
+
+        self._refresh()
+        results = {}
+        fallback = []
+        for code in codes:
+            entry = self._lookup(code_hash(company_id, code))
+            if entry is None or entry[0] == AMBIGUOUS:
+                fallback.append(code)
+            else:
+                results[code] = _result(*entry)
+        if fallback:
+            # Неизвестные и неоднозначные коды проверяются в БД одним набором запросов
+            results.update(resolve_from_db(company_id, fallback))
+        return results
+
+
+def _result(product_id, marketplace_id, source):
+    return {
+        'product_id': product_id,
+        'marketplace_id': marketplace_id or None,
+        'source': SOURCE_NAMES[source],
+    }
+
+
+def resolve_from_db(company_id, codes):
+    """
+    Разрешение кодов запросами к БД (по одному запросу на источник)
+    """
+    codes = list(dict.fromkeys(codes))
+    found = {}
+    rows = Product.objects.filter(company_id=company_id, is_deleted=False, barcode__in=codes).values_list(
+        'barcode', 'id'
+    )
+    for barcode, product_id in rows:
+        found.setdefault(barcode, {})[product_id] = (product_id, 0, SOURCE_BARCODE)
+
+    links = ProductMarketplace.objects.filter(product__company_id=company_id, product__is_deleted=False)
+    for field, source in (('external_barcode', SOURCE_EXTERNAL_BARCODE), ('external_article', SOURCE_EXTERNAL_ARTICLE)):
+        missing = [code for code in codes if code not in found]
+        if not missing:
+            break
+        for code, product_id, marketplace_id in links.filter(**{f'{field}__in': missing}).values_list(
+            field, 'product_id', 'marketplace_id'
+        ):
+            found.setdefault(code, {}).setdefault(product_id, (product_id, marketplace_id, source))
+
+    results = {}
+    for code in codes:
+        candidates = found.get(code)
+        if not candidates:
+            results[code] = None
+        elif len(candidates) == 1:
+            results[code] = _result(*next(iter(candidates.values())))
+        else:
+            results[code] = {'product_id': None, 'candidates': sorted(candidates), 'source': None}
+    return results
+
+
+resolver = BarcodeResolver()
+
+
+def resolve_codes(company_id, codes):
+    return resolver.resolve(company_id, codes)
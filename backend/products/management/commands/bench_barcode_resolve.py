@@ -0,0 +1,65 @@
+import random
+import time
+
+from core.benchmark import BenchmarkCommand, stopwatch, summarize_latencies
+from products.barcodes import (
+    SOURCE_BARCODE, SOURCE_EXTERNAL_ARTICLE, SOURCE_EXTERNAL_BARCODE, BarcodeIndex, BarcodeResolver,
+)
+
+
+def synthetic_codes(skus, companies):
+    for product_id in range(1, skus + 1):
+        company_id = (product_id - 1) % companies + 1
+        yield company_id, f'46{product_id:011d}', product_id, 0, SOURCE_BARCODE
+        yield company_id, f'WB{product_id:09d}', product_id, 1, SOURCE_EXTERNAL_BARCODE
+        yield company_id, f'ART-{product_id}', product_id, 1, SOURCE_EXTERNAL_ARTICLE
+
+
+class Command(BenchmarkCommand):
+    help = 'Замеряет построение и поиск по индексу штрихкодов на синтетическом каталоге'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skus', type=int, default=2000000)
+        parser.add_argument('--companies', type=int, default=100)
+        parser.add_argument('--batch', type=int, default=200, help='Кодов в одном запросе')
+        parser.add_argument('--batches', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        skus = options['skus']
+        companies = options['companies']
+
+        with stopwatch() as elapsed:
+            index = BarcodeIndex.build(synthetic_codes(skus, companies))
+        build_seconds = elapsed()
+
+        resolver = BarcodeResolver()
+        resolver._index = index
+        # Опрос изменений в БД не относится к синтетическому каталогу
+        resolver._built_at = resolver._polled_at = float('inf')
+
+        rng = random.Random(1)
+        formats = ('46{:011d}', 'WB{:09d}', 'ART-{}')
+        per_code = []
+        per_batch = []
+        for _ in range(options['batches']):
+            company_id = rng.randrange(companies) + 1
+            codes = [
+                rng.choice(formats).format(rng.randrange(skus // companies) * companies + company_id)
+                for _ in range(options['batch'])
+            ]
+            started = time.perf_counter()
+            results = resolver.resolve(company_id, codes)
+            spent = time.perf_counter() - started
+            per_batch.append(spent)
+            per_code.append(spent / len(results))
+
+        self.report('barcode_resolve', {
+            'skus': skus,
+            'codes': len(index),
+            'build_seconds': build_seconds,
+            'index_bytes': index.memory_bytes,
+            'bytes_per_code': index.memory_bytes / len(index),
+            'batch_size': options['batch'],
+            'per_code': summarize_latencies(per_code),
+            'per_batch': summarize_latencies(per_batch),
+        }, options)
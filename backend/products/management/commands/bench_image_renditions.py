@@ -0,0 +1,162 @@
+import io
+import os
+import random
+import tempfile
+import uuid
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from PIL import Image, ImageDraw
+
+from core.benchmark import BenchmarkCommand, stopwatch, summarize_latencies
+from core.loadtest import LoadContext
+from products.models import ImageContent, Product, ProductImage
+from products.renditions import available_formats, import_images, render_pending
+
+
+def synthetic_image(seed, width, height):
+    """
+    JPEG-фотография товара: градиент с цветными фигурами и шумом (плохо сжимается, как снимок)
+    """
+    rng = random.Random(seed)
+    image = Image.merge('RGB', [
+        Image.linear_gradient('L').resize((width, height)),
+        Image.effect_noise((width, height), 40),
+        Image.linear_gradient('L').rotate(rng.choice([90, 180, 270])).resize((width, height)),
+    ])
+    draw = ImageDraw.Draw(image)
+    for _shape in range(20):
+        x, y = rng.randrange(width), rng.randrange(height)
+        size = rng.randint(width // 20, width // 4)
+        draw.ellipse((x, y, x + size, y + size), fill=tuple(rng.randrange(256) for _ in range(3)))
+    stream = io.BytesIO()
+    image.save(stream, 'JPEG', quality=90)
+    return stream.getvalue()
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Замеряет массовый импорт изображений товаров (хэширование, дедупликация), построение копий '
+        'в одном процессе и в пуле процессов и отдачу копий (данные generate_dataset, файлы — во временном '
+        'MEDIA_ROOT, записи удаляются после замера)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Компания с данными (по умолчанию первая синтетическая)')
+        parser.add_argument('--images', type=int, default=200)
+        parser.add_argument('--duplicate-share', type=float, default=0.3, help='Доля изображений-повторов')
+        parser.add_argument('--width', type=int, default=3000)
+        parser.add_argument('--height', type=int, default=2000)
+        parser.add_argument('--serial', type=int, default=40, help='Изображений для замера в одном процессе')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--requests', type=int, default=500, help='Запросов к копиям')
+
+    def handle(self, *args, **options):
+        try:
+            context = LoadContext.load(options['company'])
+        except LookupError as exc:
+            raise CommandError(str(exc))
+        product_ids = list(Product.objects.filter(company=context.company).values_list('pk', flat=True)[:1000])
+        if not product_ids:
+            raise CommandError(f'Company {context.company.pk} has no products')
+
+        rng = random.Random(1)
+        run_id = uuid.uuid4().hex
+        unique = max(1, round(options['images'] * (1 - options['duplicate_share'])))
+        with stopwatch() as elapsed:
+            blobs = [synthetic_image(f'{run_id}-{n}', options['width'], options['height']) for n in range(unique)]
+        generate_seconds = elapsed()
+        sources = blobs + [rng.choice(blobs) for _ in range(options['images'] - unique)]
+        rng.shuffle(sources)
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            prefix = f'bench-{run_id[:8]}'
+            try:
+                metrics = self._run(product_ids, sources, prefix, options, rng)
+            finally:
+                images = ProductImage.objects.filter(image__startswith=f'products/{prefix}')
+                content_ids = set(images.values_list('content_id', flat=True))
+                with transaction.atomic():
+                    images.delete()
+                    ImageContent.objects.filter(pk__in=content_ids, images__isnull=True).delete()
+        self.report('image_renditions', {
+            'images': len(sources),
+            'unique_images': unique,
+            'source_width': options['width'],
+            'source_height': options['height'],
+            'source_mean_bytes': sum(map(len, sources)) / len(sources),
+            'formats': ','.join(available_formats()),
+            'generate_seconds': generate_seconds,
+            **metrics,
+        }, options)
+
+    def _run(self, product_ids, sources, prefix, options, rng):
+        images = [
+            ProductImage(product_id=rng.choice(product_ids), image=ContentFile(blob, name=f'{prefix}-{n}.jpg'))
+            for n, blob in enumerate(sources)
+        ]
+        with stopwatch() as elapsed:
+            with transaction.atomic():
+                pending = import_images(images, render=False)
+        import_seconds = elapsed()
+        metrics = {
+            'import_seconds': import_seconds,
+            'import_images_per_second': len(images) / import_seconds,
+            # Повторы не записывают файл и не строят копии
+            'contents': len(pending),
+            'deduplicated': len(images) - len(pending),
+        }
+
+        serial = min(options['serial'], len(pending))
+        with stopwatch() as elapsed:
+            serial_counts = render_pending(workers=1, limit=serial)
+        metrics['serial_images_per_second'] = serial / elapsed() if serial else 0.0
+        with stopwatch() as elapsed:
+            pool_counts = render_pending(workers=options['workers'])
+        rendered = pool_counts['ready'] + pool_counts['failed']
+        metrics.update({
+            'workers': options['workers'],
+            'pool_images_per_second': rendered / elapsed() if rendered else 0.0,
+            'failed': serial_counts['failed'] + pool_counts['failed'],
+        })
+        if metrics['serial_images_per_second']:
+            metrics['pool_speedup'] = metrics['pool_images_per_second'] / metrics['serial_images_per_second']
+
+        contents = list(ImageContent.objects.filter(pk__in=pending, status='ready'))
+        if not contents:
+            raise CommandError('No renditions were built')
+        for size, formats in contents[0].renditions.items():
+            for image_format in formats:
+                metrics[f'{size}_{image_format}_mean_bytes'] = sum(
+                    default_storage.size(content.renditions[size][image_format]) for content in contents
+                ) / len(contents)
+
+        client = Client()
+        paths = [
+            reverse('image-rendition', args=[content.sha256, size])
+            for content in contents for size in content.renditions
+        ]
+        accept = 'image/avif,image/webp,image/*,*/*;q=0.8'
+        samples = []
+        etags = {}
+        for _request in range(options['requests']):
+            path = rng.choice(paths)
+            with stopwatch() as elapsed:
+                response = client.get(path, HTTP_ACCEPT=accept)
+                b''.join(response.streaming_content)
+            samples.append(elapsed())
+            etags[path] = response['ETag']
+        metrics.update({f'serve_{key}': value for key, value in summarize_latencies(samples).items()})
+        samples = []
+        for path, etag in etags.items():
+            with stopwatch() as elapsed:
+                response = client.get(path, HTTP_ACCEPT=accept, HTTP_IF_NONE_MATCH=etag)
+            if response.status_code != 304:
+                raise CommandError(f'{path}: expected 304, got {response.status_code}')
+            samples.append(elapsed())
+        metrics.update({f'not_modified_{key}': value for key, value in summarize_latencies(samples).items()})
+        return metrics
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from products import renditions
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит копии ожидающих изображений товаров в пуле процессов (после массового импорта '
+        'или для догоняющей обработки); параллельно работающие задачи Celery не строят те же изображения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Процессов (по умолчанию PRODUCT_IMAGE_WORKERS)')
+        parser.add_argument('--batch-size', type=int, help='Изображений, захватываемых за раз')
+        parser.add_argument('--limit', type=int, help='Остановиться после этого числа изображений')
+        parser.add_argument(
+            '--release-stale', action='store_true',
+            help='Сначала вернуть в очередь построения, зависшие дольше PRODUCT_IMAGE_RENDER_TIMEOUT',
+        )
+
+    def handle(self, *args, **options):
+        if options['release_stale']:
+            self.stdout.write(f'{renditions.release_stale()} stale renderings queued again')
+        counts = renditions.render_pending(
+            workers=options['workers'], batch_size=options['batch_size'], limit=options['limit'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'{counts["ready"]} images rendered, {counts["failed"]} failed'))
@@ -42,11 +42,68 @@ class Product(models.Model):
     class Meta:
         verbose_name = _('product')
         verbose_name_plural = _('products')
+        indexes = [
+            models.Index(fields=['updated_at'], name='product_updated_at_idx'),
+            # Водяной знак справочника компании (см. core.httpcache)
+            models.Index(fields=['company', 'updated_at'], name='product_company_updated_idx'),
+            models.Index(
+                fields=['company', 'article'], name='product_company_live_idx', condition=models.Q(is_deleted=False),
+            ),
+            # Списки товаров компании постранично по ключу (см. core.pagination)
+            models.Index(
+                fields=['company', 'created_at', 'id'], name='product_company_created_idx',
+                condition=models.Q(is_deleted=False),
+            ),
+        ]
         
     def __str__(self):
         return f"{self.name} ({self.article})"
 
 
+class ImageContent(models.Model):
+    """
+    Модель содержимого изображения товара.
+
+    Одна запись на SHA-256 оригинала, общая для изображений всех товаров и
+    компаний с тем же содержимым: оригинал хранится один раз, уменьшенные
+    копии строятся один раз (см. products.renditions).
+    """
+    STATUSES = (
+        ('pending', _('Pending')),
+        ('processing', _('Processing')),
+        ('ready', _('Ready')),
+        ('failed', _('Failed')),
+    )
+    
+    sha256 = models.CharField(_('SHA-256'), max_length=64, unique=True)
+    # Имя файла оригинала в хранилище (первой загрузки с этим содержимым)
+    source = models.CharField(_('source'), max_length=255)
+    status = models.CharField(_('status'), max_length=20, choices=STATUSES, default='pending')
+    
+    width = models.PositiveIntegerField(_('width (px)'), blank=True, null=True)
+    height = models.PositiveIntegerField(_('height (px)'), blank=True, null=True)
+    # Размер -> {формат: имя файла}
+    renditions = models.JSONField(_('renditions'), default=dict)
+    error = models.TextField(_('error'), blank=True, null=True)
+    
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+    
+    class Meta:
+        verbose_name = _('image content')
+        verbose_name_plural = _('image contents')
+        indexes = [
+            # Очередь построения и зависшие построения (см. products.renditions.render_pending)
+            models.Index(
+                fields=['status', 'updated_at'], name='image_content_queue_idx',
+                condition=models.Q(status__in=['pending', 'processing']),
+            ),
+        ]
+        
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.get_status_display()})"
+
+
 class ProductImage(models.Model):
     """
     Модель изображения товара
@@ -58,6 +115,14 @@ class ProductImage(models.Model):
     )
     
     image = models.ImageField(_('image'), upload_to='products/')
+    # Заполняется при сохранении по хэшу загруженного файла
+    content = models.ForeignKey(
+        ImageContent,
+        on_delete=models.PROTECT,
+        related_name='images',
+        blank=True,
+        null=True
+    )
     is_main = models.BooleanField(_('main image'), default=False)
     order = models.IntegerField(_('order'), default=0)
     
@@ -94,6 +159,7 @@ class ProductMarketplace(models.Model):
     
     # Статус на маркетплейсе
     is_active = models.BooleanField(_('active'), default=True)
+    stock_quantity = models.IntegerField(_('stock quantity'), default=0)
     last_sync = models.DateTimeField(_('last synchronization'), blank=True, null=True)
     
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
@@ -103,6 +169,12 @@ class ProductMarketplace(models.Model):
         verbose_name = _('product marketplace')
         verbose_name_plural = _('product marketplaces')
         unique_together = ('product', 'marketplace')
+        indexes = [
+            models.Index(fields=['marketplace', 'external_id'], name='product_mp_external_id_idx'),
+            models.Index(fields=['external_barcode'], name='product_mp_ext_barcode_idx'),
+            models.Index(fields=['external_article'], name='product_mp_ext_article_idx'),
+            models.Index(fields=['updated_at'], name='product_mp_updated_at_idx'),
+        ]
         
     def __str__(self):
         return f"{self.product.name} on {self.marketplace.name}"
@@ -0,0 +1,283 @@
+"""
+Уменьшенные копии (рендишны) изображений товаров.
+
+При сохранении ProductImage загруженный файл хэшируется (SHA-256), и
+изображения с одинаковым содержимым — у любых товаров и компаний —
+получают одну запись ImageContent: повторная загрузка не пишет файл в
+хранилище, а копии строятся один раз на содержимое.
+
+Для каждого размера PRODUCT_IMAGE_RENDITIONS (длинная сторона, px; меньшие
+изображения не увеличиваются) строится копия в каждом формате
+PRODUCT_IMAGE_FORMATS, который умеет записывать Pillow (AVIF — с
+pillow-avif-plugin, без него пропускается). Копия лежит по пути
+renditions/<хэш[:2]>/<хэш>/<размер>.<формат>: содержимое по пути не меняется,
+поэтому отдается как неизменяемое (см. products.views.ImageRenditionView).
+JPEG декодируется сразу в уменьшенном масштабе (draft), а меньшие размеры
+строятся из большего, а не из оригинала.
+
+Копии строятся в фоне, вне запроса загрузки: после фиксации транзакции
+ставится задача products.render_images, периодическая
+products.render_pending_images подбирает пропущенное и зависшее, а
+массовый импорт (import_images) раздает пачки задачам или обрабатывает
+render_pending в пуле процессов (команда render_product_images). Построение захватывает записи (pending ->
+processing, SKIP LOCKED), поэтому параллельные обработчики не строят одно
+содержимое дважды.
+"""
+import hashlib
+import importlib
+import io
+import logging
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import ExifTags, Image, ImageOps
+
+from .models import ImageContent, ProductImage
+
+try:
+    # pillow-avif-plugin регистрирует формат AVIF в Pillow
+    importlib.import_module('pillow_avif')
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+# Формат -> (формат Pillow, тип содержимого, расширение)
+FORMATS = {
+    'avif': ('AVIF', 'image/avif', 'avif'),
+    'webp': ('WEBP', 'image/webp', 'webp'),
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg'),
+}
+
+# Ориентации EXIF, при которых стороны меняются местами
+ROTATED_ORIENTATIONS = frozenset({5, 6, 7, 8})
+
+
+def available_formats():
+    """
+    Форматы PRODUCT_IMAGE_FORMATS, которые умеет записывать установленный Pillow, в порядке предпочтения
+    """
+    Image.init()
+    return [name for name in settings.PRODUCT_IMAGE_FORMATS if FORMATS[name][0] in Image.SAVE]
+
+
+def file_sha256(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def rendition_name(sha256, size, image_format):
+    return f'renditions/{sha256[:2]}/{sha256}/{size}.{FORMATS[image_format][2]}'
+
+
+def attach_content(product_image):
+    """
+    Связывает изображение с содержимым по хэшу загруженного файла (до сохранения модели).
+
+    Файл с уже известным содержимым не пишется: изображение ссылается на оригинал первой загрузки.
+    """
+    field_file = product_image.image
+    if not field_file or field_file._committed:
+        return
+    digest = file_sha256(field_file.file)
+    content = ImageContent.objects.filter(sha256=digest).first()
+    if content is None:
+        field_file.save(field_file.name, field_file.file, save=False)
+        content, _created = ImageContent.objects.get_or_create(sha256=digest, defaults={'source': field_file.name})
+    else:
+        product_image.image = content.source
+    product_image.content = content
+
+
+def import_images(images, render=True):
+    """
+    Массовый импорт: сохраняет несохраненные ProductImage одним bulk_create.
+
+    Запрос импорта только хэширует и сохраняет новые файлы; копии нового содержимого
+    строятся в фоне (render=False — не ставить задачи, например перед render_pending).
+    Возвращает ID записей ImageContent, ожидающих построения.
+    """
+    for image in images:
+        attach_content(image)
+    ProductImage.objects.bulk_create(images, batch_size=1000)
+    pending = sorted(
+        {image.content_id for image in images if image.content is not None and image.content.status == 'pending'}
+    )
+    if render:
+        schedule(pending)
+    return pending
+
+
+def _prepare(image):
+    """
+    Изображение в RGB или RGBA с учетом ориентации EXIF; возвращает его и исходные размеры
+    """
+    width, height = image.size
+    if image.getexif().get(ExifTags.Base.Orientation) in ROTATED_ORIENTATIONS:
+        width, height = height, width
+    scale = max(settings.PRODUCT_IMAGE_RENDITIONS.values()) / max(image.size)
+    if scale < 1:
+        # JPEG декодируется с уменьшением в 2-8 раз, пока длинная сторона не меньше наибольшей копии
+        image.draft('RGB', (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    return image, width, height
+
+
+def _encode(image, image_format):
+    pillow_format = FORMATS[image_format][0]
+    options = {'quality': settings.PRODUCT_IMAGE_QUALITY}
+    if pillow_format == 'JPEG':
+        if image.mode == 'RGBA':
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        options.update(optimize=True, progressive=True)
+    elif pillow_format == 'WEBP':
+        options['method'] = 4
+    stream = io.BytesIO()
+    image.save(stream, pillow_format, **options)
+    return stream.getvalue()
+
+
+def render_content(job):
+    """
+    Строит копии одного содержимого (выполняется и в процессах пула, без обращений к базе).
+
+    job — (ID, SHA-256, имя оригинала); возвращает (ID, поля ImageContent).
+    """
+    pk, sha256, source = job
+    formats = available_formats()
+    try:
+        with default_storage.open(source) as stream, Image.open(stream) as original:
+            image, width, height = _prepare(original)
+            renditions = {}
+            # От большего размера к меньшему: каждая копия уменьшается из предыдущей
+            for size_name, size in sorted(settings.PRODUCT_IMAGE_RENDITIONS.items(), key=lambda item: -item[1]):
+                image = image.copy()
+                image.thumbnail((size, size), Image.LANCZOS)
+                renditions[size_name] = {}
+                for image_format in formats:
+                    name = rendition_name(sha256, size_name, image_format)
+                    if not default_storage.exists(name):
+                        name = default_storage.save(name, ContentFile(_encode(image, image_format)))
+                    renditions[size_name][image_format] = name
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        return pk, {'status': 'failed', 'error': f'{type(exc).__name__}: {exc}'}
+    return pk, {'status': 'ready', 'width': width, 'height': height, 'renditions': renditions, 'error': None}
+
+
+def claim(ids=None, limit=None):
+    """
+    Переводит ожидающие построения записи (все или из ids) в processing; возвращает задания render_content
+    """
+    with transaction.atomic():
+        queryset = ImageContent.objects.select_for_update(skip_locked=True).filter(status='pending')
+        if ids is not None:
+            queryset = queryset.filter(pk__in=ids)
+        jobs = list(queryset.order_by('pk').values_list('pk', 'sha256', 'source')[:limit])
+        ImageContent.objects.filter(pk__in=[pk for pk, _sha256, _source in jobs]).update(
+            status='processing', updated_at=timezone.now(),
+        )
+    return jobs
+
+
+def save_results(results):
+    """
+    Записывает итоги render_content (bulk_update по 1000 записей)
+    """
+    contents = []
+    for pk, fields in results:
+        content = ImageContent(pk=pk, **{'width': None, 'height': None, 'renditions': {}, **fields})
+        content.updated_at = timezone.now()
+        contents.append(content)
+        if content.status == 'failed':
+            logger.warning('Image content %s rendering failed: %s', pk, content.error)
+    ImageContent.objects.bulk_update(
+        contents, ['status', 'width', 'height', 'renditions', 'error', 'updated_at'], batch_size=1000,
+    )
+    return contents
+
+
+def render_contents(ids):
+    """
+    Строит копии содержимого ids в текущем процессе (задача Celery); возвращает число построенных
+    """
+    jobs = claim(ids)
+    save_results(render_content(job) for job in jobs)
+    return len(jobs)
+
+
+def render_pending(workers=None, batch_size=None, limit=None):
+    """
+    Строит копии всех ожидающих записей в пуле из workers процессов пачками по batch_size.
+
+    Возвращает {'ready': ..., 'failed': ...}.
+    """
+    workers = workers or settings.PRODUCT_IMAGE_WORKERS
+    batch_size = batch_size or settings.PRODUCT_IMAGE_BATCH_SIZE
+    counts = {'ready': 0, 'failed': 0}
+    # Дочерние процессы не должны наследовать подключения к базе
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        while limit is None or counts['ready'] + counts['failed'] < limit:
+            remaining = None if limit is None else limit - counts['ready'] - counts['failed']
+            jobs = claim(limit=batch_size if remaining is None else min(batch_size, remaining))
+            if not jobs:
+                break
+            chunksize = max(1, len(jobs) // (workers * 4))
+            for content in save_results(pool.map(render_content, jobs, chunksize=chunksize)):
+                counts[content.status] += 1
+    return counts
+
+
+def release_stale():
+    """
+    Возвращает в очередь записи, зависшие в processing дольше PRODUCT_IMAGE_RENDER_TIMEOUT
+    """
+    deadline = timezone.now() - timedelta(seconds=settings.PRODUCT_IMAGE_RENDER_TIMEOUT)
+    return ImageContent.objects.filter(status='processing', updated_at__lt=deadline).update(
+        status='pending', updated_at=timezone.now(),
+    )
+
+
+def dispatch_pending():
+    """
+    Возвращает в очередь зависшие записи и ставит задачи на ожидающие дольше минуты (пропущенные при загрузке)
+    """
+    release_stale()
+    ids = list(
+        ImageContent.objects.filter(status='pending', updated_at__lt=timezone.now() - timedelta(minutes=1))
+        .order_by('pk').values_list('pk', flat=True)
+    )
+    schedule(ids)
+    return len(ids)
+
+
+def schedule(content_ids):
+    """
+    Ставит построение копий в очередь Celery после фиксации транзакции, пачками по PRODUCT_IMAGE_TASK_BATCH
+    """
+    from .tasks import render_product_images
+
+    content_ids = list(content_ids)
+    batch = settings.PRODUCT_IMAGE_TASK_BATCH
+
+    def enqueue():
+        for start in range(0, len(content_ids), batch):
+            render_product_images.delay(content_ids[start:start + batch])
+
+    transaction.on_commit(enqueue)
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.urls import reverse
+from rest_framework import serializers
+
+from core.fieldsets import FieldsetSerializer
+
+from .models import Product, ProductImage
+
+
+class ProductSerializer(FieldsetSerializer):
+    class Meta:
+        model = Product
+        fields = (
+            'id', 'name', 'article', 'barcode', 'description', 'brand', 'category', 'weight', 'width', 'height',
+            'depth', 'purchase_price', 'recommended_price', 'is_active', 'created_at', 'updated_at',
+        )
+        read_only_fields = fields
+
+
+class ProductImageSerializer(serializers.ModelSerializer):
+    """
+    Изображение товара со ссылками на копии (пустые, пока копии не построены)
+    """
+    status = serializers.CharField(source='content.status', default=None)
+    width = serializers.IntegerField(source='content.width', default=None)
+    height = serializers.IntegerField(source='content.height', default=None)
+    renditions = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProductImage
+        fields = ('id', 'product', 'image', 'is_main', 'order', 'status', 'width', 'height', 'renditions')
+        read_only_fields = fields
+
+    def get_renditions(self, image):
+        if image.content is None or image.content.status != 'ready':
+            return {}
+        request = self.context.get('request')
+        renditions = {}
+        for size in settings.PRODUCT_IMAGE_RENDITIONS:
+            url = reverse('image-rendition', args=[image.content.sha256, size])
+            renditions[size] = request.build_absolute_uri(url) if request else url
+        return renditions
@@ -0,0 +1,20 @@
+from .barcodes import resolver
+from .renditions import attach_content, schedule
+
+
+def invalidate_product_codes(sender, instance, **kwargs):
+    resolver.invalidate(instance.pk)
+
+
+def invalidate_link_codes(sender, instance, **kwargs):
+    resolver.invalidate(instance.product_id)
+
+
+def attach_image_content(sender, instance, raw=False, **kwargs):
+    if not raw:
+        attach_content(instance)
+
+
+def schedule_image_renditions(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.content_id is not None and instance.content.status == 'pending':
+        schedule([instance.content_id])
@@ -0,0 +1,13 @@
+from core.celery import app
+
+from . import renditions
+
+
+@app.task(name='products.render_images', acks_late=True)
+def render_product_images(content_ids):
+    return renditions.render_contents(content_ids)
+
+
+@app.task(name='products.render_pending_images')
+def render_pending_images():
+    return renditions.dispatch_pending()
@@ -0,0 +1,133 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseNotFound
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from django.views import View
+from rest_framework import status
+from rest_framework.generics import ListAPIView
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.fieldsets import FieldsetMixin
+from core.httpcache import CatalogCacheMixin
+
+from .barcodes import resolve_codes
+from .models import Product, ProductImage
+from .renditions import FORMATS, available_formats, rendition_name
+from .serializers import ProductImageSerializer, ProductSerializer
+
+MAX_RESOLVE_CODES = 1000
+MAX_IMAGE_PRODUCTS = 500
+
+
+class ProductListView(CatalogCacheMixin, FieldsetMixin, ListAPIView):
+    """
+    Товары компании (кроме удаленных) от новых к старым, постранично по ключу (created_at, id);
+    поддерживает If-None-Match.
+
+    GET ?active=1|0&fields=id,name,article&cursor=...&total=approximate
+    """
+    # Пользователь токена, водяной знак справочника и страница
+    query_budget = 3
+    serializer_class = ProductSerializer
+    catalog_model = Product
+
+    def get_queryset(self):
+        queryset = Product.objects.filter(company_id=self.request.user.company_id, is_deleted=False)
+        active = self.request.query_params.get('active')
+        if active is not None:
+            queryset = queryset.filter(is_active=active in ('1', 'true'))
+        return queryset
+
+
+class BarcodeResolveView(APIView):
+    """
+    Пакетное разрешение отсканированных кодов в товары компании.
+
+    POST {"codes": ["4600000000001", ...]} -> {"results": {code: {...} | null}}
+    """
+
+    def post(self, request):
+        codes = request.data.get('codes')
+        if not isinstance(codes, list) or not all(isinstance(code, str) and code for code in codes):
+            return Response({'codes': 'Expected a list of non-empty strings'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(codes) > MAX_RESOLVE_CODES:
+            return Response(
+                {'codes': f'At most {MAX_RESOLVE_CODES} codes per request'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if request.user.company_id is None:
+            return Response({'results': {code: None for code in codes}})
+
+        return Response({'results': resolve_codes(request.user.company_id, codes)})
+
+
+class ProductImageListView(APIView):
+    """
+    Изображения товаров компании со ссылками на копии (экраны подбора, списки товаров).
+
+    GET ?product=<id>&product=<id>... -> {"results": {product_id: [{..., "renditions": {размер: url}}]}}
+    """
+    # Пользователь токена и изображения с содержимым
+    query_budget = 2
+
+    def get(self, request):
+        try:
+            product_ids = [int(value) for value in request.query_params.getlist('product')]
+        except ValueError:
+            return Response({'product': 'Expected integer IDs'}, status=status.HTTP_400_BAD_REQUEST)
+        if not product_ids or len(product_ids) > MAX_IMAGE_PRODUCTS:
+            return Response(
+                {'product': f'Expected 1 to {MAX_IMAGE_PRODUCTS} product IDs'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        images = ProductImage.objects.filter(
+            product__company_id=request.user.company_id, product_id__in=product_ids,
+        ).select_related('content').order_by('product_id', 'order', 'pk')
+        results = {product_id: [] for product_id in product_ids}
+        for image in ProductImageSerializer(images, many=True, context={'request': request}).data:
+            results[image['product']].append(image)
+        return Response({'results': results})
+
+
+class ImageRenditionView(View):
+    """
+    Копия изображения товара: GET /api/images/<sha256>/<размер>/.
+
+    Формат выбирается по Accept в порядке PRODUCT_IMAGE_FORMATS, JPEG отдается
+    любому клиенту. Содержимое по адресу не меняется, поэтому ответ кэшируется
+    как неизменяемый; токен не нужен — адрес содержит хэш содержимого, и
+    изображения можно отдавать в <img>. Запросов к базе нет: файлы ищутся по
+    путям rendition_name.
+    """
+
+    def get(self, request, sha256, size):
+        if size not in settings.PRODUCT_IMAGE_RENDITIONS:
+            return _not_found()
+        accept = request.headers.get('Accept', '')
+        for image_format in available_formats():
+            name = rendition_name(sha256, size, image_format)
+            content_type = FORMATS[image_format][1]
+            if (image_format == 'jpeg' or content_type in accept) and default_storage.exists(name):
+                break
+        else:
+            # Копии еще не построены
+            return _not_found()
+
+        etag = quote_etag(f'{sha256[:32]}-{size}-{image_format}')
+        tags = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in {tag[2:] if tag.startswith('W/') else tag for tag in tags}:
+            response = HttpResponse(status=304)
+        else:
+            response = FileResponse(default_storage.open(name), content_type=content_type)
+        response['ETag'] = etag
+        response['Cache-Control'] = f'public, max-age={settings.PRODUCT_IMAGE_CACHE_MAX_AGE}, immutable'
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+
+def _not_found():
+    response = HttpResponseNotFound()
+    response['Cache-Control'] = 'no-store'
+    return response
@@ -0,0 +1,25 @@
+from django.apps import AppConfig
+
+
+class ReportsConfig(AppConfig):
+    name = 'reports'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_migrate, post_save
+
+        from orders.signals import orders_archived
+
+        from .signals import (
+            COMPANY_PATHS, ITEM_MODELS, install_rollup_triggers, invalidate_archived_reports, invalidate_report_cache,
+        )
+
+        for model in COMPANY_PATHS:
+            post_delete.connect(
+                invalidate_report_cache, sender=model, dispatch_uid=f'report_cache_delete_{model._meta.label_lower}'
+            )
+        for model in ITEM_MODELS:
+            post_save.connect(
+                invalidate_report_cache, sender=model, dispatch_uid=f'report_cache_save_{model._meta.label_lower}'
+            )
+        post_migrate.connect(install_rollup_triggers, sender=self, dispatch_uid='report_rollup_triggers')
+        orders_archived.connect(invalidate_archived_reports, dispatch_uid='report_cache_archived_orders')
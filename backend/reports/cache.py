@@ -0,0 +1,221 @@
+"""
+Кэш готовых файлов отчетов.
+
+Ключ — SHA-256 канонического JSON (компания, тип, формат, нормализованные
+параметры), поэтому одинаковые по смыслу запросы (другой порядок статусов,
+ID строкой, пустые фильтры) попадают в одну запись. Запись действительна,
+пока не изменились исходные таблицы отчета: при построении запоминается
+водяной знак — максимальный updated_at каждой таблицы в пределах компании,
+а удаления строк и изменения позиций (у которых нет updated_at) сбрасывают
+записи компании сигналами (см. reports.signals).
+
+Попадание не читает данные отчета: Report.file указывает на файл записи.
+Записи вытесняются по давности использования (LRU), когда их больше
+REPORT_CACHE_MAX_ENTRIES или суммарный размер файлов больше
+REPORT_CACHE_MAX_BYTES.
+"""
+import hashlib
+import json
+from datetime import date
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from api.models import Marketplace
+from core.replicas import analytics
+from orders.models import Order
+from products.models import Product
+from services.models import Service, ServiceRequest
+from shipments.models import Shipment
+from stock.models import StockBalance
+from supplies.models import Supply
+from warehouses.models import StorageUnit, Warehouse
+
+from .models import OrderDailyRollup, Report, ReportCacheEntry
+from .rendering import release_file, render_report
+
+# Исходные таблицы отчетов: (модель, путь к компании)
+WATERMARK_SOURCES = {
+    'orders': [(Order, 'company'), (Marketplace, 'company'), (Warehouse, 'company')],
+    'sales': [(Order, 'company'), (Product, 'company'), (Marketplace, 'company')],
+    'supplies': [(Supply, 'company'), (Product, 'company'), (Warehouse, 'company')],
+    'shipments': [(Shipment, 'company'), (Order, 'company'), (Marketplace, 'company'), (Warehouse, 'company')],
+    'services': [(ServiceRequest, 'company'), (Service, 'company'), (Warehouse, 'company')],
+    'inventory': [
+        (StockBalance, 'warehouse__company'), (Product, 'company'), (Warehouse, 'company'),
+        (StorageUnit, 'warehouse__company'),
+    ],
+    'financial': [(OrderDailyRollup, 'company'), (Marketplace, 'company'), (Warehouse, 'company')],
+}
+
+ID_PARAMETERS = ('warehouse', 'marketplace')
+DATE_PARAMETERS = ('date_from', 'date_to')
+
+
+class InvalidParameter(ValueError):
+    """
+    Некорректный параметр отчета; name — имя параметра
+    """
+
+    def __init__(self, name, message):
+        super().__init__(message)
+        self.name = name
+
+
+def _id(name, value):
+    # bool — подкласс int, но не ID
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise InvalidParameter(name, 'Expected an ID or a list of IDs')
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidParameter(name, 'Expected an ID or a list of IDs')
+
+
+def normalize_parameters(parameters):
+    """
+    Канонический вид параметров отчета: даты ISO, ID числами, статусы сортированным списком, без пустых значений.
+
+    Некорректный параметр — InvalidParameter.
+    """
+    if not isinstance(parameters or {}, dict):
+        raise InvalidParameter('parameters', 'Expected an object')
+    normalized = {}
+    for name, value in (parameters or {}).items():
+        if value in (None, '', [], ()):
+            continue
+        if name in DATE_PARAMETERS:
+            if not isinstance(value, date):
+                try:
+                    value = date.fromisoformat(value)
+                except (TypeError, ValueError):
+                    raise InvalidParameter(name, 'Expected a date in YYYY-MM-DD format')
+            value = value.isoformat()
+        elif name in ID_PARAMETERS:
+            value = sorted({_id(name, item) for item in value}) if isinstance(value, list) else _id(name, value)
+        elif name == 'status':
+            statuses = [value] if isinstance(value, str) else value
+            if not isinstance(statuses, list) or not all(isinstance(item, str) for item in statuses):
+                raise InvalidParameter(name, 'Expected a status or a list of statuses')
+            value = sorted(set(statuses))
+        normalized[name] = value
+    return normalized
+
+
+def cache_key(company_id, report_type, report_format, parameters):
+    payload = json.dumps(
+        [company_id, report_type, report_format, normalize_parameters(parameters)],
+        sort_keys=True, separators=(',', ':'), default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def watermark(company_id, report_type):
+    """
+    Максимальные updated_at исходных таблиц отчета в пределах компании
+    """
+    marks = {}
+    for model, company_path in WATERMARK_SOURCES.get(report_type, ()):
+        latest = model.objects.filter(**{company_path: company_id}).aggregate(latest=Max('updated_at'))['latest']
+        marks[model._meta.label] = latest.isoformat() if latest else None
+    return marks
+
+
+def invalidate(company_id):
+    """
+    Помечает устаревшими все записи кэша компании
+    """
+    return ReportCacheEntry.objects.filter(company_id=company_id, watermark__isnull=False).update(watermark=None)
+
+
+def serve_from_cache(report, key, marks):
+    """
+    Отдает отчету файл действительной записи кэша; возвращает число строк или None при промахе
+    """
+    entry = ReportCacheEntry.objects.filter(key=key).first()
+    if entry is None or entry.watermark != marks or not entry.file.storage.exists(entry.file.name):
+        return None
+    now = timezone.now()
+    ReportCacheEntry.objects.filter(pk=entry.pk).update(hits=F('hits') + 1, last_used_at=now)
+    previous = report.file.name
+    report.file.name = entry.file.name
+    report.is_generated = True
+    report.generation_date = now
+    report.save(update_fields=['file', 'is_generated', 'generation_date', 'updated_at'])
+    if previous != entry.file.name:
+        release_file(previous)
+    return entry.rows
+
+
+def remember(report, key, marks, count):
+    """
+    Запоминает только что сформированный файл отчета в кэше
+    """
+    previous = ReportCacheEntry.objects.filter(key=key).values_list('file', flat=True).first()
+    ReportCacheEntry.objects.update_or_create(key=key, defaults={
+        'company_id': report.company_id,
+        'type': report.type,
+        'format': report.format,
+        'parameters': normalize_parameters(report.parameters),
+        'watermark': marks,
+        'file': report.file.name,
+        'size': report.file.size,
+        'rows': count,
+        'last_used_at': timezone.now(),
+    })
+    if previous and previous != report.file.name:
+        # Файл устаревшей записи больше не нужен, если его не выдавали отчетам
+        release_file(previous)
+    evict()
+
+
+def is_cacheable(report):
+    return report.type in WATERMARK_SOURCES
+
+
+def generate_report(report, use_cache=True):
+    """
+    Формирует файл отчета, по возможности беря его из кэша.
+
+    Возвращает (число строк, попадание в кэш); некорректные параметры — InvalidParameter.
+    """
+    normalize_parameters(report.parameters)
+    if not use_cache or not is_cacheable(report):
+        return render_report(report), False
+
+    key = cache_key(report.company_id, report.type, report.format, report.parameters)
+    # Водяной знак снимается до чтения данных и с той же базы: изменения во время построения (или еще не
+    # дошедшие до реплики) сделают запись устаревшей
+    with analytics() as database:
+        marks = watermark(report.company_id, report.type)
+    count = serve_from_cache(report, key, marks)
+    if count is not None:
+        return count, True
+
+    count = render_report(report, database)
+    remember(report, key, marks, count)
+    return count, False
+
+
+def evict(max_bytes=None, max_entries=None):
+    """
+    Вытесняет давно не использованные записи сверх лимитов; возвращает число удаленных
+    """
+    max_bytes = settings.REPORT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_entries = settings.REPORT_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    total = 0
+    evicted = []
+    entries = ReportCacheEntry.objects.order_by('-last_used_at', '-pk').values_list('pk', 'size', 'file')
+    for number, (pk, size, name) in enumerate(entries.iterator(), start=1):
+        total += size
+        if number > max_entries or total > max_bytes:
+            evicted.append((pk, name))
+    for pk, name in evicted:
+        with transaction.atomic():
+            ReportCacheEntry.objects.filter(pk=pk).delete()
+            # Отчеты, выданные из этой записи, нужно сформировать заново
+            Report.objects.filter(file=name).update(file='', is_generated=False, generation_date=None)
+        release_file(name)
+    return len(evicted)
@@ -0,0 +1,110 @@
+import uuid
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from api.models import Marketplace
+from companies.models import Company
+from core.benchmark import BenchmarkCommand, stopwatch, summarize_latencies
+from orders.models import Order, OrderItem
+from products.models import Product
+from reports.rollups import dashboard
+from warehouses.models import Warehouse
+
+
+class Command(BenchmarkCommand):
+    help = 'Замеряет сводку рабочего стола по дневным итогам и такой же расчет по заказам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000000)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--repeats', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            run_id = uuid.uuid4().hex[:8]
+            company = Company.objects.create(name=f'Benchmark {run_id}', inn=run_id, legal_address='-')
+            marketplaces = [
+                Marketplace.objects.create(name=f'Benchmark {n}', type='wildberries', company=company).pk
+                for n in range(3)
+            ]
+            warehouses = [
+                Warehouse.objects.create(name=f'Benchmark {n}', type='fulfillment', address='-', company=company).pk
+                for n in range(3)
+            ]
+            products = [
+                product.pk for product in Product.objects.bulk_create(
+                    [
+                        Product(name=f'Product {i}', article=f'A-{i}', barcode=f'{run_id}{i:08d}', company=company)
+                        for i in range(options['products'])
+                    ],
+                    batch_size=5000,
+                )
+            ]
+            # Итоги поддерживаются триггерами прямо во время загрузки
+            with stopwatch() as elapsed:
+                self._generate_orders(company, marketplaces, warehouses, products, options['orders'], options['days'],
+                                      run_id)
+            load_seconds = elapsed()
+
+            today = timezone.localdate()
+            periods = {'30d': today - timedelta(days=29), 'all': today - timedelta(days=options['days'])}
+            for period, date_from in periods.items():
+                samples = []
+                for _repeat in range(options['repeats']):
+                    with stopwatch() as elapsed:
+                        dashboard(company.pk, date_from=date_from, date_to=today)
+                    samples.append(elapsed())
+
+                with stopwatch() as elapsed:
+                    orders = Order.objects.filter(company=company, created_at__date__gte=date_from)
+                    orders.aggregate(orders=Count('id'), revenue=Sum('total_price'), cost=Sum('fulfillment_cost'))
+                    list(orders.values('status').annotate(orders=Count('id')).order_by())
+                    list(orders.values('created_at__date').annotate(revenue=Sum('total_price')).order_by())
+                    list(orders.values('marketplace_id').annotate(revenue=Sum('total_price')).order_by())
+                    OrderItem.objects.filter(
+                        order__company=company, order__created_at__date__gte=date_from,
+                        order__status__in=['shipped', 'delivered'],
+                    ).aggregate(quantity=Sum('quantity'))
+                scan_seconds = elapsed()
+
+                self.report(f'dashboard_{period}', {
+                    'orders': options['orders'],
+                    'load_seconds': load_seconds,
+                    **{f'rollup_{key}': value for key, value in summarize_latencies(samples).items()},
+                    'order_scan_ms': scan_seconds * 1000,
+                }, options)
+
+            transaction.set_rollback(True)
+
+    def _generate_orders(self, company, marketplaces, warehouses, products, count, days, run_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {Order._meta.db_table}
+                    (marketplace_id, company_id, external_id, status, shipping_warehouse_id,
+                     total_price, fulfillment_cost, weight, created_at, updated_at)
+                SELECT (%(marketplaces)s::bigint[])[1 + n %% 3], %(company)s, %(run_id)s || '-' || n,
+                       (ARRAY['new', 'processing', 'shipped', 'delivered', 'cancelled'])[1 + n %% 5],
+                       (%(warehouses)s::bigint[])[1 + n / 7 %% 3], 100 + n %% 9900, 35, 50 + n %% 20000,
+                       now() - (n %% %(days)s) * interval '1 day' - (n %% 86400) * interval '1 second', now()
+                FROM generate_series(1, %(count)s) AS n
+                """,
+                {
+                    'marketplaces': marketplaces, 'warehouses': warehouses, 'company': company.pk,
+                    'run_id': run_id, 'count': count, 'days': days,
+                },
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO {OrderItem._meta.db_table} (order_id, product_id, quantity, price, is_processed, created_at)
+                SELECT o.id, (%(products)s::bigint[])[1 + (o.id * line) %% array_length(%(products)s::bigint[], 1)],
+                       1 + o.id %% 3, 99.90, false, now()
+                FROM {Order._meta.db_table} o, generate_series(1, 1 + o.id %% 2) AS line
+                WHERE o.company_id = %(company)s
+                """,
+                {'products': products, 'company': company.pk},
+            )
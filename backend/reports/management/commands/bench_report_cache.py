@@ -0,0 +1,82 @@
+import uuid
+
+from django.db import connection, transaction
+
+from api.models import Marketplace
+from companies.models import Company
+from core.benchmark import BenchmarkCommand, stopwatch, summarize_latencies
+from orders.models import Order
+from reports.cache import generate_report
+from reports.models import Report
+
+
+class Command(BenchmarkCommand):
+    help = 'Сравнивает время формирования отчета без кэша, из кэша и после изменения данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=200000)
+        parser.add_argument('--repeats', type=int, default=200)
+        parser.add_argument('--format', choices=['csv', 'excel'], default='csv')
+
+    def handle(self, *args, **options):
+        files = set()
+        try:
+            with transaction.atomic():
+                run_id = uuid.uuid4().hex[:8]
+                company = Company.objects.create(name=f'Benchmark {run_id}', inn=run_id, legal_address='-')
+                marketplace = Marketplace.objects.create(name='Benchmark', type='wildberries', company=company)
+                self._generate_orders(company, marketplace, options['orders'], run_id)
+
+                def request(parameters):
+                    report = Report.objects.create(
+                        name='Benchmark', type='orders', format=options['format'], company=company,
+                        parameters=parameters,
+                    )
+                    with stopwatch() as elapsed:
+                        rows, cached = generate_report(report)
+                    files.add(report.file.name)
+                    return elapsed(), rows, cached
+
+                miss_seconds, rows, _cached = request({'status': ['new', 'processing']})
+                hits = []
+                for number in range(options['repeats']):
+                    # Те же параметры в другом виде попадают в ту же запись кэша
+                    seconds, _rows, cached = request({'status': ['processing', 'new'], 'warehouse': ''})
+                    assert cached, 'repeat request missed the cache'
+                    hits.append(seconds)
+
+                order = Order.objects.filter(company=company).first()
+                order.save(update_fields=['updated_at'])
+                stale_seconds, _rows, cached = request({'status': ['new', 'processing']})
+                assert not cached, 'changed data was served from the cache'
+
+                transaction.set_rollback(True)
+        finally:
+            storage = Report._meta.get_field('file').storage
+            for name in files:
+                if name:
+                    storage.delete(name)
+
+        self.report('report_cache', {
+            'format': options['format'],
+            'rows': rows,
+            'miss_seconds': miss_seconds,
+            'stale_miss_seconds': stale_seconds,
+            **{f'hit_{key}': value for key, value in summarize_latencies(hits).items()},
+            'speedup': miss_seconds / (sum(hits) / len(hits)) if hits else 0.0,
+        }, options)
+
+    def _generate_orders(self, company, marketplace, count, run_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {Order._meta.db_table}
+                    (marketplace_id, company_id, external_id, status, total_price, weight, created_at, updated_at)
+                SELECT %(marketplace)s, %(company)s, %(run_id)s || '-' || n,
+                       CASE WHEN n %% 5 = 0 THEN 'processing' ELSE 'new' END,
+                       100 + n %% 9900, 50 + (n * 7919) %% 20000,
+                       now() - (n %% 86400) * interval '1 second', now()
+                FROM generate_series(1, %(count)s) AS n
+                """,
+                {'marketplace': marketplace.pk, 'company': company.pk, 'run_id': run_id, 'count': count},
+            )
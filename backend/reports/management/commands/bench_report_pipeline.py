@@ -0,0 +1,89 @@
+import multiprocessing
+import uuid
+
+from django.db import connection, connections
+
+from api.models import Marketplace
+from companies.models import Company
+from core.benchmark import BenchmarkCommand, stopwatch
+from orders.models import Order
+from reports.models import Report, ReportChunk
+from reports.pipeline import merge_chunks, prepare_chunks, render_chunk
+from reports.rendering import render_report
+
+
+class Command(BenchmarkCommand):
+    help = 'Сравнивает последовательную генерацию отчета с генерацией по частям в нескольких процессах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000000)
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+        parser.add_argument('--chunks-per-worker', type=int, default=2)
+        parser.add_argument('--format', choices=['csv', 'excel'], default='csv')
+
+    def handle(self, *args, **options):
+        # Воркерам нужны зафиксированные данные, поэтому они удаляются явно в конце
+        run_id = uuid.uuid4().hex[:8]
+        company = Company.objects.create(name=f'Benchmark {run_id}', inn=run_id, legal_address='-')
+        reports = []
+        try:
+            marketplace = Marketplace.objects.create(name='Benchmark', type='wildberries', company=company)
+            self._generate_orders(company, marketplace, options['orders'], options['days'], run_id)
+
+            def new_report():
+                report = Report.objects.create(
+                    name='Benchmark', type='orders', format=options['format'], company=company, parameters={}
+                )
+                reports.append(report)
+                return report
+
+            with stopwatch() as elapsed:
+                rows = render_report(new_report())
+            sequential = elapsed()
+            self.report('report_pipeline_sequential', {'rows': rows, 'seconds': sequential}, options)
+
+            context = multiprocessing.get_context('fork')
+            for workers in options['workers']:
+                report = new_report()
+                with stopwatch() as elapsed:
+                    chunks = prepare_chunks(report, max_chunks=workers * options['chunks_per_worker'])
+                    connections.close_all()
+                    with context.Pool(workers) as pool:
+                        pool.map(render_chunk, [chunk.pk for chunk in chunks], chunksize=1)
+                    with stopwatch() as merge_elapsed:
+                        rows = merge_chunks(report.pk)
+                seconds = elapsed()
+                self.report(f'report_pipeline_{workers}_workers', {
+                    'rows': rows,
+                    'chunks': len(chunks),
+                    'seconds': seconds,
+                    'merge_seconds': merge_elapsed(),
+                    'speedup': sequential / seconds,
+                    'efficiency': sequential / seconds / workers,
+                }, options)
+        finally:
+            for report in Report.objects.filter(pk__in=[report.pk for report in reports]):
+                if report.file:
+                    report.file.delete(save=False)
+            for chunk in ReportChunk.objects.filter(report__in=reports):
+                if chunk.file:
+                    chunk.file.delete(save=False)
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {Order._meta.db_table} WHERE company_id = %s', [company.pk])
+            company.delete()
+
+    def _generate_orders(self, company, marketplace, count, days, run_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {Order._meta.db_table}
+                    (marketplace_id, company_id, external_id, status, total_price, weight, created_at, updated_at)
+                SELECT %(marketplace)s, %(company)s, %(run_id)s || '-' || n,
+                       (ARRAY['new', 'processing', 'shipped', 'delivered'])[1 + n %% 4],
+                       100 + n %% 9900, 50 + (n::bigint * 7919) %% 20000,
+                       now() - (n %% %(days)s) * interval '1 day' - (n %% 86400) * interval '1 second', now()
+                FROM generate_series(1, %(count)s) AS n
+                """,
+                {'marketplace': marketplace.pk, 'company': company.pk, 'run_id': run_id, 'count': count, 'days': days},
+            )
@@ -0,0 +1,66 @@
+import multiprocessing
+import resource
+import tempfile
+
+from django.core.management.base import CommandError
+from django.db import connections, transaction
+
+from core.benchmark import BenchmarkCommand, stopwatch
+from reports.rendering import localize_datetimes, orders_source, sql_rows, write_report
+
+# Строки формы отчета по заказам, сгенерированные на стороне БД
+SYNTHETIC_ORDERS_SQL = """
+    SELECT 'ORD-' || n, 'Marketplace ' || n %% 5, (ARRAY['new', 'processing', 'shipped', 'delivered'])[1 + n %% 4],
+           timestamptz '2024-01-01 00:00:00+00' + n * interval '3 seconds', 'Warehouse 1',
+           to_char(date '2024-01-01' + n / 28800, 'YYYYMMDD') || '-1200-1-' || lpad((n / 200 %% 1000)::text, 3, '0'),
+           date '2024-01-01' + n / 28800, (100 + n %% 9900)::numeric(10, 2), NULL::numeric(10, 2),
+           (50 + n %% 20000)::numeric(10, 2)
+    FROM generate_series(1, %s) AS n
+"""
+
+
+def _render(report_format, rows_count, pipe):
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    headers = [str(header) for header, _lookup in orders_source(None, {})[1]]
+    with tempfile.TemporaryFile() as stream:
+        with stopwatch() as elapsed, transaction.atomic():
+            rows = localize_datetimes(sql_rows(SYNTHETIC_ORDERS_SQL, [rows_count]), [3])
+            written = write_report(stream, report_format, headers, rows)
+        seconds = elapsed()
+        size = stream.tell()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    connections.close_all()
+    pipe.send({
+        'rows': written,
+        'seconds': seconds,
+        'rows_per_second': written / seconds,
+        'file_mb': size / 2 ** 20,
+        'peak_rss_mb': peak / 1024,
+        'rss_growth_mb': (peak - base) / 1024,
+    })
+
+
+class Command(BenchmarkCommand):
+    help = 'Замеряет время и пиковую память потоковой генерации отчетов разного размера'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000000, 5000000, 10000000])
+        parser.add_argument('--formats', nargs='+', choices=['csv', 'excel'], default=['csv', 'excel'])
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('fork')
+        for report_format in options['formats']:
+            for rows_count in options['rows']:
+                # Каждый замер — в отдельном процессе, чтобы пиковая память не копилась между прогонами
+                connections.close_all()
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(target=_render, args=(report_format, rows_count, sender))
+                process.start()
+                sender.close()
+                try:
+                    metrics = receiver.recv()
+                except EOFError:
+                    raise CommandError(f'{report_format} render of {rows_count} rows failed')
+                finally:
+                    process.join()
+                self.report(f'report_render_{report_format}_{rows_count}', {'format': report_format, **metrics}, options)
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from reports.cache import InvalidParameter, generate_report
+from reports.models import Report
+from reports.pipeline import GenerationInProgress, progress, start_generation
+from reports.rendering import UnsupportedReport
+
+
+class Command(BaseCommand):
+    help = 'Формирует файл отчета'
+
+    def add_arguments(self, parser):
+        parser.add_argument('report', type=int, help='ID отчета')
+        parser.add_argument('--no-cache', action='store_true', help='Сформировать заново, не используя кэш отчетов')
+        parser.add_argument(
+            '--background', action='store_true',
+            help='Сформировать по частям в воркерах Celery (при CELERY_TASK_ALWAYS_EAGER — в этом процессе)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            report = Report.objects.get(pk=options['report'])
+        except Report.DoesNotExist:
+            raise CommandError(f"Report {options['report']} does not exist")
+
+        if options['background']:
+            try:
+                start_generation(report, use_cache=not options['no_cache'])
+            except InvalidParameter as exc:
+                raise CommandError(f'Parameter {exc.name}: {exc}')
+            except (UnsupportedReport, GenerationInProgress) as exc:
+                raise CommandError(str(exc))
+            report.refresh_from_db()
+            state = progress(report)
+            self.stdout.write(
+                f"Report {report.pk}: {state['status']}, {state['chunks_done']}/{state['chunks_total']} chunks, "
+                f"{state['rows_done']} rows"
+            )
+            return
+
+        try:
+            count, cached = generate_report(report, use_cache=not options['no_cache'])
+        except InvalidParameter as exc:
+            raise CommandError(f'Parameter {exc.name}: {exc}')
+        except UnsupportedReport as exc:
+            raise CommandError(str(exc))
+        source = 'taken from cache' if cached else 'written'
+        self.stdout.write(self.style.SUCCESS(f'Report {report.pk}: {count} rows {source} to {report.file.name}'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from reports.rollups import install_triggers, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает дневные итоги заказов и продаж с нуля и переустанавливает триггеры их поддержки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Пересчитать итоги только этой компании')
+
+    def handle(self, *args, **options):
+        install_triggers()
+        count = rebuild(options['company'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} daily rollup rows'))
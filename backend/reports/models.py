@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
 from django.utils.translation import gettext_lazy as _
 
 
@@ -23,6 +25,15 @@ class Report(models.Model):
         ('csv', 'CSV'),
     )
     
+    GENERATION_STATUSES = (
+        ('idle', _('Idle')),
+        ('queued', _('Queued')),
+        ('running', _('Running')),
+        ('completed', _('Completed')),
+        ('failed', _('Failed')),
+        ('cancelled', _('Cancelled')),
+    )
+    
     name = models.CharField(_('name'), max_length=255)
     type = models.CharField(_('type'), max_length=20, choices=REPORT_TYPES)
     format = models.CharField(_('format'), max_length=10, choices=REPORT_FORMATS)
@@ -44,6 +55,15 @@ class Report(models.Model):
     is_generated = models.BooleanField(_('generated'), default=False)
     generation_date = models.DateTimeField(_('generation date'), blank=True, null=True)
     
+    # Ход фоновой генерации (см. reports.pipeline)
+    generation_status = models.CharField(
+        _('generation status'), max_length=20, choices=GENERATION_STATUSES, default='idle'
+    )
+    chunks_total = models.IntegerField(_('chunks total'), default=0)
+    chunks_done = models.IntegerField(_('chunks done'), default=0)
+    rows_done = models.BigIntegerField(_('rows done'), default=0)
+    generation_error = models.TextField(_('generation error'), blank=True)
+    
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
     updated_at = models.DateTimeField(_('updated at'), auto_now=True)
     
@@ -55,6 +75,199 @@ class Report(models.Model):
         return f"{self.name} ({self.get_type_display()})"
 
 
+class ReportChunk(models.Model):
+    """
+    Модель части отчета при параллельной генерации
+    """
+    CHUNK_STATUSES = (
+        ('pending', _('Pending')),
+        ('running', _('Running')),
+        ('completed', _('Completed')),
+        ('failed', _('Failed')),
+        ('cancelled', _('Cancelled')),
+    )
+    
+    report = models.ForeignKey(
+        Report,
+        on_delete=models.CASCADE,
+        related_name='chunks'
+    )
+    number = models.IntegerField(_('number'))
+    
+    # Параметры отчета, суженные до части (склад или диапазон дат)
+    parameters = models.JSONField(_('parameters'), default=dict)
+    
+    status = models.CharField(_('status'), max_length=20, choices=CHUNK_STATUSES, default='pending')
+    rows = models.BigIntegerField(_('rows'), default=0)
+    
+    # Фрагмент без заголовка (см. reports.rendering.write_fragment)
+    file = models.FileField(_('file'), upload_to='reports/chunks/', blank=True, null=True)
+    
+    started_at = models.DateTimeField(_('started at'), blank=True, null=True)
+    finished_at = models.DateTimeField(_('finished at'), blank=True, null=True)
+    
+    class Meta:
+        verbose_name = _('report chunk')
+        verbose_name_plural = _('report chunks')
+        unique_together = ('report', 'number')
+        ordering = ['report', 'number']
+        
+    def __str__(self):
+        return f"{self.report_id}#{self.number} ({self.status})"
+
+
+class ReportCacheEntry(models.Model):
+    """
+    Модель закэшированного файла отчета
+    """
+    # Хеш (компания, тип, формат, нормализованные параметры)
+    key = models.CharField(_('key'), max_length=64, unique=True)
+    
+    # Связь с компанией
+    company = models.ForeignKey(
+        'companies.Company',
+        on_delete=models.CASCADE,
+        related_name='report_cache_entries'
+    )
+    
+    type = models.CharField(_('type'), max_length=20, choices=Report.REPORT_TYPES)
+    format = models.CharField(_('format'), max_length=10, choices=Report.REPORT_FORMATS)
+    parameters = models.JSONField(_('parameters'), default=dict)
+    
+    # Максимальные updated_at исходных таблиц на момент построения; null — устарел
+    watermark = models.JSONField(_('watermark'), blank=True, null=True)
+    
+    file = models.FileField(_('file'), upload_to='reports/', max_length=255)
+    size = models.BigIntegerField(_('size'), default=0)
+    rows = models.BigIntegerField(_('rows'), default=0)
+    
+    hits = models.IntegerField(_('hits'), default=0)
+    last_used_at = models.DateTimeField(_('last used at'))
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    
+    class Meta:
+        verbose_name = _('report cache entry')
+        verbose_name_plural = _('report cache entries')
+        indexes = [
+            models.Index(fields=['last_used_at'], name='report_cache_last_used_idx'),
+            models.Index(fields=['company', 'type'], name='report_cache_company_type_idx'),
+        ]
+        
+    def __str__(self):
+        return f"{self.type}.{self.format} ({self.key[:12]})"
+
+
+class OrderDailyRollup(models.Model):
+    """
+    Модель дневного итога заказов (компания, день, маркетплейс, склад, статус).
+
+    Поддерживается триггерами БД (см. reports.rollups). Связи без ограничений
+    внешнего ключа: строки итогов переживают удаление заказов и справочников
+    и обнуляются приращениями.
+    """
+    company = models.ForeignKey(
+        'companies.Company',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    day = models.DateField(_('day'))
+    marketplace = models.ForeignKey(
+        'api.Marketplace',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    warehouse = models.ForeignKey(
+        'warehouses.Warehouse',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+        blank=True,
+        null=True
+    )
+    status = models.CharField(_('status'), max_length=20)
+    
+    orders = models.BigIntegerField(_('orders'), default=0)
+    revenue = models.DecimalField(_('revenue'), max_digits=16, decimal_places=2, default=0)
+    fulfillment_cost = models.DecimalField(_('fulfillment cost'), max_digits=16, decimal_places=2, default=0)
+    
+    # Позиции заказов группы: количество и сумма
+    items_quantity = models.BigIntegerField(_('items quantity'), default=0)
+    items_amount = models.DecimalField(_('items amount'), max_digits=16, decimal_places=2, default=0)
+    
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+    
+    class Meta:
+        verbose_name = _('order daily rollup')
+        verbose_name_plural = _('order daily rollups')
+        constraints = [
+            models.UniqueConstraint(
+                F('company'), F('day'), F('marketplace'), Coalesce(F('warehouse'), Value(0)), F('status'),
+                name='order_rollup_key',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['company', 'updated_at'], name='order_rollup_company_upd_idx'),
+        ]
+        
+    def __str__(self):
+        return f"{self.day} {self.status}: {self.orders}"
+
+
+class SalesDailyRollup(models.Model):
+    """
+    Модель дневного итога продаж по товарам (позиции отгруженных и доставленных заказов).
+
+    Поддерживается триггерами БД (см. reports.rollups).
+    """
+    company = models.ForeignKey(
+        'companies.Company',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    day = models.DateField(_('day'))
+    marketplace = models.ForeignKey(
+        'api.Marketplace',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    warehouse = models.ForeignKey(
+        'warehouses.Warehouse',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+        blank=True,
+        null=True
+    )
+    product = models.ForeignKey(
+        'products.Product',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    
+    quantity = models.BigIntegerField(_('quantity'), default=0)
+    amount = models.DecimalField(_('amount'), max_digits=16, decimal_places=2, default=0)
+    
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+    
+    class Meta:
+        verbose_name = _('sales daily rollup')
+        verbose_name_plural = _('sales daily rollups')
+        constraints = [
+            models.UniqueConstraint(
+                F('company'), F('day'), F('marketplace'), Coalesce(F('warehouse'), Value(0)), F('product'),
+                name='sales_rollup_key',
+            ),
+        ]
+        
+    def __str__(self):
+        return f"{self.day} {self.product_id}: {self.quantity}"
+
+
 class Inventory(models.Model):
     """
     Модель инвентаризации
@@ -97,6 +310,10 @@ class Inventory(models.Model):
     class Meta:
         verbose_name = _('inventory')
         verbose_name_plural = _('inventories')
+        indexes = [
+            # Списки инвентаризаций компании постранично по ключу (см. core.pagination)
+            models.Index(fields=['company', 'created_at', 'id'], name='inventory_company_created_idx'),
+        ]
         
     def __str__(self):
         return f"{self.name} ({self.get_status_display()})"
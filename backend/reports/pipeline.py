@@ -0,0 +1,318 @@
+"""
+Параллельная генерация отчетов в воркерах Celery.
+
+Отчет делится на части по первому полю своего упорядочения: диапазоны дат
+(отчеты по заказам, продажам, поставкам, отгрузкам, услугам) или группы
+складов (остатки). Поэтому фрагменты частей, склеенные по порядку, дают тот
+же файл, что и последовательная генерация. Границы частей подбираются по
+числу строк, чтобы части были примерно равны, а время отчета уменьшалось
+почти пропорционально числу воркеров.
+
+Части строятся задачами render_report_chunk (группа chord), затем
+merge_report_chunks склеивает фрагменты в Report.file. Ход генерации — в
+полях Report.generation_status, chunks_total/chunks_done и rows_done.
+Отмена кооперативная: части проверяют статус отчета перед началом и после
+каждой порции строк, а сборка удаляет уже готовые фрагменты. Сбой части
+отменяет сборку (chord не вызывает merge), поэтому фрагменты готовых частей
+удаляет сама упавшая часть, а завершившиеся после сбоя или отмены — свои.
+
+Планирование частей и их строки читаются с реплики (core.replicas), выбранной
+при запуске вместе с водяным знаком кэша; если она стала непригодной, части
+читают основную базу. Статус отчета для отмены читается с основной базы.
+
+Без брокера (CELERY_TASK_ALWAYS_EAGER) те же задачи выполняются в процессе.
+"""
+import math
+import tempfile
+from datetime import timedelta
+
+from celery import chord
+from django.conf import settings
+from django.core.files import File
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, DateField, DateTimeField, F, ForeignKey
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.replicas import analytics
+from warehouses.models import Warehouse
+
+from . import cache
+from .models import Report, ReportChunk
+from .rendering import (
+    WRITERS, UnsupportedReport, merge_fragments, report_rows, report_source, save_report_file, write_fragment,
+)
+
+IN_PROGRESS = ('queued', 'running')
+
+
+class GenerationInProgress(Exception):
+    pass
+
+
+class GenerationCancelled(Exception):
+    pass
+
+
+def _resolve_field(model, lookup):
+    *relations, name = lookup.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def plan_chunks(report, max_chunks=None, min_rows=None):
+    """
+    Параметры частей отчета (в порядке строк итогового файла); некорректные параметры — cache.InvalidParameter
+    """
+    cache.normalize_parameters(report.parameters)
+    max_chunks = max_chunks or settings.REPORT_PIPELINE_MAX_CHUNKS
+    min_rows = min_rows or settings.REPORT_PIPELINE_MIN_CHUNK_ROWS
+    parameters = dict(report.parameters or {})
+    queryset, _columns = report_source(report.company_id, report.type, parameters)
+    lookup = queryset.query.order_by[0]
+    field = _resolve_field(queryset.model, lookup)
+    queryset = queryset.order_by()
+
+    if isinstance(field, (DateField, DateTimeField)):
+        # Дата в местном времени, как в фильтрах date_from/date_to
+        key = TruncDate(lookup) if isinstance(field, DateTimeField) else F(lookup)
+    elif isinstance(field, ForeignKey) and field.related_model is Warehouse:
+        key = F(lookup)
+    else:
+        return [parameters]
+
+    groups = list(queryset.values(key=key).annotate(rows=Count('pk')).order_by('key').values_list('key', 'rows'))
+    total = sum(rows for _key, rows in groups)
+    count = min(max_chunks, len(groups), math.ceil(total / min_rows))
+    if count <= 1:
+        return [parameters]
+
+    # Непрерывные отрезки групп с примерно равным числом строк
+    bounds = []
+    accumulated = 0
+    start = 0
+    for index, (_key, rows) in enumerate(groups):
+        accumulated += rows
+        if accumulated >= total * (len(bounds) + 1) / count and index + 1 < len(groups):
+            bounds.append((start, index + 1))
+            start = index + 1
+    bounds.append((start, len(groups)))
+
+    chunks = []
+    if isinstance(field, ForeignKey):
+        for start, end in bounds:
+            chunks.append({**parameters, 'warehouse': [key for key, _rows in groups[start:end]]})
+        return chunks
+    for number, (start, end) in enumerate(bounds):
+        chunk = dict(parameters)
+        # Соседние части смыкаются, крайние сохраняют исходные границы отчета
+        if number:
+            chunk['date_from'] = groups[start][0].isoformat()
+        if number + 1 < len(bounds):
+            chunk['date_to'] = (groups[end][0] - timedelta(days=1)).isoformat()
+        chunks.append(chunk)
+    return chunks
+
+
+def start_generation(report, use_cache=True, max_chunks=None):
+    """
+    Запускает фоновую генерацию отчета; при попадании в кэш отчет сразу готов
+    """
+    from .tasks import merge_report_chunks, render_report_chunk
+
+    if report.format not in WRITERS:
+        raise UnsupportedReport(f'Report format {report.format!r} is not supported for streaming')
+    if report.generation_status in IN_PROGRESS:
+        raise GenerationInProgress(f'Report {report.pk} is already being generated')
+
+    key = marks = None
+    with analytics() as database:
+        if use_cache and cache.is_cacheable(report):
+            key = cache.cache_key(report.company_id, report.type, report.format, report.parameters)
+            # Части читают ту же базу, что и водяной знак (см. reports.cache.generate_report)
+            marks = cache.watermark(report.company_id, report.type)
+    if key:
+        count = cache.serve_from_cache(report, key, marks)
+        if count is not None:
+            _set_progress(report, generation_status='completed', chunks_total=0, chunks_done=0, rows_done=count,
+                          generation_error='')
+            return report
+
+    chunks = prepare_chunks(report, max_chunks, database)
+    workflow = chord(
+        [render_report_chunk.si(chunk.pk, database) for chunk in chunks],
+        merge_report_chunks.si(report.pk, key, marks),
+    )
+    transaction.on_commit(workflow.apply_async)
+    return report
+
+
+def prepare_chunks(report, max_chunks=None, database=None):
+    """
+    Заново создает части отчета и ставит отчет в очередь; возвращает части
+    """
+    with analytics(database):
+        parameters = plan_chunks(report, max_chunks)
+    with transaction.atomic():
+        locked = Report.objects.select_for_update().get(pk=report.pk)
+        if locked.generation_status in IN_PROGRESS:
+            raise GenerationInProgress(f'Report {report.pk} is already being generated')
+        _delete_chunks(report)
+        chunks = ReportChunk.objects.bulk_create(
+            ReportChunk(report=report, number=number, parameters=chunk_parameters)
+            for number, chunk_parameters in enumerate(parameters)
+        )
+        _set_progress(report, generation_status='queued', chunks_total=len(chunks), chunks_done=0, rows_done=0,
+                      generation_error='')
+    return chunks
+
+
+def cancel_generation(report):
+    """
+    Отменяет фоновую генерацию; возвращает False, если отчет не генерируется
+    """
+    with transaction.atomic():
+        cancelled = Report.objects.filter(pk=report.pk, generation_status__in=IN_PROGRESS).update(
+            generation_status='cancelled'
+        )
+        ReportChunk.objects.filter(report_id=report.pk, status='pending').update(status='cancelled')
+    report.refresh_from_db(fields=['generation_status'])
+    return bool(cancelled)
+
+
+def _set_progress(report, **fields):
+    for name, value in fields.items():
+        setattr(report, name, value)
+    Report.objects.filter(pk=report.pk).update(updated_at=timezone.now(), **fields)
+
+
+def _delete_chunks(report):
+    for chunk in ReportChunk.objects.filter(report_id=report.pk):
+        if chunk.file:
+            chunk.file.delete(save=False)
+    ReportChunk.objects.filter(report_id=report.pk).delete()
+
+
+def _discard_fragments(report_id):
+    """
+    Удаляет фрагменты готовых частей отчета, который не будет собран
+    """
+    chunks = [chunk for chunk in ReportChunk.objects.filter(report_id=report_id, status='completed') if chunk.file]
+    for chunk in chunks:
+        chunk.file.delete(save=False)
+    ReportChunk.objects.filter(pk__in=[chunk.pk for chunk in chunks]).update(file=None)
+
+
+def _status(report_id):
+    return Report.objects.using(DEFAULT_DB_ALIAS).filter(pk=report_id).values_list('generation_status', flat=True).first()
+
+
+def _checked(rows, report_id):
+    """
+    Пропускает строки, проверяя отмену отчета после каждой порции
+    """
+    try:
+        for number, row in enumerate(rows, start=1):
+            if number % settings.REPORT_CHUNK_SIZE == 0 and _status(report_id) == 'cancelled':
+                raise GenerationCancelled
+            yield row
+    finally:
+        # Серверный курсор закрывается внутри транзакции части
+        rows.close()
+
+
+def render_chunk(chunk_id, database=None):
+    """
+    Строит фрагмент части отчета; возвращает число строк. database — база, выбранная при запуске генерации
+    """
+    chunk = ReportChunk.objects.select_related('report').get(pk=chunk_id)
+    report = chunk.report
+    if _status(report.pk) not in IN_PROGRESS:
+        ReportChunk.objects.filter(pk=chunk.pk, status='pending').update(status='cancelled')
+        return 0
+    Report.objects.filter(pk=report.pk, generation_status='queued').update(generation_status='running')
+    chunk.status = 'running'
+    chunk.started_at = timezone.now()
+    chunk.save(update_fields=['status', 'started_at'])
+
+    try:
+        with tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR) as stream:
+            with analytics(database) as alias, transaction.atomic(using=alias):
+                _headers, rows = report_rows(report.company_id, report.type, chunk.parameters)
+                count = write_fragment(stream, report.format, _checked(rows, report.pk))
+            stream.seek(0)
+            chunk.file.save(f'{report.pk}-{chunk.number}.part', File(stream), save=False)
+    except GenerationCancelled:
+        chunk.status = 'cancelled'
+        chunk.finished_at = timezone.now()
+        chunk.save(update_fields=['status', 'finished_at'])
+        return 0
+    except Exception as exc:
+        chunk.status = 'failed'
+        chunk.finished_at = timezone.now()
+        chunk.save(update_fields=['status', 'finished_at'])
+        Report.objects.filter(pk=report.pk, generation_status__in=IN_PROGRESS).update(
+            generation_status='failed', generation_error=f'Chunk {chunk.number}: {exc}'
+        )
+        _discard_fragments(report.pk)
+        raise
+
+    chunk.status = 'completed'
+    chunk.rows = count
+    chunk.finished_at = timezone.now()
+    chunk.save(update_fields=['status', 'rows', 'file', 'finished_at'])
+    Report.objects.filter(pk=report.pk).update(chunks_done=F('chunks_done') + 1, rows_done=F('rows_done') + count)
+    if _status(report.pk) not in IN_PROGRESS:
+        # Генерация прервана (например, сбоем другой части), и сборка может не состояться
+        _discard_fragments(report.pk)
+    return count
+
+
+def _fragments(chunks):
+    for chunk in chunks:
+        with chunk.file.open('rb') as fragment:
+            yield fragment
+
+
+def merge_chunks(report_id, key=None, marks=None):
+    """
+    Склеивает фрагменты частей в файл отчета; возвращает число строк или None, если сборка не нужна
+    """
+    report = Report.objects.get(pk=report_id)
+    chunks = list(report.chunks.order_by('number'))
+    try:
+        if report.generation_status not in IN_PROGRESS or any(chunk.status != 'completed' for chunk in chunks):
+            return None
+        headers = [str(header) for header, _lookup in report_source(report.company_id, report.type, {})[1]]
+        count = sum(chunk.rows for chunk in chunks)
+        with tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR) as stream:
+            merge_fragments(stream, report.format, headers, _fragments(chunks))
+            save_report_file(report, stream, generation_status='completed')
+    finally:
+        for chunk in chunks:
+            if chunk.file:
+                chunk.file.delete(save=False)
+    if key:
+        cache.remember(report, key, marks, count)
+    return count
+
+
+def progress(report):
+    """
+    Ход генерации отчета для API
+    """
+    chunks = list(report.chunks.order_by('number').values('number', 'status', 'rows', 'started_at', 'finished_at'))
+    return {
+        'report': report.pk,
+        'status': report.generation_status,
+        'chunks_total': report.chunks_total,
+        'chunks_done': report.chunks_done,
+        'rows_done': report.rows_done,
+        'percent': round(100 * report.chunks_done / report.chunks_total, 1) if report.chunks_total else (
+            100.0 if report.generation_status == 'completed' else 0.0
+        ),
+        'error': report.generation_error,
+        'file': report.file.name if report.is_generated and report.file else None,
+        'chunks': chunks,
+    }
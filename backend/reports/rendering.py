@@ -0,0 +1,415 @@
+"""
+Потоковая генерация файлов отчетов.
+
+Строки отчета читаются серверным курсором БД порциями по REPORT_CHUNK_SIZE
+и сразу записываются во временный файл: CSV — через csv.writer, Excel —
+потоковой записью листа в архив XLSX (см. reports.xlsx). Готовый файл
+по частям копируется в хранилище Report.file.
+Потребление памяти не зависит от числа строк.
+
+Для параллельной генерации (reports.pipeline) части отчета пишутся во
+фрагменты без заголовка (write_fragment), которые затем склеиваются в
+итоговый файл (merge_fragments).
+
+Параметры отчета (Report.parameters): date_from, date_to (YYYY-MM-DD),
+warehouse, marketplace (ID или список ID) и status (строка или список).
+С archive: true отчеты по заказам и продажам включают заказы, перенесенные
+в архив (orders.archive): строки архива и рабочих таблиц сливаются по дате
+заказа.
+"""
+import csv
+import heapq
+import io
+import shutil
+import tempfile
+from datetime import date, datetime, time, timedelta
+from itertools import chain, islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core.files import File
+from django.db import transaction
+from django.db.models import DateTimeField, F
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from core.replicas import analytics, analytics_connection
+from orders import archive
+from orders.models import Order, OrderItem
+from services.models import ServiceRequest
+from shipments.models import ShipmentOrder
+from stock.models import StockBalance
+from supplies.models import SupplyItem
+
+from .models import OrderDailyRollup, Report, ReportCacheEntry
+from .xlsx import write_xlsx, write_xlsx_fragment, write_xlsx_rows
+
+FILE_EXTENSIONS = {
+    'csv': 'csv',
+    'excel': 'xlsx',
+}
+
+
+class UnsupportedReport(ValueError):
+    pass
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _apply_filters(queryset, parameters, date_field=None, warehouse_field=None, marketplace_field=None,
+                   status_field=None):
+    if date_field and date_field.endswith('__date'):
+        # Границы суток вместо приведения к дате: условие по created_at остается индексируемым
+        field = date_field[:-len('__date')]
+        if parameters.get('date_from'):
+            queryset = queryset.filter(**{f'{field}__gte': _day_start(date.fromisoformat(parameters['date_from']))})
+        if parameters.get('date_to'):
+            day_after = date.fromisoformat(parameters['date_to']) + timedelta(days=1)
+            queryset = queryset.filter(**{f'{field}__lt': _day_start(day_after)})
+    elif date_field:
+        if parameters.get('date_from'):
+            queryset = queryset.filter(**{f'{date_field}__gte': date.fromisoformat(parameters['date_from'])})
+        if parameters.get('date_to'):
+            queryset = queryset.filter(**{f'{date_field}__lte': date.fromisoformat(parameters['date_to'])})
+    for field, name in ((warehouse_field, 'warehouse'), (marketplace_field, 'marketplace')):
+        value = parameters.get(name)
+        if field and value:
+            queryset = queryset.filter(**{f'{field}__in' if isinstance(value, list) else field: value})
+    if status_field and parameters.get('status'):
+        statuses = parameters['status']
+        queryset = queryset.filter(**{f'{status_field}__in': [statuses] if isinstance(statuses, str) else statuses})
+    return queryset
+
+
+def orders_source(company_id, parameters):
+    queryset = _apply_filters(
+        Order.objects.filter(company_id=company_id), parameters,
+        date_field='created_at__date', warehouse_field='shipping_warehouse_id',
+        marketplace_field='marketplace_id', status_field='status',
+    )
+    return queryset.order_by('created_at', 'id'), [
+        (_('Order number'), 'external_id'),
+        (_('Marketplace'), 'marketplace__name'),
+        (_('Status'), 'status'),
+        (_('Created at'), 'created_at'),
+        (_('Warehouse'), 'shipping_warehouse__name'),
+        (_('Shipping wave'), 'shipping_wave'),
+        (_('Shipping date'), 'shipping_date'),
+        (_('Total price'), 'total_price'),
+        (_('Fulfillment cost'), 'fulfillment_cost'),
+        (_('Weight (g)'), 'weight'),
+    ]
+
+
+SALES_STATUSES = ['shipped', 'delivered']
+
+
+def sales_source(company_id, parameters):
+    parameters = {'status': SALES_STATUSES, **parameters}
+    queryset = _apply_filters(
+        OrderItem.objects.filter(order__company_id=company_id), parameters,
+        date_field='order__created_at__date', warehouse_field='order__shipping_warehouse_id',
+        marketplace_field='order__marketplace_id', status_field='order__status',
+    ).annotate(amount=F('quantity') * F('price'))
+    # Позиция создается не раньше заказа: условия отсекают секции позиций (см. orders.partitions)
+    queryset = queryset.filter(created_at__gte=F('order__created_at'))
+    if parameters.get('date_from'):
+        queryset = queryset.filter(created_at__gte=_day_start(date.fromisoformat(parameters['date_from'])))
+    return queryset.order_by('order__created_at', 'order_id', 'id'), [
+        (_('Date'), 'order__created_at'),
+        (_('Order number'), 'order__external_id'),
+        (_('Marketplace'), 'order__marketplace__name'),
+        (_('Article'), 'product__article'),
+        (_('Barcode'), 'product__barcode'),
+        (_('Product'), 'product__name'),
+        (_('Quantity'), 'quantity'),
+        (_('Price'), 'price'),
+        (_('Amount'), 'amount'),
+    ]
+
+
+def supplies_source(company_id, parameters):
+    queryset = _apply_filters(
+        SupplyItem.objects.filter(supply__company_id=company_id), parameters,
+        date_field='supply__supply_date', warehouse_field='supply__destination_warehouse_id',
+        status_field='supply__status',
+    )
+    return queryset.order_by('supply__supply_date', 'supply_id', 'id'), [
+        (_('Supply'), 'supply_id'),
+        (_('Supply date'), 'supply__supply_date'),
+        (_('Status'), 'supply__status'),
+        (_('Warehouse'), 'supply__destination_warehouse__name'),
+        (_('Article'), 'product__article'),
+        (_('Barcode'), 'product__barcode'),
+        (_('Product'), 'product__name'),
+        (_('Quantity'), 'quantity'),
+        (_('Quantity received'), 'quantity_received'),
+    ]
+
+
+def shipments_source(company_id, parameters):
+    queryset = _apply_filters(
+        ShipmentOrder.objects.filter(shipment__company_id=company_id), parameters,
+        date_field='shipment__shipment_date', warehouse_field='shipment__warehouse_id',
+        marketplace_field='order__marketplace_id', status_field='shipment__status',
+    )
+    return queryset.order_by('shipment__shipment_date', 'shipment_id', 'id'), [
+        (_('Shipment'), 'shipment_id'),
+        (_('Shipment date'), 'shipment__shipment_date'),
+        (_('Status'), 'shipment__status'),
+        (_('Warehouse'), 'shipment__warehouse__name'),
+        (_('Transport company'), 'shipment__transport_company'),
+        (_('Tracking number'), 'shipment__tracking_number'),
+        (_('Order number'), 'order__external_id'),
+        (_('Marketplace'), 'order__marketplace__name'),
+        (_('Total price'), 'order__total_price'),
+    ]
+
+
+def services_source(company_id, parameters):
+    queryset = _apply_filters(
+        ServiceRequest.objects.filter(company_id=company_id), parameters,
+        date_field='planned_date', warehouse_field='warehouse_id', status_field='status',
+    )
+    return queryset.order_by('planned_date', 'id'), [
+        (_('Service request'), 'id'),
+        (_('Service'), 'service__name'),
+        (_('Status'), 'status'),
+        (_('Warehouse'), 'warehouse__name'),
+        (_('Planned date'), 'planned_date'),
+        (_('Completed date'), 'completed_date'),
+        (_('Quantity'), 'quantity'),
+        (_('Total cost'), 'total_cost'),
+    ]
+
+
+def inventory_source(company_id, parameters):
+    queryset = _apply_filters(
+        StockBalance.objects.filter(product__company_id=company_id, quantity__gt=0), parameters,
+        warehouse_field='warehouse_id',
+    )
+    return queryset.order_by('warehouse_id', 'storage_unit__code', 'product_id'), [
+        (_('Warehouse'), 'warehouse__name'),
+        (_('Storage unit'), 'storage_unit__code'),
+        (_('Article'), 'product__article'),
+        (_('Barcode'), 'product__barcode'),
+        (_('Product'), 'product__name'),
+        (_('Quantity'), 'quantity'),
+    ]
+
+
+def financial_source(company_id, parameters):
+    # Дневные итоги вместо сканирования заказов (см. reports.rollups)
+    queryset = _apply_filters(
+        OrderDailyRollup.objects.filter(company_id=company_id).exclude(orders=0), parameters,
+        date_field='day', warehouse_field='warehouse_id', marketplace_field='marketplace_id', status_field='status',
+    )
+    return queryset.order_by('day', 'marketplace_id', 'warehouse_id', 'status'), [
+        (_('Date'), 'day'),
+        (_('Marketplace'), 'marketplace__name'),
+        (_('Warehouse'), 'warehouse__name'),
+        (_('Status'), 'status'),
+        (_('Orders'), 'orders'),
+        (_('Revenue'), 'revenue'),
+        (_('Fulfillment cost'), 'fulfillment_cost'),
+    ]
+
+
+# Отчеты, которые могут включать архив заказов: вид файлов архива, поле даты заказа и параметры по умолчанию
+ARCHIVE_SOURCES = {
+    'orders': ('orders', 'created_at', {}),
+    'sales': ('items', 'order__created_at', {'status': SALES_STATUSES}),
+}
+
+
+REPORT_SOURCES = {
+    'orders': orders_source,
+    'sales': sales_source,
+    'supplies': supplies_source,
+    'shipments': shipments_source,
+    'services': services_source,
+    'inventory': inventory_source,
+    'financial': financial_source,
+}
+
+
+def report_source(company_id, report_type, parameters):
+    """
+    Queryset отчета с фильтрами и упорядочением и его колонки [(заголовок, поле)]
+    """
+    try:
+        source = REPORT_SOURCES[report_type]
+    except KeyError:
+        raise UnsupportedReport(f'Report type {report_type!r} is not supported')
+    return source(company_id, parameters or {})
+
+
+def report_rows(company_id, report_type, parameters):
+    """
+    Заголовки и итератор строк отчета (серверный курсор, порции по REPORT_CHUNK_SIZE)
+    """
+    queryset, columns = report_source(company_id, report_type, parameters)
+    lookups = [lookup for _header, lookup in columns]
+    queryset = queryset.values_list(*lookups)
+    datetimes = [index for index, lookup in enumerate(lookups) if _is_datetime(queryset.model, lookup)]
+    rows = queryset.iterator(chunk_size=settings.REPORT_CHUNK_SIZE)
+    if (parameters or {}).get('archive') and report_type in ARCHIVE_SOURCES:
+        kind, date_lookup, defaults = ARCHIVE_SOURCES[report_type]
+        archived = archive.report_rows(company_id, kind, {**defaults, **parameters}, lookups)
+        rows = heapq.merge(archived, rows, key=itemgetter(lookups.index(date_lookup)))
+    return [str(header) for header, _lookup in columns], localize_datetimes(rows, datetimes)
+
+
+def _is_datetime(model, lookup):
+    *relations, name = lookup.split('__')
+    try:
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        return isinstance(model._meta.get_field(name), DateTimeField)
+    except FieldDoesNotExist:
+        # Аннотации (например, сумма строки)
+        return False
+
+
+def sql_rows(sql, params=None, chunk_size=None):
+    """
+    Строки произвольного запроса через серверный курсор (в блоке analytics() — на его базе)
+    """
+    chunk_size = chunk_size or settings.REPORT_CHUNK_SIZE
+    with analytics_connection().chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield from rows
+
+
+def localize_datetimes(rows, datetimes):
+    """
+    Переводит значения даты и времени в местное время без часового пояса (Excel его не поддерживает)
+    """
+    if not datetimes:
+        yield from rows
+        return
+    zone = timezone.get_current_timezone()
+    for row in rows:
+        row = list(row)
+        for index in datetimes:
+            if row[index] is not None:
+                row[index] = row[index].astimezone(zone).replace(tzinfo=None)
+        yield row
+
+
+def write_csv(stream, headers, rows):
+    # BOM нужен Excel, чтобы открыть файл в UTF-8
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    csv.writer(text).writerow(headers)
+    text.flush()
+    text.detach()
+    return write_csv_fragment(stream, rows)
+
+
+def write_csv_fragment(stream, rows):
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    count = 0
+    while True:
+        chunk = list(islice(rows, settings.REPORT_CHUNK_SIZE))
+        if not chunk:
+            break
+        writer.writerows(chunk)
+        count += len(chunk)
+    text.flush()
+    text.detach()
+    return count
+
+
+WRITERS = {
+    'csv': write_csv,
+    'excel': write_xlsx,
+}
+
+
+FRAGMENT_WRITERS = {
+    'csv': write_csv_fragment,
+    'excel': write_xlsx_fragment,
+}
+
+
+def write_report(stream, report_format, headers, rows):
+    """
+    Пишет строки в поток в формате отчета; возвращает число строк данных
+    """
+    try:
+        writer = WRITERS[report_format]
+    except KeyError:
+        raise UnsupportedReport(f'Report format {report_format!r} is not supported for streaming')
+    return writer(stream, headers, rows)
+
+
+def write_fragment(stream, report_format, rows):
+    """
+    Пишет часть строк отчета во фрагмент без заголовка; возвращает число строк
+    """
+    return FRAGMENT_WRITERS[report_format](stream, rows)
+
+
+def merge_fragments(stream, report_format, headers, fragments):
+    """
+    Склеивает фрагменты (двоичные потоки, по порядку) в файл отчета с заголовком
+    """
+    if report_format == 'csv':
+        write_csv(stream, headers, iter(()))
+        for fragment in fragments:
+            shutil.copyfileobj(fragment, stream)
+        return
+    lines = chain.from_iterable(io.TextIOWrapper(fragment, encoding='utf-8') for fragment in fragments)
+    write_xlsx_rows(stream, headers, (line.rstrip('\n') for line in lines))
+
+
+def render_report(report, database=None):
+    """
+    Формирует файл отчета и сохраняет его в Report.file; возвращает число строк.
+
+    Строки читаются с реплики (см. core.replicas.analytics); database — база, выбранная раньше.
+    """
+    if report.format not in WRITERS:
+        raise UnsupportedReport(f'Report format {report.format!r} is not supported for streaming')
+    with tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR) as stream:
+        # В транзакции серверный курсор читает один снимок данных и не материализуется целиком (WITH HOLD)
+        with analytics(database) as alias, transaction.atomic(using=alias):
+            headers, rows = report_rows(report.company_id, report.type, report.parameters)
+            count = write_report(stream, report.format, headers, rows)
+        save_report_file(report, stream)
+    return count
+
+
+def save_report_file(report, stream, **fields):
+    """
+    Сохраняет готовый файл из потока в Report.file и отмечает отчет сформированным
+    """
+    stream.seek(0)
+    name = f'{report.type}-{report.pk}-{datetime.now():%Y%m%d%H%M%S}.{FILE_EXTENSIONS[report.format]}'
+    previous = report.file.name
+    report.file.save(name, File(stream), save=False)
+    report.is_generated = True
+    report.generation_date = timezone.now()
+    for field_name, value in fields.items():
+        setattr(report, field_name, value)
+    report.save(update_fields=['file', 'is_generated', 'generation_date', 'updated_at', *fields])
+    release_file(previous)
+
+
+def release_file(name):
+    """
+    Удаляет файл отчета, если на него больше не ссылаются ни отчеты, ни кэш (см. reports.cache)
+    """
+    if not name:
+        return
+    if Report.objects.filter(file=name).exists() or ReportCacheEntry.objects.filter(file=name).exists():
+        return
+    Report._meta.get_field('file').storage.delete(name)
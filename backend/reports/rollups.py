@@ -0,0 +1,352 @@
+"""
+Дневные итоги заказов и продаж.
+
+OrderDailyRollup хранит число заказов, выручку (Order.total_price) и
+стоимость фулфилмента по (компания, день, маркетплейс, склад, статус),
+SalesDailyRollup — количество и сумму позиций отгруженных и доставленных
+заказов по товарам. День — дата создания заказа в TIME_ZONE.
+
+Итоги поддерживаются триггерами уровня оператора с таблицами переходов на
+заказах и позициях: каждый INSERT/UPDATE/DELETE, включая пакетную загрузку и
+сырые запросы, одним INSERT ... ON CONFLICT добавляет к итогам разницу
+по затронутым группам. Изменения, не влияющие на итоги (например,
+назначение волны), строк итогов не касаются. Триггеры ставятся после
+migrate (install_triggers); пересчет с нуля — rebuild_rollups.
+
+Перенос заказов в архив (orders.archive) итоги не меняет; rebuild()
+добавляет вклад архивных заказов по файлам архива.
+"""
+from datetime import timedelta
+
+import pyarrow.dataset as ds
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from core.triggers import install_statement_triggers, unless_archiving
+from orders import archive
+from orders.models import Order, OrderItem
+
+from .models import OrderDailyRollup, SalesDailyRollup
+
+SALE_STATUSES = ('shipped', 'delivered')
+
+ORDER_KEY = 'company_id, day, marketplace_id, COALESCE(warehouse_id, 0), status'
+SALES_KEY = 'company_id, day, marketplace_id, COALESCE(warehouse_id, 0), product_id'
+
+# Поля заказа, от которых зависят итоги
+ORDER_DIMENSIONS = ('company_id', 'created_at', 'marketplace_id', 'shipping_warehouse_id')
+
+
+def _day(alias):
+    return f"({alias}.created_at AT TIME ZONE '{settings.TIME_ZONE}')::date"
+
+
+def _sale(alias):
+    statuses = ', '.join(f"'{status}'" for status in SALE_STATUSES)
+    return f'({alias}.status IN ({statuses}))'
+
+
+def _order_delta(alias, sign, items=None):
+    """
+    Вклад заказов в итоги заказов; items — выражение (quantity, amount) их позиций
+    """
+    if items is None:
+        items = (
+            f'LEFT JOIN LATERAL (SELECT SUM(quantity) AS quantity, SUM(quantity * price) AS amount '
+            f'FROM {OrderItem._meta.db_table} WHERE order_id = {alias}.id) AS t ON true'
+        )
+    return (
+        f'SELECT {alias}.company_id, {_day(alias)} AS day, {alias}.marketplace_id, '
+        f'{alias}.shipping_warehouse_id AS warehouse_id, {alias}.status, {sign} AS orders, '
+        f'{sign} * {alias}.total_price AS revenue, {sign} * COALESCE({alias}.fulfillment_cost, 0) AS fulfillment_cost, '
+        f'{sign} * COALESCE(t.quantity, 0) AS items_quantity, {sign} * COALESCE(t.amount, 0) AS items_amount',
+        items,
+    )
+
+
+def _item_delta(order, item, sign):
+    """
+    Вклад позиций в итоги заказов группы их заказа (без числа заказов и выручки)
+    """
+    return (
+        f'SELECT {order}.company_id, {_day(order)} AS day, {order}.marketplace_id, '
+        f'{order}.shipping_warehouse_id AS warehouse_id, {order}.status, 0 AS orders, 0 AS revenue, '
+        f'0 AS fulfillment_cost, {sign} * {item}.quantity AS items_quantity, '
+        f'{sign} * {item}.quantity * {item}.price AS items_amount'
+    )
+
+
+def _sales_delta(alias, sign, item='i'):
+    return (
+        f'SELECT {alias}.company_id, {_day(alias)} AS day, {alias}.marketplace_id, '
+        f'{alias}.shipping_warehouse_id AS warehouse_id, {item}.product_id, {sign} * {item}.quantity AS quantity, '
+        f'{sign} * {item}.quantity * {item}.price AS amount'
+    )
+
+
+def _changed(columns, old='o', new='n'):
+    old_values = ', '.join(f'{old}.{column}' for column in columns)
+    new_values = ', '.join(f'{new}.{column}' for column in columns)
+    return f'({old_values}) IS DISTINCT FROM ({new_values})'
+
+
+def _apply_orders(delta):
+    rollup = OrderDailyRollup._meta.db_table
+    return f"""
+        INSERT INTO {rollup} AS r (company_id, day, marketplace_id, warehouse_id, status, orders, revenue,
+                                   fulfillment_cost, items_quantity, items_amount, updated_at)
+        SELECT company_id, day, marketplace_id, warehouse_id, status, SUM(orders), SUM(revenue),
+               SUM(fulfillment_cost), SUM(items_quantity), SUM(items_amount), clock_timestamp()
+        FROM ({delta}) AS delta
+        GROUP BY company_id, day, marketplace_id, warehouse_id, status
+        HAVING SUM(orders) <> 0 OR SUM(revenue) <> 0 OR SUM(fulfillment_cost) <> 0
+            OR SUM(items_quantity) <> 0 OR SUM(items_amount) <> 0
+        ON CONFLICT ({ORDER_KEY}) DO UPDATE SET
+            orders = r.orders + EXCLUDED.orders,
+            revenue = r.revenue + EXCLUDED.revenue,
+            fulfillment_cost = r.fulfillment_cost + EXCLUDED.fulfillment_cost,
+            items_quantity = r.items_quantity + EXCLUDED.items_quantity,
+            items_amount = r.items_amount + EXCLUDED.items_amount,
+            updated_at = EXCLUDED.updated_at;
+    """
+
+
+def _apply_sales(delta):
+    rollup = SalesDailyRollup._meta.db_table
+    return f"""
+        INSERT INTO {rollup} AS r (company_id, day, marketplace_id, warehouse_id, product_id,
+                                   quantity, amount, updated_at)
+        SELECT company_id, day, marketplace_id, warehouse_id, product_id,
+               SUM(quantity), SUM(amount), clock_timestamp()
+        FROM ({delta}) AS delta
+        GROUP BY company_id, day, marketplace_id, warehouse_id, product_id
+        HAVING SUM(quantity) <> 0 OR SUM(amount) <> 0
+        ON CONFLICT ({SALES_KEY}) DO UPDATE SET
+            quantity = r.quantity + EXCLUDED.quantity,
+            amount = r.amount + EXCLUDED.amount,
+            updated_at = EXCLUDED.updated_at;
+    """
+
+
+def _trigger_bodies():
+    """
+    Тела функций триггеров: {(таблица, операция): SQL}
+    """
+    orders = Order._meta.db_table
+    items = OrderItem._meta.db_table
+    order_columns = (*ORDER_DIMENSIONS, 'status', 'total_price', 'fulfillment_cost')
+    changed_orders = 'FROM old_rows o JOIN new_rows n ON n.id = o.id'
+    # Позиции заказа меняют продажи, если заказ вошел в продажи или вышел из них либо сменил группу
+    sales_changed = (
+        f'({_changed(ORDER_DIMENSIONS)} AND ({_sale("o")} OR {_sale("n")}) OR {_sale("o")} <> {_sale("n")})'
+    )
+    item_columns = ('order_id', 'product_id', 'quantity', 'price')
+    changed_items = 'FROM old_rows oi JOIN new_rows ni ON ni.id = oi.id'
+    item_changed = _changed(item_columns, 'oi', 'ni')
+
+    def order_rows(alias, sign, source, where=''):
+        select, items_join = _order_delta(alias, sign)
+        return f'{select} {source} {items_join} {where}'
+
+    return {
+        (orders, 'INSERT'): (
+            _apply_orders(order_rows('n', 1, 'FROM new_rows n'))
+            + _apply_sales(
+                f'{_sales_delta("n", 1)} FROM new_rows n JOIN {items} i ON i.order_id = n.id WHERE {_sale("n")}'
+            )
+        ),
+        (orders, 'UPDATE'): (
+            _apply_orders(
+                order_rows('o', -1, changed_orders, f'WHERE {_changed(order_columns)}')
+                + ' UNION ALL '
+                + order_rows('n', 1, changed_orders, f'WHERE {_changed(order_columns)}')
+            )
+            + _apply_sales(
+                f'{_sales_delta("o", -1)} {changed_orders} JOIN {items} i ON i.order_id = o.id '
+                f'WHERE {_sale("o")} AND {sales_changed} '
+                f'UNION ALL {_sales_delta("n", 1)} {changed_orders} JOIN {items} i ON i.order_id = n.id '
+                f'WHERE {_sale("n")} AND {sales_changed}'
+            )
+        ),
+        # Заказы, перенесенные в архив, остаются в итогах
+        (orders, 'DELETE'): unless_archiving(
+            _apply_orders(order_rows('o', -1, 'FROM old_rows o'))
+            + _apply_sales(
+                f'{_sales_delta("o", -1)} FROM old_rows o JOIN {items} i ON i.order_id = o.id WHERE {_sale("o")}'
+            )
+        ),
+        (items, 'INSERT'): (
+            _apply_orders(f'{_item_delta("o", "i", 1)} FROM new_rows i JOIN {orders} o ON o.id = i.order_id')
+            + _apply_sales(
+                f'{_sales_delta("o", 1)} FROM new_rows i JOIN {orders} o ON o.id = i.order_id WHERE {_sale("o")}'
+            )
+        ),
+        (items, 'UPDATE'): (
+            _apply_orders(
+                f'{_item_delta("o", "oi", -1)} {changed_items} JOIN {orders} o ON o.id = oi.order_id '
+                f'WHERE {item_changed} '
+                f'UNION ALL {_item_delta("o", "ni", 1)} {changed_items} JOIN {orders} o ON o.id = ni.order_id '
+                f'WHERE {item_changed}'
+            )
+            + _apply_sales(
+                f'{_sales_delta("o", -1, item="oi")} {changed_items} JOIN {orders} o ON o.id = oi.order_id '
+                f'WHERE {_sale("o")} AND {item_changed} '
+                f'UNION ALL {_sales_delta("o", 1, item="ni")} {changed_items} JOIN {orders} o ON o.id = ni.order_id '
+                f'WHERE {_sale("o")} AND {item_changed}'
+            )
+        ),
+        (items, 'DELETE'): unless_archiving(
+            _apply_orders(f'{_item_delta("o", "i", -1)} FROM old_rows i JOIN {orders} o ON o.id = i.order_id')
+            + _apply_sales(
+                f'{_sales_delta("o", -1)} FROM old_rows i JOIN {orders} o ON o.id = i.order_id WHERE {_sale("o")}'
+            )
+        ),
+    }
+
+
+def install_triggers(using=DEFAULT_DB_ALIAS):
+    """
+    Создает (или пересоздает) функции и триггеры поддержки итогов
+    """
+    install_statement_triggers(_trigger_bodies(), 'rollup', using)
+
+
+def rebuild(company_id=None):
+    """
+    Пересчитывает итоги с нуля (всех компаний или одной); возвращает число строк итогов
+    """
+    orders = Order._meta.db_table
+    items = OrderItem._meta.db_table
+    order_rollup = OrderDailyRollup._meta.db_table
+    sales_rollup = SalesDailyRollup._meta.db_table
+    scope = '(%(company)s::bigint IS NULL OR o.company_id = %(company)s)'
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Запись заказов ждет окончания пересчета, иначе ее приращения потерялись бы
+        cursor.execute(f'LOCK TABLE {orders}, {items} IN SHARE MODE')
+        if company_id is None:
+            cursor.execute(f'TRUNCATE {order_rollup}, {sales_rollup}')
+        else:
+            cursor.execute(f'DELETE FROM {order_rollup} WHERE company_id = %s', [company_id])
+            cursor.execute(f'DELETE FROM {sales_rollup} WHERE company_id = %s', [company_id])
+        cursor.execute(
+            f"""
+            INSERT INTO {order_rollup} (company_id, day, marketplace_id, warehouse_id, status, orders, revenue,
+                                        fulfillment_cost, items_quantity, items_amount, updated_at)
+            SELECT o.company_id, {_day('o')}, o.marketplace_id, o.shipping_warehouse_id, o.status,
+                   COUNT(*), SUM(o.total_price), COALESCE(SUM(o.fulfillment_cost), 0),
+                   COALESCE(SUM(t.quantity), 0), COALESCE(SUM(t.amount), 0), now()
+            FROM {orders} o
+            LEFT JOIN (
+                SELECT order_id, SUM(quantity) AS quantity, SUM(quantity * price) AS amount
+                FROM {items} GROUP BY order_id
+            ) AS t ON t.order_id = o.id
+            WHERE {scope}
+            GROUP BY 1, 2, 3, 4, 5
+            """,
+            {'company': company_id},
+        )
+        count = cursor.rowcount
+        cursor.execute(
+            f"""
+            INSERT INTO {sales_rollup} (company_id, day, marketplace_id, warehouse_id, product_id,
+                                        quantity, amount, updated_at)
+            SELECT o.company_id, {_day('o')}, o.marketplace_id, o.shipping_warehouse_id, i.product_id,
+                   SUM(i.quantity), SUM(i.quantity * i.price), now()
+            FROM {orders} o JOIN {items} i ON i.order_id = o.id
+            WHERE {_sale('o')} AND {scope}
+            GROUP BY 1, 2, 3, 4, 5
+            """,
+            {'company': company_id},
+        )
+        count += cursor.rowcount
+        for month in archive.by_month(archive.batches(company_id)):
+            count += _add_archived(cursor, month)
+        return count
+
+
+def _column(table, name, default=None):
+    values = table.column(name).to_pylist()
+    return values if default is None else [default if value is None else value for value in values]
+
+
+def _add_archived(cursor, archive_batches):
+    """
+    Добавляет к итогам вклад заказов месяца из файлов архива; возвращает число затронутых строк итогов
+    """
+    keys = ['company_id', 'day', 'marketplace_id', 'shipping_warehouse_id', 'status']
+    orders = archive.read_table(archive_batches, 'orders', columns=[
+        *keys, 'id', 'total_price', 'fulfillment_cost', 'items_quantity', 'items_amount',
+    ]).group_by(keys).aggregate([
+        ('id', 'count'), ('total_price', 'sum'), ('fulfillment_cost', 'sum'),
+        ('items_quantity', 'sum'), ('items_amount', 'sum'),
+    ])
+    cursor.execute(
+        _apply_orders(
+            'SELECT * FROM unnest(%s::bigint[], %s::date[], %s::bigint[], %s::bigint[], %s::varchar[], '
+            '%s::bigint[], %s::numeric[], %s::numeric[], %s::bigint[], %s::numeric[]) AS archived '
+            '(company_id, day, marketplace_id, warehouse_id, status, orders, revenue, fulfillment_cost, '
+            'items_quantity, items_amount)'
+        ),
+        [
+            *(_column(orders, key) for key in keys),
+            _column(orders, 'id_count'), _column(orders, 'total_price_sum'),
+            _column(orders, 'fulfillment_cost_sum', 0), _column(orders, 'items_quantity_sum'),
+            _column(orders, 'items_amount_sum'),
+        ],
+    )
+    count = cursor.rowcount
+
+    keys = ['company_id', 'day', 'order__marketplace_id', 'order__shipping_warehouse_id', 'product_id']
+    sales = archive.read_table(
+        archive_batches, 'items', columns=[*keys, 'quantity', 'amount'],
+        condition=ds.field('order__status').isin(SALE_STATUSES),
+    ).group_by(keys).aggregate([('quantity', 'sum'), ('amount', 'sum')])
+    cursor.execute(
+        _apply_sales(
+            'SELECT * FROM unnest(%s::bigint[], %s::date[], %s::bigint[], %s::bigint[], %s::bigint[], '
+            '%s::bigint[], %s::numeric[]) AS archived '
+            '(company_id, day, marketplace_id, warehouse_id, product_id, quantity, amount)'
+        ),
+        [*(_column(sales, key) for key in keys), _column(sales, 'quantity_sum'), _column(sales, 'amount_sum')],
+    )
+    return count + cursor.rowcount
+
+
+def dashboard(company_id, date_from=None, date_to=None, marketplace=None, warehouse=None):
+    """
+    Сводка для рабочего стола по итогам за период (по умолчанию — последние 30 дней)
+    """
+    date_to = date_to or timezone.localdate()
+    date_from = date_from or date_to - timedelta(days=29)
+    rollups = OrderDailyRollup.objects.filter(company_id=company_id, day__gte=date_from, day__lte=date_to)
+    if marketplace:
+        rollups = rollups.filter(marketplace_id=marketplace)
+    if warehouse:
+        rollups = rollups.filter(warehouse_id=warehouse)
+    sales = Q(status__in=SALE_STATUSES)
+    totals = {
+        'orders': Sum('orders'),
+        'revenue': Sum('revenue'),
+        'fulfillment_cost': Sum('fulfillment_cost'),
+        'sales_quantity': Sum('items_quantity', filter=sales),
+        'sales_amount': Sum('items_amount', filter=sales),
+    }
+
+    by_day = list(rollups.values('day').annotate(**totals).order_by('day'))
+    by_status = {
+        row['status']: row['orders']
+        for row in rollups.values('status').annotate(orders=Sum('orders')).order_by('status') if row['orders']
+    }
+    by_marketplace = list(
+        rollups.values('marketplace_id', 'marketplace__name').annotate(**totals).order_by('marketplace_id')
+    )
+    return {
+        'date_from': date_from,
+        'date_to': date_to,
+        'totals': {name: sum(row[name] or 0 for row in by_day) for name in totals},
+        'by_status': by_status,
+        'by_day': by_day,
+        'by_marketplace': by_marketplace,
+    }
@@ -0,0 +1,27 @@
+from core.fieldsets import FieldsetSerializer
+
+from .models import Inventory, InventoryItem
+
+
+class InventoryItemSerializer(FieldsetSerializer):
+    class Meta:
+        model = InventoryItem
+        fields = (
+            'id', 'product', 'expected_quantity', 'actual_quantity', 'is_checked', 'has_discrepancy',
+            'discrepancy_reason', 'created_at', 'updated_at',
+        )
+        read_only_fields = fields
+        expandable = {'product': 'products.serializers.ProductSerializer'}
+
+
+class InventorySerializer(FieldsetSerializer):
+    class Meta:
+        model = Inventory
+        fields = (
+            'id', 'warehouse', 'name', 'status', 'start_date', 'end_date', 'comment', 'created_at', 'updated_at',
+        )
+        read_only_fields = fields
+        expandable = {
+            'items': InventoryItemSerializer,
+            'warehouse': 'warehouses.serializers.WarehouseSerializer',
+        }
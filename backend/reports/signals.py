@@ -0,0 +1,47 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connections
+
+from orders.models import OrderItem
+from shipments.models import ShipmentOrder
+from supplies.models import SupplyItem
+
+from . import rollups
+from .cache import WATERMARK_SOURCES, invalidate
+
+# Модели, изменения которых не видны по updated_at: удаления исходных строк и позиции документов
+COMPANY_PATHS = {
+    **{model: path for sources in WATERMARK_SOURCES.values() for model, path in sources},
+    OrderItem: 'order__company',
+    SupplyItem: 'supply__company',
+    ShipmentOrder: 'shipment__company',
+}
+
+ITEM_MODELS = (OrderItem, SupplyItem, ShipmentOrder)
+
+
+def _company_id(instance):
+    *relations, _company = COMPANY_PATHS[type(instance)].split('__')
+    try:
+        for relation in relations:
+            instance = getattr(instance, relation)
+    except ObjectDoesNotExist:
+        return None
+    return instance.company_id
+
+
+def invalidate_report_cache(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    company_id = _company_id(instance)
+    if company_id is not None:
+        invalidate(company_id)
+
+
+def invalidate_archived_reports(sender, company_id, **kwargs):
+    # Архивация удаляет заказы сырыми запросами, минуя post_delete
+    invalidate(company_id)
+
+
+def install_rollup_triggers(sender, using='default', **kwargs):
+    if connections[using].vendor == 'postgresql':
+        rollups.install_triggers(using)
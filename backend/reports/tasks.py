@@ -0,0 +1,13 @@
+from core.celery import app
+
+from . import pipeline
+
+
+@app.task(name='reports.render_chunk', acks_late=True)
+def render_report_chunk(chunk_id, database=None):
+    return pipeline.render_chunk(chunk_id, database)
+
+
+@app.task(name='reports.merge_chunks', acks_late=True)
+def merge_report_chunks(report_id, key=None, marks=None):
+    return pipeline.merge_chunks(report_id, key, marks)
@@ -0,0 +1,172 @@
+"""
+Тесты параллельной генерации отчетов (reports.pipeline).
+
+Задачи Celery выполняются в процессе (task_always_eager), а результаты chord
+хранятся в памяти, поэтому брокер и Redis не нужны:
+python manage.py test reports.tests
+"""
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import Marketplace
+from companies.models import Company
+from core.celery import app
+from orders.models import Order
+from orders.partitions import ensure_partitions
+from users.models import User
+
+from . import pipeline
+from .models import Report, ReportChunk
+from .rendering import render_report
+
+ORDERS = 300
+DAYS = 30
+
+
+@override_settings(REPORT_PIPELINE_MIN_CHUNK_ROWS=1)
+class ReportPipelineTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Pipeline', inn='7700000001', legal_address='-')
+        cls.marketplace = Marketplace.objects.create(name='Pipeline', type='wildberries', company=cls.company)
+        ensure_partitions(since=timezone.now() - timedelta(days=DAYS))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {Order._meta.db_table}
+                    (marketplace_id, company_id, external_id, status, total_price, weight, created_at, updated_at)
+                SELECT %(marketplace)s, %(company)s, 'pipeline-' || n, 'new', 100 + n, 50 + n,
+                       now() - (n %% %(days)s) * interval '1 day', now()
+                FROM generate_series(1, %(orders)s) AS n
+                """,
+                {'marketplace': cls.marketplace.pk, 'company': cls.company.pk, 'orders': ORDERS, 'days': DAYS},
+            )
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.chunks_dir = os.path.join(media_root, 'reports', 'chunks')
+
+        # Ключи в пространстве имен CELERY, как в настройках Django (core.celery)
+        celery_config = {'CELERY_TASK_ALWAYS_EAGER': True, 'CELERY_RESULT_BACKEND': 'cache+memory://'}
+        self.addCleanup(app.conf.update, {name: app.conf[name] for name in celery_config})
+        app.conf.update(celery_config)
+
+    def new_report(self, **parameters):
+        return Report.objects.create(
+            name='Orders', type='orders', format='csv', company=self.company, parameters=parameters,
+        )
+
+    def fragments(self):
+        return os.listdir(self.chunks_dir) if os.path.isdir(self.chunks_dir) else []
+
+    def read(self, report):
+        with report.file.open('rb') as stream:
+            return stream.read()
+
+    def test_chord_merges_chunks_into_sequential_file(self):
+        sequential = self.new_report()
+        self.assertEqual(render_report(sequential), ORDERS)
+
+        report = self.new_report()
+        with self.captureOnCommitCallbacks(execute=True):
+            pipeline.start_generation(report, use_cache=False, max_chunks=4)
+
+        report.refresh_from_db()
+        self.assertEqual(report.generation_status, 'completed')
+        self.assertEqual((report.chunks_total, report.chunks_done, report.rows_done), (4, 4, ORDERS))
+        self.assertEqual(self.read(report), self.read(sequential))
+        self.assertEqual(self.fragments(), [])
+
+    def test_cancel_skips_merge_and_removes_fragments(self):
+        report = self.new_report()
+        chunks = pipeline.prepare_chunks(report, max_chunks=3)
+        self.assertGreater(pipeline.render_chunk(chunks[0].pk), 0)
+        self.assertEqual(len(self.fragments()), 1)
+
+        self.assertTrue(pipeline.cancel_generation(report))
+        self.assertFalse(pipeline.cancel_generation(report))
+        for chunk in chunks[1:]:
+            self.assertEqual(pipeline.render_chunk(chunk.pk), 0)
+        self.assertIsNone(pipeline.merge_chunks(report.pk))
+
+        report.refresh_from_db()
+        self.assertEqual(report.generation_status, 'cancelled')
+        self.assertFalse(report.is_generated)
+        self.assertEqual(
+            list(report.chunks.order_by('number').values_list('status', flat=True)),
+            ['completed', 'cancelled', 'cancelled'],
+        )
+        self.assertEqual(self.fragments(), [])
+
+    def test_cancel_between_portions_stops_chunk(self):
+        report = self.new_report()
+        chunks = pipeline.prepare_chunks(report, max_chunks=1)
+        with override_settings(REPORT_CHUNK_SIZE=10), mock.patch.object(
+            pipeline, '_status', side_effect=['queued', 'cancelled'],
+        ):
+            self.assertEqual(pipeline.render_chunk(chunks[0].pk), 0)
+        self.assertEqual(ReportChunk.objects.get(pk=chunks[0].pk).status, 'cancelled')
+        self.assertEqual(self.fragments(), [])
+
+    def test_failed_chunk_removes_sibling_fragments(self):
+        report = self.new_report()
+        write_fragment = pipeline.write_fragment
+        calls = []
+
+        def fail_second(stream, report_format, rows):
+            calls.append(report_format)
+            if len(calls) == 2:
+                raise OSError('disk full')
+            return write_fragment(stream, report_format, rows)
+
+        with mock.patch.object(pipeline, 'write_fragment', side_effect=fail_second):
+            with self.assertRaisesMessage(OSError, 'disk full'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    pipeline.start_generation(report, use_cache=False, max_chunks=3)
+
+        report.refresh_from_db()
+        self.assertEqual(report.generation_status, 'failed')
+        self.assertEqual(report.generation_error, 'Chunk 1: disk full')
+        self.assertFalse(report.is_generated)
+        self.assertEqual(
+            list(report.chunks.order_by('number').values_list('status', flat=True)),
+            ['completed', 'failed', 'pending'],
+        )
+        self.assertEqual(self.fragments(), [])
+
+    def test_chunk_finished_after_failure_removes_its_fragment(self):
+        report = self.new_report()
+        chunks = pipeline.prepare_chunks(report, max_chunks=2)
+        # Часть уже идет, когда другая часть отчета падает
+        with mock.patch.object(pipeline, '_status', side_effect=['running', 'failed']):
+            pipeline.render_chunk(chunks[0].pk)
+        self.assertEqual(ReportChunk.objects.get(pk=chunks[0].pk).status, 'completed')
+        self.assertEqual(self.fragments(), [])
+
+    def test_malformed_parameters_are_rejected_before_queueing(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='pipeline', email='pipeline@example.com',
+                                                      company=self.company))
+        for name, value in (('warehouse', 'abc'), ('date_from', '2024-13-01'), ('status', 5)):
+            with self.subTest(name=name):
+                report = self.new_report(**{name: value})
+                response = client.post(reverse('report-generate', args=[report.pk]), {}, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(list(response.data['parameters']), [name])
+                report.refresh_from_db()
+                self.assertEqual(report.generation_status, 'idle')
+                self.assertFalse(report.chunks.exists())
@@ -0,0 +1,119 @@
+from datetime import date
+
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import ListAPIView
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.fieldsets import FieldsetMixin
+from core.replicas import analytics
+
+from .cache import InvalidParameter
+from .models import Inventory, Report
+from .pipeline import GenerationInProgress, cancel_generation, progress, start_generation
+from .rendering import UnsupportedReport
+from .rollups import dashboard
+from .serializers import InventorySerializer
+
+
+def _get_report(request, pk):
+    return get_object_or_404(Report, pk=pk, company_id=request.user.company_id)
+
+
+class ReportGenerateView(APIView):
+    """
+    Запуск фоновой генерации отчета.
+
+    POST {"no_cache": false} -> 202 и ход генерации (см. ReportProgressView)
+    """
+
+    def post(self, request, pk):
+        report = _get_report(request, pk)
+        try:
+            start_generation(report, use_cache=not request.data.get('no_cache'))
+        except InvalidParameter as exc:
+            return Response({'parameters': {exc.name: str(exc)}}, status=status.HTTP_400_BAD_REQUEST)
+        except UnsupportedReport as exc:
+            return Response({'format': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except GenerationInProgress as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_409_CONFLICT)
+        report.refresh_from_db()
+        return Response(progress(report), status=status.HTTP_202_ACCEPTED)
+
+
+class ReportProgressView(APIView):
+    """
+    Ход генерации отчета: статус, число готовых частей и строк, состояние частей
+    """
+
+    def get(self, request, pk):
+        return Response(progress(_get_report(request, pk)))
+
+
+class ReportCancelView(APIView):
+    """
+    Отмена фоновой генерации отчета
+    """
+
+    def post(self, request, pk):
+        report = _get_report(request, pk)
+        if not cancel_generation(report):
+            return Response({'detail': 'Report is not being generated'}, status=status.HTTP_409_CONFLICT)
+        report.refresh_from_db()
+        return Response(progress(report))
+
+
+class DashboardView(APIView):
+    """
+    Сводка рабочего стола по дневным итогам заказов и продаж.
+
+    GET ?date_from=YYYY-MM-DD&date_to=YYYY-MM-DD&marketplace=<id>&warehouse=<id>;
+    по умолчанию — последние 30 дней
+    """
+    # Пользователь токена, три сводки и периодическая проверка отставания реплики
+    query_budget = 5
+
+    def get(self, request):
+        params = request.query_params
+        filters = {}
+        for name in ('date_from', 'date_to'):
+            if params.get(name):
+                try:
+                    filters[name] = date.fromisoformat(params[name])
+                except ValueError:
+                    raise ValidationError({name: 'Expected a date in YYYY-MM-DD format'})
+        for name in ('marketplace', 'warehouse'):
+            if params.get(name):
+                try:
+                    filters[name] = int(params[name])
+                except ValueError:
+                    raise ValidationError({name: 'Expected an ID'})
+        with analytics():
+            data = dashboard(request.user.company_id, **filters)
+        return Response(data)
+
+
+class InventoryListView(FieldsetMixin, ListAPIView):
+    """
+    Инвентаризации компании от новых к старым, постранично по ключу (created_at, id).
+
+    GET ?status=<статус>&status=...&warehouse=<id>&fields=id,name,items.actual_quantity&expand=items.product
+    &cursor=...&total=approximate
+    """
+    query_budget = 2
+    serializer_class = InventorySerializer
+
+    def get_queryset(self):
+        queryset = Inventory.objects.filter(company_id=self.request.user.company_id)
+        statuses = self.request.query_params.getlist('status')
+        if statuses:
+            queryset = queryset.filter(status__in=statuses)
+        warehouse = self.request.query_params.get('warehouse')
+        if warehouse is not None:
+            try:
+                queryset = queryset.filter(warehouse_id=int(warehouse))
+            except ValueError:
+                raise ValidationError({'warehouse': 'Expected an integer ID'})
+        return queryset
@@ -0,0 +1,206 @@
+"""
+Потоковая запись XLSX.
+
+Строки листа сразу сериализуются в SpreadsheetML и пишутся в zip-архив
+записью в поток (zipfile.ZipFile.open(..., 'w')), поэтому память не
+зависит от размера отчета. Значения: строки (inline string), числа,
+bool, date и datetime без часового пояса; None — пустая ячейка.
+Лист вмещает XLSX_MAX_ROWS строк, дальше строки продолжаются на новом листе
+с повтором заголовка.
+
+Для параллельной генерации строки можно сериализовать во фрагмент заранее
+(write_xlsx_fragment, по строке <row> на строку файла) и затем собрать
+книгу из фрагментов (write_xlsx_rows).
+"""
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import islice
+from xml.sax.saxutils import escape
+
+# Предел строк листа Excel
+XLSX_MAX_ROWS = 1048576
+
+CHUNK_ROWS = 2000
+
+_EPOCH = datetime(1899, 12, 30)
+_EPOCH_DATE = _EPOCH.date()
+
+# Управляющие символы недопустимы в XML 1.0
+_CONTROL = dict.fromkeys(code for code in range(32) if code not in (9, 10, 13))
+
+# Переводы строк — ссылками на символы, чтобы строка листа занимала одну строку фрагмента
+_NEWLINES = {'\n': '&#10;', '\r': '&#13;'}
+
+
+def _text(value):
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(value.translate(_CONTROL), _NEWLINES)}</t></is></c>'
+
+
+def _number(value):
+    return f'<c><v>{value}</v></c>'
+
+
+_CELLS = {
+    str: _text,
+    int: _number,
+    float: _number,
+    Decimal: _number,
+    bool: lambda value: f'<c t="b"><v>{int(value)}</v></c>',
+    # Стили 1 и 2 из STYLES: дата и дата со временем
+    date: lambda value: f'<c s="1"><v>{(value - _EPOCH_DATE).days}</v></c>',
+    datetime: lambda value: f'<c s="2"><v>{(value - _EPOCH).total_seconds() / 86400!r}</v></c>',
+    type(None): lambda value: '<c/>',
+}
+
+
+def _cell(value):
+    formatter = _CELLS.get(type(value))
+    return formatter(value) if formatter else _text(str(value))
+
+
+def _row(values):
+    return '<row>' + ''.join(map(_cell, values)) + '</row>'
+
+
+SHEET_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+SHEET_FOOTER = '</sheetData></worksheet>'
+
+STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd hh:mm:ss"/></numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+
+def _package_parts(sheets):
+    sheet_numbers = range(1, sheets + 1)
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        + ''.join(
+            f'<Override PartName="/xl/worksheets/sheet{n}.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for n in sheet_numbers
+        )
+        + '</Types>'
+    )
+    root_rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    )
+    workbook = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+        + ''.join(f'<sheet name="Report {n}" sheetId="{n}" r:id="rId{n}"/>' for n in sheet_numbers)
+        + '</sheets></workbook>'
+    )
+    workbook_rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        + ''.join(
+            f'<Relationship Id="rId{n}" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+            f'Target="worksheets/sheet{n}.xml"/>'
+            for n in sheet_numbers
+        )
+        + f'<Relationship Id="rId{sheets + 1}" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    )
+    return {
+        '[Content_Types].xml': content_types,
+        '_rels/.rels': root_rels,
+        'xl/workbook.xml': workbook,
+        'xl/_rels/workbook.xml.rels': workbook_rels,
+        'xl/styles.xml': STYLES,
+    }
+
+
+def write_xlsx(stream, headers, rows):
+    """
+    Пишет строки в поток как книгу XLSX; возвращает число строк данных
+    """
+    return write_xlsx_rows(stream, headers, map(_row, rows))
+
+
+def write_xlsx_fragment(stream, rows):
+    """
+    Пишет сериализованные строки листа во фрагмент, по одной на строку; возвращает их число
+    """
+    count = 0
+    while True:
+        chunk = list(islice(rows, CHUNK_ROWS))
+        if not chunk:
+            return count
+        stream.write(''.join(_row(values) + '\n' for values in chunk).encode())
+        count += len(chunk)
+
+
+def write_xlsx_rows(stream, headers, rows):
+    """
+    Пишет книгу XLSX из уже сериализованных строк листа; возвращает число строк данных
+    """
+    header = _row(headers)
+    count = 0
+    sheets = 0
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+        while True:
+            chunk = list(islice(rows, CHUNK_ROWS))
+            if not chunk and sheets:
+                break
+            sheets += 1
+            with archive.open(f'xl/worksheets/sheet{sheets}.xml', 'w', force_zip64=True) as sheet:
+                sheet.write((SHEET_HEADER + header).encode())
+                sheet_rows = 1
+                while chunk:
+                    if sheet_rows + len(chunk) > XLSX_MAX_ROWS:
+                        # Остаток порции переходит на следующий лист
+                        fits = XLSX_MAX_ROWS - sheet_rows
+                        chunk, rest = chunk[:fits], chunk[fits:]
+                    else:
+                        rest = None
+                    sheet.write(''.join(chunk).encode())
+                    sheet_rows += len(chunk)
+                    count += len(chunk)
+                    if rest is not None:
+                        chunk = rest
+                        break
+                    chunk = list(islice(rows, CHUNK_ROWS))
+                sheet.write(SHEET_FOOTER.encode())
+            if not chunk:
+                break
+            rows = _prepend(chunk, rows)
+        for name, content in _package_parts(sheets).items():
+            archive.writestr(name, content)
+    return count
+
+
+def _prepend(chunk, rows):
+    yield from chunk
+    yield from rows
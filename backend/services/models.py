@@ -47,6 +47,10 @@ class Service(models.Model):
     class Meta:
         verbose_name = _('service')
         verbose_name_plural = _('services')
+        indexes = [
+            # Водяной знак справочника компании (см. core.httpcache)
+            models.Index(fields=['company', 'updated_at'], name='service_company_updated_idx'),
+        ]
         
     def __str__(self):
         return f"{self.name} ({self.get_type_display()})"
@@ -0,0 +1,10 @@
+from core.fieldsets import FieldsetSerializer
+
+from .models import Service
+
+
+class ServiceSerializer(FieldsetSerializer):
+    class Meta:
+        model = Service
+        fields = ('id', 'name', 'type', 'description', 'price', 'price_type', 'is_active', 'created_at', 'updated_at')
+        read_only_fields = fields
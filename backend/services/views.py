@@ -0,0 +1,29 @@
+from rest_framework.generics import ListAPIView
+
+from core.fieldsets import FieldsetMixin
+from core.httpcache import CatalogCacheMixin
+
+from .models import Service
+from .serializers import ServiceSerializer
+
+
+class ServiceListView(CatalogCacheMixin, FieldsetMixin, ListAPIView):
+    """
+    Услуги компании от новых к старым, постранично по ключу (created_at, id); поддерживает If-None-Match.
+
+    GET ?active=1|0&type=<тип>&fields=id,name,price&cursor=...
+    """
+    # Пользователь токена, водяной знак справочника и страница
+    query_budget = 3
+    serializer_class = ServiceSerializer
+    catalog_model = Service
+
+    def get_queryset(self):
+        queryset = Service.objects.filter(company_id=self.request.user.company_id)
+        active = self.request.query_params.get('active')
+        if active is not None:
+            queryset = queryset.filter(is_active=active in ('1', 'true'))
+        service_type = self.request.query_params.get('type')
+        if service_type:
+            queryset = queryset.filter(type=service_type)
+        return queryset
@@ -52,6 +52,10 @@ class Shipment(models.Model):
     class Meta:
         verbose_name = _('shipment')
         verbose_name_plural = _('shipments')
+        indexes = [
+            # Списки отгрузок компании постранично по ключу (см. core.pagination)
+            models.Index(fields=['company', 'created_at', 'id'], name='shipment_company_created_idx'),
+        ]
         
     def __str__(self):
         return f"Shipment #{self.id} ({self.get_status_display()})"
@@ -67,10 +71,12 @@ class ShipmentOrder(models.Model):
         related_name='shipment_orders'
     )
     
+    # Заказы секционированы (orders.partitions): внешний ключ только на уровне Django
     order = models.ForeignKey(
         'orders.Order',
         on_delete=models.CASCADE,
-        related_name='shipment_links'
+        related_name='shipment_links',
+        db_constraint=False
     )
     
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
@@ -81,7 +87,7 @@ class ShipmentOrder(models.Model):
         unique_together = ('shipment', 'order')
         
     def __str__(self):
-        return f"Order {self.order.external_id} in Shipment #{self.shipment.id}"
+        return f"Order {self.order.external_id} in Shipment #{self.shipment_id}"
 
 
 class ShipmentDocument(models.Model):
@@ -104,4 +110,4 @@ class ShipmentDocument(models.Model):
         verbose_name_plural = _('shipment documents')
         
     def __str__(self):
-        return f"{self.name} for Shipment #{self.shipment.id}"
+        return f"{self.name} for Shipment #{self.shipment_id}"
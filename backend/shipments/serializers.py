@@ -0,0 +1,25 @@
+from core.fieldsets import FieldsetSerializer
+
+from .models import Shipment, ShipmentOrder
+
+
+class ShipmentOrderSerializer(FieldsetSerializer):
+    class Meta:
+        model = ShipmentOrder
+        fields = ('id', 'order', 'created_at')
+        read_only_fields = fields
+        expandable = {'order': 'orders.serializers.OrderSerializer'}
+
+
+class ShipmentSerializer(FieldsetSerializer):
+    class Meta:
+        model = Shipment
+        fields = (
+            'id', 'warehouse', 'status', 'shipment_date', 'transport_company', 'tracking_number', 'pallets_count',
+            'boxes_count', 'total_weight', 'comment', 'created_at', 'updated_at',
+        )
+        read_only_fields = fields
+        expandable = {
+            'shipment_orders': ShipmentOrderSerializer,
+            'warehouse': 'warehouses.serializers.WarehouseSerializer',
+        }
@@ -0,0 +1,31 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import ListAPIView
+
+from core.fieldsets import FieldsetMixin
+
+from .models import Shipment
+from .serializers import ShipmentSerializer
+
+
+class ShipmentListView(FieldsetMixin, ListAPIView):
+    """
+    Отгрузки компании от новых к старым, постранично по ключу (created_at, id).
+
+    GET ?status=<статус>&status=...&warehouse=<id>
+    &fields=id,status,shipment_orders.order.external_id&expand=shipment_orders.order.items&cursor=...
+    """
+    query_budget = 2
+    serializer_class = ShipmentSerializer
+
+    def get_queryset(self):
+        queryset = Shipment.objects.filter(company_id=self.request.user.company_id)
+        statuses = self.request.query_params.getlist('status')
+        if statuses:
+            queryset = queryset.filter(status__in=statuses)
+        warehouse = self.request.query_params.get('warehouse')
+        if warehouse is not None:
+            try:
+                queryset = queryset.filter(warehouse_id=int(warehouse))
+            except ValueError:
+                raise ValidationError({'warehouse': 'Expected an integer ID'})
+        return queryset
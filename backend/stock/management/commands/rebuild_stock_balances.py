@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from stock.services import rebuild_balances
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает остатки товаров по журналу движений'
+
+    def handle(self, *args, **options):
+        count = rebuild_balances()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} stock balances'))
@@ -0,0 +1,136 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class StockMovement(models.Model):
+    """
+    Модель движения товара (журнал, только добавление)
+    """
+    MOVEMENT_TYPES = (
+        ('receipt', _('Receipt')),
+        ('pick', _('Pick')),
+        ('move', _('Move')),
+        ('adjustment', _('Adjustment')),
+    )
+    
+    movement_type = models.CharField(_('movement type'), max_length=20, choices=MOVEMENT_TYPES)
+    
+    product = models.ForeignKey(
+        'products.Product',
+        on_delete=models.PROTECT,
+        related_name='stock_movements'
+    )
+    
+    storage_unit = models.ForeignKey(
+        'warehouses.StorageUnit',
+        on_delete=models.PROTECT,
+        related_name='stock_movements'
+    )
+    
+    # Склад юнита (денормализовано для выборок по складу)
+    warehouse = models.ForeignKey(
+        'warehouses.Warehouse',
+        on_delete=models.PROTECT,
+        related_name='stock_movements'
+    )
+    
+    # Изменение количества со знаком и остаток после операции
+    quantity = models.IntegerField(_('quantity'))
+    balance_after = models.IntegerField(_('balance after'))
+    
+    # Перемещение пишется двумя строками с общим идентификатором операции
+    operation_id = models.UUIDField(_('operation ID'), db_index=True)
+    
+    # Основание движения
+    supply_item = models.ForeignKey(
+        'supplies.SupplyItem',
+        on_delete=models.SET_NULL,
+        related_name='stock_movements',
+        blank=True,
+        null=True
+    )
+    
+    # Позиции заказов секционированы (orders.partitions): внешний ключ только на уровне Django
+    order_item = models.ForeignKey(
+        'orders.OrderItem',
+        on_delete=models.SET_NULL,
+        related_name='stock_movements',
+        blank=True,
+        null=True,
+        db_constraint=False
+    )
+    
+    comment = models.TextField(_('comment'), blank=True, null=True)
+    
+    created_by = models.ForeignKey(
+        'users.User',
+        on_delete=models.SET_NULL,
+        related_name='stock_movements',
+        blank=True,
+        null=True
+    )
+    
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    
+    class Meta:
+        verbose_name = _('stock movement')
+        verbose_name_plural = _('stock movements')
+        indexes = [
+            models.Index(fields=['product', 'storage_unit', 'created_at'], name='stock_mov_product_unit_idx'),
+            models.Index(fields=['warehouse', 'created_at'], name='stock_mov_warehouse_idx'),
+        ]
+        
+    def __str__(self):
+        return f"{self.get_movement_type_display()} {self.quantity:+d} of {self.product_id} at {self.storage_unit_id}"
+    
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Stock movements are append-only and cannot be changed")
+        super().save(*args, **kwargs)
+        
+    def delete(self, *args, **kwargs):
+        raise ValueError("Stock movements are append-only and cannot be deleted")
+
+
+class StockBalance(models.Model):
+    """
+    Остаток товара в единице хранения
+    """
+    product = models.ForeignKey(
+        'products.Product',
+        on_delete=models.PROTECT,
+        related_name='stock_balances'
+    )
+    
+    storage_unit = models.ForeignKey(
+        'warehouses.StorageUnit',
+        on_delete=models.PROTECT,
+        related_name='stock_balances'
+    )
+    
+    # Склад юнита (денормализовано для выборок по складу)
+    warehouse = models.ForeignKey(
+        'warehouses.Warehouse',
+        on_delete=models.PROTECT,
+        related_name='stock_balances'
+    )
+    
+    quantity = models.IntegerField(_('quantity'), default=0)
+    
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+    
+    class Meta:
+        verbose_name = _('stock balance')
+        verbose_name_plural = _('stock balances')
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'storage_unit'], name='stock_balance_product_unit_uniq'),
+            models.CheckConstraint(check=models.Q(quantity__gte=0), name='stock_balance_quantity_non_negative'),
+        ]
+        indexes = [
+            models.Index(fields=['warehouse', 'product'], name='stock_bal_warehouse_idx'),
+            models.Index(fields=['storage_unit'], name='stock_bal_unit_idx'),
+            models.Index(fields=['warehouse', 'updated_at'], name='stock_bal_warehouse_upd_idx'),
+        ]
+        
+    def __str__(self):
+        return f"{self.product_id} x{self.quantity} at {self.storage_unit_id}"
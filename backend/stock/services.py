@@ -0,0 +1,194 @@
+"""
+Сервис складских остатков.
+
+Каждое изменение остатка записывается в журнал StockMovement и в той же
+транзакции применяется к StockBalance, поэтому чтение остатка — это поиск
+по индексу, а не суммирование истории движений.
+"""
+import uuid
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from core.replicas import analytics
+
+from .models import StockBalance, StockMovement
+
+
+class InsufficientStockError(Exception):
+    """
+    Недостаточно товара в единице хранения
+    """
+
+    def __init__(self, product_id, storage_unit_id, requested):
+        self.product_id = product_id
+        self.storage_unit_id = storage_unit_id
+        self.requested = requested
+        super().__init__(
+            f"Not enough stock of product {product_id} in storage unit {storage_unit_id} "
+            f"to take {requested}"
+        )
+
+
+def _apply_delta(product_id, storage_unit, delta):
+    """
+    Атомарно изменяет остаток и возвращает новое количество.
+
+    Списание выполняется условным UPDATE, поэтому остаток не уходит в минус
+    даже при конкурентных операциях. UPDATE минует auto_now, поэтому updated_at
+    (водяной знак кэша отчетов, см. reports.cache) выставляется явно.
+    """
+    balance = StockBalance.objects.filter(product_id=product_id, storage_unit_id=storage_unit.pk)
+    target = balance.filter(quantity__gte=-delta) if delta < 0 else balance
+
+    if target.update(quantity=F('quantity') + delta, updated_at=timezone.now()):
+        return balance.values_list('quantity', flat=True).get()
+
+    if delta < 0:
+        raise InsufficientStockError(product_id, storage_unit.pk, -delta)
+
+    try:
+        with transaction.atomic():
+            StockBalance.objects.create(
+                product_id=product_id,
+                storage_unit_id=storage_unit.pk,
+                warehouse_id=storage_unit.warehouse_id,
+                quantity=delta,
+            )
+        return delta
+    except IntegrityError:
+        # Строку остатка успели создать в параллельной транзакции
+        balance.update(quantity=F('quantity') + delta, updated_at=timezone.now())
+        return balance.values_list('quantity', flat=True).get()
+
+
+def _record(movement_type, product_id, storage_unit, delta, operation_id, **extra):
+    balance_after = _apply_delta(product_id, storage_unit, delta)
+    return StockMovement.objects.create(
+        movement_type=movement_type,
+        product_id=product_id,
+        storage_unit=storage_unit,
+        warehouse_id=storage_unit.warehouse_id,
+        quantity=delta,
+        balance_after=balance_after,
+        operation_id=operation_id,
+        **extra
+    )
+
+
+@transaction.atomic
+def receive(product, storage_unit, quantity, supply_item=None, user=None, comment=None):
+    """
+    Приемка товара в единицу хранения
+    """
+    if quantity <= 0:
+        raise ValueError("Receipt quantity must be positive")
+    return _record(
+        'receipt', product.pk, storage_unit, quantity, uuid.uuid4(),
+        supply_item=supply_item, created_by=user, comment=comment
+    )
+
+
+@transaction.atomic
+def pick(product, storage_unit, quantity, order_item=None, user=None, comment=None):
+    """
+    Отбор товара из единицы хранения
+    """
+    if quantity <= 0:
+        raise ValueError("Pick quantity must be positive")
+    return _record(
+        'pick', product.pk, storage_unit, -quantity, uuid.uuid4(),
+        order_item=order_item, created_by=user, comment=comment
+    )
+
+
+@transaction.atomic
+def move(product, source_unit, destination_unit, quantity, user=None, comment=None):
+    """
+    Перемещение товара между единицами хранения.
+
+    Возвращает пару движений (списание, поступление) с общим operation_id.
+    """
+    if quantity <= 0:
+        raise ValueError("Move quantity must be positive")
+    if source_unit.pk == destination_unit.pk:
+        raise ValueError("Source and destination storage units must differ")
+
+    operation_id = uuid.uuid4()
+    # Блокируем строки остатков в одном порядке, чтобы встречные перемещения не взаимоблокировались
+    for unit in sorted((source_unit, destination_unit), key=lambda u: u.pk):
+        list(StockBalance.objects.select_for_update().filter(
+            product_id=product.pk, storage_unit_id=unit.pk
+        ).values_list('pk', flat=True))
+
+    outgoing = _record('move', product.pk, source_unit, -quantity, operation_id, created_by=user, comment=comment)
+    incoming = _record('move', product.pk, destination_unit, quantity, operation_id, created_by=user, comment=comment)
+    return outgoing, incoming
+
+
+@transaction.atomic
+def adjust(product, storage_unit, quantity, user=None, comment=None):
+    """
+    Корректировка остатка на величину quantity (со знаком)
+    """
+    if quantity == 0:
+        raise ValueError("Adjustment quantity must not be zero")
+    return _record(
+        'adjustment', product.pk, storage_unit, quantity, uuid.uuid4(),
+        created_by=user, comment=comment
+    )
+
+
+def get_product_stock(product_id, warehouse_id=None):
+    """
+    Суммарный остаток товара (по всем складам или по одному складу)
+    """
+    balances = StockBalance.objects.filter(product_id=product_id)
+    if warehouse_id is not None:
+        balances = balances.filter(warehouse_id=warehouse_id)
+    return balances.aggregate(total=Sum('quantity'))['total'] or 0
+
+
+def get_warehouse_stock(warehouse_id, product_ids=None):
+    """
+    Остатки склада в виде словаря {product_id: quantity}
+    """
+    balances = StockBalance.objects.filter(warehouse_id=warehouse_id, quantity__gt=0)
+    if product_ids is not None:
+        balances = balances.filter(product_id__in=product_ids)
+    return dict(
+        balances.values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total')
+    )
+
+
+def fill_inventory_expected_quantities(inventory):
+    """
+    Заполняет expected_quantity позиций инвентаризации по текущим остаткам склада (остатки — с реплики)
+    """
+    from reports.models import InventoryItem
+
+    items = list(inventory.items.all())
+    with analytics():
+        stock = get_warehouse_stock(inventory.warehouse_id, [item.product_id for item in items])
+    for item in items:
+        item.expected_quantity = stock.get(item.product_id, 0)
+    InventoryItem.objects.bulk_update(items, ['expected_quantity'], batch_size=1000)
+    return items
+
+
+def rebuild_balances():
+    """
+    Пересчитывает таблицу остатков по журналу движений одним SQL-запросом
+    """
+    movement_table = StockMovement._meta.db_table
+    balance_table = StockBalance._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {balance_table}")
+        cursor.execute(
+            f"INSERT INTO {balance_table} (product_id, storage_unit_id, warehouse_id, quantity, updated_at) "
+            f"SELECT product_id, storage_unit_id, MAX(warehouse_id), SUM(quantity), CURRENT_TIMESTAMP "
+            f"FROM {movement_table} GROUP BY product_id, storage_unit_id "
+            f"HAVING SUM(quantity) <> 0"
+        )
+        return cursor.rowcount
@@ -55,6 +55,10 @@ class Supply(models.Model):
     class Meta:
         verbose_name = _('supply')
         verbose_name_plural = _('supplies')
+        indexes = [
+            # Списки поставок компании постранично по ключу (см. core.pagination)
+            models.Index(fields=['company', 'created_at', 'id'], name='supply_company_created_idx'),
+        ]
         
     def __str__(self):
         return f"Supply #{self.id} ({self.get_status_display()})"
@@ -89,7 +93,7 @@ class SupplyItem(models.Model):
         verbose_name_plural = _('supply items')
         
     def __str__(self):
-        return f"{self.product.name} x{self.quantity} in Supply #{self.supply.id}"
+        return f"{self.product.name} x{self.quantity} in Supply #{self.supply_id}"
 
 
 class SupplyDocument(models.Model):
@@ -112,4 +116,4 @@ class SupplyDocument(models.Model):
         verbose_name_plural = _('supply documents')
         
     def __str__(self):
-        return f"{self.name} for Supply #{self.supply.id}"
+        return f"{self.name} for Supply #{self.supply_id}"
@@ -0,0 +1,26 @@
+from core.fieldsets import FieldsetSerializer
+
+from .models import Supply, SupplyItem
+
+
+class SupplyItemSerializer(FieldsetSerializer):
+    class Meta:
+        model = SupplyItem
+        fields = ('id', 'product', 'quantity', 'quantity_received', 'is_processed', 'created_at')
+        read_only_fields = fields
+        expandable = {'product': 'products.serializers.ProductSerializer'}
+
+
+class SupplySerializer(FieldsetSerializer):
+    class Meta:
+        model = Supply
+        fields = (
+            'id', 'status', 'source_warehouse', 'destination_warehouse', 'supply_date', 'supply_time_slot',
+            'pallets_count', 'boxes_count', 'pickup_required', 'comment', 'created_at', 'updated_at',
+        )
+        read_only_fields = fields
+        expandable = {
+            'items': SupplyItemSerializer,
+            'source_warehouse': 'warehouses.serializers.WarehouseSerializer',
+            'destination_warehouse': 'warehouses.serializers.WarehouseSerializer',
+        }
@@ -0,0 +1,33 @@
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import ListAPIView
+
+from core.fieldsets import FieldsetMixin
+
+from .models import Supply
+from .serializers import SupplySerializer
+
+
+class SupplyListView(FieldsetMixin, ListAPIView):
+    """
+    Поставки компании от новых к старым, постранично по ключу (created_at, id).
+
+    GET ?status=<статус>&status=...&warehouse=<id склада отправления или назначения>
+    &fields=id,status,items.quantity&expand=items.product&cursor=...&total=approximate
+    """
+    query_budget = 2
+    serializer_class = SupplySerializer
+
+    def get_queryset(self):
+        queryset = Supply.objects.filter(company_id=self.request.user.company_id)
+        statuses = self.request.query_params.getlist('status')
+        if statuses:
+            queryset = queryset.filter(status__in=statuses)
+        warehouse = self.request.query_params.get('warehouse')
+        if warehouse is not None:
+            try:
+                warehouse = int(warehouse)
+            except ValueError:
+                raise ValidationError({'warehouse': 'Expected an integer ID'})
+            queryset = queryset.filter(Q(source_warehouse_id=warehouse) | Q(destination_warehouse_id=warehouse))
+        return queryset
@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+
+
+class UsersConfig(AppConfig):
+    name = 'users'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_migrate, post_save
+
+        from .models import User
+        from .signals import forget_cached_version, install_token_version_trigger
+
+        post_migrate.connect(install_token_version_trigger, sender=self, dispatch_uid='user_token_version_trigger')
+        post_save.connect(forget_cached_version, sender=User, dispatch_uid='user_token_version_save')
+        post_delete.connect(forget_cached_version, sender=User, dispatch_uid='user_token_version_delete')
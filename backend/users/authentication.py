@@ -0,0 +1,101 @@
+"""
+Аутентификация JWT без запроса к базе.
+
+Токены users.tokens несут идентификатор пользователя, company_id, флаги
+активности и прав и версию прав (User.token_version). Запрос с таким
+токеном получает TenantUser, собранный из токена, а представления берут
+request.user.company_id из него же.
+
+Отзыв — смена версии: триггер users_user увеличивает token_version при
+смене активности, компании, флагов прав или пароля (в том числе через
+queryset.update()), и токен с прежней версией отклоняется. Текущие версии
+кэшируются в процессе на JWT_TOKEN_VERSION_TTL секунд, поэтому запрос к
+базе — один на пользователя и процесс за этот срок. Процесс, изменивший
+пользователя, сбрасывает свою запись сразу (post_save); остальные видят
+отзыв не позже чем через JWT_TOKEN_VERSION_TTL секунд.
+
+Токены без версии (выпущенные до этой схемы) проверяются по базе, как в
+JWTAuthentication.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+from .tokens import TOKEN_VERSION_CLAIM
+
+# Записей кэша версий, после которых из него убираются устаревшие
+MAX_CACHED_VERSIONS = 10000
+
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+def token_version(user_id):
+    """
+    Текущая версия прав пользователя (кэш процесса на JWT_TOKEN_VERSION_TTL); None — пользователя нет
+    """
+    now = time.monotonic()
+    cached = _versions.get(user_id)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    version = User.objects.filter(pk=user_id).values_list('token_version', flat=True).first()
+    with _versions_lock:
+        if len(_versions) >= MAX_CACHED_VERSIONS:
+            for key in [key for key, (expires_at, _version) in _versions.items() if expires_at <= now]:
+                del _versions[key]
+        _versions[user_id] = (now + settings.JWT_TOKEN_VERSION_TTL, version)
+    return version
+
+
+def forget_token_version(user_id):
+    _versions.pop(user_id, None)
+
+
+class TenantUser(TokenUser):
+    """
+    Пользователь запроса из токена: id, company_id и флаги прав без обращения к базе
+    """
+
+    @cached_property
+    def company_id(self):
+        return self.token.get('company_id')
+
+    @cached_property
+    def is_active(self):
+        return self.token.get('is_active', False)
+
+    @cached_property
+    def company(self):
+        from companies.models import Company
+
+        return Company.objects.filter(pk=self.company_id).first() if self.company_id else None
+
+
+class TenantJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication, авторизующая токены с версией прав без базы (см. модуль)
+    """
+
+    def get_user(self, validated_token):
+        if TOKEN_VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        if not validated_token.get('is_active'):
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        current = token_version(user_id)
+        if current is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if validated_token[TOKEN_VERSION_CLAIM] != current:
+            raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
+        return TenantUser(validated_token)
@@ -0,0 +1,69 @@
+from django.core.management.base import CommandError
+from django.urls import reverse
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.benchmark import BenchmarkCommand, stopwatch, summarize_latencies
+from core.loadtest import LoadContext
+from core.profiling import profile
+from users.authentication import TenantJWTAuthentication
+from users.tokens import access_token_for
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Сравнивает аутентификацию JWT с чтением пользователя из базы и по данным токена: '
+        'только authenticate() и полный запрос API (данные generate_dataset)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Компания с данными (по умолчанию первая синтетическая)')
+        parser.add_argument('--repeats', type=int, default=2000)
+        parser.add_argument('--path', default=reverse('counter-badges'), help='Конечная точка для полного запроса')
+
+    def handle(self, *args, **options):
+        try:
+            context = LoadContext.load(options['company'])
+        except LookupError as exc:
+            raise CommandError(str(exc))
+        # Токен без версии прав и в полном запросе (через TenantJWTAuthentication) проверяется по базе
+        tokens = {
+            'database': (JWTAuthentication(), str(AccessToken.for_user(context.user))),
+            'token': (TenantJWTAuthentication(), str(access_token_for(context.user))),
+        }
+        factory = APIRequestFactory()
+        repeats = options['repeats']
+
+        metrics = {}
+        for name, (authentication, token) in tokens.items():
+            request = factory.get(options['path'], HTTP_AUTHORIZATION=f'Bearer {token}')
+            authentication.authenticate(request)
+            samples = []
+            with profile(name) as current:
+                for _repeat in range(repeats):
+                    with stopwatch() as elapsed:
+                        authentication.authenticate(request)
+                    samples.append(elapsed())
+            metrics[f'authenticate_{name}_queries'] = current.count / repeats
+            metrics.update({f'authenticate_{name}_{key}': value for key, value in summarize_latencies(samples).items()})
+
+        for name, (_authentication, token) in tokens.items():
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            response = client.get(options['path'])
+            if response.status_code != 200:
+                raise CommandError(f'{options["path"]}: HTTP {response.status_code}')
+            samples = []
+            with profile(name) as current:
+                for _repeat in range(repeats):
+                    with stopwatch() as elapsed:
+                        client.get(options['path'])
+                    samples.append(elapsed())
+            metrics[f'request_{name}_queries'] = current.count / repeats
+            metrics.update({f'request_{name}_{key}': value for key, value in summarize_latencies(samples).items()})
+
+        for stage in ('authenticate', 'request'):
+            for key in ('mean_ms', 'p50_ms', 'p95_ms'):
+                metrics[f'{stage}_saved_{key}'] = metrics[f'{stage}_database_{key}'] - metrics[f'{stage}_token_{key}']
+        self.report('jwt_auth', {'path': options['path'], 'repeats': repeats, **metrics}, options)
@@ -23,6 +23,10 @@ class User(AbstractUser):
     # Дополнительные поля для двухфакторной аутентификации
     is_two_factor_enabled = models.BooleanField(default=False)
     
+    # Версия прав в токенах доступа: растет при смене активности, компании, прав или пароля (триггер
+    # users.signals), и токены со старой версией отклоняются (users.authentication)
+    token_version = models.PositiveIntegerField(_('token version'), default=0)
+    
     class Meta:
         verbose_name = _('user')
         verbose_name_plural = _('users')
@@ -0,0 +1,25 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+from .tokens import TOKEN_VERSION_CLAIM, TenantRefreshToken, access_token_for
+
+
+class TenantTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = TenantRefreshToken
+
+
+class TenantTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Новый токен доступа с текущими данными пользователя; токен обновления со старой версией прав отклоняется
+    """
+    token_class = TenantRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(pk=refresh.get(api_settings.USER_ID_CLAIM)).first()
+        if user is None or not user.is_active or refresh.get(TOKEN_VERSION_CLAIM) != user.token_version:
+            raise InvalidToken(_('Token has been revoked'))
+        return {'access': str(access_token_for(user))}
@@ -0,0 +1,41 @@
+from django.db import connections, transaction
+
+from .authentication import forget_token_version
+from .models import User
+
+# Поля, смена которых отзывает выданные токены
+REVOKING_COLUMNS = ('is_active', 'company_id', 'is_staff', 'is_superuser', 'password')
+
+
+def install_token_version_trigger(sender, using='default', **kwargs):
+    if connections[using].vendor != 'postgresql':
+        return
+    table = User._meta.db_table
+    old = ', '.join(f'OLD.{column}' for column in REVOKING_COLUMNS)
+    new = ', '.join(f'NEW.{column}' for column in REVOKING_COLUMNS)
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        # Версия не убывает, даже если сохраняется экземпляр, прочитанный до отзыва
+        cursor.execute(
+            f"""
+            CREATE OR REPLACE FUNCTION {table}_token_version() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                NEW.token_version := GREATEST(NEW.token_version, OLD.token_version)
+                    + CASE WHEN ({new}) IS DISTINCT FROM ({old}) THEN 1 ELSE 0 END;
+                RETURN NEW;
+            END
+            $$
+            """
+        )
+        cursor.execute(f'DROP TRIGGER IF EXISTS {table}_token_version ON {table}')
+        cursor.execute(
+            f'CREATE TRIGGER {table}_token_version BEFORE UPDATE ON {table} '
+            f'FOR EACH ROW EXECUTE FUNCTION {table}_token_version()'
+        )
+
+
+def forget_cached_version(sender, instance, raw=False, **kwargs):
+    # Версию из триггера экземпляр не видит: следующий запрос этого процесса прочитает ее из базы,
+    # в том числе после фиксации, если до нее версию успел закэшировать параллельный запрос
+    user_id = instance.pk
+    forget_token_version(user_id)
+    transaction.on_commit(lambda: forget_token_version(user_id))
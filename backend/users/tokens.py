@@ -0,0 +1,39 @@
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+TOKEN_VERSION_CLAIM = 'token_version'
+
+
+def tenant_claims(user):
+    """
+    Данные пользователя в токене, по которым запрос авторизуется без базы (см. users.authentication)
+    """
+    return {
+        'company_id': user.company_id,
+        'is_active': user.is_active,
+        'is_staff': user.is_staff,
+        'is_superuser': user.is_superuser,
+        TOKEN_VERSION_CLAIM: user.token_version,
+    }
+
+
+class TenantRefreshToken(RefreshToken):
+    """
+    Токен обновления с данными пользователя; токен доступа из него копирует их
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim, value in tenant_claims(user).items():
+            token[claim] = value
+        return token
+
+
+def access_token_for(user):
+    """
+    Токен доступа с текущими данными пользователя
+    """
+    token = AccessToken.for_user(user)
+    for claim, value in tenant_claims(user).items():
+        token[claim] = value
+    return token
@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+
+
+class WarehousesConfig(AppConfig):
+    name = 'warehouses'
+
+    def ready(self):
+        from django.db.models.signals import pre_delete, post_save, pre_save
+
+        from .models import StorageUnit
+        from .signals import detach_from_hierarchy, remember_hierarchy_state, update_hierarchy
+
+        pre_save.connect(remember_hierarchy_state, sender=StorageUnit, dispatch_uid='storage_unit_hierarchy_pre_save')
+        post_save.connect(update_hierarchy, sender=StorageUnit, dispatch_uid='storage_unit_hierarchy_post_save')
+        pre_delete.connect(detach_from_hierarchy, sender=StorageUnit, dispatch_uid='storage_unit_hierarchy_delete')
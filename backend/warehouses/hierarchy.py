@@ -0,0 +1,173 @@
+"""
+Поддержка индекса иерархии единиц хранения.
+
+StorageUnitClosure хранит все пары (предок, потомок), поэтому поддерево,
+цепочка предков и глубина читаются одним индексным запросом вместо обхода
+parent_unit по уровням. StorageUnitCapacity хранит суммарную вместимость
+поддерева; при изменениях она корректируется приращениями у всех предков.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import StorageUnit, StorageUnitCapacity, StorageUnitClosure
+
+ZERO = Decimal('0')
+
+
+def own_capacity(unit):
+    """
+    Собственная вместимость юнита: (max_weight, max_items, объем)
+    """
+    volume = ZERO
+    if unit.width is not None and unit.height is not None and unit.depth is not None:
+        volume = Decimal(unit.width) * Decimal(unit.height) * Decimal(unit.depth)
+    return (
+        Decimal(unit.max_weight) if unit.max_weight is not None else ZERO,
+        unit.max_items or 0,
+        volume,
+    )
+
+
+def _add_capacity(unit_ids, weight, items, volume):
+    if not (weight or items or volume):
+        return
+    StorageUnitCapacity.objects.filter(storage_unit_id__in=unit_ids).update(
+        total_max_weight=F('total_max_weight') + weight,
+        total_max_items=F('total_max_items') + items,
+        total_volume=F('total_volume') + volume,
+    )
+
+
+def _ancestor_ids(unit_id):
+    return StorageUnitClosure.objects.filter(descendant_id=unit_id).values('ancestor_id')
+
+
+@transaction.atomic
+def attach(unit):
+    """
+    Добавляет новый юнит в иерархию под parent_unit
+    """
+    table = StorageUnitClosure._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (ancestor_id, descendant_id, depth) "
+            f"SELECT ancestor_id, %s, depth + 1 FROM {table} WHERE descendant_id = %s "
+            f"UNION ALL SELECT %s, %s, 0",
+            [unit.pk, unit.parent_unit_id, unit.pk, unit.pk],
+        )
+    StorageUnitCapacity.objects.create(storage_unit_id=unit.pk)
+    _add_capacity(_ancestor_ids(unit.pk), *own_capacity(unit))
+
+
+def check_move(unit):
+    """
+    Запрещает перенос юнита внутрь собственного поддерева
+    """
+    if unit.parent_unit_id is not None and StorageUnitClosure.objects.filter(
+        ancestor_id=unit.pk, descendant_id=unit.parent_unit_id
+    ).exists():
+        raise ValueError("A storage unit cannot be moved under itself or its descendant")
+
+
+@transaction.atomic
+def move(unit):
+    """
+    Переносит поддерево юнита под новый parent_unit
+    """
+    capacity = StorageUnitCapacity.objects.get(storage_unit_id=unit.pk)
+    totals = (capacity.total_max_weight, capacity.total_max_items, capacity.total_volume)
+    old_ancestors = list(
+        StorageUnitClosure.objects.filter(descendant_id=unit.pk, depth__gt=0).values_list('ancestor_id', flat=True)
+    )
+    _add_capacity(old_ancestors, *(-value for value in totals))
+
+    table = StorageUnitClosure._meta.db_table
+    with connection.cursor() as cursor:
+        # Отрываем поддерево от прежних предков
+        cursor.execute(
+            f"DELETE FROM {table} WHERE ancestor_id = ANY(%s) "
+            f"AND descendant_id IN (SELECT descendant_id FROM {table} WHERE ancestor_id = %s)",
+            [old_ancestors, unit.pk],
+        )
+        # Подвешиваем поддерево ко всем предкам нового родителя
+        if unit.parent_unit_id is not None:
+            cursor.execute(
+                f"INSERT INTO {table} (ancestor_id, descendant_id, depth) "
+                f"SELECT above.ancestor_id, below.descendant_id, above.depth + below.depth + 1 "
+                f"FROM {table} above CROSS JOIN {table} below "
+                f"WHERE above.descendant_id = %s AND below.ancestor_id = %s",
+                [unit.parent_unit_id, unit.pk],
+            )
+
+    _add_capacity(
+        StorageUnitClosure.objects.filter(descendant_id=unit.pk, depth__gt=0).values('ancestor_id'),
+        *totals
+    )
+
+
+def change_capacity(unit, old_capacity):
+    """
+    Применяет изменение собственной вместимости юнита к нему и его предкам
+    """
+    delta = [new - old for new, old in zip(own_capacity(unit), old_capacity)]
+    _add_capacity(_ancestor_ids(unit.pk), *delta)
+
+
+def detach(unit):
+    """
+    Вычитает собственную вместимость удаляемого юнита из его предков.
+
+    Вызывается до удаления для каждого удаляемого юнита поддерева, поэтому
+    предки вне поддерева уменьшаются ровно на вместимость удаленных юнитов.
+    """
+    _add_capacity(_ancestor_ids(unit.pk), *(-value for value in own_capacity(unit)))
+
+
+@transaction.atomic
+def rebuild(warehouse_ids=None):
+    """
+    Полностью пересчитывает таблицу замыкания и суммарную вместимость (всех складов или только заданных)
+    """
+    units = StorageUnit._meta.db_table
+    closure = StorageUnitClosure._meta.db_table
+    capacity = StorageUnitCapacity._meta.db_table
+    params = {'warehouses': list(warehouse_ids or ())}
+
+    def scope(column):
+        if warehouse_ids is None:
+            return ''
+        return f'WHERE {column} IN (SELECT id FROM {units} WHERE warehouse_id = ANY(%(warehouses)s))'
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {closure} {scope('descendant_id')}", params)
+        cursor.execute(
+            f"""
+            INSERT INTO {closure} (ancestor_id, descendant_id, depth)
+            WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+                SELECT id, id, 0 FROM {units} {scope('id')}
+                UNION ALL
+                SELECT tree.ancestor_id, child.id, tree.depth + 1
+                FROM tree JOIN {units} child ON child.parent_unit_id = tree.descendant_id
+            )
+            SELECT ancestor_id, descendant_id, depth FROM tree
+            """,
+            params,
+        )
+        cursor.execute(f"DELETE FROM {capacity} {scope('storage_unit_id')}", params)
+        cursor.execute(
+            f"""
+            INSERT INTO {capacity} (storage_unit_id, total_max_weight, total_max_items, total_volume)
+            SELECT link.ancestor_id,
+                   COALESCE(SUM(unit.max_weight), 0),
+                   COALESCE(SUM(unit.max_items), 0),
+                   COALESCE(SUM(unit.width * unit.height * unit.depth), 0)
+            FROM {closure} link JOIN {units} unit ON unit.id = link.descendant_id
+            {scope('link.ancestor_id')}
+            GROUP BY link.ancestor_id
+            """,
+            params,
+        )
+        cursor.execute(f"SELECT COUNT(*) FROM {closure} {scope('descendant_id')}", params)
+        return cursor.fetchone()[0]
@@ -0,0 +1,79 @@
+import random
+import string
+import uuid
+
+from django.db import transaction
+
+from companies.models import Company
+from core.benchmark import BenchmarkCommand, stopwatch, summarize_latencies
+from warehouses.models import StorageUnit, Warehouse
+from warehouses.routing import get_layout
+
+
+class Command(BenchmarkCommand):
+    help = 'Замеряет построение маршрутов подбора и выигрыш в расстоянии (данные откатываются после замера)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--aisles', type=int, default=30)
+        parser.add_argument('--racks', type=int, default=40, help='Стеллажей в проходе')
+        parser.add_argument('--shelves', type=int, default=4, help='Полок в стеллаже')
+        parser.add_argument('--lines', type=int, default=300, help='Строк в листе подбора')
+        parser.add_argument('--routes', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            run_id = uuid.uuid4().hex[:8]
+            company = Company.objects.create(name=f'Benchmark {run_id}', inn=run_id, legal_address='-')
+            warehouse = Warehouse.objects.create(name='Benchmark', type='fulfillment', address='-', company=company)
+            units = StorageUnit.objects.bulk_create(
+                [
+                    StorageUnit(
+                        warehouse=warehouse, name='Shelf', type='shelf',
+                        code=f'{_aisle_code(aisle)}-{rack:02d}-{shelf}-{run_id}',
+                    )
+                    for aisle in range(options['aisles'])
+                    for rack in range(1, options['racks'] + 1)
+                    for shelf in range(1, options['shelves'] + 1)
+                ],
+                batch_size=5000,
+            )
+            unit_ids = [unit.pk for unit in units]
+
+            with stopwatch() as elapsed:
+                layout = get_layout(warehouse.pk)
+            layout_seconds = elapsed()
+
+            rng = random.Random(7)
+            latencies = []
+            distance = naive_distance = 0.0
+            for _ in range(options['routes']):
+                # Строки приходят в порядке позиций заказов, то есть без связи с расположением ячеек
+                lines = [rng.choice(unit_ids) for _ in range(options['lines'])]
+                with stopwatch() as elapsed:
+                    route = get_layout(warehouse.pk).route(lines)
+                latencies.append(elapsed())
+                distance += route.distance
+                naive_distance += route.naive_distance
+
+            transaction.set_rollback(True)
+
+        self.report('pick_routing', {
+            'storage_units': len(unit_ids),
+            'pick_points': len(layout.aisles) - 1,
+            'layout_seconds': layout_seconds,
+            'lines': options['lines'],
+            'routes': options['routes'],
+            **summarize_latencies(latencies),
+            'mean_distance_m': distance / options['routes'],
+            'mean_naive_distance_m': naive_distance / options['routes'],
+            'distance_saved_pct': 100 * (1 - distance / naive_distance) if naive_distance else 0.0,
+        }, options)
+
+
+def _aisle_code(number):
+    code = ''
+    number += 1
+    while number:
+        number, rest = divmod(number - 1, 26)
+        code = string.ascii_uppercase[rest] + code
+    return code
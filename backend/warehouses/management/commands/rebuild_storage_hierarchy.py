@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from warehouses.hierarchy import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает индекс иерархии единиц хранения и суммарную вместимость'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--warehouse', type=int, action='append', help='Пересчитать только этот склад (можно указать несколько раз)'
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild(options['warehouse'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} storage unit hierarchy links'))
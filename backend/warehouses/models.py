@@ -34,6 +34,10 @@ class Warehouse(models.Model):
     class Meta:
         verbose_name = _('warehouse')
         verbose_name_plural = _('warehouses')
+        indexes = [
+            # Водяной знак справочника компании (см. core.httpcache)
+            models.Index(fields=['company', 'updated_at'], name='warehouse_company_updated_idx'),
+        ]
         
     def __str__(self):
         return self.name
@@ -84,6 +88,89 @@ class StorageUnit(models.Model):
     class Meta:
         verbose_name = _('storage unit')
         verbose_name_plural = _('storage units')
+        indexes = [
+            # Водяной знак справочника компании (см. core.httpcache)
+            models.Index(fields=['warehouse', 'updated_at'], name='storage_unit_wh_updated_idx'),
+        ]
         
     def __str__(self):
         return f"{self.code} - {self.name}"
+    
+    def get_descendants(self, include_self=False):
+        filters = {'ancestor_links__ancestor': self}
+        if not include_self:
+            filters['ancestor_links__depth__gt'] = 0
+        return StorageUnit.objects.filter(**filters)
+    
+    def get_ancestors(self, include_self=False):
+        """
+        Предки от корня к непосредственному родителю
+        """
+        filters = {'descendant_links__descendant': self}
+        if not include_self:
+            filters['descendant_links__depth__gt'] = 0
+        return StorageUnit.objects.filter(**filters).order_by('-descendant_links__depth')
+    
+    def get_level(self):
+        """
+        Глубина юнита в иерархии (0 — корневой юнит)
+        """
+        return StorageUnitClosure.objects.filter(descendant=self).count() - 1
+
+
+class StorageUnitClosure(models.Model):
+    """
+    Таблица замыкания иерархии единиц хранения: строка на каждую пару
+    (предок, потомок), включая пару единицы с самой собой (depth = 0)
+    """
+    ancestor = models.ForeignKey(
+        StorageUnit,
+        on_delete=models.CASCADE,
+        related_name='descendant_links'
+    )
+    
+    descendant = models.ForeignKey(
+        StorageUnit,
+        on_delete=models.CASCADE,
+        related_name='ancestor_links'
+    )
+    
+    depth = models.PositiveIntegerField(_('depth'))
+    
+    class Meta:
+        verbose_name = _('storage unit closure')
+        verbose_name_plural = _('storage unit closures')
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='storage_unit_closure_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['ancestor', 'depth'], name='su_closure_ancestor_idx'),
+            models.Index(fields=['descendant', 'depth'], name='su_closure_descendant_idx'),
+        ]
+        
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+
+class StorageUnitCapacity(models.Model):
+    """
+    Суммарная вместимость единицы хранения вместе со всеми вложенными юнитами
+    """
+    storage_unit = models.OneToOneField(
+        StorageUnit,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='capacity'
+    )
+    
+    total_max_weight = models.DecimalField(_('total max weight'), max_digits=16, decimal_places=2, default=0)
+    total_max_items = models.BigIntegerField(_('total max items'), default=0)
+    # Объем в см³
+    total_volume = models.DecimalField(_('total volume'), max_digits=20, decimal_places=2, default=0)
+    
+    class Meta:
+        verbose_name = _('storage unit capacity')
+        verbose_name_plural = _('storage unit capacities')
+        
+    def __str__(self):
+        return f"Capacity of {self.storage_unit_id}"
@@ -0,0 +1,257 @@
+"""
+Маршрутизация подбора по единицам хранения склада.
+
+Склад моделируется как ряд параллельных проходов с передним и задним
+поперечными проходами. Точка подбора — пара (проход, стеллаж); она
+извлекается из кода единицы хранения по PICK_ROUTE_CODE_PATTERN, а юниты с
+нераспознанным кодом (коробки, паллеты) стоят в точке ближайшего предка.
+Путь между точками разных проходов идет через ближайший поперечный проход.
+
+Точки склада строятся один раз и кэшируются в процессе до изменения набора
+единиц хранения. Расстояния считаются по формуле только между точками
+маршрута: матрица всего склада (тысячи точек — сотни мегабайт на процесс)
+не хранится. Маршрут строится эвристиками S-shape и largest gap, лучший из
+двух улучшается 2-opt в пределах PICK_ROUTE_TIME_BUDGET.
+"""
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .models import StorageUnit
+
+# Индекс точки упаковочного стола: начало и конец любого маршрута
+DEPOT = 0
+
+
+def parse_aisle(token):
+    """
+    Номер прохода: число как есть, буквы — A=1 ... Z=26, AA=27 ...
+    """
+    if token.isdigit():
+        return int(token)
+    number = 0
+    for char in token.upper():
+        number = number * 26 + ord(char) - ord('A') + 1
+    return number
+
+
+@dataclass
+class Route:
+    """
+    Маршрут обхода единиц хранения; расстояния в метрах, с возвратом к упаковочному столу
+    """
+    storage_unit_ids: list
+    distance: float
+    naive_distance: float
+    unrouted: list = field(default_factory=list)
+
+
+class WarehouseLayout:
+    """
+    Точки подбора склада и расстояния между ними
+    """
+
+    def __init__(self, signature, unit_points, aisles, xs, ys, aisle_length):
+        self.signature = signature
+        self.unit_points = unit_points
+        self.aisles = aisles
+        self.xs = xs
+        self.ys = ys
+        self.aisle_length = aisle_length
+
+    @classmethod
+    def load(cls, warehouse_id, signature=None):
+        pattern = re.compile(settings.PICK_ROUTE_CODE_PATTERN)
+        units = list(StorageUnit.objects.filter(warehouse_id=warehouse_id).values_list('id', 'code', 'parent_unit_id'))
+        parents = {unit_id: parent_id for unit_id, _code, parent_id in units}
+        locations = {}
+        for unit_id, code, _parent_id in units:
+            match = pattern.match(code)
+            if match:
+                locations[unit_id] = (parse_aisle(match['aisle']), int(match['rack']))
+        for unit_id, _code, parent_id in units:
+            ancestor = parent_id
+            seen = set()
+            while unit_id not in locations and ancestor is not None and ancestor not in seen:
+                seen.add(ancestor)
+                if ancestor in locations:
+                    locations[unit_id] = locations[ancestor]
+                ancestor = parents.get(ancestor)
+
+        layout = settings.PICK_ROUTE_LAYOUT
+        aisles, xs, ys = [None], [float(layout['depot_x'])], [0.0]
+        points = {}
+        unit_points = {}
+        for unit_id, (aisle, rack) in locations.items():
+            point = points.get((aisle, rack))
+            if point is None:
+                point = points[aisle, rack] = len(aisles)
+                aisles.append(aisle)
+                xs.append(aisle * layout['aisle_spacing'])
+                ys.append((rack + 0.5) * layout['rack_length'])
+            unit_points[unit_id] = point
+        aisle_length = max(ys) + layout['rack_length'] / 2
+
+        return cls(signature, unit_points, aisles, xs, ys, aisle_length)
+
+    def submatrix(self, points):
+        """
+        Матрица расстояний между заданными точками (в их порядке)
+        """
+        length = self.aisle_length
+        targets = [(self.xs[point], self.ys[point]) for point in points]
+        same_aisle = {}
+        for local, point in enumerate(points):
+            if self.aisles[point] is not None:
+                same_aisle.setdefault(self.aisles[point], []).append(local)
+        rows = []
+        for point in points:
+            x, y = self.xs[point], self.ys[point]
+            # Через ближайший поперечный проход: min(y1 + y2, (L - y1) + (L - y2)) = L - |L - y1 - y2|
+            back = length - y
+            row = [abs(x - target_x) + length - abs(back - target_y) for target_x, target_y in targets]
+            for local in same_aisle.get(self.aisles[point], ()):
+                row[local] = abs(y - targets[local][1])
+            rows.append(row)
+        return rows
+
+    def route(self, storage_unit_ids, time_budget=None):
+        """
+        Упорядочивает обход единиц хранения; юниты без точки подбора возвращаются в unrouted
+        """
+        started = time.perf_counter()
+        units_at = {}
+        unrouted = []
+        for unit_id in dict.fromkeys(storage_unit_ids):
+            point = self.unit_points.get(unit_id)
+            if point is None:
+                unrouted.append(unit_id)
+            else:
+                units_at.setdefault(point, []).append(unit_id)
+
+        points = [DEPOT, *units_at]
+        matrix = self.submatrix(points)
+        nodes = range(1, len(points))
+        aisles = [self.aisles[point] for point in points]
+        ys = [self.ys[point] for point in points]
+
+        candidates = [_s_shape(nodes, aisles, ys), _largest_gap(nodes, aisles, ys, self.aisle_length)]
+        order = min(candidates, key=lambda candidate: _length(candidate, matrix))
+        if time_budget is None:
+            time_budget = settings.PICK_ROUTE_TIME_BUDGET
+        order = _two_opt(order, matrix, started + time_budget)
+
+        naive = [self.unit_points[unit_id] for unit_id in storage_unit_ids if unit_id in self.unit_points]
+        position = {point: local for local, point in enumerate(points)}
+        return Route(
+            storage_unit_ids=[unit_id for local in order for unit_id in units_at[points[local]]],
+            distance=_length(order, matrix),
+            naive_distance=_length([position[point] for point in naive], matrix),
+            unrouted=unrouted,
+        )
+
+
+def _length(order, matrix):
+    total = 0.0
+    previous = DEPOT
+    for node in order:
+        total += matrix[previous][node]
+        previous = node
+    return total + matrix[previous][DEPOT]
+
+
+def _group_by_aisle(nodes, aisles, ys):
+    groups = {}
+    for node in nodes:
+        groups.setdefault(aisles[node], []).append(node)
+    return [sorted(groups[aisle], key=ys.__getitem__) for aisle in sorted(groups)]
+
+
+def _s_shape(nodes, aisles, ys):
+    """
+    Проходы с подбором обходятся змейкой: вверх по одному, вниз по следующему
+    """
+    order = []
+    for number, group in enumerate(_group_by_aisle(nodes, aisles, ys)):
+        order.extend(reversed(group) if number % 2 else group)
+    return order
+
+
+def _largest_gap(nodes, aisles, ys, aisle_length):
+    """
+    Крайние проходы проходятся целиком; в остальных точки ниже наибольшего
+    промежутка собираются с переднего поперечного прохода, выше — с заднего
+    """
+    groups = _group_by_aisle(nodes, aisles, ys)
+    if len(groups) < 3:
+        return _s_shape(nodes, aisles, ys)
+
+    front_parts, back_parts = [], []
+    for group in groups[1:-1]:
+        bounds = [0.0, *(ys[node] for node in group), aisle_length]
+        split = max(range(len(bounds) - 1), key=lambda i: bounds[i + 1] - bounds[i])
+        front_parts.append(group[:split])
+        back_parts.append(group[split:])
+
+    order = list(groups[0])
+    for part in back_parts:
+        order.extend(reversed(part))
+    order.extend(reversed(groups[-1]))
+    for part in reversed(front_parts):
+        order.extend(part)
+    return order
+
+
+def _two_opt(order, matrix, deadline):
+    """
+    Улучшение маршрута разворотами отрезков, пока есть выигрыш и не истек срок
+    """
+    route = [DEPOT, *order, DEPOT]
+    count = len(route)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(1, count - 2):
+            row_a = matrix[route[i - 1]]
+            row_b = matrix[route[i]]
+            current = row_a[route[i]]
+            for j in range(i + 1, count - 1):
+                c, e = route[j], route[j + 1]
+                if row_a[c] + row_b[e] < current + matrix[c][e] - 1e-9:
+                    route[i:j + 1] = route[j:i - 1:-1]
+                    row_b = matrix[route[i]]
+                    current = row_a[route[i]]
+                    improved = True
+            if time.perf_counter() >= deadline:
+                break
+    return route[1:-1]
+
+
+_layouts = {}
+_layouts_lock = threading.Lock()
+
+
+def _signature(warehouse_id):
+    stats = StorageUnit.objects.filter(warehouse_id=warehouse_id).aggregate(count=Count('id'), updated=Max('updated_at'))
+    return stats['count'], stats['updated']
+
+
+def get_layout(warehouse_id):
+    """
+    Схема склада из кэша процесса; перестраивается при изменении единиц хранения
+    """
+    signature = _signature(warehouse_id)
+    layout = _layouts.get(warehouse_id)
+    if layout is None or layout.signature != signature:
+        layout = WarehouseLayout.load(warehouse_id, signature)
+        with _layouts_lock:
+            _layouts[warehouse_id] = layout
+    return layout
+
+
+def route_storage_units(warehouse, storage_unit_ids, time_budget=None):
+    return get_layout(getattr(warehouse, 'pk', warehouse)).route(storage_unit_ids, time_budget)
@@ -0,0 +1,20 @@
+from core.fieldsets import FieldsetSerializer
+
+from .models import StorageUnit, Warehouse
+
+
+class WarehouseSerializer(FieldsetSerializer):
+    class Meta:
+        model = Warehouse
+        fields = ('id', 'name', 'type', 'address')
+        read_only_fields = fields
+
+
+class StorageUnitSerializer(FieldsetSerializer):
+    class Meta:
+        model = StorageUnit
+        fields = (
+            'id', 'warehouse', 'parent_unit', 'name', 'type', 'code', 'width', 'height', 'depth', 'max_weight',
+            'max_items', 'created_at', 'updated_at',
+        )
+        read_only_fields = fields
@@ -0,0 +1,38 @@
+from django.db import transaction
+
+from . import hierarchy
+from .models import StorageUnit
+
+
+def remember_hierarchy_state(sender, instance, raw=False, **kwargs):
+    instance._hierarchy_previous = None
+    if raw or instance.pk is None:
+        return
+    previous = StorageUnit.objects.filter(pk=instance.pk).only(
+        'parent_unit_id', 'width', 'height', 'depth', 'max_weight', 'max_items'
+    ).first()
+    if previous is None:
+        return
+    if previous.parent_unit_id != instance.parent_unit_id:
+        hierarchy.check_move(instance)
+    instance._hierarchy_previous = (previous.parent_unit_id, hierarchy.own_capacity(previous))
+
+
+def update_hierarchy(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_hierarchy_previous', None)
+    with transaction.atomic():
+        if created or previous is None:
+            hierarchy.attach(instance)
+            return
+        parent_id, capacity = previous
+        if parent_id != instance.parent_unit_id:
+            hierarchy.move(instance)
+        if capacity != hierarchy.own_capacity(instance):
+            hierarchy.change_capacity(instance, capacity)
+    instance._hierarchy_previous = (instance.parent_unit_id, hierarchy.own_capacity(instance))
+
+
+def detach_from_hierarchy(sender, instance, **kwargs):
+    hierarchy.detach(instance)
@@ -0,0 +1,52 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import ListAPIView
+
+from core.fieldsets import FieldsetMixin
+from core.httpcache import CatalogCacheMixin
+
+from .models import StorageUnit, Warehouse
+from .serializers import StorageUnitSerializer, WarehouseSerializer
+
+
+class WarehouseListView(CatalogCacheMixin, FieldsetMixin, ListAPIView):
+    """
+    Склады компании от новых к старым, постранично по ключу (created_at, id); поддерживает If-None-Match.
+
+    GET ?type=client|fulfillment|marketplace&fields=id,name&cursor=...
+    """
+    # Пользователь токена, водяной знак справочника и страница
+    query_budget = 3
+    serializer_class = WarehouseSerializer
+    catalog_model = Warehouse
+
+    def get_queryset(self):
+        queryset = Warehouse.objects.filter(company_id=self.request.user.company_id)
+        warehouse_type = self.request.query_params.get('type')
+        if warehouse_type:
+            queryset = queryset.filter(type=warehouse_type)
+        return queryset
+
+
+class StorageUnitListView(CatalogCacheMixin, FieldsetMixin, ListAPIView):
+    """
+    Юниты хранения складов компании от новых к старым, постранично по ключу (created_at, id);
+    поддерживает If-None-Match.
+
+    GET ?warehouse=<id>&type=shelf|rack|pallet|box|cell&fields=id,code,name&cursor=...
+    """
+    query_budget = 3
+    serializer_class = StorageUnitSerializer
+    catalog_model = StorageUnit
+
+    def get_queryset(self):
+        queryset = StorageUnit.objects.filter(warehouse__company_id=self.request.user.company_id)
+        warehouse = self.request.query_params.get('warehouse')
+        if warehouse is not None:
+            try:
+                queryset = queryset.filter(warehouse_id=int(warehouse))
+            except ValueError:
+                raise ValidationError({'warehouse': 'Expected an integer ID'})
+        unit_type = self.request.query_params.get('type')
+        if unit_type:
+            queryset = queryset.filter(type=unit_type)
+        return queryset